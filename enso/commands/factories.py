@@ -53,12 +53,17 @@ __updated__ = "2017-02-23"
 
 import logging
 import re
+import threading
 from abc import ABCMeta, abstractmethod
+from collections import Counter, namedtuple
+from heapq import nsmallest
 
 from enso.commands.suggestions import AutoCompletion, Suggestion
 from enso.commands.interfaces import AbstractCommandFactory, CommandObject
+from enso.commands.postfixindex import EQUIVALENT_CHARS, PostfixIndex
 from enso import config
 from enso import clipboard
+from enso.utils.strings import string_ratio
 
 
 # ----------------------------------------------------------------------------
@@ -71,27 +76,6 @@ def _equivalizeChars(userText):
     replaced with equivalent character sets, e.g., "2" by "[2@]".
     """
 
-    # TODO: These appear to only be equivalent characters for US
-    # keyboard layouts.
-
-    EQUIVALENT_CHARS = {
-        "1": "1!",
-        "2": "2@",
-        "3": "3#",
-        "4": "4$",
-        "5": "5%",
-        "6": "6^",
-        "7": "7&",
-        "8": "8*",
-        "9": "9(",
-        "0": "0)",
-        "-": "-_",
-        "=": "=+",
-        ";": ":;",
-        "-": "-_",
-        "'": "'\"",
-    }
-
     re_escape = re.escape
 
     searchText = re_escape(userText)
@@ -113,6 +97,16 @@ def _equivalizeChars(userText):
     return searchText
 
 
+# ----------------------------------------------------------------------------
+# Suggestions Narrowing
+# ----------------------------------------------------------------------------
+
+# Remembers the postfixes that matched a postfix text, see
+# GenericPrefixFactory.retrieveNarrowedSuggestions().
+SuggestionsNarrowing = namedtuple(
+    'SuggestionsNarrowing', 'postfixText postfixesVersion postfixes')
+
+
 # ----------------------------------------------------------------------------
 # Prefix Command Factory
 # ----------------------------------------------------------------------------
@@ -130,8 +124,8 @@ class GenericPrefixFactory(AbstractCommandFactory):
 
     __metaclass__ = ABCMeta
     override = (
-        'retrieveSuggestions', 'autoComplete', 'getCommandObj', 'getCommandList',
-        'update', 'HELP_TEXT', 'PREFIX')
+        'retrieveSuggestions', 'retrieveTopSuggestions', 'autoComplete',
+        'getCommandObj', 'getCommandList', 'update', 'HELP_TEXT', 'PREFIX')
 
     # The portion of the command expression that is common to all
     # the command names that this command factory produces.
@@ -163,8 +157,17 @@ class GenericPrefixFactory(AbstractCommandFactory):
         # the resulting string is a complete command name.
         self.__postfixes = []
         self.__postfixesChanged = False
-
-        self.__searchString = ""
+        # Incremented on every change of the postfixes; used to detect
+        # stale suggestion narrowings.
+        self.__postfixesVersion = 0
+
+        # Search index over the postfixes; it is synchronized with the
+        # postfix list lazily, see __update().
+        self.__postfixIndex = PostfixIndex()
+        # Guards the postfixes and the search index, as the suggestions
+        # can be retrieved on a worker thread (see
+        # config.QUASIMODE_ASYNC_SUGGESTIONS).
+        self.__lock = threading.RLock()
 
         self.userText = ""
 
@@ -174,9 +177,19 @@ class GenericPrefixFactory(AbstractCommandFactory):
     def getPostfixes(self):
         return self.__postfixes
 
+    def getPostfixesVersion(self):
+        """
+        Returns a number that changes on every change of the postfixes.
+        """
+        return self.__postfixesVersion
+
     def setPostfixes(self, postfixes):
-        self.__postfixesChanged = True
-        self.__postfixes = postfixes
+        # Postfixes can be passed in as a generator
+        postfixes = list(postfixes)
+        with self.__lock:
+            self.__postfixesChanged = True
+            self.__postfixesVersion += 1
+            self.__postfixes = postfixes
 
     # A protected property; subclasses should maintain this and update
     # it in the .update() method.
@@ -186,13 +199,52 @@ class GenericPrefixFactory(AbstractCommandFactory):
     # modifying the postfix list themselves, because modifying the list
     # in place will not invoke the property set method, which means
     # postfixesChanged won't get updated, which is bad.
+    # Unless a whole new postfix list is pending, they also update the
+    # search index in place instead of having it re-synchronized.
     def _addPostfix(self, cmdName):
-        self._postfixes = self._postfixes[:] + [cmdName]
+        with self.__lock:
+            self.__postfixes = self.__postfixes[:] + [cmdName]
+            self.__postfixesVersion += 1
+            if not self.__postfixesChanged:
+                self.__postfixIndex.add(cmdName)
 
     def _removePostfix(self, cmdExpr):
-        newPostfixes = self._postfixes[:]
-        newPostfixes.remove(cmdExpr)
-        self._postfixes = newPostfixes
+        with self.__lock:
+            newPostfixes = self.__postfixes[:]
+            newPostfixes.remove(cmdExpr)
+            self.__postfixes = newPostfixes
+            self.__postfixesVersion += 1
+            if not self.__postfixesChanged:
+                self.__postfixIndex.remove(cmdExpr)
+
+    def _updatePostfixes(self, added, removed):
+        """
+        Adds and removes several postfixes at once; equivalent to
+        calling _removePostfix() for every removed and _addPostfix()
+        for every added postfix, but much cheaper for large lists.
+        """
+        added = list(added)
+        removed = list(removed)
+        if not added and not removed:
+            return
+        with self.__lock:
+            toRemove = Counter(removed)
+            newPostfixes = []
+            for postfix in self.__postfixes:
+                if toRemove.get(postfix):
+                    toRemove[postfix] -= 1
+                else:
+                    newPostfixes.append(postfix)
+            if any(toRemove.itervalues()):
+                raise ValueError("Postfix to remove is not present")
+            newPostfixes.extend(added)
+            self.__postfixes = newPostfixes
+            self.__postfixesVersion += 1
+            if not self.__postfixesChanged:
+                for postfix in removed:
+                    self.__postfixIndex.remove(postfix)
+                for postfix in added:
+                    self.__postfixIndex.add(postfix)
 
     def getCommandList(self):
         """
@@ -205,19 +257,19 @@ class GenericPrefixFactory(AbstractCommandFactory):
 
     def __update(self):
         """
-        Private method for maintaining a search-string structure.
+        Private method for maintaining the search index.
         """
 
         self.update()
-
-        if self.__postfixesChanged:
-            self.__postfixesChanged = False
-            self.__searchString = "\n".join(self.__postfixes)
+        self.afterUpdate()
 
     def afterUpdate(self):
-        if self.__postfixesChanged:
-            self.__postfixesChanged = False
-            self.__searchString = "\n".join(self.__postfixes)
+        with self.__lock:
+            if self.__postfixesChanged:
+                self.__postfixesChanged = False
+                # Only the difference against the indexed postfixes gets
+                # applied, so re-setting a mostly unchanged list is cheap.
+                self.__postfixIndex.setPostfixes(self.__postfixes)
 
     # LONGTERM TODO: This is not the greatest design.  Perhaps in
     # Mehitabel Core 2.0 this can be replaced with an Observer pattern.
@@ -245,16 +297,53 @@ class GenericPrefixFactory(AbstractCommandFactory):
 
         This returns a list of Suggestion objects.
         """
+
+        return self.retrieveNarrowedSuggestions(userText)[0]
+
+    def retrieveTopSuggestions(self, userText, k):
+        """
+        Retrieves at most k suggestions that match the userText string,
+        nearest first.
+
+        The matching postfixes are ranked as plain strings, and the
+        Suggestion objects are created only for the top k of them.
+        """
+
+        return self.retrieveNarrowedSuggestions(userText, k=k)[0]
+
+    def retrieveNarrowedSuggestions(self, userText, narrowing=None, k=None):
+        """
+        Works as retrieveSuggestions(), but returns a tuple
+        (suggestions, narrowing).  If k is given, only the k nearest
+        suggestions are returned, as in retrieveTopSuggestions().
+
+        The returned SuggestionsNarrowing remembers the postfixes that
+        matched userText.  When it is passed back in a later call for
+        a user text that extends this one (i.e., the user typed another
+        character), only the remembered postfixes are matched instead
+        of all of them, as no other postfix can match the longer text.
+
+        The narrowing is ignored if it does not apply, i.e., if the
+        user text does not extend the remembered one, or if the
+        postfixes have changed in the meantime.
+        """
         self.userText = userText
 
-        pattern = userText[len(self.PREFIX):]
-        pattern = _equivalizeChars(pattern)
+        postfix = userText[len(self.PREFIX):]
+        pattern = _equivalizeChars(postfix)
 
         # Match any command that contains the user postfix (i.e.,
         # any characters followed by the user postfix).
         pattern = ".*" + pattern
 
-        matches = self.__findMatches(pattern)
+        # The top k matches are ranked separately; don't sort them all.
+        matches = self.__findMatches(
+            pattern, postfix, narrowing=narrowing, sort=k is None)
+        narrowing = SuggestionsNarrowing(
+            postfix, self.__postfixesVersion, [m[0] for m in matches])
+
+        if k is not None:
+            matches = self.__topMatches(userText, matches, k)
 
         suggestions = [Suggestion(userText, self.PREFIX + m[0])
                        for m in matches]
@@ -267,7 +356,28 @@ class GenericPrefixFactory(AbstractCommandFactory):
                 Suggestion(userText, self.PREFIX, self.HELP_TEXT)
             )
 
-        return suggestions
+        if k is not None:
+            suggestions = nsmallest(k, suggestions)
+
+        return suggestions, narrowing
+
+    def __topMatches(self, userText, matches, k):
+        """
+        Returns the k matches (as returned by __findMatches()) whose
+        suggestions would be the nearest to userText.
+
+        The ranking is the same as the one of the Suggestion objects:
+        higher nearness first, then alphabetical order of the
+        suggested text.
+        """
+
+        prefix = self.PREFIX
+
+        def rankKey(match):
+            suggestedText = prefix + match[0]
+            return (-string_ratio(userText, suggestedText), suggestedText)
+
+        return nsmallest(k, matches, key=rankKey)
 
     def autoComplete(self, userText):
         """
@@ -284,15 +394,17 @@ class GenericPrefixFactory(AbstractCommandFactory):
         elif not userText.startswith(self.PREFIX):
             return None
 
-        pattern = userText[len(self.PREFIX):]
-        pattern = _equivalizeChars(pattern)
-        matches = self.__findMatches(pattern)
+        postfix = userText[len(self.PREFIX):]
+        pattern = _equivalizeChars(postfix)
+        matches = self.__findMatches(pattern, postfix, anchored=True)
         if len(self.PREFIX) > 0 and len(matches) == 0:
             # We have a real prefix; look for beginings of words.
             # Instead of \b for word boundary, use [^a-zA-Z0-9] so the underscore
             # character is also considered as a word boundary
+            # NOTE: The pattern is escaped as a whole here, so it is
+            # matched literally.
             matches = self.__findMatches(
-                r".*?(?:^|[^a-zA-Z0-9])(%s)" % re.escape(pattern))
+                r".*?(?:^|[^a-zA-Z0-9])(%s)" % re.escape(pattern), pattern)
         if len(matches) < 1:
             return None
 
@@ -319,44 +431,64 @@ class GenericPrefixFactory(AbstractCommandFactory):
             len(self.PREFIX), start, end)
         return completion
 
-    def __findMatches(self, pattern):
+    def __findMatches(self, pattern, text, anchored=False, narrowing=None,
+                      sort=True):
         """
         Finds all command names that:
           (1) start with the correct prefix, and
           (2) match pattern.
 
-        Returns list of tuples:
+        'text' is the literal text the pattern was created from; it
+        is used to look up the candidate postfixes in the search
+        index.  If anchored is True, the pattern matches only at the
+        beginning of the postfix.  If a still valid narrowing is given,
+        its postfixes are used as the candidates instead.
+
+        Returns list of tuples, sorted unless sort is False:
         (match:string, match_location:int)
         """
 
+        with self.__lock:
+            return self.__findMatchesLocked(
+                pattern, text, anchored, narrowing, sort)
+
+    def __findMatchesLocked(self, pattern, text, anchored, narrowing, sort):
+        """
+        Implements __findMatches(); must be called with the lock held.
+        """
+
         self.__update()
 
-        # This part works by using regular expressions to quickly grab
-        # all the new-line delimited substrings that contain
-        # the pattern.  NOTE: This will allow us to modify the pattern
+        # The search index narrows the postfixes down to those that
+        # contain the (normalized) text.  Only these candidates are
+        # then matched with the regular expression, which decides the
+        # final result.  NOTE: This will allow us to modify the pattern
         # into a more advanced regexp, allowing ( for example ) the
         # user text "open boo 9temp0" to match to the command named
         # "open boo (temp)".
 
-        # ^ matches begining of line or begining of string
-        # $ matches end of line or end of string
         # .* matches any number of any character, except newlines
-
-        # re.M means that "multiline mode" is used, so "." does not
-        # match newlines.
+        # $ matches end of string
         # re.I matches case-insensitively
         if "(" not in pattern or ")" not in pattern:
             pattern = r"(%s)" % pattern
-        re_pattern_finditer = re.compile(
-            r"^%s.*$" % pattern, re.M | re.I).finditer
-        # print [(m.groups(), m.start(0), m.start(1)) for m in
-        # re_pattern.finditer(self.__searchString)]
-        matches = [
-            (m.group(0), m.start(1) - m.start(0))
-            for m in re_pattern_finditer(self.__searchString)
-            if m.groups() and m.group(0)
-        ]
-        if matches:
+        # NOTE: re.compile() keeps its own cache of the compiled
+        # patterns, so repeated calls don't recompile the pattern.
+        re_pattern_match = re.compile(r"%s.*$" % pattern, re.I).match
+
+        if (narrowing is not None
+                and narrowing.postfixesVersion == self.__postfixesVersion
+                and text.startswith(narrowing.postfixText)):
+            candidates = narrowing.postfixes
+        else:
+            candidates = self.__postfixIndex.candidates(text, anchored)
+
+        matches = []
+        for postfix in candidates:
+            m = re_pattern_match(postfix)
+            if m and m.groups() and m.group(0):
+                matches.append((m.group(0), m.start(1)))
+        if sort and matches:
             matches.sort()
         return matches
 
@@ -400,7 +532,8 @@ class ArbitraryPostfixFactory(GenericPrefixFactory):
     Abstract factory class for factories that produce "learn as"
     commands, and other command families that can take any argument.
     """
-    override = ('retrieveSuggestions', 'autoComplete', 'update')
+    override = ('retrieveSuggestions', 'retrieveTopSuggestions',
+                'autoComplete', 'update')
 
     def __init__(self):
         """
@@ -466,6 +599,13 @@ class ArbitraryPostfixFactory(GenericPrefixFactory):
         else:
             return []
 
+    def retrieveTopSuggestions(self, userText, k):
+        """
+        Returns the suggestion of retrieveSuggestions(), if k allows.
+        """
+
+        return self.retrieveSuggestions(userText)[:k]
+
     def textModified(self, keyCode, oldText, newText, quasimodeId=None):
         pass
 
@@ -93,6 +93,7 @@
 
 from abc import ABCMeta, abstractmethod
 from collections import namedtuple
+from heapq import nsmallest
 
 # ----------------------------------------------------------------------------
 # Command Objects
@@ -205,8 +206,8 @@ class AbstractCommandFactory(_CommandImpl):
 
     __metaclass__ = ABCMeta
 
-    override = ('retrieveSuggestions', 'autoComplete',
-                'getCommandObj', 'getCommandList')
+    override = ('retrieveSuggestions', 'retrieveTopSuggestions',
+                'autoComplete', 'getCommandObj', 'getCommandList')
 
     @abstractmethod
     def getCommandList(self):
@@ -225,6 +226,18 @@ class AbstractCommandFactory(_CommandImpl):
         """
         return None
 
+    def retrieveTopSuggestions(self, userText, k):
+        """
+        Returns a list of at most k suggestions that match the
+        userText string, nearest first.
+
+        The default implementation ranks all the suggestions returned
+        by retrieveSuggestions(); subclasses can override it to avoid
+        creating the Suggestion objects that would not make it to the
+        top k.
+        """
+        return nsmallest(k, self.retrieveSuggestions(userText))
+
     @abstractmethod
     def autoComplete(self, userText):
         """
@@ -44,6 +44,9 @@
 
 import logging
 import operator
+import threading
+from collections import OrderedDict
+from heapq import nsmallest
 
 from enso import config
 from enso.commands.factories import GenericPrefixFactory
@@ -51,6 +54,181 @@ from enso.commands.interfaces import AbstractCommandFactory
 from enso.commands.interfaces import CommandExpression, CommandObject
 
 
+# ----------------------------------------------------------------------------
+# Private Utility Functions
+# ----------------------------------------------------------------------------
+
+def _supportsNarrowing(factory):
+    """
+    Returns True if the factory retrieves its suggestions using the
+    GenericPrefixFactory implementation, which can narrow the results
+    of a previous query (see retrieveNarrowedSuggestions()).
+    """
+
+    try:
+        return (factory.retrieveSuggestions.im_func
+                is GenericPrefixFactory.retrieveSuggestions.im_func)
+    except AttributeError:
+        return False
+
+
+# ----------------------------------------------------------------------------
+# Factory Dispatch Table
+# ----------------------------------------------------------------------------
+
+class _PrefixTrieNode(object):
+    """
+    A node of the _FactoryDispatchTable trie.
+    """
+
+    __slots__ = ('children', 'factories', 'subtreeFactories')
+
+    def __init__(self):
+        # Character -> child node.
+        self.children = {}
+        # (expr, factory) tuples whose prefix ends at this node.
+        self.factories = []
+        # Cached list of all the (expr, factory) tuples below this
+        # node, or None if it needs to be recomputed.
+        self.subtreeFactories = None
+
+
+class _FactoryDispatchTable(object):
+    """
+    A trie of the command factories, keyed by the prefixes of their
+    command expressions.
+
+    Finds the factories whose command expression matches a user text
+    (see CommandExpression.matches()) without checking every
+    registered command expression: these are the factories along the
+    path of the user text in the trie (their prefix starts the user
+    text), and all the factories below its end (their prefix starts
+    with the user text).
+    """
+
+    def __init__(self):
+        self.__root = _PrefixTrieNode()
+
+    def add(self, expr, factory):
+        node = self.__root
+        node.subtreeFactories = None
+        for char in expr.getPrefix():
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _PrefixTrieNode()
+            node = child
+            node.subtreeFactories = None
+        node.factories.append((expr, factory))
+
+    def remove(self, expr):
+        path = [self.__root]
+        for char in expr.getPrefix():
+            path.append(path[-1].children[char])
+        node = path[-1]
+        node.factories = [(e, f) for e, f in node.factories if e is not expr]
+        for node in path:
+            node.subtreeFactories = None
+        # Prune the nodes that no longer lead to any factory.
+        prefix = expr.getPrefix()
+        for depth in range(len(prefix), 0, -1):
+            node = path[depth]
+            if node.factories or node.children:
+                break
+            del path[depth - 1].children[prefix[depth - 1]]
+
+    def getMatching(self, userText):
+        """
+        Returns a list of (expr, factory) tuples for all the factories
+        whose command expression matches userText.
+        """
+
+        node = self.__root
+        matching = list(node.factories)
+        for char in userText:
+            node = node.children.get(char)
+            if node is None:
+                return matching
+            matching.extend(node.factories)
+        matching.extend(self.__getSubtreeFactories(node))
+        return matching
+
+    def __getSubtreeFactories(self, node):
+        """
+        Returns the (expr, factory) tuples of all the nodes below node.
+        """
+
+        if node.subtreeFactories is None:
+            factories = []
+            # NOTE: values() copies the children, as they may be
+            # modified by another thread.
+            for child in node.children.values():
+                factories.extend(child.factories)
+                factories.extend(self.__getSubtreeFactories(child))
+            node.subtreeFactories = factories
+        return node.subtreeFactories
+
+
+# ----------------------------------------------------------------------------
+# Quasimode Session
+# ----------------------------------------------------------------------------
+
+class _QuasimodeSession(object):
+    """
+    Remembers the candidate factories and narrowings of the recent
+    suggestion queries made during one quasimode session, and the
+    commands retrieved by name.
+
+    When the user types another character, the new user text extends
+    the previous one, and only the factories (and postfixes) that
+    matched the previous user text can match the new one.  Several
+    recent queries are remembered, as the suggestion list queries
+    more user texts on each keystroke (e.g., "open <text>").
+
+    The queries can be made from the suggestion worker thread, so the
+    query memory is guarded by a lock.
+    """
+
+    # Maximum number of remembered queries.
+    MAX_ENTRIES = 16
+
+    def __init__(self):
+        # User text -> list of (expr, factory, narrowing) tuples.
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        # Command name -> (postfixes versions of the matching
+        # factories, command object), see CommandManager.getCommand().
+        self.commands = {}
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+        self.commands.clear()
+
+    def findEntry(self, userText):
+        """
+        Returns the entry for the longest remembered user text that
+        userText starts with, or None.
+        """
+
+        with self.__lock:
+            bestText = None
+            for text in self.__entries:
+                if (userText.startswith(text)
+                        and (bestText is None or len(text) > len(bestText))):
+                    bestText = text
+            if bestText is None:
+                return None
+            return self.__entries[bestText]
+
+    def addEntry(self, userText, entry):
+        with self.__lock:
+            entries = self.__entries
+            entries.pop(userText, None)
+            entries[userText] = entry
+            if len(entries) > self.MAX_ENTRIES:
+                entries.popitem(last=False)
+
+
 # ----------------------------------------------------------------------------
 # The Command Manager
 # ----------------------------------------------------------------------------
@@ -82,6 +260,58 @@ class CommandManager(object):
         self.__cmdFactoryDict = {
             self.CMD_KEY: self.__cmdObjReg,
         }
+        self.__dispatchTable = _FactoryDispatchTable()
+        self.__dispatchTable.add(self.CMD_KEY, self.__cmdObjReg)
+
+        # Query memory of the current quasimode session, if any.
+        self.__session = None
+
+    def startQuasimodeSession(self):
+        """
+        Starts remembering the suggestion queries so that the
+        following queries for extended user text can be narrowed, and
+        the commands retrieved by getCommand().  Called when the
+        quasimode starts.
+        """
+
+        self.__session = _QuasimodeSession()
+
+    def endQuasimodeSession(self):
+        """
+        Forgets the suggestion queries and commands remembered since
+        startQuasimodeSession().  Called when the quasimode ends.
+        """
+
+        self.__session = None
+
+    def __clearSession(self):
+        """
+        Forgets the remembered queries, as the set of registered
+        commands has changed.
+        """
+
+        if self.__session is not None:
+            self.__session.clear()
+
+    def __matchingFactories(self, userText):
+        """
+        Returns a list of (expr, factory, narrowing) tuples for all
+        the factories whose command expression matches userText.
+
+        If a query for a shorter user text is remembered in the
+        current session, only its factories are considered, along with
+        their narrowings; otherwise the narrowings are None.
+        """
+
+        entry = None
+        if self.__session is not None:
+            entry = self.__session.findEntry(userText)
+        if entry is None:
+            return [(expr, factory, None) for expr, factory
+                    in self.__dispatchTable.getMatching(userText)]
+        return [(expr, factory, narrowing)
+                for expr, factory, narrowing in entry
+                if expr.matches(userText)]
 
     def registerCommand(self, cmdName, cmdObj):
         """
@@ -108,22 +338,26 @@ class CommandManager(object):
             assert cmdExpr not in self.__cmdFactoryDict,\
                 "Command is already registered: %s" % cmdExpr
             self.__cmdFactoryDict[cmdExpr] = cmdObj
+            self.__dispatchTable.add(cmdExpr, cmdObj)
         else:
             # The command expression has no argument; it is a
             # simple command with an exact name.
             assert isinstance(cmdObj, CommandObject), \
                 "Could not register %s. Object has not type CommandObject." % cmdName
             self.__cmdObjReg.addCommandObj(cmdObj, cmdExpr)
+        self.__clearSession()
 
     def unregisterCommand(self, cmdName):
         for cmdExpr in self.__cmdFactoryDict.keys(
         ):  # Need keys() to obtain copy so we can mutate
             if cmdExpr.getString() == cmdName and cmdExpr != self.CMD_KEY:  # Protect cmdObjeReg from deletion
                 del self.__cmdFactoryDict[cmdExpr]
+                self.__dispatchTable.remove(cmdExpr)
                 break
         else:
             self.__cmdObjReg.removeCommandObj(cmdName)
         assert self.CMD_KEY in self.__cmdFactoryDict
+        self.__clearSession()
 
     def getCommandPrefix(self, commandName):
         """
@@ -135,18 +369,17 @@ class CommandManager(object):
 
         prefixes = []
 
-        for expr, factory in self.__cmdFactoryDict.iteritems():
-            if expr.matches(commandName):
-                # This expression matches commandName; try to fetch a
-                # command object from the corresponding factory.
-                cmd = factory.getCommandObj(commandName)
-                if expr == self.CMD_KEY and cmd is not None:
-                    prefixes.append(commandName)
-                elif cmd is not None:
-                    # The factory returned a non-nil command object.
-                    # Make sure that nothing else has matched this
-                    # commandName.
-                    prefixes.append(expr.getPrefix())
+        for expr, factory in self.__dispatchTable.getMatching(commandName):
+            # This expression matches commandName; try to fetch a
+            # command object from the corresponding factory.
+            cmd = factory.getCommandObj(commandName)
+            if expr == self.CMD_KEY and cmd is not None:
+                prefixes.append(commandName)
+            elif cmd is not None:
+                # The factory returned a non-nil command object.
+                # Make sure that nothing else has matched this
+                # commandName.
+                prefixes.append(expr.getPrefix())
 
         if len(prefixes) == 0:
             return None
@@ -186,18 +419,17 @@ class CommandManager(object):
 
         expressions = []
 
-        for expr, factory in self.__cmdFactoryDict.iteritems():
-            if expr.matches(commandName):
-                # This expression matches commandName; try to fetch a
-                # command object from the corresponding factory.
-                cmd = factory.getCommandObj(commandName)
-                if expr == self.CMD_KEY and cmd is not None:
-                    expressions.append((commandName, commandName))
-                elif cmd is not None:
-                    # The factory returned a non-nil command object.
-                    # Make sure that nothing else has matched this
-                    # commandName.
-                    expressions.append((expr.getPrefix(), expr))
+        for expr, factory in self.__dispatchTable.getMatching(commandName):
+            # This expression matches commandName; try to fetch a
+            # command object from the corresponding factory.
+            cmd = factory.getCommandObj(commandName)
+            if expr == self.CMD_KEY and cmd is not None:
+                expressions.append((commandName, commandName))
+            elif cmd is not None:
+                # The factory returned a non-nil command object.
+                # Make sure that nothing else has matched this
+                # commandName.
+                expressions.append((expr.getPrefix(), expr))
 
         if len(expressions) == 0:
             return None
@@ -234,22 +466,56 @@ class CommandManager(object):
         registered CommandObjects and the registered CommandFactories.
 
         If no command matches, returns None explicitly.
+
+        During a quasimode session, the commands are remembered by
+        name, as the same command is often retrieved again (e.g., the
+        active suggestion on every keystroke).  A remembered command
+        is used only while the postfixes of the matching factories
+        stay the same, as they can be updated during the session
+        (e.g., by the directory monitors of the 'open' command).
+        Commands that are the factories themselves are not remembered:
+        such a factory keeps the state of the last retrieved command
+        (e.g., the expression of the 'calculate' command), which a
+        later retrieval of another name overwrites.  Nor is a missing
+        command remembered.
+        """
+
+        matching = self.__dispatchTable.getMatching(commandName)
+        if self.__session is None:
+            return self.__getCommand(commandName, matching)[0]
+
+        versions = tuple(factory.getPostfixesVersion()
+                         for _, factory in matching)
+        commands = self.__session.commands
+        remembered = commands.get(commandName)
+        if remembered is not None and remembered[0] == versions:
+            return remembered[1]
+        cmd, factory = self.__getCommand(commandName, matching)
+        if cmd is not None and cmd is not factory:
+            commands[commandName] = (versions, cmd)
+        return cmd
+
+    def __getCommand(self, commandName, matching):
+        """
+        Returns tuple (command, factory) of the command with
+        commandName, or (None, None) if no command matches.
+        'matching' are the (expr, factory) tuples of the factories
+        matching commandName.
         """
 
         commands = []
 
-        for expr, factory in self.__cmdFactoryDict.iteritems():
-            if expr.matches(commandName):
-                # This expression matches commandName; try to fetch a
-                # command object from the corresponding factory.
-                cmd = factory.getCommandObj(commandName)
-                if cmd is not None:
-                    # The factory returned a non-nil command object.
-                    commands.append((expr, cmd))
+        for expr, factory in matching:
+            # This expression matches commandName; try to fetch a
+            # command object from the corresponding factory.
+            cmd = factory.getCommandObj(commandName)
+            if cmd is not None:
+                # The factory returned a non-nil command object.
+                commands.append((expr, (cmd, factory)))
 
         if len(commands) == 0:
             # There is no match
-            return None
+            return None, None
         elif len(commands) == 1:
             # There is exactly one match
             return commands[0][1]
@@ -286,11 +552,10 @@ class CommandManager(object):
         completions = []
 
         # Check each of the command factories for a match.
-        for expr, factory in self.__cmdFactoryDict.iteritems():
-            if expr.matches(userText):
-                completion = factory.autoComplete(userText)
-                if completion is not None:
-                    completions.append(completion)
+        for _, factory, _ in self.__matchingFactories(userText):
+            completion = factory.autoComplete(userText)
+            if completion is not None:
+                completions.append(completion)
 
         if len(completions) == 0:
             return None
@@ -325,13 +590,56 @@ class CommandManager(object):
     def retrieveSuggestions(self, userText):
         """
         Returns an unsorted list of suggestions.
+
+        During a quasimode session, the factories and postfixes that
+        matched a shorter user text are remembered, and the query is
+        narrowed down to them when userText extends that text.
+        """
+
+        return self.__retrieveSuggestions(userText)
+
+    def retrieveTopSuggestions(self, userText, k, isCancelled=None):
+        """
+        Returns a list of at most k suggestions, nearest first.
+
+        Each factory ranks its own matches and returns only its top k
+        suggestions, so the suggestions that could not make it to the
+        list are never created.
+
+        If isCancelled is given, it is called between the factories;
+        once it returns True, the retrieval stops and None is returned.
+        """
+
+        suggestions = self.__retrieveSuggestions(userText, k, isCancelled)
+        if suggestions is None:
+            return None
+        return nsmallest(k, suggestions)
+
+    def __retrieveSuggestions(self, userText, k=None, isCancelled=None):
+        """
+        Collects the suggestions of all the matching factories; if k
+        is given, only the top k suggestions of each factory.  Returns
+        None if cancelled, see retrieveTopSuggestions().
         """
 
         suggestions = []
+        entry = []
         # Extend the suggestions using each of the command factories
-        for expr, factory in self.__cmdFactoryDict.iteritems():
-            if expr.matches(userText):
-                suggestions.extend(factory.retrieveSuggestions(userText))
+        for expr, factory, narrowing in self.__matchingFactories(userText):
+            if isCancelled is not None and isCancelled():
+                return None
+            if _supportsNarrowing(factory):
+                found, narrowing = factory.retrieveNarrowedSuggestions(
+                    userText, narrowing, k)
+            elif k is not None:
+                found = factory.retrieveTopSuggestions(userText, k)
+            else:
+                found = factory.retrieveSuggestions(userText)
+            suggestions.extend(found)
+            entry.append((expr, factory, narrowing))
+
+        if self.__session is not None:
+            self.__session.addEntry(userText, entry)
 
         return suggestions
 
@@ -0,0 +1,371 @@
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+# ----------------------------------------------------------------------------
+#
+#   enso.commands.postfixindex
+#
+# ----------------------------------------------------------------------------
+
+"""
+    A persistent search index over the postfixes of a command factory.
+
+    GenericPrefixFactory used to join all its postfixes into one big
+    string and scan it with a freshly built regular expression on every
+    keystroke.  The PostfixIndex keeps a trigram index and a sorted
+    array of the postfixes instead, so that only the postfixes which can
+    possibly match the user text are handed over to the regular
+    expression.  The index is maintained incrementally as the postfixes
+    are added and removed.
+
+    All lookups work on a "normalized" form of the text, in which the
+    case is folded, the equivalent characters (see EQUIVALENT_CHARS) are
+    replaced with a single representative and runs of spaces are reduced
+    to a single space.  The candidates returned by the index are
+    therefore a superset of the real matches and must be verified by
+    the caller.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import re
+from bisect import bisect_left, insort
+
+
+# ----------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------
+
+# Characters that are considered equivalent when matching the user
+# text against the postfixes, e.g., "2" also matches "@".
+# TODO: These appear to only be equivalent characters for US
+# keyboard layouts.
+EQUIVALENT_CHARS = {
+    "1": "1!",
+    "2": "2@",
+    "3": "3#",
+    "4": "4$",
+    "5": "5%",
+    "6": "6^",
+    "7": "7&",
+    "8": "8*",
+    "9": "9(",
+    "0": "0)",
+    "-": "-_",
+    "=": "=+",
+    ";": ":;",
+    "'": "'\"",
+}
+
+# Length of the n-grams stored in the index.  Queries shorter than this
+# can't use the n-gram index and are answered by a linear scan.
+NGRAM_LENGTH = 3
+
+# Number of postfixes added or removed at once above which the sorted
+# array is rebuilt rather than updated in place.
+_BULK_UPDATE_THRESHOLD = 64
+
+
+# ----------------------------------------------------------------------------
+# Private Utility Functions
+# ----------------------------------------------------------------------------
+
+_CANONICAL_CHARS = dict(
+    (unicode(equivalent), unicode(canonical))
+    for canonical, equivalents in EQUIVALENT_CHARS.iteritems()
+    for equivalent in equivalents
+    if equivalent != canonical
+)
+
+# NOTE: Substituting through a regular expression is several times
+# faster than unicode.translate(), which matters when indexing tens of
+# thousands of postfixes.
+_EQUIVALENT_CHAR_RE = re.compile(
+    u"[%s]" % re.escape(u"".join(_CANONICAL_CHARS)))
+
+_MULTISPACE_RE = re.compile(" {2,}")
+
+
+def normalize(text):
+    """
+    Returns the normalized form of text used for the index lookups.
+
+    Byte strings are decoded as latin-1, so that every byte maps to the
+    code point of the same value.  This keeps the normalized forms of
+    str and unicode postfixes comparable with each other, and it
+    matches the way the regular expressions compare them.
+
+      >>> normalize("Open  Foo_Bar!")
+      u'open foo-bar1'
+    """
+
+    if not isinstance(text, unicode):
+        text = text.decode("latin-1")
+    text = text.lower()
+    if _EQUIVALENT_CHAR_RE.search(text):
+        text = _EQUIVALENT_CHAR_RE.sub(
+            lambda m: _CANONICAL_CHARS[m.group()], text)
+    if "  " in text:
+        text = _MULTISPACE_RE.sub(" ", text)
+    return text
+
+
+def _ngrams(text):
+    """
+    Returns the set of all n-grams of text.
+    """
+
+    return {text[i:i + NGRAM_LENGTH]
+            for i in xrange(len(text) - NGRAM_LENGTH + 1)}
+
+
+# ----------------------------------------------------------------------------
+# Postfix Index
+# ----------------------------------------------------------------------------
+
+class PostfixIndex(object):
+    """
+    Trigram index plus sorted prefix array over a list of postfixes.
+
+    The same postfix can be present more than once; every occurrence
+    is reported as a separate candidate, the same way the joined search
+    string used to report it.
+
+      >>> index = PostfixIndex(["firefox", "file manager", "gimp"])
+      >>> sorted(index.candidates("fi", anchored=True))
+      ['file manager', 'firefox']
+      >>> sorted(index.candidates("fox"))
+      ['firefox']
+      >>> index.remove("firefox")
+      >>> index.add("Fire Fox")
+      >>> sorted(index.candidates("fire"))
+      ['Fire Fox']
+    """
+
+    def __init__(self, postfixes=()):
+        # Id -> postfix and id -> normalized postfix mappings.
+        self.__postfixes = {}
+        self.__normalized = {}
+        # Postfix -> list of ids; a postfix can be present more than once.
+        self.__ids = {}
+        # N-gram -> set of ids of the postfixes containing the n-gram.
+        self.__ngrams = {}
+        # Sorted list of (normalized postfix, id) tuples, used for the
+        # anchored (prefix) lookups.
+        self.__sorted = []
+        self.__nextId = 0
+
+        self.setPostfixes(postfixes)
+
+    def __len__(self):
+        return len(self.__postfixes)
+
+    def __contains__(self, postfix):
+        return postfix in self.__ids
+
+    def __insert(self, postfix):
+        """
+        Adds postfix to all structures except for the sorted array.
+        Returns the (normalized postfix, id) tuple of the new entry.
+        """
+
+        postfixId = self.__nextId
+        self.__nextId += 1
+
+        normalized = normalize(postfix)
+        self.__postfixes[postfixId] = postfix
+        self.__normalized[postfixId] = normalized
+        self.__ids.setdefault(postfix, []).append(postfixId)
+
+        ngramsIndex = self.__ngrams
+        for ngram in _ngrams(normalized):
+            try:
+                ngramsIndex[ngram].add(postfixId)
+            except KeyError:
+                ngramsIndex[ngram] = set((postfixId,))
+
+        return normalized, postfixId
+
+    def __delete(self, postfix):
+        """
+        Removes one occurrence of postfix from all structures except for
+        the sorted array.  Returns the (normalized postfix, id) tuple of
+        the removed entry.
+
+        Raises ValueError if postfix is not in the index.
+        """
+
+        try:
+            ids = self.__ids[postfix]
+        except KeyError:
+            raise ValueError("Postfix '%s' is not in the index." % postfix)
+
+        postfixId = ids.pop()
+        if not ids:
+            del self.__ids[postfix]
+
+        del self.__postfixes[postfixId]
+        normalized = self.__normalized.pop(postfixId)
+
+        ngramsIndex = self.__ngrams
+        for ngram in _ngrams(normalized):
+            ids = ngramsIndex[ngram]
+            ids.discard(postfixId)
+            if not ids:
+                del ngramsIndex[ngram]
+
+        return normalized, postfixId
+
+    def add(self, postfix):
+        """
+        Adds one occurrence of postfix to the index.
+        """
+
+        insort(self.__sorted, self.__insert(postfix))
+
+    def remove(self, postfix):
+        """
+        Removes one occurrence of postfix from the index.
+
+        Raises ValueError if postfix is not in the index.
+        """
+
+        entry = self.__delete(postfix)
+        del self.__sorted[bisect_left(self.__sorted, entry)]
+
+    def update(self, added=(), removed=()):
+        """
+        Adds and removes several postfixes at once.  Large updates
+        rebuild the sorted array in one go instead of shifting it for
+        every single postfix.
+
+        Raises ValueError if any of the removed postfixes is not in the
+        index.
+        """
+
+        added = list(added)
+        removed = list(removed)
+
+        if len(added) + len(removed) < _BULK_UPDATE_THRESHOLD:
+            for postfix in removed:
+                self.remove(postfix)
+            for postfix in added:
+                self.add(postfix)
+            return
+
+        removedEntries = set(self.__delete(postfix) for postfix in removed)
+        if removedEntries:
+            self.__sorted = [
+                entry for entry in self.__sorted
+                if entry not in removedEntries
+            ]
+        self.__sorted.extend(self.__insert(postfix) for postfix in added)
+        self.__sorted.sort()
+
+    def setPostfixes(self, postfixes):
+        """
+        Makes the index contain exactly the given postfixes.  Only the
+        difference against the current content is applied.
+        """
+
+        counts = {}
+        for postfix in postfixes:
+            counts[postfix] = counts.get(postfix, 0) + 1
+
+        removed = []
+        for postfix, ids in self.__ids.iteritems():
+            removed.extend([postfix] * (len(ids) - counts.get(postfix, 0)))
+
+        added = []
+        for postfix, count in counts.iteritems():
+            added.extend([postfix] * (count - len(self.__ids.get(postfix, ()))))
+
+        self.update(added, removed)
+
+    def candidates(self, text, anchored=False):
+        """
+        Returns a list of the postfixes whose normalized form contains
+        the normalized text; if anchored is True, only the postfixes
+        whose normalized form starts with it are returned.
+
+        The list is unordered and can contain false positives with
+        respect to the exact matching rules, but never misses a
+        postfix that would match.
+        """
+
+        query = normalize(text)
+        postfixes = self.__postfixes
+
+        if anchored:
+            sortedEntries = self.__sorted
+            result = []
+            i = bisect_left(sortedEntries, (query,))
+            end = len(sortedEntries)
+            while i < end:
+                normalized, postfixId = sortedEntries[i]
+                if not normalized.startswith(query):
+                    break
+                result.append(postfixes[postfixId])
+                i += 1
+            return result
+
+        if not query:
+            return postfixes.values()
+
+        normalizedItems = self.__normalized
+        if len(query) < NGRAM_LENGTH:
+            return [
+                postfixes[postfixId]
+                for postfixId, normalized in normalizedItems.iteritems()
+                if query in normalized
+            ]
+
+        ngramsIndex = self.__ngrams
+        postings = []
+        for ngram in _ngrams(query):
+            ids = ngramsIndex.get(ngram)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+
+        ids = postings[0].intersection(*postings[1:])
+        return [
+            postfixes[postfixId]
+            for postfixId in ids
+            if query in normalizedItems[postfixId]
+        ]
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod()
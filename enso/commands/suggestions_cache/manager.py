@@ -34,7 +34,10 @@
 # ----------------------------------------------------------------------------
 
 """
-    The CommandManager singleton.
+    The suggestions CacheManager singleton.
+
+    The cached suggestions are persisted in a single SQLite database,
+    keyed by the cache id and the query, with an expiration time.
 """
 
 __updated__ = "2017-02-23"
@@ -43,26 +46,42 @@ __updated__ = "2017-02-23"
 # Imports
 # ----------------------------------------------------------------------------
 
+import atexit
 import logging
 import os
+import shutil
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from ctypes import c_ulong
 from glob import glob
-from os import makedirs
-from os.path import exists as path_exists, getmtime, isfile, join as path_join
+from os.path import basename, dirname, getmtime, join as path_join
+from Queue import Queue
+from sys import getsizeof
 
 import enso.providers
 from enso.events import EventManager
-from enso.utils.memoize import lru_cache
 
 
 DISK_CACHING = True
 MAX_CACHE_AGE = 60 * 60 * 12
 
+# Default limits of the in-memory caches
+DEFAULT_MAX_ITEMS = 1000
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+
+# Limits of the in-memory caches by cache_id, as
+# {cache_id: (max_items, max_bytes)}; see CacheManager.configure_cache().
+CACHE_LIMITS = {}
+
 # The directory path for cached google results
 CACHE_DIR = path_join(
     enso.providers.get_interface("system").get_enso_cache_dir(), "suggestions")
 
+# The database file holding the cached results of all caches
+CACHE_DB_FILE = path_join(CACHE_DIR, "suggestions.sqlite")
+
 CACHE_SESSIONS = {}
 
 
@@ -70,17 +89,6 @@ if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR, 0o744)
 
 
-def maybe_clean_cache():
-    """Delete all .cache files in the cache directory that are older than 12 hours."""
-    now = time.time()
-    for fname in glob(path_join(CACHE_DIR, "*", "*", "*.cache")):
-        if now > getmtime(fname) + MAX_CACHE_AGE:
-            os.remove(fname)
-
-# Clean the CACHEDIR once in a while
-maybe_clean_cache()
-
-
 def sdbm_l_hash(L):
     h = 0
     for c in L:
@@ -88,29 +96,21 @@ def sdbm_l_hash(L):
     return h
 
 
-def cached_file_name(search_params):
-    #sha = hashlib.sha256()
-    # Make a unique file name based on the values of the google search parameters.
-    # sha.update(search_params.encode())
-    return '%s.%s' % (str(sdbm_l_hash(search_params)), "cache")
-
-
-@lru_cache()
-def ensure_cache_dir_exists(cache_id):
-    assert isinstance(cache_id, basestring) and cache_id.isalnum()
-    complete_cache_dir = path_join(CACHE_DIR, cache_id)
-    if not path_exists(complete_cache_dir):
-        makedirs(complete_cache_dir, 0o744)
-    for i in range(10):
-        cache_subdir = path_join(complete_cache_dir, str(i))
-        if not path_exists(cache_subdir):
-            makedirs(cache_subdir, 0o744)
-    return complete_cache_dir
+def key_hash(search_params):
+    """
+    Returns the hash of the cache key, as a string.  It is the name of
+    the file the key was cached in by the former file-per-key cache.
+    """
+    return str(sdbm_l_hash(search_params))
 
 
-def write_list_to_cache_file(fname, lst):
-    with open(fname, "wb") as f:
-        f.write(u"\n".join(lst).encode("UTF-8"))
+def key_text(key):
+    """
+    Returns the cache key as unicode, as stored in the database.
+    """
+    if isinstance(key, str):
+        return key.decode("UTF-8", "replace")
+    return key
 
 
 def read_list_from_cache_file(fname):
@@ -119,79 +119,347 @@ def read_list_from_cache_file(fname):
         return txt.splitlines()
 
 
+# ----------------------------------------------------------------------------
+# The cache store
+# ----------------------------------------------------------------------------
+
+class CacheStore(object):
+    """
+    Persists the cached lists of all caches in one SQLite database.
+
+    Each row is keyed by the cache id and the hash of the key (see
+    key_hash()); the key itself is stored along to tell apart hash
+    collisions, except for the rows imported from the former
+    file-per-key cache, whose keys are not known.  Every row has an
+    expiration time, and the expired rows are deleted in bulk when the
+    store is opened.
+
+    The store can be used from several threads.
+    """
+
+    # Incremented on incompatible schema changes; stored in the
+    # database as "PRAGMA user_version".
+    SCHEMA_VERSION = 1
+
+    def __init__(self, filename, max_age=MAX_CACHE_AGE):
+        self.__filename = filename
+        self.__max_age = max_age
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(
+            filename, check_same_thread=False)
+        with self.__lock:
+            self.__initialize()
+        self.expire()
+
+    def __initialize(self):
+        """
+        Creates the schema, and imports the files of the former
+        file-per-key cache, if not done yet.
+        """
+
+        connection = self.__connection
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == self.SCHEMA_VERSION:
+            return
+
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS cache")
+            connection.execute(
+                "CREATE TABLE cache ("
+                " cache_id TEXT NOT NULL,"
+                " key_hash TEXT NOT NULL,"
+                " key TEXT,"
+                " data TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (cache_id, key_hash))")
+            connection.execute(
+                "CREATE INDEX cache_expires ON cache (expires)")
+            self.__importCacheFiles(dirname(self.__filename))
+            connection.execute(
+                "PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+
+    def __importCacheFiles(self, cache_dir):
+        """
+        Imports the unexpired files of the former file-per-key cache,
+        i.e., <cache_dir>/<cache_id>/<0-9>/<key hash>.cache, and
+        removes the files.
+        """
+
+        now = time.time()
+        rows = []
+        for fname in glob(path_join(cache_dir, "*", "*", "*.cache")):
+            try:
+                expires = getmtime(fname) + self.__max_age
+                if expires > now:
+                    cache_id = basename(dirname(dirname(fname)))
+                    rows.append((
+                        cache_id,
+                        basename(fname)[:-len(".cache")],
+                        u"\n".join(read_list_from_cache_file(fname)),
+                        expires))
+            except Exception as e:
+                logging.error(
+                    "Error importing suggestions cache file %s: %s", fname, e)
+
+        self.__connection.executemany(
+            "INSERT OR REPLACE INTO cache (cache_id, key_hash, key, data, expires) "
+            "VALUES (?, ?, NULL, ?, ?)", rows)
+
+        for cache_dir in glob(path_join(cache_dir, "*", "")):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def get(self, cache_id, key):
+        """
+        Returns the unexpired list stored under key, or None.
+        """
+
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT key, data FROM cache"
+                " WHERE cache_id = ? AND key_hash = ? AND expires > ?",
+                (cache_id, key_hash(key), time.time())).fetchone()
+        if row is None or (row[0] is not None and row[0] != key_text(key)):
+            return None
+        return row[1].splitlines()
+
+    def put_many(self, cache_id, items):
+        """
+        Stores the (key, list) items in a single transaction.
+        """
+
+        expires = time.time() + self.__max_age
+        rows = [(cache_id, key_hash(key), key_text(key), u"\n".join(value),
+                 expires)
+                for key, value in items]
+        with self.__lock:
+            with self.__connection:
+                self.__connection.executemany(
+                    "INSERT OR REPLACE INTO cache"
+                    " (cache_id, key_hash, key, data, expires)"
+                    " VALUES (?, ?, ?, ?, ?)", rows)
+
+    def expire(self):
+        """
+        Deletes all the expired lists.
+        """
+
+        with self.__lock:
+            with self.__connection:
+                self.__connection.execute(
+                    "DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+
+# ----------------------------------------------------------------------------
+# The write-behind writer
+# ----------------------------------------------------------------------------
+
+class CacheWriter(object):
+    """
+    Writes the cached lists to the store on a background thread, so
+    that persisting the caches does not block the caller.
+
+    The pending writes are flushed at exit.
+    """
+
+    def __init__(self):
+        self.__queue = Queue()
+        self.__thread = None
+        self.__lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def write(self, store, cache_id, items):
+        """
+        Schedules the (key, list) items to be stored.
+        """
+
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__run, name="SuggestionsCacheWriter")
+                self.__thread.setDaemon(True)
+                self.__thread.start()
+        self.__queue.put((store, cache_id, items))
+
+    def flush(self):
+        """
+        Waits until all the scheduled items are written.
+        """
+
+        if self.__thread is not None:
+            self.__queue.join()
+
+    def __run(self):
+        while True:
+            store, cache_id, items = self.__queue.get()
+            try:
+                store.put_many(cache_id, items)
+            except Exception as e:
+                logging.error(
+                    "Error persisting suggestions cache '%s': %s", cache_id, e)
+            finally:
+                self.__queue.task_done()
+
+
 # ----------------------------------------------------------------------------
 # The cache
 # ----------------------------------------------------------------------------
 
+def estimate_size(key, value):
+    """
+    Returns the approximate memory size of a cached (key, list) item,
+    in bytes.
+    """
+    return (getsizeof(key) + getsizeof(value)
+            + sum(getsizeof(item) for item in value))
+
+
 class Cache(object):
+    """
+    In-memory LRU cache of lists, backed by the store.
+
+    The cache holds at most max_items items, taking at most max_bytes
+    bytes (see estimate_size()); the least recently used items are
+    evicted first.  The newly set items are written to the store by
+    persist(), or when they are evicted.
 
-    def __init__(self, cache_id):
+    The cache can be used from several threads.
+    """
+
+    def __init__(self, cache_id, store=None, writer=None,
+                 max_items=DEFAULT_MAX_ITEMS, max_bytes=DEFAULT_MAX_BYTES):
         self.cache_id = cache_id
-        self.__cache = {}
+        self.__store = store
+        self.__writer = writer
+        self.__lock = threading.Lock()
+        # key -> (value, size), least recently used first
+        self.__cache = OrderedDict()
+        self.__bytes = 0
+        # Keys set since the last persist()
+        self.__dirty = set()
+
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
+        # Statistics
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get_object(self, key, default=None):
-        if key in self.__cache:
-            # print "Getting memory cached object for '%s'" % (key)
-            return self.__cache[key]
-
-        if not DISK_CACHING:
+        with self.__lock:
+            item = self.__cache.pop(key, None)
+            if item is not None:
+                # Move to the most recently used end
+                self.__cache[key] = item
+                self.hits += 1
+                # print "Getting memory cached object for '%s'" % (key)
+                return item[0]
+
+        if self.__store is None:
+            self.misses += 1
             return default
 
-        # return self._caches.get(key, [])
-        cache_dir = ensure_cache_dir_exists(self.cache_id)
+        try:
+            result = self.__store.get(self.cache_id, key)
+        except Exception as err:
+            logging.error(
+                "Error reading suggestions cache for '%s': %s", key, err)
+            result = None
 
-        fname = cached_file_name(key)
-        fname = path_join(cache_dir, fname[0], fname)
-        if not isfile(fname):
+        if result is None:
             # print "No cached object for '%s'" % (key)
+            self.misses += 1
             return default
 
-        try:
-            # If the cached file is older than 12 hours, return False and thus
-            # make a new fresh request.
-            modtime = getmtime(fname)
-            if (time.time() - modtime) / 60 / 60 > 12:
-                # print "No cached object for '%s'" % (key)
-                return default
-
-            result = read_list_from_cache_file(fname)
-
-            # print result
-            self.__cache[key] = result
-            # print "Getting file cached for '%s'" % (key)
-            return result
-        except Exception as err:
-            print key, err
-
-        # print "No cached object for '%s'" % (key)
-        return default
+        self.store_hits += 1
+        with self.__lock:
+            if key not in self.__cache:
+                self.__add(key, result)
+        return result
 
     def set_object(self, key, value):
         # print "Caching object for '%s' in memory" % (key)
-        self.__cache[key] = value
+        with self.__lock:
+            self.__remove(key)
+            # Dirty before adding, so that the item is written if it
+            # gets evicted right away (e.g., it is larger than max_bytes)
+            self.__dirty.add(key)
+            self.__add(key, value)
+
+    def configure(self, max_items=None, max_bytes=None):
+        with self.__lock:
+            if max_items is not None:
+                self.max_items = max_items
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self.__evict()
+
+    def get_stats(self):
+        """
+        Returns a dictionary of the cache statistics.
+        """
+
+        return {
+            "items": len(self.__cache),
+            "bytes": self.__bytes,
+            "max_items": self.max_items,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
 
     def persist(self):
-        if len(self.__cache) == 0:
-            return
+        """
+        Schedules the items set since the last call to be written to
+        the store.
+        """
 
-        if not DISK_CACHING:
-            return
+        with self.__lock:
+            items = [(key, self.__cache[key][0]) for key in self.__dirty]
+            self.__dirty.clear()
+        self.__write(items)
+
+    def __add(self, key, value):
+        size = estimate_size(key, value)
+        self.__cache[key] = (value, size)
+        self.__bytes += size
+        self.__evict()
 
-        # Flush memory cache to disk and purge memory cache
-        cache_dir = ensure_cache_dir_exists(self.cache_id)
-        # print "Persisting cache '%s' into %s (%d items)" % (self.cache_id,
-        # cache_dir, len(self.__cache))
-        for key, value in self.__cache.items()[:]:
-            fname = cached_file_name(key)
-            fname = path_join(cache_dir, fname[0], fname)
-            # Already saved
+    def __remove(self, key):
+        item = self.__cache.pop(key, None)
+        if item is not None:
+            self.__bytes -= item[1]
+
+    def __evict(self):
+        """
+        Evicts the least recently used items until the limits are met.
+        The evicted items that were not persisted yet are written.
+        """
+
+        evicted = []
+        while self.__cache and (len(self.__cache) > self.max_items
+                                or self.__bytes > self.max_bytes):
+            key, (value, size) = self.__cache.popitem(last=False)
+            self.__bytes -= size
+            self.evictions += 1
+            if key in self.__dirty:
+                self.__dirty.discard(key)
+                evicted.append((key, value))
+        self.__write(evicted)
+
+    def __write(self, items):
+        if not items or self.__store is None:
+            return
+        if self.__writer is not None:
+            self.__writer.write(self.__store, self.cache_id, items)
+        else:
             try:
-                if not path_exists(fname):
-                    write_list_to_cache_file(fname, value)
+                self.__store.put_many(self.cache_id, items)
             except Exception as e:
                 logging.error(e)
-            else:
-                del self.__cache[key]
 
 
 # ----------------------------------------------------------------------------
@@ -220,6 +488,16 @@ class CacheManager(object):
         """
         self._current_session_id = None
         self.__caches = {}
+        self.__lock = threading.Lock()
+        self.__writer = CacheWriter()
+        self.__store = None
+        if DISK_CACHING:
+            try:
+                self.__store = CacheStore(CACHE_DB_FILE)
+            except Exception as e:
+                logging.error(
+                    "Error opening the suggestions cache %s: %s",
+                    CACHE_DB_FILE, e)
         self.__eventManager = EventManager.get()
         self.__eventManager.registerResponder(
             self._onEndQuasimode, "endQuasimode")
@@ -230,15 +508,64 @@ class CacheManager(object):
         assert session_id is None or isinstance(session_id, basestring)
         assert isinstance(data, list)
 
-        self.__caches.setdefault(
-            cache_id, Cache(cache_id)).set_object(key, data)
+        self.__get_cache(cache_id).set_object(key, data)
 
     def get_data(self, key, cache_id, session_id=None):
         assert isinstance(key, basestring)
         assert isinstance(cache_id, basestring) and cache_id.isalnum()
         assert session_id is None or isinstance(session_id, basestring)
 
-        return self.__caches.setdefault(cache_id, Cache(cache_id)).get_object(key, [])
+        return self.__get_cache(cache_id).get_object(key, [])
+
+    def configure_cache(self, cache_id, max_items=None, max_bytes=None):
+        """
+        Sets the limits of the in-memory cache for cache_id; None keeps
+        the current (or default) limit.
+        """
+        assert isinstance(cache_id, basestring) and cache_id.isalnum()
+
+        with self.__lock:
+            limits = CACHE_LIMITS.get(
+                cache_id, (DEFAULT_MAX_ITEMS, DEFAULT_MAX_BYTES))
+            CACHE_LIMITS[cache_id] = (
+                limits[0] if max_items is None else max_items,
+                limits[1] if max_bytes is None else max_bytes)
+            cache = self.__caches.get(cache_id)
+        if cache is not None:
+            cache.configure(*CACHE_LIMITS[cache_id])
+
+    def get_stats(self):
+        """
+        Returns the statistics of the in-memory caches, as
+        {cache_id: {"hits": ..., "store_hits": ..., "misses": ...,
+        "evictions": ..., "items": ..., "bytes": ..., ...}}.
+        """
+
+        with self.__lock:
+            caches = self.__caches.items()
+        return dict((cache_id, cache.get_stats())
+                    for cache_id, cache in caches)
+
+    def flush(self):
+        """
+        Persists all the caches and waits until they are written.
+        """
+
+        self._onEndQuasimode()
+        self.__writer.flush()
+
+    def __get_cache(self, cache_id):
+        cache = self.__caches.get(cache_id)
+        if cache is None:
+            with self.__lock:
+                cache = self.__caches.get(cache_id)
+                if cache is None:
+                    max_items, max_bytes = CACHE_LIMITS.get(
+                        cache_id, (DEFAULT_MAX_ITEMS, DEFAULT_MAX_BYTES))
+                    cache = self.__caches[cache_id] = Cache(
+                        cache_id, self.__store, self.__writer,
+                        max_items, max_bytes)
+        return cache
 
     def get_session_cache(self, session_id):
         assert session_id is None or isinstance(session_id, basestring)
@@ -256,6 +583,9 @@ class CacheManager(object):
         pass
 
     def _onEndQuasimode(self):
-        # Flush memory cache to disk on quasimode end
-        for cache in self.__caches.itervalues():
+        # Write the new cached objects to disk on quasimode end; the
+        # writing itself happens on the writer thread.
+        with self.__lock:
+            caches = self.__caches.values()
+        for cache in caches:
             cache.persist()
@@ -52,6 +52,17 @@ QUASIMODE_SUGGESTION_DELAY = 0.2
 # The maximum number of suggestions to display in the quasimode.
 QUASIMODE_MAX_SUGGESTIONS = 6
 
+# Retrieve the quasimode suggestions on a worker thread.  The typed
+# text and the auto-completion are drawn immediately, and the
+# suggestions are filled in when they are ready, so that slow commands
+# don't hold up the drawing of the quasimode.
+QUASIMODE_ASYNC_SUGGESTIONS = False
+
+# Trace the latency of each keystroke typed in the quasimode, from its
+# arrival until the quasimode is drawn; see the 'quasimode latency'
+# command.
+QUASIMODE_LATENCY_TRACING = False
+
 # The minimum number of characters the user must type before the
 # auto-completion mechanism engages.
 QUASIMODE_MIN_AUTOCOMPLETE_CHARS = 2
@@ -118,6 +129,11 @@ ABOUT_MSG_XML = u"<p><command>Enso</command></p>" \
     "<p>https://github.com/blackdaemon/enso-launcher-continued</p>" \
     % ("Version[local]: %s</p><p>Version[remote]: %s" % (VERSION_LOCAL, VERSION_REMOTE) if VERSION_LOCAL else "Version: %s" % VERSION_REMOTE)
 
+# Lay out the primary and mini messages on a worker thread.  Messages
+# are then shown once they are laid out, so that long messages don't
+# hold up the handling of the keyboard.
+MESSAGES_ASYNC_LAYOUT = False
+
 # Message XML displayed when the mouse hovers over a mini message.
 MINI_MSG_HELP_XML = "<p>The <command>hide mini messages</command>" \
     " and <command>put</command> commands control" \
@@ -148,6 +164,7 @@ PLUGINS = [
     "enso.contrib.websearch",
     "enso.contrib.evaluate",
     "enso.contrib.minimessages",
+    "enso.contrib.profiling",
     "enso.contrib.recentresults",
     "enso.contrib.calc",
     "enso.contrib.open",
@@ -347,5 +364,9 @@ ASYNCHRONOUS_OPEN_SHORTCUTS_REFRESH = (CURRENT_PLATFORM != PLATFORM_NAME_WINDOWS
 
 DEBUG_REPORT_TIMINGS = False
 
+# Collect the time each event responder takes, from the start; see
+# the "profile events" command.
+PROFILE_EVENT_DISPATCH = False
+
 # apiKey for https://free.currencyconverterapi.com/
 CURRENCY_CONVERTER_API_KEY = None
@@ -39,7 +39,6 @@
 
 import logging  # @UnusedImport
 import re
-import itertools
 
 from xml.sax.saxutils import escape as xml_escape
 
@@ -57,12 +56,15 @@ from enso.contrib.websearch import LOCAL_TLD, HTTP_HEADERS
 from text2num import text2num, format_number_local
 from enso.commands.interfaces import AbstractCommandFactory
 from enso.commands.mixins import CommandParameterWebSuggestionsMixin
+from enso.events import EventManager
+from enso.messages import MessageManager, ConditionMiniMessage
 from enso.utils import suppress
 import urllib2
 import urllib
 import locale
 import threading
 from contextlib import closing
+from multiprocessing.pool import ThreadPool
 from enso.utils.html_tools import strip_html_tags
 try:
     import ujson as jsonlib
@@ -73,6 +75,20 @@ except ImportError as e:
     
 ensoapi = EnsoApi()
 
+# Multi-line selections with at least this many expressions (other than
+# plain numbers) are calculated on a background thread, showing a
+# mini-message meanwhile
+BATCH_BACKGROUND_EXPRESSIONS = 200
+
+# Number of threads calculating the expressions of a multi-line
+# selection. The parser is pure Python and holds the GIL, so more
+# threads only pay off with a GIL-free interpreter.
+BATCH_WORKERS = 1
+
+# A line holding just a number, e.g. "-1,234.5" or "6.02e23"
+RE_PLAIN_NUMBER = re.compile(
+    r"^[-+]?(?:[0-9]{1,3}(?:,[0-9]{3})+|[0-9]+)(?:\.[0-9]*)?(?:[eE][-+]?[0-9]+)?$")
+
 
 def _replace_special_unicode_chars(expr):
     expr = expr.replace(u"\N{MINUS SIGN}", "-")
@@ -238,25 +254,11 @@ def cmd_calculate(ensoapi, expression=None):
 
     """
     if expression.count("\n"):
-        new_lines = []
-        total = 0
-        for line in expression.split("\n"):
-            leading_whitespace = "".join(s for s in itertools.takewhile(str.isspace, line))
-            try:
-                result, expr = fourfn.evaluate(line.strip())
-                new_lines.append(u"%s%s" % (leading_whitespace, unicode(result)))
-                total += long(result)
-            except ZeroDivisionError as e:
-                logging.warning(e)
-                new_lines.append(line.rstrip())
-            except ArithmeticError as e:
-                logging.warning(e)
-                new_lines.append(line.rstrip())
-            except Exception as e:
-                logging.warning(e)
-                new_lines.append(line.rstrip())
-        expression = " +\n".join(new_lines) + "\n"
-        result = total
+        lines = expression.split("\n")
+        if _count_expressions(lines) >= BATCH_BACKGROUND_EXPRESSIONS:
+            _calculate_lines_in_background(lines, got_selection)
+            return None, None
+        expression, result = _format_lines(lines, calculate_lines(lines))
         append_result = True
     else:
         try:
@@ -271,6 +273,16 @@ def cmd_calculate(ensoapi, expression=None):
             logging.warning(e)
             return str(e), expression
 
+    _show_result(expression, result, got_selection, append_result)
+    return result, unicode(expression)
+
+
+def _show_result(expression, result, got_selection, append_result):
+    """
+    Pastes the result over the selection, if the expression was
+    selected, and shows it in a message.
+    """
+
     pasted = False
     if got_selection:
         if append_result:
@@ -296,7 +308,138 @@ def cmd_calculate(ensoapi, expression=None):
         #if paste_command:
         #    paste_command.update_pastings({".calculation result" : unicode(result)})
     """
-    return result, unicode(expression)
+
+
+def _parse_plain_number(line):
+    """
+    Returns the value of the line matching RE_PLAIN_NUMBER, as the
+    parser would, or None if it is too large to be summed.
+    """
+    number = line.replace(",", "")
+    try:
+        return long(number)
+    except ValueError:
+        value = float(number)
+    try:
+        long(value)
+    except OverflowError as e:
+        logging.warning(e)
+        return None
+    return value
+
+
+def _calculate_line(evaluator, line):
+    """
+    Returns the value of the expression on the line of a multi-line
+    selection, or None if the line is not a valid expression or its
+    value is not a number.
+    """
+    try:
+        result, _ = evaluator.evaluate(line)
+        # Only the numbers can be summed
+        long(result)
+        return result
+    except Exception as e:
+        logging.warning(e)
+        return None
+
+
+def _count_expressions(lines):
+    return sum(
+        1 for line in lines
+        if line.strip() and not RE_PLAIN_NUMBER.match(line.strip())
+    )
+
+
+def calculate_lines(lines, workers=BATCH_WORKERS):
+    """
+    Calculates the lines of a multi-line selection.  Returns the list
+    of their values, None for the lines which are not valid
+    expressions.
+
+    The lines holding just a number, e.g. a spreadsheet column, are
+    converted directly; only the other lines are parsed, by a thread
+    pool if workers is greater than 1.
+    """
+    values = [None] * len(lines)
+    expressions = []
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        elif RE_PLAIN_NUMBER.match(line):
+            values[index] = _parse_plain_number(line)
+        else:
+            expressions.append((index, line))
+
+    if expressions:
+        # An evaluator of its own, not to push the expressions typed in
+        # the quasimode out of the cache of the default one
+        evaluator = fourfn.Evaluator()
+        expression_lines = [line for _, line in expressions]
+        if workers < 2 or len(expressions) < 2:
+            results = [_calculate_line(evaluator, line)
+                       for line in expression_lines]
+        else:
+            pool = ThreadPool(min(workers, len(expressions)))
+            try:
+                results = pool.map(
+                    lambda line: _calculate_line(evaluator, line),
+                    expression_lines)
+            finally:
+                pool.terminate()
+        for (index, _), result in zip(expressions, results):
+            values[index] = result
+    return values
+
+
+def _format_lines(lines, values):
+    """
+    Returns the (expression, result) of a multi-line selection: the
+    lines with the expressions replaced by their values, joined by
+    "+", and the total.
+    """
+    new_lines = []
+    for line, value in zip(lines, values):
+        if value is None:
+            new_lines.append(line.rstrip())
+        else:
+            leading_whitespace = line[:len(line) - len(line.lstrip())]
+            new_lines.append(u"%s%s" % (leading_whitespace, unicode(value)))
+    total = sum(long(value) for value in values if value is not None)
+    return " +\n".join(new_lines) + "\n", total
+
+
+def _calculate_lines_in_background(lines, got_selection):
+    """
+    Calculates a large multi-line selection on a background thread, so
+    that Enso doesn't freeze meanwhile, and shows the result on the
+    main thread when done.
+    """
+    done = threading.Event()
+    MessageManager.get().newMessage(ConditionMiniMessage(
+        miniXml=u"<p>Calculating %s lines\u2026</p>"
+        % format_number_local(len(lines)),
+        is_finished_func=done.is_set
+    ))
+
+    def show_result(values):
+        done.set()
+        expression, result = _format_lines(lines, values)
+        _show_result(expression, result, got_selection, True)
+
+    def calculate():
+        try:
+            values = calculate_lines(lines)
+        except Exception as e:
+            logging.error(e)
+            EventManager.get().callLater(0, done.set)
+        else:
+            EventManager.get().callLater(0, show_result, values)
+
+    thread = threading.Thread(target=calculate)
+    thread.daemon = True
+    thread.start()
 
 
 class CalculateCommandFactory(CommandParameterWebSuggestionsMixin, ArbitraryPostfixFactory):
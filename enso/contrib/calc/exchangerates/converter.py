@@ -51,6 +51,7 @@ import locale
 import logging
 import os
 import re
+import struct
 import subprocess
 import sys
 import time
@@ -80,6 +81,7 @@ from enso.contrib.calc.ipgetter import myip
 from enso.net import inetcache
 from enso.contrib.calc.ipgetter import myip
 from enso.contrib.calc.exchangerates import inflation
+from enso.contrib.calc.exchangerates.ratesnapshot import RatesSnapshot
 
 __all__ = [
     'get_home_currency',
@@ -87,6 +89,7 @@ __all__ = [
     'guess_home_currency',
     'get_currency_rates',
     'convert_currency',
+    'convert_many',
 ]
 
 
@@ -132,6 +135,8 @@ CACHE_DIR = os.path.expanduser(u"~/.cache/enso/cmd_calculate")
 if not os.path.isdir(CACHE_DIR):
     os.makedirs(CACHE_DIR)
 RATES_FILENAME = os.path.join(CACHE_DIR, "rates.csv")
+# Binary snapshot of the rates, written by the updater along with the CSV
+RATES_SNAPSHOT_FILENAME = os.path.join(CACHE_DIR, "rates.bin")
 
 _dir_monitor = None
 _file_changed_event_handler = None
@@ -192,97 +197,92 @@ class ExchangeRates(object):
                 logging.error(e)
 
     def __init__(self):
-        self.exchange_rates = {}
-        self.updated_on = 0
+        self.snapshot = RatesSnapshot([], [])
+        # (snapshot, exchange_rates dict) of the last exchange_rates call
+        self._exchange_rates = (None, None)
 
-        self.parse_rates_file(RATES_FILENAME)
-        try:
-            self.rates_file_mtime = os.path.getmtime(RATES_FILENAME)
-        except IOError:
-            self.rates_file_mtime = 0
+        self.load_snapshot()
 
         self._file_changed_event_handler = ExchangeRates._FileChangedEventHandler(
-            [RATES_FILENAME],
+            [RATES_FILENAME, RATES_SNAPSHOT_FILENAME],
             self.rates_file_updated
         )
         self._dir_monitor = DirectoryChangeObserver()
         self._dir_monitor.schedule(self._file_changed_event_handler, CACHE_DIR, recursive=False)
         self._dir_monitor.start()
 
+    @property
+    def exchange_rates(self):
+        """
+        Currency code -> {"name", "rate", "updated"} dictionary of the
+        current snapshot.
+        """
+        snapshot, exchange_rates = self._exchange_rates
+        if snapshot is not self.snapshot:
+            snapshot = self.snapshot
+            updated = snapshot.get_updated() or 0
+            exchange_rates = dict(
+                (code, {
+                    "name": code,
+                    "rate": snapshot.get_rate(code),
+                    "updated": updated
+                })
+                for code in snapshot.codes
+            )
+            self._exchange_rates = (snapshot, exchange_rates)
+        return exchange_rates
+
     def rates_file_updated(self, event):
-        if self.updated_on != os.path.getmtime(RATES_FILENAME):
-            self.parse_rates_file(RATES_FILENAME)
+        self.load_snapshot()
 
-    def parse_rates_file(self, filename):
-        updates = 0
-        try:
-            with open(filename, "r") as fd:
-                mtime = os.path.getmtime(filename)
-                for line in fd:
-                    if not line:
-                        continue
-                    symbol, definition = self.parse_rate(line, mtime)
-                    if symbol and definition:
-                        self.exchange_rates[symbol] = definition
-                        updates += 1
-        except Exception as e:
-            logging.error(e)
-        else:
-            if updates:
-                self.updated_on = os.path.getmtime(filename)
-                logging.info("Currency exchange rates updated for %d currencies on %s",
-                             updates,
-                             time.ctime(self.updated_on)
-                             )
-
-    def parse_rate(self, ratedef, update_ts=None):
-        symbol = None
+    def load_snapshot(self):
+        """
+        Maps the snapshot of the rates, re-creating it from the rates
+        file if the snapshot is missing or older, and swaps it with the
+        current one.
+        """
         try:
-            symbol, rate_s = ratedef.strip().split(",")
+            csv_mtime = os.path.getmtime(RATES_FILENAME)
+        except OSError:
+            csv_mtime = 0
+        if self.snapshot.updated and self.snapshot.updated == csv_mtime:
+            return
+
+        snapshot = None
+        if os.path.isfile(RATES_SNAPSHOT_FILENAME):
             try:
-                rate = float(rate_s)
-            except ValueError, e:
-                logging.warn(
-                    "Currency exchange rate returned for code '%s' is not parseable: %s",
-                    str(symbol), rate_s)
-                rate = float(0)
-            # TODO: This service does not provide date/time
-            last_date = "N/A"
-            last_date = last_date.strip("\"")
-            updated = None
-            if last_date != "N/A":
-                #last_datetime = "%s %s" % (last_date, last_time)
-                #updated = datetime.strptime(last_datetime, "%m/%d/%Y %I:%M%p")
-
-                month, day, year = map(int, last_date.split("/"))
-                # TODO: This service does not provide date/time
-                last_time = "N/A"
-                last_time = last_time.strip("\"")
-                if last_time != "N/A":
-                    hour, minute = last_time.split(":")
-                    hour = int(hour)
-                    if minute.endswith("pm"):
-                        if hour < 12:
-                            hour += 12
-                    minute = int(minute[:-2])
-                updated = datetime(year, month, day, hour, minute)
-            #name = self.exchange_rates.get(symbol, {"name":None})["name"]
-            if rate == 0.0:
+                snapshot = RatesSnapshot.load(RATES_SNAPSHOT_FILENAME)
+            except (EnvironmentError, ValueError, struct.error) as e:
                 logging.warning(
-                    "Currency exchange data returned for code '%s' unhandled; empty data received.",
-                    symbol
-                )
-            return symbol, {
-                #"name":name,
-                "name": symbol,
-                "rate": rate,
-                "updated": updated if updated else datetime.fromtimestamp(update_ts) if update_ts else 0
-            }
-        except Exception as e:
-            logging.error(
-                "Currency exchange data returned for code '%s' are not parseable: %s",
-                str(symbol), e)
-            return None, None
+                    "Error reading currency exchange rates snapshot %s: %s",
+                    RATES_SNAPSHOT_FILENAME, e)
+            else:
+                if csv_mtime and snapshot.updated != csv_mtime:
+                    snapshot = None
+
+        if snapshot is None:
+            if not csv_mtime:
+                return
+            try:
+                snapshot = RatesSnapshot.from_csv(RATES_FILENAME)
+            except Exception as e:
+                logging.error(e)
+                return
+            try:
+                snapshot.save(RATES_SNAPSHOT_FILENAME)
+            except EnvironmentError as e:
+                logging.warning(
+                    "Error saving currency exchange rates snapshot %s: %s",
+                    RATES_SNAPSHOT_FILENAME, e)
+
+        if not len(snapshot):
+            return
+        # Atomic swap; readers still holding the old snapshot keep using it
+        self.snapshot = snapshot
+        logging.info("Currency exchange rates updated for %d currencies on %s",
+                     len(snapshot),
+                     time.ctime(snapshot.updated)
+                     )
 
 
 RATES = ExchangeRates()
@@ -307,7 +307,7 @@ partial_currency_re = re.compile(
 def is_supported_currency(iso):
     if not iso:
         return False
-    return iso.upper() in RATES.exchange_rates
+    return iso.upper() in RATES.snapshot
 
 
 def guess_home_currency():
@@ -414,53 +414,53 @@ def set_home_currency(curr):
         config.write(fp)
 
 
-def _raw_convert(amount, from_curr, to_curr):
-    global RATES
+def _raw_convert(amount, from_curr, to_curr, snapshot=None):
+    if snapshot is None:
+        snapshot = RATES.snapshot
 
-    result = None
-    rate = None
-    rate_updated = None
-    unknown_rates = []
+    results, rate, unknown_rates = snapshot.convert_many(
+        (amount,), from_curr, to_curr)
+    if results is None:
+        return None, rate, None, unknown_rates
+    return results[0], rate, snapshot.get_updated(), unknown_rates
 
-    if from_curr == "EUR":
-        if RATES.exchange_rates[to_curr]["rate"] == 0:
-            unknown_rates.append(to_curr)
-        else:
-            rate = RATES.exchange_rates[to_curr]["rate"]
-            rate_updated = RATES.exchange_rates[to_curr]["updated"]
-            result = rate * amount
-    elif to_curr == "EUR":
-        if RATES.exchange_rates[from_curr]["rate"] == 0:
-            unknown_rates.append(from_curr)
-        else:
-            rate = 1 / RATES.exchange_rates[from_curr]["rate"]
-            rate_updated = RATES.exchange_rates[to_curr]["updated"]
-            result = rate * amount
-    else:
-        # How to correctly calculate this?
-        if RATES.exchange_rates[from_curr]["rate"] == 0:
-            unknown_rates.append(from_curr)
-        if RATES.exchange_rates[to_curr]["rate"] == 0:
-            unknown_rates.append(to_curr)
-        if not unknown_rates:
-            in_eur = amount / RATES.exchange_rates[from_curr]["rate"]
-            result = round(RATES.exchange_rates[to_curr]["rate"] * in_eur, 4)
-            rate_updated = RATES.exchange_rates[to_curr]["updated"]
-
-    return result, rate, rate_updated, unknown_rates
 
-
-def convert_currency(amount, from_curr, to_curr, year_in_past=None):
+def _check_currencies(snapshot, from_curr, to_curr):
     # TODO: Convert following assertions into custom exceptions
-    assert from_curr in RATES.exchange_rates, "Unknown source currency code: %s" % from_curr
-    assert to_curr in RATES.exchange_rates, "Unknown target currency code: %s" % to_curr
+    assert from_curr in snapshot, "Unknown source currency code: %s" % from_curr
+    assert to_curr in snapshot, "Unknown target currency code: %s" % to_curr
 
-    converted_amount, rate, rate_updated, unknown_rates = _raw_convert(amount, from_curr, to_curr)
 
+def _show_unknown_rates(unknown_rates):
     if unknown_rates:
         quasimode.setDidyoumeanHint(
             u"Unknown exchange rate for currency %s"
             % ",".join(unknown_rates))
+
+
+def convert_many(amounts, from_curr, to_curr):
+    """
+    Converts list of amounts from one currency to another, looking up
+    the exchange rate only once. Returns list of the converted amounts,
+    or None if the exchange rate is unknown.
+    """
+    snapshot = RATES.snapshot
+    _check_currencies(snapshot, from_curr, to_curr)
+    converted_amounts, _, unknown_rates = snapshot.convert_many(
+        amounts, from_curr, to_curr)
+    _show_unknown_rates(unknown_rates)
+    return converted_amounts
+
+
+def convert_currency(amount, from_curr, to_curr, year_in_past=None):
+    # The same rates for all conversions, even if they get updated meanwhile
+    snapshot = RATES.snapshot
+    _check_currencies(snapshot, from_curr, to_curr)
+
+    converted_amount, rate, rate_updated, unknown_rates = _raw_convert(
+        amount, from_curr, to_curr, snapshot)
+
+    _show_unknown_rates(unknown_rates)
     #result2 = currency1(amount, from_curr, to_curr)
     # if result2 != result:
     #    print "Currency computed: %f; currency Google: %f" % (result, result2)
@@ -489,7 +489,8 @@ def convert_currency(amount, from_curr, to_curr, year_in_past=None):
         except Exception as e:
             pass
         else:
-            converted_inflated_amount, _, _, _ = _raw_convert(inflated_amount, from_curr, to_curr)
+            converted_inflated_amount, _, _, _ = _raw_convert(
+                inflated_amount, from_curr, to_curr, snapshot)
             expr = "%s %s in %d is worth today in %s" % (
                 ("%.4f" % amount).rstrip("0").rstrip("."),
                 from_curr,
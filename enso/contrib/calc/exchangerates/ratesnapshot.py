@@ -0,0 +1,287 @@
+# vim:set ff=unix tabstop=4 shiftwidth=4 expandtab:
+
+# Author : Pavel Vitis "blackdaemon"
+# Email  : blackdaemon@seznam.cz
+#
+# Copyright (c) 2010, Pavel Vitis <blackdaemon@seznam.cz>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# AUTHORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Compact snapshot of the currency exchange rates.
+
+The snapshot holds the rates of the currencies against EUR, indexed by
+the position of the currency code, and the time the rates were
+downloaded. It is saved in a small binary file next to the rates.csv
+written by the updater, and memory-mapped by the converter, so that
+the CSV needn't be parsed on every start nor on every update.
+
+This module is used by the updater process too, so it must not import
+anything from Enso.
+"""
+
+#==============================================================================
+# Imports
+#==============================================================================
+
+import logging
+import mmap
+import os
+import struct
+
+from array import array
+from datetime import datetime
+
+__all__ = [
+    'RatesSnapshot',
+    'read_rates_csv',
+]
+
+
+#==============================================================================
+# Constants
+#==============================================================================
+
+SNAPSHOT_MAGIC = "ERTS"
+
+# Format version of the snapshot file; snapshots of other versions are ignored
+SNAPSHOT_VERSION = 1
+
+# magic, version, update timestamp, number of currencies, size of the codes
+_HEADER = struct.Struct("=4sHdII")
+_RATE = struct.Struct("=d")
+
+# Currency the rates are relative to
+BASE_CURRENCY = "EUR"
+
+
+#==============================================================================
+# Classes & Functions
+#==============================================================================
+
+def read_rates_csv(filename):
+    """
+    Reads the 'CODE,rate' lines of the rates file written by the updater.
+    Returns list of (code, rate) pairs; unparseable rates are 0.
+    """
+    rates = []
+    with open(filename, "r") as fd:
+        for line in fd:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                symbol, rate_s = line.split(",")
+            except ValueError:
+                logging.error(
+                    "Currency exchange data are not parseable: %s", line)
+                continue
+            try:
+                rate = float(rate_s)
+            except ValueError:
+                logging.warn(
+                    "Currency exchange rate returned for code '%s' is not parseable: %s",
+                    symbol, rate_s)
+                rate = float(0)
+            if rate == 0.0:
+                logging.warning(
+                    "Currency exchange data returned for code '%s' unhandled; empty data received.",
+                    symbol
+                )
+            rates.append((symbol, rate))
+    return rates
+
+
+class _MappedRates(object):
+    """
+    Rates stored in the memory-mapped snapshot file.
+    """
+
+    __slots__ = ('_data', '_offset', '_length')
+
+    def __init__(self, data, offset, length):
+        self._data = data
+        self._offset = offset
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._length:
+            raise IndexError("rate index out of range")
+        return _RATE.unpack_from(self._data, self._offset + i * _RATE.size)[0]
+
+
+class RatesSnapshot(object):
+    """
+    Immutable table of the exchange rates against EUR.
+
+    Snapshots are never modified, a new snapshot replaces the old one
+    when the rates are updated; a reader holding the old snapshot can
+    safely keep using it.
+    """
+
+    def __init__(self, codes, rates, updated=0, data=None):
+        assert len(codes) == len(rates)
+        self.codes = tuple(codes)
+        self.index = dict((code, i) for i, code in enumerate(self.codes))
+        self.rates = rates
+        # Timestamp of the rates, 0 if unknown
+        self.updated = updated
+        # Keeps the mapped file alive
+        self._data = data
+
+    @classmethod
+    def from_rates(cls, rates, updated=0):
+        """
+        Creates the snapshot from list of (code, rate) pairs.
+        """
+        codes = []
+        values = array('d')
+        positions = {}
+        for code, rate in rates:
+            if code in positions:
+                # The last rate of a duplicate code wins
+                values[positions[code]] = rate
+            else:
+                positions[code] = len(codes)
+                codes.append(code)
+                values.append(rate)
+        return cls(codes, values, updated)
+
+    @classmethod
+    def from_csv(cls, filename):
+        """
+        Creates the snapshot from the rates file written by the updater;
+        the rates are timestamped by the file modification time.
+        """
+        return cls.from_rates(
+            read_rates_csv(filename), os.path.getmtime(filename))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Maps the snapshot saved by save().
+        Raises ValueError if the file is not a valid snapshot.
+        """
+        with open(filename, "rb") as fd:
+            if os.name == "nt":
+                # Mapped file could not be replaced by the next update
+                data = fd.read()
+            else:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, updated, count, codes_size = _HEADER.unpack_from(data)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(
+                    "Outdated exchange rates snapshot %s" % filename)
+            codes_offset = _HEADER.size + count * _RATE.size
+            if len(data) != codes_offset + codes_size:
+                raise ValueError(
+                    "Truncated exchange rates snapshot %s" % filename)
+            codes = data[codes_offset:codes_offset + codes_size].split(",")
+            if count == 0:
+                codes = []
+            if len(codes) != count:
+                raise ValueError(
+                    "Corrupted exchange rates snapshot %s" % filename)
+        except (ValueError, struct.error):
+            if isinstance(data, mmap.mmap):
+                data.close()
+            raise
+        return cls(codes, _MappedRates(data, _HEADER.size, count), updated, data)
+
+    def save(self, filename):
+        """
+        Writes the snapshot into the file, replacing it atomically.
+        """
+        codes = ",".join(self.codes)
+        data = "".join((
+            _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.updated,
+                         len(self.codes), len(codes)),
+            "".join(_RATE.pack(rate) for rate in self.rates),
+            codes,
+        ))
+        tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(tmp_filename, "wb") as fd:
+            fd.write(data)
+        if os.name == "nt" and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp_filename, filename)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def get_rate(self, code):
+        """
+        Returns the rate of the currency against EUR, 0 if it is unknown.
+        Raises KeyError for unsupported currency.
+        """
+        return self.rates[self.index[code]]
+
+    def get_updated(self):
+        """
+        Returns datetime of the rates, None if it is unknown.
+        """
+        return datetime.fromtimestamp(self.updated) if self.updated else None
+
+    def convert_many(self, amounts, from_curr, to_curr):
+        """
+        Converts the amounts from one currency to another, looking up
+        the rates only once.
+        Returns tuple (converted amounts, rate, unknown rates); the
+        converted amounts and the rate are None if the rate of either
+        currency is unknown. The rate is None also for conversions
+        between two currencies other than EUR.
+        """
+        if from_curr == BASE_CURRENCY:
+            to_rate = self.get_rate(to_curr)
+            if to_rate == 0:
+                return None, None, [to_curr]
+            return [to_rate * amount for amount in amounts], to_rate, []
+        elif to_curr == BASE_CURRENCY:
+            from_rate = self.get_rate(from_curr)
+            if from_rate == 0:
+                return None, None, [from_curr]
+            rate = 1 / from_rate
+            return [rate * amount for amount in amounts], rate, []
+        else:
+            from_rate = self.get_rate(from_curr)
+            to_rate = self.get_rate(to_curr)
+            unknown_rates = [
+                code for code, rate in ((from_curr, from_rate), (to_curr, to_rate))
+                if rate == 0
+            ]
+            if unknown_rates:
+                return None, None, unknown_rates
+            return [
+                round(to_rate * (amount / from_rate), 4) for amount in amounts
+            ], None, []
@@ -92,6 +92,7 @@ except ImportError:
     from ConfigParser import SafeConfigParser
 
 from enso.utils import suppress
+from ratesnapshot import RatesSnapshot
 from enso import config
 config.load_ensorc()
 
@@ -119,6 +120,7 @@ CACHE_DIR = os.path.expanduser(u"~/.cache/enso/cmd_calculate")
 if not os.path.isdir(CACHE_DIR):
     os.makedirs(CACHE_DIR)
 RATES_FILE = os.path.join(CACHE_DIR, "rates.csv")
+RATES_SNAPSHOT_FILE = os.path.join(CACHE_DIR, "rates.bin")
 CURRENCIES_FILE = os.path.join(CACHE_DIR, "currencies.json")
 
 API_KEY = config.CURRENCY_CONVERTER_API_KEY
@@ -528,6 +530,11 @@ def download_actual_rates():
     else:
         shutil.move("%s.new" % RATES_FILE, RATES_FILE)
         os.utime(RATES_FILE, None)
+        # The converter maps the snapshot instead of parsing the CSV
+        try:
+            RatesSnapshot.from_csv(RATES_FILE).save(RATES_SNAPSHOT_FILE)
+        except Exception as e:
+            logging.error("Error saving rates snapshot: %s", e)
 
     return len(currency_symbols)
 
@@ -50,6 +50,9 @@ import datetime
 import math
 import operator
 import re
+import threading
+
+from collections import OrderedDict
 
 import pyparsing
 from enso.contrib.calc.exchangerates.converter import (
@@ -76,7 +79,7 @@ from pyparsing import (
 from text2num import text2num
 
 __updated__ = "2019-03-08"
-__all__ = ["evaluate"]
+__all__ = ["Evaluator", "evaluate"]
 
 RE_ROMAN_NUMERALS = '[IVXLCDMivxlcdm]+'
 RE_VALID_ROMAN_NUMBER = r"\b(M{0,4}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3}))\b"
@@ -85,6 +88,18 @@ RE_TIMEDELTA = r"(\d+) ?(days?|weeks?|months?|years?)"
 
 RE_FULL_YEAR = r"^[1-9][0-9]{3}$"
 
+# Stands for the home currency in the parsed expressions, so that they
+# don't depend on the home currency set at the time of the parsing
+HOME_CURRENCY = "<home currency>"
+
+# Maximum number of parsed expressions kept in the cache of an
+# Evaluator
+EXPRESSION_CACHE_SIZE = 256
+
+# The postfix stack of the parsing in progress in the thread, see
+# BNF.parse()
+_parse_state = threading.local()
+
 
 class timedelta(relativedelta):
 
@@ -128,67 +143,94 @@ class Regex(pyparsing.Regex):
 
 class BNF(object):
     """
+    The grammar of the expressions, built once and shared by all the
+    parsings.  The parse actions push to the postfix stack of the
+    parsing in progress in the current thread, see parse().
     """
     __bnf = None
-    expr_stack = []
+    __lock = threading.Lock()
 
     @classmethod
     def invalidate(cls):
-        cls.__bnf = None
+        with cls.__lock:
+            cls.__bnf = None
+
+    @classmethod
+    def parse(cls, expression):
+        """
+        Parses the expression, returning its postfix stack as a tuple.
+
+        Can be called from several threads at once, and from within a
+        parsing in progress too.
+        """
+        bnf = cls.__bnf
+        if bnf is None:
+            with cls.__lock:
+                bnf = cls.get_bnf()
+        outer_stack = getattr(_parse_state, "stack", None)
+        _parse_state.stack = stack = []
+        try:
+            bnf.parseString(expression)
+        finally:
+            _parse_state.stack = outer_stack
+        return tuple(stack)
 
     @classmethod
     def pushFirst(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
-        cls.expr_stack.append(toks[0])
+        _parse_state.stack.append(toks[0])
 
     @classmethod
     def pushSecond(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
-        cls.expr_stack.append(toks[1])
+        _parse_state.stack.append(toks[1])
 
     @classmethod
     def pushUMinus(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
+        stack = _parse_state.stack
         if toks:
             if toks[0] == '-':
-                cls.expr_stack.append('unary -')
+                stack.append('unary -')
                 #~ exprStack.append( '-1' )
                 #~ exprStack.append( '*' )
             if toks[0] == '(' and toks[-1] == ')':
-                cls.expr_stack.append("()")
+                stack.append("()")
                 #~ exprStack.append( '-1' )
                 #~ exprStack.append( '*' )
 
     @classmethod
     def pushFunc(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
-        cls.expr_stack.append(toks[1])
+        _parse_state.stack.append(toks[1])
         return ParseResults([toks[0]])
 
     @classmethod
     def pushCurrency(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
-        if len(cls.expr_stack[-1]) == 3:
+        stack = _parse_state.stack
+        if len(stack[-1]) == 3:
             # Only source currency specified, add home currency as target
-            cls.expr_stack.append(get_home_currency())
-        elif len(cls.expr_stack[-1]) == 6:
+            stack.append(HOME_CURRENCY)
+        elif len(stack[-1]) == 6:
             # Split source and target currency on stack
-            cls.expr_stack.append(cls.expr_stack[-1][3:])
-            cls.expr_stack[-2] = cls.expr_stack[-2][:3]
-        cls.expr_stack.append("currency")
+            stack.append(stack[-1][3:])
+            stack[-2] = stack[-2][:3]
+        stack.append("currency")
 
     @classmethod
     def pushCurrencyWithInflation(cls, strg, loc, toks):
         _, _ = loc, strg  # keep pylint happy
+        stack = _parse_state.stack
         if len(toks[-2]) == 3:
             # Only source currency specified, add home currency as target
-            cls.expr_stack.append(get_home_currency())
+            stack.append(HOME_CURRENCY)
         elif len(toks[-2]) == 6:
             # Split source and target currency on stack
-            cls.expr_stack.append(toks[-2][3:])
-            cls.expr_stack[-2] = toks[-2][:3]
-        cls.expr_stack.append(toks[-1])
-        cls.expr_stack.append("currency")
+            stack.append(toks[-2][3:])
+            stack[-2] = toks[-2][:3]
+        stack.append(toks[-1])
+        stack.append("currency")
 
     @classmethod
     def pushNumber(cls, strg, loc, toks):
@@ -254,15 +296,12 @@ class BNF(object):
                 "and") | CaselessLiteral("or")
             shift = Literal("<<") | Literal(">>")
 
-            now = CaselessLiteral("now").setParseAction(
-                lambda s, l, t: [datetime.datetime.now()])
-            one_day = timedelta(days=1)
-            today = CaselessLiteral("today").setParseAction(
-                lambda s, l, t: [datetime.date.today()])
-            yesterday = CaselessLiteral("yesterday").setParseAction(
-                lambda s, l, t: [datetime.date.today() - one_day])
-            tomorrow = CaselessLiteral("tomorrow").setParseAction(
-                lambda s, l, t: [datetime.date.today() + one_day])
+            # The time-dependent values are left on the stack as names,
+            # and evaluated by evaluateStack() each time
+            now = CaselessLiteral("now")
+            today = CaselessLiteral("today")
+            yesterday = CaselessLiteral("yesterday")
+            tomorrow = CaselessLiteral("tomorrow")
             minutes = Combine(
                 (Word("+-" + nums, nums) +
                  CaselessLiteral("minutes").suppress())
@@ -346,6 +385,9 @@ class BNF(object):
                 )
 
             # print expr1
+            # Streamline the grammar before it is shared, parseString()
+            # would do it on its first use, in whichever thread
+            expr1.streamline()
             cls.__bnf = expr1
         return cls.__bnf
 
@@ -531,15 +573,20 @@ def evaluateStack(s):
     elif op == "E":
         val = math.e  # 2.718281828
         return val, op
+    elif op == "now":
+        val = datetime.datetime.now()
+        return val, val.strftime("%Y-%m-%d %H:%M:%S")
     elif op == "today":
         val = datetime.date.today()
-        return val, op
+        return val, str(val)
     elif op == "yesterday":
         val = datetime.date.today() - datetime.timedelta(days=1)
-        return val, op
+        return val, str(val)
     elif op == "tomorrow":
         val = datetime.date.today() + datetime.timedelta(days=1)
-        return val, op
+        return val, str(val)
+    elif op == HOME_CURRENCY:
+        return get_home_currency(), op
     elif op in fn:
         op1, expr1 = evaluateStack(s)
         val = fn[op](op1)
@@ -588,40 +635,132 @@ def evaluateStack(s):
         return val, str(op).strip()
 
 
-def evaluate(expression):
-    BNF.expr_stack = []
+def normalize_expression(expression):
+    """
+    Returns the expression as used for the parsing and as the key of
+    the parsed expressions cache: with the runs of whitespace
+    collapsed, which the grammar skips anyway.
+
+    >>> normalize_expression(u"  1 +\t2 ")
+    u'1 + 2'
+    """
+    return " ".join(expression.split())
+
+
+def parse_expression(expression):
+    """
+    Parses the (normalized) expression into a postfix stack, a tuple
+    evaluated by evaluateStack().
+    """
     expression, formatted_expression = text2num(expression)
 
     expression = expression.replace(u"\u00D7", "*")  # X symbol
     expression = expression.replace(u"\u03c0", "PI")  # Greek PI symbol
 
     # print "CONVERTED:", expression, formatted_expression
-    res = BNF.get_bnf().parseString(expression)
-    # print "STACK:", BNF.expr_stack[:]
-    # print "RES: ", res, "STACK: ", BNF.expr_stack
-    val, expr = evaluateStack(BNF.expr_stack[:])
-    #expr = " ".join(res)
-    # print expr
-
-    if isinstance(val, datetime.timedelta):
-        val = "%d days %d hours %d minutes" % (
-            val.days,  # IGNORE:E1103
-            val.seconds // 3600, val.seconds % 3600 // 60
-        )
+    return BNF.parse(expression)
+
+
+class Evaluator(object):
+    """
+    Evaluates the expressions, keeping a cache of the parsed ones.
 
-    return val, expr
+    An evaluator can be used from several threads at once, e.g. by the
+    preview of the calculate command and by the command itself.  All
+    the evaluators share the grammar; each parsing collects its own
+    postfix stack.
+    """
+
+    def __init__(self, cache_size=EXPRESSION_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # Parsed expressions (or the exceptions raised parsing them) by
+        # the normalized expression, least recently used first
+        self._cache = OrderedDict()
+
+    def parse(self, expression):
+        """
+        Returns the postfix stack of the expression, from the cache if
+        the same expression was parsed recently.  The parse errors are
+        cached and raised again too, as the preview parses every
+        incomplete expression typed a few times.
+        """
+        key = normalize_expression(expression)
+        with self._lock:
+            parsed = self._cache.pop(key, None)
+        if parsed is None:
+            # Parse outside of the lock; two threads parsing the same
+            # expression at once just both do it.
+            try:
+                parsed = parse_expression(key)
+            except Exception as e:
+                parsed = e
+        if self.cache_size > 0:
+            with self._lock:
+                if len(self._cache) >= self.cache_size:
+                    self._cache.popitem(last=False)
+                # (Re)insert as the most recently used
+                self._cache[key] = parsed
+        if isinstance(parsed, Exception):
+            raise parsed
+        return parsed
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def evaluate(self, expression):
+        """
+        Evaluates the expression, returning its value and the
+        expression formatted for display.
+
+        Only the parsing is cached; the evaluation is repeated each
+        time, so that 'now', 'today' or the currency conversions give
+        current values.
+        """
+        val, expr = evaluateStack(list(self.parse(expression)))
+        #expr = " ".join(res)
+        # print expr
+
+        if isinstance(val, datetime.timedelta):
+            val = "%d days %d hours %d minutes" % (
+                val.days,  # IGNORE:E1103
+                val.seconds // 3600, val.seconds % 3600 // 60
+            )
+
+        return val, expr
+
+
+_evaluator = Evaluator()
+
+
+def get_parsed_expression(expression):
+    """
+    Returns the postfix stack of the expression, see Evaluator.parse().
+    """
+    return _evaluator.parse(expression)
+
+
+def clear_expression_cache():
+    _evaluator.clear_cache()
+
+
+def evaluate(expression):
+    """
+    Evaluates the expression, see Evaluator.evaluate().  Thread-safe.
+    """
+    return _evaluator.evaluate(expression)
 
 
 def test(s, expVal):
-    BNF.expr_stack = []
-    results = BNF.get_bnf().parseString(s)
-    val = evaluateStack(BNF.expr_stack[:])
+    stack = BNF.parse(s)
+    val = evaluateStack(list(stack))
     # print val.__class__, expVal.__class__
     if val == expVal:
-        # print s, "=", val, results, "=>", BNF.expr_stack
+        # print s, "=", val, "=>", stack
         return expVal
     else:
-        return s + "!!!", val, "!=", expVal, results, "=>", BNF.expr_stack
+        return s + "!!!", val, "!=", expVal, "=>", stack
 
 
 if __name__ == "__main__":
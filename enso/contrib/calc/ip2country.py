@@ -34,6 +34,10 @@ apnicFileDb = "~/.ip2countrydb"
 
 ipCacheFile = "~/.ip2countryips"
 
+# pathname of the binary index of the address ranges, built from the
+# cached APNIC file so that it needn't be parsed on every start
+apnicIndexFile = "~/.ip2countryidx"
+
 # set the maximum age of a cached APNIC database in DAYS
 # if the cached file is older than this, a new one will
 # be downloaded
@@ -42,6 +46,168 @@ maxApnicDbAge = 30
 #
 # END OF CONFIGURATION SECTION
 import sys, os, time, stat, StringIO, commands, re
+import array, bisect, mmap, socket, struct
+
+# index file layout: header, then the first and the last addresses of
+# the ranges (native unsigned longs, as array('L') stores them) and the
+# two-letter country codes of the ranges
+indexMagic = "IP2C"
+indexVersion = 1
+# magic, version, size of the unsigned long, number of ranges
+indexHeader = struct.Struct("=4sHHQ")
+
+def ipToLong(ipaddr):
+    """
+    Converts dotted IPv4 address to unsigned long
+    """
+    return struct.unpack("!L", socket.inet_aton(ipaddr))[0]
+
+class MappedArray:
+    """
+    Read-only sequence of unsigned longs in a memory-mapped file,
+    searchable by bisect without reading the whole of it
+    """
+    item = struct.Struct("L")
+
+    def __init__(self, mapped, offset, length):
+        self.mapped = mapped
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.length:
+            raise IndexError("MappedArray index out of range")
+        return self.item.unpack_from(
+            self.mapped, self.offset + i * self.item.size)[0]
+
+class RangeIndex:
+    """
+    Sorted, non-overlapping IPv4 address ranges with their countries
+
+    The ranges are looked up by bisecting their first addresses, so a
+    lookup takes O(log n) and covers every address of the ranges.
+    """
+    def __init__(self, starts, ends, countries, mapped=None):
+        self.starts = starts
+        self.ends = ends
+        # country codes of the ranges, 2 characters each
+        self.countries = countries
+        self.mapped = mapped
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, ip):
+        """
+        Returns country code of the range holding the address given as
+        unsigned long, or None if it is in none of them
+        """
+        i = bisect.bisect_right(self.starts, ip) - 1
+        if i < 0 or ip > self.ends[i]:
+            return None
+        return self.countries[i * 2:i * 2 + 2]
+
+    def fromRecords(cls, records):
+        """
+        Builds the index from (first address, count, country code)
+        records; adjacent ranges of the same country are merged
+        """
+        starts = array.array('L')
+        ends = array.array('L')
+        countries = []
+        for start, count, cc in sorted(records):
+            end = start + count - 1
+            if starts and start <= ends[-1] + 1 and countries[-1] == cc:
+                ends[-1] = max(ends[-1], end)
+            elif starts and start <= ends[-1]:
+                # overlap of ranges of different countries, which the
+                # registry doesn't allocate; keep the earlier one
+                if end > ends[-1]:
+                    starts.append(ends[-1] + 1)
+                    ends.append(end)
+                    countries.append(cc)
+            else:
+                starts.append(start)
+                ends.append(end)
+                countries.append(cc)
+        return cls(starts, ends, "".join(countries))
+    fromRecords = classmethod(fromRecords)
+
+    def fromFile(cls, path):
+        """
+        Memory-maps index saved by save()
+
+        Raises ValueError if the file is not a valid index
+        """
+        f = open(path, "rb")
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        try:
+            magic, version, itemSize, length = indexHeader.unpack_from(mapped)
+            if (magic != indexMagic or version != indexVersion or
+                    itemSize != MappedArray.item.size):
+                raise ValueError("Outdated index file %s" % path)
+            offset = indexHeader.size
+            size = offset + length * (2 * itemSize + 2)
+            if len(mapped) != size:
+                raise ValueError("Truncated index file %s" % path)
+            starts = MappedArray(mapped, offset, length)
+            ends = MappedArray(mapped, offset + length * itemSize, length)
+            countries = buffer(mapped, offset + 2 * length * itemSize)
+        except:
+            mapped.close()
+            raise
+        return cls(starts, ends, countries, mapped)
+    fromFile = classmethod(fromFile)
+
+    def save(self, path):
+        """
+        Saves the index to file, replacing it atomically
+        """
+        data = [
+            indexHeader.pack(indexMagic, indexVersion,
+                             MappedArray.item.size, len(self)),
+            array.array('L', self.starts).tostring(),
+            array.array('L', self.ends).tostring(),
+            str(self.countries),
+            ]
+        tmpPath = "%s.%d.tmp" % (path, os.getpid())
+        f = open(tmpPath, "wb")
+        try:
+            f.write("".join(data))
+        finally:
+            f.close()
+        if os.name == "nt" and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+def readApnicRecords(path):
+    """
+    Yields (first address, count, country code) of the IPv4
+    allocations in APNIC delegation file
+    """
+    for line in file(path):
+        parts = line.strip().split("|")
+        if len(parts) < 7:
+            continue
+        if parts[0] != 'apnic' or parts[2] != 'ipv4':
+            continue
+        # skip the summary lines and the unallocated ranges
+        country = parts[1]
+        if len(country) != 2 or not parts[4].isdigit():
+            continue
+        yield ipToLong(parts[3]), int(parts[4]), country
+
 class IP2Country:
     """
     Looks up IP addresses in APNIC database
@@ -52,6 +218,7 @@ class IP2Country:
     apnicUrl = apnicUrl
     apnicFileDb = apnicFileDb
     ipCacheFile = ipCacheFile
+    apnicIndexFile = apnicIndexFile
     
     updateInterval = 86400 * maxApnicDbAge
     
@@ -306,6 +473,8 @@ class IP2Country:
             self.apnicFileDb = os.path.expanduser(self.apnicFileDb)
         if self.ipCacheFile.startswith("~/"):
             self.ipCacheFile = os.path.expanduser(self.ipCacheFile)
+        if self.apnicIndexFile.startswith("~/"):
+            self.apnicIndexFile = os.path.expanduser(self.apnicIndexFile)
     
         self.load()
     def load(self):
@@ -321,42 +490,7 @@ class IP2Country:
         if not gotLatest:
             self.download()
     
-        lines = file(self.apnicFileDb).read().split("\n")
-    
-        ipv4Recs = []
-        self.db = ipTree = {}
-        for line in lines:
-            parts = line.split("|")
-            if len(parts) < 7:
-                continue
-            if parts[0] != 'apnic' or parts[2] != 'ipv4':
-                continue
-    
-            # got an alloc
-            country = parts[1]
-            ip = parts[3]
-    
-            ipbit0, ipbit1, ipbit2, ipbit3 = ip.split(".")
-    
-            if not ipTree.has_key(ipbit0):
-                ipTree0 = ipTree[ipbit0] = {}
-            else:
-                ipTree0 = ipTree[ipbit0]
-    
-            if not ipTree0.has_key(ipbit1):
-                ipTree1 = ipTree0[ipbit1] = {}
-            else:
-                ipTree1 = ipTree0[ipbit1]
-    
-            if not ipTree1.has_key(ipbit2):
-                ipTree2 = ipTree1[ipbit2] = {}
-            else:
-                ipTree2 = ipTree1[ipbit2]
-    
-            if not ipTree2.has_key(ipbit3):
-                ipTree3 = ipTree2[ipbit3] = country
-            else:
-                ipTree3 = ipTree2[ipbit3]
+        self.db = self.loadIndex()
     
         # read in IP address cache
         if not os.path.isfile(self.ipCacheFile):
@@ -373,6 +507,27 @@ class IP2Country:
         
         self.log("Created apnic lookup tables")
     
+    def loadIndex(self):
+        """
+        Maps the index of the APNIC database, building it first if it's
+        missing or older than the database
+        """
+        if (os.path.isfile(self.apnicIndexFile) and
+                os.stat(self.apnicIndexFile)[stat.ST_MTIME] >=
+                os.stat(self.apnicFileDb)[stat.ST_MTIME]):
+            try:
+                return RangeIndex.fromFile(self.apnicIndexFile)
+            except (EnvironmentError, ValueError, struct.error), e:
+                self.log("Can't read apnic index: %s" % e)
+    
+        self.log("Building apnic index")
+        index = RangeIndex.fromRecords(readApnicRecords(self.apnicFileDb))
+        try:
+            index.save(self.apnicIndexFile)
+        except EnvironmentError, e:
+            self.log("Can't save apnic index: %s" % e)
+        return index
+    
     def lookup(self, ipaddr):
         """
         Looks up an IP address, returns tuple (countrycode, country) if IP is
@@ -390,45 +545,12 @@ class IP2Country:
             return None, None
     
         # not in cache IPs - consult APNIC database
-        db = self.db
-       
-        if db.has_key(bit0):
-            db1 = db[bit0]
-        elif db.has_key("0"):
-            db1 = db["0"]
-        else:
-            return self.lookupWhois(ipaddr) # not found
-        
-        if db1.has_key(bit1):
-            db2 = db1[bit1]
-        elif db1.has_key("0"):
-            db2 = db1["0"]
-        else:
-            return self.lookupWhois(ipaddr) # not found
-        
-        if db2.has_key(bit2):
-            db3 = db2[bit2]
-        elif db2.has_key("0"):
-            db3 = db2["0"]
-        else:
-            return self.lookupWhois(ipaddr) # not found
-        
-        if db3.has_key(bit3):
-            cc = db3[bit3]
-        elif db3.has_key("0"):
-            cc = db3["0"]
-        else:
-            cc = None
-    
-        #print repr(cc)
+        cc = self.db.lookup(ipToLong(ipaddr))
     
         if not cc:
             return self.lookupWhois(ipaddr)
-            
-        if cc:
-            return cc, self.countryCodes.get(cc, "???")
-        else:
-            return None, None
+    
+        return cc, self.countryCodes.get(cc, "???")
     
     def lookupWhois(self, ipaddr):
         """
@@ -369,7 +369,64 @@ class LearnAsOpenCommandFactory(ArbitraryPostfixFactory):
         return cmd
 
 
-class OpenCommandFactory(GenericPrefixFactory):
+class ShortcutsCommandFactory(GenericPrefixFactory):
+    """
+    Base class of the factories generating commands for the shortcuts.
+
+    The postfixes are set from the ShortcutsDict at the first update;
+    after that only the shortcuts added or removed meanwhile are
+    applied, see ShortcutsDict.subscribe().
+    """
+
+    # Name of the command in the timing messages
+    COMMAND_NAME = None
+
+    def __init__(self):
+        super(ShortcutsCommandFactory, self).__init__()
+        self.postfixes_updated_on = 0
+        self.__changes = None
+        # Postfixes currently set, to apply the changes idempotently
+        self.__postfixes_set = set()
+
+    def _is_postfix(self, shortcut):
+        """ Returns True if the command should be generated for the shortcut """
+        return True
+
+    def _update_from_shortcuts(self, shortcuts_dict):
+        if self.__changes is None or self.__changes.shortcuts_dict is not shortcuts_dict:
+            if self.__changes is not None:
+                self.__changes.shortcuts_dict.unsubscribe(self.__changes)
+            # Subscribe first, so that no change is missed; the changes
+            # already included below are then skipped as no-ops.
+            self.__changes = shortcuts_dict.subscribe()
+            with timed_execution("Setting postfixes for '%s' command." % self.COMMAND_NAME):
+                self.__postfixes_set = set(
+                    key for key, shortcut in shortcuts_dict.items()
+                    if self._is_postfix(shortcut))
+                self.setPostfixes(self.__postfixes_set)
+            self.postfixes_updated_on = shortcuts_dict.updated_on
+            return
+
+        # Not checking 'updated_on' here, popping the changes is cheap
+        # and the timestamp can be updated before the changes are recorded.
+        added, removed = self.__changes.pop()
+        if not added and not removed:
+            return
+        self.postfixes_updated_on = shortcuts_dict.updated_on
+        with timed_execution("Updating postfixes for '%s' command." % self.COMMAND_NAME):
+            postfixes_set = self.__postfixes_set
+            removed_postfixes = [
+                key for key, shortcut in removed.iteritems()
+                if key in postfixes_set and self._is_postfix(shortcut)]
+            postfixes_set.difference_update(removed_postfixes)
+            added_postfixes = [
+                key for key, shortcut in added.iteritems()
+                if key not in postfixes_set and self._is_postfix(shortcut)]
+            postfixes_set.update(added_postfixes)
+            self._updatePostfixes(added_postfixes, removed_postfixes)
+
+
+class OpenCommandFactory(ShortcutsCommandFactory):
     """
     Generates a "open {name}" command.
     """
@@ -380,9 +437,10 @@ class OpenCommandFactory(GenericPrefixFactory):
     NAME = "%s{name}" % PREFIX
     DESCRIPTION = "Continue typing to open an application or document"
 
+    COMMAND_NAME = "open"
+
     def __init__(self):
         super(OpenCommandFactory, self).__init__()
-        self.postfixes_updated_on = 0
 
     def _generateCommandObj(self, parameter=None):
         cmd = OpenCommand(parameter)
@@ -391,15 +449,10 @@ class OpenCommandFactory(GenericPrefixFactory):
 
     @safetyNetted
     def update(self):
-        shortcuts_dict = open_command_impl.get_shortcuts()
-        if self.postfixes_updated_on >= shortcuts_dict.updated_on:
-            return
-        with timed_execution("Setting postfixes for 'open' command."):
-            self.setPostfixes(shortcuts_dict.keys())
-        self.postfixes_updated_on = shortcuts_dict.updated_on
+        self._update_from_shortcuts(open_command_impl.get_shortcuts())
 
 
-class OpenWithCommandFactory(GenericPrefixFactory):
+class OpenWithCommandFactory(ShortcutsCommandFactory):
     """
     Generates a "open with {name}" command.
     """
@@ -410,28 +463,25 @@ class OpenWithCommandFactory(GenericPrefixFactory):
     NAME = "%s{name}" % PREFIX
     DESCRIPTION = "Opens your currently selected file(s) or folder with the specified application"
 
+    COMMAND_NAME = "open with"
+
     def __init__(self):
         super(OpenWithCommandFactory, self).__init__()
-        self.postfixes_updated_on = 0
 
     def _generateCommandObj(self, parameter=None):
         cmd = OpenWithCommand(parameter)
         cmd.setDescription(self.DESCRIPTION)
         return cmd
 
+    def _is_postfix(self, shortcut):
+        return shortcut.type == shortcuts.SHORTCUT_TYPE_EXECUTABLE
+
     @safetyNetted
     def update(self):
-        shortcuts_dict = open_command_impl.get_shortcuts()
-        if self.postfixes_updated_on >= shortcuts_dict.updated_on:
-            return
-        with timed_execution("Setting postfixes for 'open with' command."):
-            self.setPostfixes(
-                [s.name for s in shortcuts_dict.values()
-                 if s.type == shortcuts.SHORTCUT_TYPE_EXECUTABLE])
-        self.postfixes_updated_on = shortcuts_dict.updated_on
+        self._update_from_shortcuts(open_command_impl.get_shortcuts())
 
 
-class UnlearnOpenCommandFactory(GenericPrefixFactory):
+class UnlearnOpenCommandFactory(ShortcutsCommandFactory):
     """
     Generates a "unlearn open {name}" command.
     """
@@ -442,29 +492,25 @@ class UnlearnOpenCommandFactory(GenericPrefixFactory):
     NAME = "%s{name}" % PREFIX
     DESCRIPTION = u" Unlearn \u201copen {name}\u201d command "
 
+    COMMAND_NAME = "unlearn open"
+
     def __init__(self):
         super(UnlearnOpenCommandFactory, self).__init__()
-        self.postfixes_updated_on = 0
 
     def _generateCommandObj(self, parameter=None):
         cmd = UnlearnOpenCommand(parameter)
         cmd.setDescription(self.DESCRIPTION)
         return cmd
 
+    def _is_postfix(self, shortcut):
+        return shortcut.flags & shortcuts.SHORTCUT_FLAG_LEARNED
+
     @safetyNetted
     def update(self):
-        shortcuts_dict = open_command_impl.get_shortcuts()
-        if self.postfixes_updated_on >= shortcuts_dict.updated_on:
-            return
-        with timed_execution("Setting postfixes for 'unlearn open' command."):
-            self.setPostfixes(
-                s[0] for s in shortcuts_dict.iteritems()
-                if s[1].flags & shortcuts.SHORTCUT_FLAG_LEARNED
-            )
-        self.postfixes_updated_on = shortcuts_dict.updated_on
+        self._update_from_shortcuts(open_command_impl.get_shortcuts())
 
 
-class WhichCommandFactory(GenericPrefixFactory):
+class WhichCommandFactory(ShortcutsCommandFactory):
     """
     Generates a "which {name}" command.
     """
@@ -475,9 +521,10 @@ class WhichCommandFactory(GenericPrefixFactory):
     NAME = "%s{name}" % PREFIX
     DESCRIPTION = u" Show target of \u201copen {name}\u201d command "
 
+    COMMAND_NAME = "which"
+
     def __init__(self):
         super(WhichCommandFactory, self).__init__()
-        self.postfixes_updated_on = 0
 
     def _generateCommandObj(self, parameter=None):
         cmd = WhichCommand(parameter)
@@ -486,18 +533,10 @@ class WhichCommandFactory(GenericPrefixFactory):
 
     @safetyNetted
     def update(self):
-        shortcuts_dict = open_command_impl.get_shortcuts()
-        if self.postfixes_updated_on >= shortcuts_dict.updated_on:
-            return
-        with timed_execution("Setting postfixes for 'which' command."):
-            self.setPostfixes(
-                s[0] for s in shortcuts_dict.iteritems()
-                if True #s[1].flags & shortcuts.SHORTCUT_FLAG_LEARNED
-            )
-        self.postfixes_updated_on = shortcuts_dict.updated_on
+        self._update_from_shortcuts(open_command_impl.get_shortcuts())
 
 
-class RecentCommandFactory(GenericPrefixFactory):
+class RecentCommandFactory(ShortcutsCommandFactory):
     """
     Generates a "recent {name}" command.
     """
@@ -508,9 +547,10 @@ class RecentCommandFactory(GenericPrefixFactory):
     NAME = "%s{name}" % PREFIX
     DESCRIPTION = "Continue typing to open recent application or document"
 
+    COMMAND_NAME = "recent"
+
     def __init__(self):
         super(RecentCommandFactory, self).__init__()
-        self.postfixes_updated_on = 0
 
     def _generateCommandObj(self, parameter=None):
         cmd = RecentCommand(parameter)
@@ -519,12 +559,7 @@ class RecentCommandFactory(GenericPrefixFactory):
 
     @safetyNetted
     def update(self):
-        shortcuts_dict = recent_command_impl.get_shortcuts()
-        if self.postfixes_updated_on >= shortcuts_dict.updated_on:
-            return
-        with timed_execution("Setting postfixes for 'recent' command."):
-            self.setPostfixes(shortcuts_dict.keys())
-        self.postfixes_updated_on = shortcuts_dict.updated_on
+        self._update_from_shortcuts(recent_command_impl.get_shortcuts())
 
 
 # ----------------------------------------------------------------------------
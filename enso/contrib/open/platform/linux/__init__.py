@@ -45,6 +45,7 @@ import glob
 import logging
 import os
 import subprocess
+import threading
 
 from itertools import chain
 
@@ -54,6 +55,7 @@ import xdg
 
 from gtk.gdk import lock as gtk_lock
 
+import enso.providers
 from enso.contrib.open import interfaces, shortcuts
 from enso.contrib.open.interfaces import (
     AbstractOpenCommand,
@@ -72,6 +74,7 @@ from enso.contrib.open.platform.linux.desktop_launch import (
 )
 from enso.contrib.open.platform.linux.utils import get_file_type
 from enso.contrib.open.shortcuts import ShortcutsDict
+from enso.contrib.open.snapshot import ShortcutsSnapshot
 from enso.utils import suppress
 from enso.utils.decorators import (
     timed_execution,
@@ -86,6 +89,20 @@ from enso.utils.decorators import (
 # Debouncing time of shortcuts refreshes in seconds
 SHORTCUTS_REFRESH_DEBOUNCE_TIME = 4
 
+# Snapshot of the shortcuts used for fast startup
+SHORTCUTS_SNAPSHOT_FILE = os.path.join(
+    enso.providers.get_interface("system").get_enso_cache_dir(),
+    "open-shortcuts.snapshot")
+
+# Files and directories the shortcuts of each category are read from
+SHORTCUT_SOURCES = {
+    applications.SHORTCUT_CATEGORY: applications.APPLICATIONS_DIRS,
+    desktop.SHORTCUT_CATEGORY_DESKTOP: (desktop.DESKTOP_DIR,),
+    desktop.SHORTCUT_CATEGORY_LAUNCHPANEL: (desktop.LAUNCH_PANEL_DIR,),
+    gtk_bookmarks.SHORTCUT_CATEGORY: (gtk_bookmarks.BOOKMARKS_PATH,),
+    learned_shortcuts.SHORTCUT_CATEGORY: (learned_shortcuts.LEARN_AS_DIR,),
+}
+
 
 """
 def limit_windows_by_title_fuzzy_search(title, win_list, first_hit=False):
@@ -129,7 +146,15 @@ class OpenCommandImpl(AbstractOpenCommand):
         return learned_shortcuts.LEARN_AS_DIR
 
     def _reload_shortcuts(self, shortcuts_dict):
+        # app_info_get_all() reads the .desktop files in subdirectories
+        # too, and skips the applications whose executable is gone.
+        snapshot = ShortcutsSnapshot(
+            SHORTCUTS_SNAPSHOT_FILE, SHORTCUT_SOURCES,
+            recursive=(applications.SHORTCUT_CATEGORY,),
+            executables=(applications.SHORTCUT_CATEGORY,))
+
         @timed_execution("Application shortcuts updated")
+        @snapshot.updates(applications.SHORTCUT_CATEGORY, shortcuts_dict)
         def update_applications(path=None):
             _ = path
             if path:
@@ -138,9 +163,9 @@ class OpenCommandImpl(AbstractOpenCommand):
                 applications.SHORTCUT_CATEGORY,
                 dict((s.name, s) for s in applications.get_applications())
             )
-        update_applications()
 
         @timed_execution("Desktop shortcuts updated")
+        @snapshot.updates(desktop.SHORTCUT_CATEGORY_DESKTOP, shortcuts_dict)
         def update_desktop_shortcuts(path=None):
             _ = path
             if path:
@@ -149,9 +174,9 @@ class OpenCommandImpl(AbstractOpenCommand):
                 desktop.SHORTCUT_CATEGORY_DESKTOP,
                 dict((s.name, s) for s in desktop.get_desktop_shortcuts())
             )
-        update_desktop_shortcuts()
 
         @timed_execution("Launch-panel shortcuts updated")
+        @snapshot.updates(desktop.SHORTCUT_CATEGORY_LAUNCHPANEL, shortcuts_dict)
         def update_launch_panel_shortcuts(path=None):
             _ = path
             if path:
@@ -160,7 +185,6 @@ class OpenCommandImpl(AbstractOpenCommand):
                 desktop.SHORTCUT_CATEGORY_LAUNCHPANEL,
                 dict((s.name, s) for s in desktop.get_launch_panel_shortcuts())
             )
-        update_launch_panel_shortcuts()
 
         """
         shortcuts_dict.update_by_category(recent.SHORTCUT_CATEGORY, dict((s.name, s) for s in recent.get_recent_documents(30)))
@@ -170,6 +194,7 @@ class OpenCommandImpl(AbstractOpenCommand):
         """
 
         @timed_execution("GTK-bookmarks shortcuts updated", mute_on_false=True)
+        @snapshot.updates(gtk_bookmarks.SHORTCUT_CATEGORY, shortcuts_dict)
         def update_gtk_bookmarks(path=None, all_calls_params=[]):
             # 'all_calls_params' arg is provided by the @debounce decorator
             if all_calls_params:
@@ -185,9 +210,8 @@ class OpenCommandImpl(AbstractOpenCommand):
             )
             return True
 
-        update_gtk_bookmarks()
-
         @timed_execution("Learned shortcuts updated")
+        @snapshot.updates(learned_shortcuts.SHORTCUT_CATEGORY, shortcuts_dict)
         def update_learned_shortcuts(path=None):
             _ = path
             if path:
@@ -196,7 +220,37 @@ class OpenCommandImpl(AbstractOpenCommand):
                 learned_shortcuts.SHORTCUT_CATEGORY,
                 dict((s.name, s) for s in learned_shortcuts.get_learned_shortcuts())
             )
-        update_learned_shortcuts()
+
+        updaters = {
+            applications.SHORTCUT_CATEGORY: update_applications,
+            desktop.SHORTCUT_CATEGORY_DESKTOP: update_desktop_shortcuts,
+            desktop.SHORTCUT_CATEGORY_LAUNCHPANEL: update_launch_panel_shortcuts,
+            gtk_bookmarks.SHORTCUT_CATEGORY: update_gtk_bookmarks,
+            learned_shortcuts.SHORTCUT_CATEGORY: update_learned_shortcuts,
+        }
+
+        @timed_execution("Revalidated \"open\" command shortcuts snapshot")
+        def revalidate_snapshot():
+            for category in snapshot.get_stale_categories():
+                try:
+                    updaters[category]()
+                except Exception as e:
+                    logging.error(e)
+
+        with timed_execution("Loaded \"open\" command shortcuts snapshot"):
+            snapshot_loaded = snapshot.load(shortcuts_dict)
+        if snapshot_loaded:
+            # The shortcuts are usable right away; re-read the categories
+            # whose sources changed since the snapshot in the background.
+            t = threading.Thread(target=revalidate_snapshot)
+            t.setDaemon(True)
+            t.start()
+        else:
+            update_applications()
+            update_desktop_shortcuts()
+            update_launch_panel_shortcuts()
+            update_gtk_bookmarks()
+            update_learned_shortcuts()
 
         applications.register_monitor_callback(
             debounce(SHORTCUTS_REFRESH_DEBOUNCE_TIME)(update_applications)
@@ -345,6 +399,10 @@ class OpenCommandImpl(AbstractOpenCommand):
                 # ...and then stored application object if .desktop does not exists
                 if not app:
                     app = applications.applications_dict.get(shortcut.name, None)
+                # ...and then application's .desktop file, which is the case
+                # when the applications were loaded from the snapshot
+                if not app and (shortcut.shortcut_filename or "").endswith(".desktop"):
+                    app = gio.unix.desktop_app_info_new_from_filename(shortcut.shortcut_filename)
                 if app:
                     """
                     # LONGTERM TODO: Finish switching to already open app window by title search(?)
@@ -390,6 +448,10 @@ class OpenCommandImpl(AbstractOpenCommand):
             # ...and then stored application object if .desktop does not exists
             if not app:
                 app = applications.applications_dict.get(shortcut.name, None)
+            # ...and then application's .desktop file, which is the case
+            # when the applications were loaded from the snapshot
+            if not app and (shortcut.shortcut_filename or "").endswith(".desktop"):
+                app = gio.unix.desktop_app_info_new_from_filename(shortcut.shortcut_filename)
             if app:
                 # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
                 gfiles = [gio.File(filepath) for filepath in files]  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
@@ -40,6 +40,7 @@ import logging
 import os
 from distutils.spawn import find_executable
 
+import xdg.BaseDirectory
 from gio import app_info_get_all  # @UnresolvedImport Keep PyLint and PyDev happy
 from gio.unix import desktop_app_info_set_desktop_env
 from gtk.gdk import lock as gtk_lock
@@ -55,6 +56,14 @@ from enso.platform.linux import DESKTOP_ENVIRONMENT
 
 SHORTCUT_CATEGORY = "application"
 
+# Directories app_info_get_all() reads the .desktop files from:
+# $XDG_DATA_HOME and $XDG_DATA_DIRS, where also flatpak and snapd
+# export their applications.
+APPLICATIONS_DIRS = tuple(
+    os.path.join(data_dir, "applications")
+    for data_dir in xdg.BaseDirectory.xdg_data_dirs
+)
+
 applications_dict = {}
 
 
@@ -118,11 +127,10 @@ def get_applications():
 
 
 def register_monitor_callback(callback_func):
-    dirwatcher.register_monitor_callback(
-        callback_func,
-        (
-            ("/usr/share/applications", False),
-            ("/usr/local/share/applications", False),
-            (os.path.expanduser("~/.local/share/applications"), False),
-        )
+    # The .desktop files in subdirectories are read too
+    directories = tuple(
+        (directory, True) for directory in APPLICATIONS_DIRS
+        if os.path.isdir(directory)
     )
+    if directories:
+        dirwatcher.register_monitor_callback(callback_func, directories)
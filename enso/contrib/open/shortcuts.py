@@ -31,9 +31,13 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+# Future imports
+from __future__ import with_statement
+
 import collections
 import logging
 import os
+import threading
 import time
 
 
@@ -98,6 +102,59 @@ class Shortcut(object):
             self.name, self.type, self.category, self.shortcut_filename, self.target, self.flags)
 
 
+def _is_same_shortcut(shortcut1, shortcut2):
+    """ Returns True if both are None or Shortcuts with equal attributes """
+    if shortcut1 is shortcut2:
+        return True
+    if shortcut1 is None or shortcut2 is None:
+        return False
+    return all(
+        getattr(shortcut1, attr) == getattr(shortcut2, attr)
+        for attr in Shortcut.__slots__ if attr != '__weakref__')
+
+
+class ShortcutsDictChanges(object):
+    """
+    Changes of a ShortcutsDict collected since the last call to pop().
+
+    Returned by ShortcutsDict.subscribe(). The changes are recorded by
+    the thread updating the dictionary and consumed by the subscriber
+    at its own pace.
+    """
+
+    def __init__(self, shortcuts_dict):
+        self.shortcuts_dict = shortcuts_dict
+        self.__lock = threading.Lock()
+        self.__added = {}
+        self.__removed = {}
+
+    def _record(self, changes):
+        """ Records a list of (key, old_shortcut, new_shortcut) changes """
+        with self.__lock:
+            added = self.__added
+            removed = self.__removed
+            for key, old_value, new_value in changes:
+                # Remember the value the key had before the first change
+                if old_value is not None and key not in added and key not in removed:
+                    removed[key] = old_value
+                if new_value is None:
+                    added.pop(key, None)
+                else:
+                    added[key] = new_value
+
+    def pop(self):
+        """
+        Returns the (added, removed) dictionaries of the shortcuts added
+        and removed since the last call. A replaced shortcut is reported
+        in both, with its new and old value respectively.
+        """
+        with self.__lock:
+            added, removed = self.__added, self.__removed
+            self.__added = {}
+            self.__removed = {}
+        return added, removed
+
+
 class ShortcutsDict(dict):
     """
     Dictionary object that provides additional attribute 'updated_on'
@@ -110,37 +167,82 @@ class ShortcutsDict(dict):
     3. Deleting item as del d[k]
     4. Updating dictionary by d.update(nd)
 
+    The same changes are reported to the subscribers, see subscribe().
+
     This class is proxy class to native dict object.
     """
 
     def __init__(self, *args, **kwargs):
         super(ShortcutsDict, self).__init__(*args, **kwargs)
         self.updated_on = time.time()
+        self.__subscriptions = []
+
+    def subscribe(self):
+        """
+        Returns ShortcutsDictChanges object collecting the subsequent
+        changes of the dictionary.
+        """
+        subscription = ShortcutsDictChanges(self)
+        self.__subscriptions = self.__subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.__subscriptions = [
+            s for s in self.__subscriptions if s is not subscription]
+
+    def __notify(self, changes):
+        if changes:
+            for subscription in self.__subscriptions:
+                subscription._record(changes)
 
     def __setitem__(self, item, value):
         old_value = self.get(item, None)
         super(ShortcutsDict, self).__setitem__(item, value)
         if old_value != value:
             self.updated_on = time.time()
+            if not _is_same_shortcut(old_value, value):
+                self.__notify([(item, old_value, value)])
         assert logging.debug("dict item inserted") or True
 
     def __delitem__(self, item):
+        old_value = self[item]
         super(ShortcutsDict, self).__delitem__(item)
         self.updated_on = time.time()
+        self.__notify([(item, old_value, None)])
         assert logging.debug("dict item deleted: %s", item) or True
 
     def update(self, *args, **kwargs):
+        new_dict = dict(*args, **kwargs)
         try:
-            super(ShortcutsDict, self).update(*args, **kwargs)
+            self.__update(new_dict)
         finally:
             if args or kwargs:
                 self.updated_on = time.time()
             assert logging.debug("dict updated") or True
 
+    def __update(self, new_dict, changes=None):
+        """
+        Updates the dictionary from new_dict and notifies the subscribers
+        about the changes, including the passed ones.
+        """
+        if changes is None:
+            changes = []
+        get = self.get
+        for key, value in new_dict.iteritems():
+            old_value = get(key, None)
+            # Re-read shortcuts are new objects, report only real changes
+            if not _is_same_shortcut(old_value, value):
+                changes.append((key, old_value, value))
+        try:
+            super(ShortcutsDict, self).update(new_dict)
+        finally:
+            self.__notify(changes)
+
     def update_by_dir(self, directory, new_dict):
         assert isinstance(new_dict, collections.Mapping), "new_dict parameter must be a dictionary"
 
         delitem = super(ShortcutsDict, self).__delitem__
+        changes = []
         directory = os.path.normpath(directory).lower()
         for key, shortcut in super(ShortcutsDict, self).items():
             if shortcut.type not in (SHORTCUT_TYPE_EXECUTABLE, SHORTCUT_TYPE_DOCUMENT, SHORTCUT_TYPE_FOLDER):
@@ -152,13 +254,15 @@ class ShortcutsDict(dict):
             if shortcut_directory.startswith(directory):
                 if key not in new_dict:
                     delitem(key)
+                    changes.append((key, shortcut, None))
         try:
-            super(ShortcutsDict, self).update(new_dict)
+            self.__update(new_dict, changes)
         finally:
             self.updated_on = time.time()
 
     def update_by_category(self, category, new_dict):
         delitem = super(ShortcutsDict, self).__delitem__
+        changes = []
         for key, shortcut in super(ShortcutsDict, self).items():
             if shortcut.category != category:
                 continue
@@ -166,8 +270,9 @@ class ShortcutsDict(dict):
                 continue
             if key not in new_dict:
                 delitem(key)
+                changes.append((key, shortcut, None))
         try:
-            super(ShortcutsDict, self).update(new_dict)
+            self.__update(new_dict, changes)
         finally:
             self.updated_on = time.time()
 
@@ -0,0 +1,266 @@
+# vim:set ff=unix tabstop=4 shiftwidth=4 expandtab:
+
+# Author : Pavel Vitis "blackdaemon"
+# Email  : blackdaemon@seznam.cz
+#
+# Copyright (c) 2010, Pavel Vitis <blackdaemon@seznam.cz>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# AUTHORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+
+"""
+On-disk snapshot of the 'open' command ShortcutsDict.
+
+The snapshot holds the shortcuts together with a signature of the source
+files/directories of every shortcut category. On startup the snapshot is
+loaded so that the 'open' command is usable immediately, and then only
+the categories whose sources changed since the snapshot was taken need
+to be re-read.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+# Future imports
+from __future__ import with_statement
+
+import cPickle
+import logging
+import os
+import threading
+from distutils.spawn import find_executable
+from functools import wraps
+
+from enso.contrib.open import shortcuts
+
+
+# ----------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------
+
+# Format version of the snapshot file; snapshots of other versions are ignored
+SNAPSHOT_VERSION = 1
+
+
+# ----------------------------------------------------------------------------
+# Source signatures
+# ----------------------------------------------------------------------------
+
+def _get_dir_signature(path, mtime):
+    # Directory mtime does not change when a file in it is modified
+    # in place, so account for mtimes of the files as well.
+    entry_mtimes = []
+    for entry in os.listdir(path):
+        try:
+            entry_mtimes.append(os.lstat(os.path.join(path, entry)).st_mtime)
+        except OSError:
+            pass
+    return (mtime, len(entry_mtimes), max(entry_mtimes or [0]))
+
+
+def get_source_signature(paths, recursive=False):
+    """
+    Returns signature of the given files/directories, which changes
+    whenever any of the files, or files directly in the directories,
+    is added, removed or modified. If recursive is True, the files in
+    the subdirectories are accounted for as well.
+    """
+    signature = []
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            # Missing source
+            signature.append((path, None))
+            continue
+        if not os.path.isdir(path):
+            signature.append((path, mtime))
+        elif not recursive:
+            signature.append((path, _get_dir_signature(path, mtime)))
+        else:
+            for dirpath, _, _ in os.walk(path):
+                try:
+                    mtime = os.stat(dirpath).st_mtime
+                    signature.append(
+                        (dirpath, _get_dir_signature(dirpath, mtime)))
+                except OSError:
+                    signature.append((dirpath, None))
+    return tuple(signature)
+
+
+def _executable_exists(target):
+    """
+    Returns whether the executable exists; the relative ones are looked
+    up in PATH.
+    """
+    if os.path.isabs(target):
+        return os.path.isfile(target) or os.path.islink(target)
+    return find_executable(target) is not None
+
+
+# ----------------------------------------------------------------------------
+# Snapshot
+# ----------------------------------------------------------------------------
+
+class ShortcutsSnapshot(object):
+    """
+    Snapshot of the ShortcutsDict stored in a file.
+
+    'sources' maps the shortcut categories to lists of the files and
+    directories the shortcuts of the category are read from. The
+    directories of the 'recursive' categories are signed including
+    their subdirectories. The categories in 'executables' are stale
+    also when an executable of their shortcuts no longer exists.
+    """
+
+    def __init__(self, filename, sources, recursive=(), executables=()):
+        self.filename = filename
+        self.sources = sources
+        self.recursive = frozenset(recursive)
+        self.executables = frozenset(executables)
+        self.__signatures = {}
+        # Executables of the shortcuts by category, see get_stale_categories()
+        self.__executables = {}
+        self.__lock = threading.Lock()
+
+    def get_signature(self, category):
+        """
+        Returns current signature of the sources of the category.
+        """
+        return get_source_signature(
+            self.sources[category], category in self.recursive)
+
+    def __set_executables(self, shortcuts_list):
+        # Must be called with the lock held
+        executables = dict((category, set()) for category in self.executables)
+        for s in shortcuts_list:
+            if (s.category in executables and
+                    s.type == shortcuts.SHORTCUT_TYPE_EXECUTABLE):
+                executables[s.category].add(s.target)
+        self.__executables = executables
+
+    def load(self, shortcuts_dict):
+        """
+        Loads the shortcuts from the snapshot file into shortcuts_dict.
+        Returns False if there is no usable snapshot.
+        """
+        try:
+            with open(self.filename, "rb") as f:
+                data = cPickle.load(f)
+            if data.get("version") != SNAPSHOT_VERSION:
+                return False
+            loaded = dict(
+                (name, shortcuts.Shortcut(
+                    name, target_type, target, shortcut_filename, category,
+                    flags))
+                for (name, target_type, target, shortcut_filename, category,
+                     flags) in data["shortcuts"]
+            )
+        except IOError:
+            return False
+        except Exception as e:
+            logging.error(
+                "Error loading open-command shortcuts snapshot %s: %s",
+                self.filename, e)
+            return False
+        with self.__lock:
+            self.__signatures = dict(
+                (category, signature)
+                for category, signature in data["signatures"].iteritems()
+                if category in self.sources)
+            self.__set_executables(loaded.itervalues())
+        shortcuts_dict.update(loaded)
+        return True
+
+    def save(self, shortcuts_dict):
+        """
+        Writes the shortcuts of the categories with known signature into
+        the snapshot file.
+        """
+        with self.__lock:
+            signatures = dict(self.__signatures)
+            # values() is a copy, the dict can be updated meanwhile
+            saved = [
+                s for s in shortcuts_dict.values()
+                if s.category in signatures
+            ]
+            self.__set_executables(saved)
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "signatures": signatures,
+                "shortcuts": [
+                    (s.name, s.type, s.target, s.shortcut_filename,
+                     s.category, s.flags)
+                    for s in saved
+                ],
+            }
+            tmp_filename = self.filename + ".tmp"
+            try:
+                with open(tmp_filename, "wb") as f:
+                    cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+                os.rename(tmp_filename, self.filename)
+            except Exception as e:
+                logging.error(
+                    "Error saving open-command shortcuts snapshot %s: %s",
+                    self.filename, e)
+
+    def get_stale_categories(self):
+        """
+        Returns the categories whose sources changed since the snapshot
+        was taken, or whose executables were removed meanwhile.
+        """
+        with self.__lock:
+            signatures = dict(self.__signatures)
+            executables = dict(self.__executables)
+        return [
+            category for category in self.sources
+            if signatures.get(category) != self.get_signature(category) or
+            not all(_executable_exists(executable)
+                    for executable in executables.get(category, ()))
+        ]
+
+    def updates(self, category, shortcuts_dict):
+        """
+        Decorator for functions updating the category in shortcuts_dict.
+        The snapshot is saved after every update; the function can return
+        False to signal it did not update anything.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                # Take the signature before reading the sources, so that
+                # changes made meanwhile are picked up next time.
+                signature = self.get_signature(category)
+                result = func(*args, **kwargs)
+                if result is not False:
+                    with self.__lock:
+                        self.__signatures[category] = signature
+                    self.save(shortcuts_dict)
+                return result
+            return wrapper
+        return decorator
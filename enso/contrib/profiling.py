@@ -0,0 +1,256 @@
+# Author : Pavel Vitis "blackdaemon"
+# Email  : blackdaemon@seznam.cz
+#
+# Copyright (c) 2010, Pavel Vitis <blackdaemon@seznam.cz>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED ``AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# AUTHORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.contrib.profiling
+#
+# ----------------------------------------------------------------------------
+
+"""
+    An Enso plugin with the commands reporting where Enso spends its
+    time.
+    Commands:
+        profile events {start|stop|reset|show|dump}
+        quasimode latency {show|start|stop|reset}
+
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+import os
+from xml.sax.saxutils import escape as xml_escape
+
+from enso.commands import CommandManager, CommandObject
+from enso.commands.factories import GenericPrefixFactory
+from enso.contrib.scriptotron.ensoapi import EnsoApi
+from enso.contrib.scriptotron.tracebacks import safetyNetted
+from enso.events import EventManager
+from enso.profiler import LatencyTracer
+
+
+ensoapi = EnsoApi()
+
+# File the event profile is dumped to, in the Enso cache directory
+EVENT_PROFILE_FILE = "event_profile.json"
+
+# Number of the slowest responders listed by 'profile events show'
+SHOW_RESPONDERS = 5
+
+
+# ----------------------------------------------------------------------------
+# The 'profile events' command
+# ---------------------------------------------------------------------------
+
+class ProfileEventsCommand(CommandObject):
+    """
+    The 'profile events {action}' command.
+    """
+
+    def __init__(self, action):
+        super(ProfileEventsCommand, self).__init__()
+        self._action = action
+
+    @safetyNetted
+    def run(self):
+        profiler = EventManager.get().getProfiler()
+        action = self._action
+        if action == "start":
+            profiler.enable()
+            ensoapi.display_message(u"Event profiling started.")
+        elif action == "stop":
+            profiler.disable()
+            ensoapi.display_message(u"Event profiling stopped.")
+        elif action == "reset":
+            profiler.reset()
+            ensoapi.display_message(u"Event profile cleared.")
+        elif action == "dump":
+            import enso.system
+            fileName = os.path.join(
+                enso.system.get_enso_cache_dir(), EVENT_PROFILE_FILE)
+            profiler.dumpJson(fileName)
+            ensoapi.display_message(
+                u"Event profile saved.", caption=unicode(fileName))
+        else:
+            self._showSlowestResponders(profiler)
+
+    def _showSlowestResponders(self, profiler):
+        responders = profiler.getSlowestResponders(SHOW_RESPONDERS)
+        if not responders:
+            if profiler.isEnabled():
+                text = u"No events profiled yet."
+            else:
+                text = u"Event profiling is off; " \
+                    u"use 'profile events start'."
+            ensoapi.display_message(text)
+            return
+
+        lines = []
+        for eventType, name, summary in responders:
+            lines.append(
+                u"<p><command>%s</command> (%s)</p>"
+                u"<caption>p50 %.1fms, p95 %.1fms, max %.1fms, "
+                u"%d calls</caption>" % (
+                    xml_escape(name), xml_escape(eventType),
+                    summary["p50_ms"], summary["p95_ms"],
+                    summary["max_ms"], summary["count"]))
+        ensoapi.display_xml_message(u"".join(lines))
+
+
+class ProfileEventsFactory(GenericPrefixFactory):
+    """
+    Generates the "profile events {action}" commands.
+    """
+
+    PREFIX = "profile events "
+    HELP_TEXT = "action"
+    DESCRIPTION = "Starts, stops, resets, shows or dumps (as JSON) " \
+        "the times spent by the event responders."
+    NAME = "%s{%s}" % (PREFIX, HELP_TEXT)
+
+    ACTIONS = ["start", "stop", "reset", "show", "dump"]
+
+    def __init__(self):
+        super(ProfileEventsFactory, self).__init__()
+        self._postfixes = self.ACTIONS
+
+    def update(self):
+        pass
+
+    def _generateCommandObj(self, postfix):
+        cmd = ProfileEventsCommand(postfix)
+        cmd.setDescription(self.DESCRIPTION)
+        cmd.setName(self.NAME)
+        cmd.setHelp(self.HELP_TEXT)
+        return cmd
+
+
+# ----------------------------------------------------------------------------
+# The 'quasimode latency' command
+# ---------------------------------------------------------------------------
+
+class QuasimodeLatencyCommand(CommandObject):
+    """
+    The 'quasimode latency {action}' command.
+    """
+
+    def __init__(self, action):
+        super(QuasimodeLatencyCommand, self).__init__()
+        self._action = action
+
+    @safetyNetted
+    def run(self):
+        tracer = LatencyTracer.get()
+        action = self._action
+        if action == "start":
+            tracer.enable()
+            ensoapi.display_message(u"Quasimode latency tracing started.")
+        elif action == "stop":
+            tracer.disable()
+            ensoapi.display_message(u"Quasimode latency tracing stopped.")
+        elif action == "reset":
+            tracer.reset()
+            ensoapi.display_message(u"Quasimode latency traces cleared.")
+        else:
+            self._showSummary(tracer)
+
+    def _showSummary(self, tracer):
+        summary = tracer.getSummary()
+        if not summary["keystrokes"]:
+            if tracer.isEnabled():
+                text = u"No keystrokes traced yet."
+            else:
+                text = u"Quasimode latency tracing is off; " \
+                    u"use 'quasimode latency start'."
+            ensoapi.display_message(text)
+            return
+
+        lines = [
+            u"<p>Keystroke to text drawn: p50 %.1fms, p95 %.1fms</p>"
+            u"<p>Keystroke to suggestions drawn: p50 %.1fms, p95 %.1fms</p>"
+            % (summary["visible"]["p50_ms"], summary["visible"]["p95_ms"],
+               summary["finished"]["p50_ms"], summary["finished"]["p95_ms"])
+        ]
+        phases = sorted(summary["phases"].iteritems(),
+                        key=lambda item: item[1]["p95_ms"], reverse=True)
+        lines.append(u"<caption>%s (%d keystrokes)</caption>" % (
+            xml_escape(u", ".join(
+                u"%s p95 %.1fms" % (name, phase["p95_ms"])
+                for name, phase in phases)),
+            summary["keystrokes"]))
+        ensoapi.display_xml_message(u"".join(lines))
+
+
+class QuasimodeLatencyFactory(GenericPrefixFactory):
+    """
+    Generates the "quasimode latency {action}" commands.
+    """
+
+    PREFIX = "quasimode latency "
+    HELP_TEXT = "action"
+    DESCRIPTION = "Shows, starts, stops or resets the tracing of the " \
+        "time from a keystroke to the quasimode being drawn."
+    NAME = "%s{%s}" % (PREFIX, HELP_TEXT)
+
+    ACTIONS = ["show", "start", "stop", "reset"]
+
+    def __init__(self):
+        super(QuasimodeLatencyFactory, self).__init__()
+        self._postfixes = self.ACTIONS
+
+    def update(self):
+        pass
+
+    def _generateCommandObj(self, postfix):
+        cmd = QuasimodeLatencyCommand(postfix)
+        cmd.setDescription(self.DESCRIPTION)
+        cmd.setName(self.NAME)
+        cmd.setHelp(self.HELP_TEXT)
+        return cmd
+
+
+# ----------------------------------------------------------------------------
+# Plugin initialization
+# ---------------------------------------------------------------------------
+
+def load():
+    cmdMan = CommandManager.get()
+    cmdMan.registerCommand(
+        ProfileEventsFactory.NAME,
+        ProfileEventsFactory()
+    )
+    cmdMan.registerCommand(
+        QuasimodeLatencyFactory.NAME,
+        QuasimodeLatencyFactory()
+    )
+
+# vim:set tabstop=4 shiftwidth=4 expandtab:
@@ -0,0 +1,147 @@
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.contrib.scriptotron.codecache
+#
+# ----------------------------------------------------------------------------
+
+"""
+    Cache of the compiled command files.
+
+    Works like the .pyc files: the code object of a command file is
+    marshalled into the cache directory along with the mtime and size
+    of the file, and it is used as long as the file does not change.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import hashlib
+import imp
+import logging
+import marshal
+import os
+import struct
+
+
+# ----------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------
+
+# Cached code is invalid for other Python versions
+MAGIC = imp.get_magic()
+
+# Cache file header: magic, source file mtime and size
+_HEADER = struct.Struct("<4sdq")
+
+CACHE_FILE_EXTENSION = ".ensoc"
+
+
+# ----------------------------------------------------------------------------
+# Code Cache
+# ----------------------------------------------------------------------------
+
+class CodeCache(object):
+    """
+    Stores compiled code of the command files in the cache directory.
+
+    The methods can be called from several threads, as long as they
+    do not work with the same file at the same time.
+    """
+
+    def __init__(self, cacheDir):
+        self._cacheDir = cacheDir
+
+    def _getCacheFileName(self, fileName):
+        pathHash = hashlib.sha1(
+            os.path.normcase(os.path.abspath(fileName))).hexdigest()
+        return os.path.join(self._cacheDir, pathHash + CACHE_FILE_EXTENSION)
+
+    def get(self, fileName, fileStat):
+        """
+        Returns the (found, code) tuple of the command file having given
+        os.stat() result. The cached code can be None.
+        """
+
+        try:
+            with open(self._getCacheFileName(fileName), "rb") as f:
+                data = f.read()
+            magic, mtime, size = _HEADER.unpack_from(data)
+            if (magic != MAGIC or mtime != fileStat.st_mtime or
+                    size != fileStat.st_size):
+                return False, None
+            return True, marshal.loads(data[_HEADER.size:])
+        except (IOError, EOFError, ValueError, TypeError, struct.error):
+            return False, None
+
+    def put(self, fileName, fileStat, code):
+        """
+        Stores the code (or None) compiled from the command file having
+        given os.stat() result.
+        """
+
+        cacheFileName = self._getCacheFileName(fileName)
+        tmpFileName = "%s.%d.tmp" % (cacheFileName, os.getpid())
+        try:
+            if not os.path.isdir(self._cacheDir):
+                os.makedirs(self._cacheDir)
+            with open(tmpFileName, "wb") as f:
+                f.write(_HEADER.pack(
+                    MAGIC, fileStat.st_mtime, fileStat.st_size))
+                f.write(marshal.dumps(code))
+            if os.name == "nt" and os.path.exists(cacheFileName):
+                os.remove(cacheFileName)
+            os.rename(tmpFileName, cacheFileName)
+        except (IOError, OSError) as e:
+            logging.warning(
+                "Error caching compiled command file %s: %s", fileName, e)
+
+    def prune(self, fileNames):
+        """
+        Removes the cached code of all the command files except the
+        given ones, e.g. of the renamed or deleted files.
+        """
+
+        keep = set(self._getCacheFileName(fileName) for fileName in fileNames)
+        try:
+            cacheFileNames = os.listdir(self._cacheDir)
+        except OSError:
+            return
+        for name in cacheFileNames:
+            cacheFileName = os.path.join(self._cacheDir, name)
+            if (name.endswith(CACHE_FILE_EXTENSION) and
+                    cacheFileName not in keep):
+                try:
+                    os.remove(cacheFileName)
+                except OSError as e:
+                    logging.warning(
+                        "Error removing cached command file %s: %s",
+                        cacheFileName, e)
@@ -36,8 +36,10 @@ __updated__ = "2018-07-12"
 import logging
 import os
 import re
+import sys
 import time
 import types
+from multiprocessing.pool import ThreadPool
 from os.path import basename
 
 import enso.config
@@ -49,6 +51,7 @@ from enso.contrib.scriptotron import (
     concurrency,
     ensoapi,
 )
+from enso.contrib.scriptotron.codecache import CodeCache
 from enso.contrib.scriptotron.events import EventResponderList
 from enso.contrib.scriptotron.tracebacks import TracebackCommand, safetyNetted
 from enso.messages import MessageManager, displayMessage as display_xml_message
@@ -66,6 +69,23 @@ COMMAND_FILE_CHECK = re.compile(
     r"^def %s[a-zA-Z0-9]|class [a-zA-Z0-9_]+\(CommandObject\):" % cmdretriever.SCRIPT_PREFIX,
     re.MULTILINE)
 
+# Directory of the cached compiled command files
+CODE_CACHE_DIR = os.path.join(enso.system.get_enso_cache_dir(), "commands")
+
+# Number of threads reading and compiling the command files
+LOADER_THREADS = 4
+
+
+class _CompileError(object):
+    """
+    Holds the sys.exc_info() of the exception raised while compiling
+    a command file on a loader thread, so that it can be re-raised on
+    the main thread.
+    """
+
+    def __init__(self, excInfo):
+        self.excInfo = excInfo
+
 
 class ScriptCommandTracker(object):
 
@@ -181,6 +201,7 @@ class ScriptTracker(object):
         self._lastMods = {}
         self._registerDependencies()
         self._commandsInFile = {}
+        self._codeCache = CodeCache(CODE_CACHE_DIR)
         # Call it now, otherwise there is a delay on first quasimode invocation
         self._updateScripts()
 
@@ -198,9 +219,10 @@ class ScriptTracker(object):
 
     @staticmethod
     @safetyNetted
-    def _getGlobalsFromSourceCode(text, filename):
+    def _getGlobalsFromCode(code, filename):
+        if isinstance(code, _CompileError):
+            raise code.excInfo[0], code.excInfo[1], code.excInfo[2]
         allGlobals = {}
-        code = compile(text + "\n", filename, "exec")
         try:
             exec code in allGlobals
         except PlatformUnsupportedError as e:
@@ -243,34 +265,12 @@ class ScriptTracker(object):
 
         assert logging.debug(commandFiles) or True
 
-        for file_name in commandFiles:
-            try:
-                with open(file_name, "r") as fd:
-                    file_contents = fd.read().replace('\r\n', '\n') + "\n"
-            except IOError as e:
-                if file_name == SCRIPTS_FILE_NAME:
-                    do_once(
-                        logging.warning,
-                        "Legacy script file %s not found" % SCRIPTS_FILE_NAME
-                    )
-                else:
-                    logging.error(e)
-                continue
-            except Exception as e:
-                logging.error(e)
-                continue
-
-            # Do not bother to parse files which does not contain command definitions
-            if not COMMAND_FILE_CHECK.search(file_contents):
-                logging.warning(
-                    "Skipping file %s as it does not contain any command definitions",
-                    file_name)
+        for file_name, code, elapsed in self._compileCommandFiles(commandFiles):
+            if code is None:
                 continue
 
-            allGlobals = self._getGlobalsFromSourceCode(
-                file_contents,
-                file_name
-            )
+            started = time.time()
+            allGlobals = self._getGlobalsFromCode(code, file_name)
 
             if allGlobals is not None:
                 infos = cmdretriever.getCommandsFromObjects(allGlobals)
@@ -278,9 +278,86 @@ class ScriptTracker(object):
                 self._registerDependencies(allGlobals)
                 self._commandsInFile[file_name] = infos
                 logging.info(
-                    "Scriptotron registered commands from '%s': [%s]" %
-                    (basename(file_name), ", ".join(info["cmdName"] for info in infos))
+                    "Scriptotron registered commands from '%s' in %0.3fs: [%s]" %
+                    (basename(file_name), elapsed + time.time() - started,
+                     ", ".join(info["cmdName"] for info in infos))
+                )
+
+        if not files:
+            # All the command files are loaded; drop the cached code of
+            # the renamed and deleted ones.
+            self._codeCache.prune(commandFiles)
+
+    def _compileCommandFiles(self, commandFiles):
+        """
+        Yields the (file_name, code, elapsed) tuples of the command files,
+        in the given order; see _compileCommandFile().
+
+        The files are read and compiled on the loader threads, while the
+        already compiled ones are executed by the caller. Executing the
+        files and registering the commands stays on the calling thread.
+        """
+
+        if len(commandFiles) < 2 or LOADER_THREADS < 2:
+            for file_name in commandFiles:
+                yield self._compileCommandFile(file_name)
+            return
+
+        pool = ThreadPool(min(LOADER_THREADS, len(commandFiles)))
+        try:
+            for result in pool.imap(self._compileCommandFile, commandFiles):
+                yield result
+        finally:
+            pool.terminate()
+
+    def _compileCommandFile(self, file_name):
+        """
+        Returns (file_name, code, elapsed) tuple for the command file.
+        The code is None if the file can't be read or contains no command
+        definitions, or _CompileError if it failed to compile.
+
+        The compiled code is cached in CODE_CACHE_DIR.
+        """
+
+        started = time.time()
+        try:
+            fileStat = os.stat(file_name)
+        except OSError as e:
+            if file_name == SCRIPTS_FILE_NAME:
+                do_once(
+                    logging.warning,
+                    "Legacy script file %s not found" % SCRIPTS_FILE_NAME
                 )
+            else:
+                logging.error(e)
+            return file_name, None, time.time() - started
+
+        found, code = self._codeCache.get(file_name, fileStat)
+        if found:
+            return file_name, code, time.time() - started
+
+        try:
+            with open(file_name, "r") as fd:
+                file_contents = fd.read().replace('\r\n', '\n') + "\n"
+        except Exception as e:
+            logging.error(e)
+            return file_name, None, time.time() - started
+
+        # Do not bother to parse files which does not contain command definitions
+        if not COMMAND_FILE_CHECK.search(file_contents):
+            logging.warning(
+                "Skipping file %s as it does not contain any command definitions",
+                file_name)
+            code = None
+        else:
+            try:
+                code = compile(file_contents + "\n", file_name, "exec")
+            except Exception:
+                # Not cached, so that the error is reported again
+                return file_name, _CompileError(sys.exc_info()), time.time() - started
+
+        self._codeCache.put(file_name, fileStat, code)
+        return file_name, code, time.time() - started
 
     def _registerDependencies(self, allGlobals=None):
         baseDeps = [self._scriptFilename] + self._getCommandFiles()
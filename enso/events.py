@@ -56,10 +56,14 @@
 # Imports
 # ----------------------------------------------------------------------------
 
+import heapq
+import itertools
 import logging
+import threading
 import time
 
-from enso import input
+from enso import config, input
+from enso.profiler import DispatchProfiler, clock as _profilerClock
 from enso.utils import call_once_for_given_args
 
 
@@ -103,6 +107,10 @@ _IDLE_TIMEOUT_SCALE = tuple(
     reversed(sorted(var[1] for var in globals().items() if var[0].startswith("IDLE_TIMEOUT_")))
 )
 
+# Maximum time (in ms) the input loop may wait between two ticks when
+# nothing is scheduled; the ticks also detect the user inactivity.
+MAX_TICK_DELAY = 1000
+
 
 class EventResponderFuncWrapper(object):
     """
@@ -176,6 +184,190 @@ class EventResponderFuncWrapper(object):
         raise AttributeError()
 
 
+# ----------------------------------------------------------------------------
+# Timer Scheduler
+# ----------------------------------------------------------------------------
+
+class TimerHandle(object):
+    """
+    Handle of a callback scheduled by the TimerScheduler.
+    """
+
+    __slots__ = ("func", "args", "deadline", "interval", "isCancelled",
+                 "_scheduler")
+
+    def __init__(self, scheduler, func, args, deadline, interval):
+        self.func = func
+        self.args = args
+        self.deadline = deadline
+        self.interval = interval
+        self.isCancelled = False
+        self._scheduler = scheduler
+
+    def cancel(self):
+        """
+        Cancels the callback; cancelling it again does nothing.
+        """
+
+        if not self.isCancelled:
+            self.isCancelled = True
+            if self._scheduler is not None:
+                self._scheduler._onCancelled(self)
+
+
+class TimerScheduler(object):
+    """
+    Keeps the callbacks scheduled to run at a given time, or at regular
+    intervals, in a heap ordered by their deadlines, so that only the
+    callbacks which are due are looked at.
+
+    The callbacks are run by runDueTimers(), called on every tick of
+    the event manager; they can be scheduled from any thread.
+    """
+
+    def __init__(self, onEarlierDeadline=None, clock=time.time):
+        """
+        Creates an empty scheduler.  onEarlierDeadline() is called
+        whenever a callback is scheduled to run before all the others.
+        """
+
+        self.__onEarlierDeadline = onEarlierDeadline
+        self.__clock = clock
+        self.__lock = threading.Lock()
+
+        # Heap of (deadline, sequence number, TimerHandle) tuples; the
+        # sequence numbers keep callbacks with the same deadline in
+        # the order they were scheduled.
+        self.__heap = []
+        self.__sequence = itertools.count()
+
+        # Number of the cancelled handles still in the heap.
+        self.__numCancelled = 0
+
+    def __len__(self):
+        """
+        Returns the number of the scheduled callbacks.
+        """
+
+        return len(self.__heap) - self.__numCancelled
+
+    def callLater(self, delayMs, func, *args):
+        """
+        Schedules func(*args) to be run once, delayMs milliseconds from
+        now.  Returns the TimerHandle of the callback.
+        """
+
+        return self.__schedule(func, args, delayMs, None)
+
+    def callEvery(self, intervalMs, func, *args):
+        """
+        Schedules func(*args) to be run every intervalMs milliseconds,
+        starting intervalMs milliseconds from now, until its
+        TimerHandle (which is returned) is cancelled.
+        """
+
+        assert intervalMs > 0, "interval must be positive"
+        return self.__schedule(func, args, intervalMs, intervalMs)
+
+    def getTimeUntilNextTimer(self):
+        """
+        Returns the number of milliseconds until the earliest scheduled
+        callback is due (0 if it is overdue), or None if there are no
+        scheduled callbacks.
+        """
+
+        with self.__lock:
+            self.__dropCancelled()
+            if not self.__heap:
+                return None
+            deadline = self.__heap[0][0]
+        return max(0.0, (deadline - self.__clock()) * 1000)
+
+    def runDueTimers(self, profiler=None):
+        """
+        Runs the callbacks which are due.  The callbacks scheduled by
+        the callbacks run on the next call at the earliest.
+
+        If a DispatchProfiler is given, the callbacks are timed as
+        responders of the "timer" event.
+        """
+
+        now = self.__clock()
+        due = []
+        with self.__lock:
+            heap = self.__heap
+            while heap and heap[0][0] <= now:
+                handle = heapq.heappop(heap)[2]
+                if handle.isCancelled:
+                    self.__numCancelled -= 1
+                    continue
+                if handle.interval is None:
+                    # The handle is no longer in the heap.
+                    handle._scheduler = None
+                else:
+                    # Skip the runs that were missed.
+                    handle.deadline += handle.interval / 1000.0
+                    if handle.deadline <= now:
+                        handle.deadline = now + handle.interval / 1000.0
+                    heapq.heappush(
+                        heap, (handle.deadline, next(self.__sequence), handle))
+                due.append(handle)
+
+        for handle in due:
+            # A callback may cancel those after it.
+            if handle.isCancelled:
+                continue
+            started = _profilerClock() if profiler is not None else None
+            try:
+                handle.func(*handle.args)
+            except Exception as e:
+                logging.error(e)
+            if started is not None:
+                profiler.recordResponder(
+                    "timer", handle.func, _profilerClock() - started)
+
+    def _onCancelled(self, handle):
+        """
+        Called by TimerHandle.cancel().
+        """
+
+        with self.__lock:
+            if handle._scheduler is None:
+                # Popped off the heap to be run
+                return
+            self.__numCancelled += 1
+            # Don't let the cancelled handles pile up in the heap.
+            if self.__numCancelled > 32 and \
+                    self.__numCancelled > len(self.__heap) // 2:
+                self.__heap = [entry for entry in self.__heap
+                               if not entry[2].isCancelled]
+                heapq.heapify(self.__heap)
+                self.__numCancelled = 0
+
+    def __schedule(self, func, args, delayMs, interval):
+        deadline = self.__clock() + delayMs / 1000.0
+        handle = TimerHandle(self, func, args, deadline, interval)
+        with self.__lock:
+            self.__dropCancelled()
+            isEarliest = not self.__heap or deadline < self.__heap[0][0]
+            heapq.heappush(
+                self.__heap, (deadline, next(self.__sequence), handle))
+        if isEarliest and self.__onEarlierDeadline is not None:
+            self.__onEarlierDeadline()
+        return handle
+
+    def __dropCancelled(self):
+        """
+        Pops the cancelled handles off the top of the heap; must be
+        called with the lock held.
+        """
+
+        heap = self.__heap
+        while heap and heap[0][2].isCancelled:
+            heapq.heappop(heap)
+            self.__numCancelled -= 1
+
+
 # ----------------------------------------------------------------------------
 # EventManager class
 # ----------------------------------------------------------------------------
@@ -216,6 +408,12 @@ class EventManager(input.InputManager):
 
         self.__idlingStage = 0
 
+        self.__timers = TimerScheduler(self.__onTickNeededSooner)
+
+        self.__profiler = DispatchProfiler()
+        if config.PROFILE_EVENT_DISPATCH:
+            self.__profiler.enable()
+
     def createEventType(self, typeName):
         """
         Creates a new event type to be responded to.
@@ -236,6 +434,7 @@ class EventManager(input.InputManager):
         assert eventType in self._dynamicEventTypes,\
             "dynamic-event-type '%s' is uknown" % eventType
         perf = []
+        dispatchStarted = time.time()
 
         # Act on copy of the responders list, as the responder function might
         # change the original list (by calling registerResponder or removeReponder)
@@ -251,6 +450,11 @@ class EventManager(input.InputManager):
                     perf.extend(sub_perf)
                 elapsed = time.time() - started
                 perf.append((func, args, kwargs, elapsed))
+
+        if self.__profiler.isEnabled():
+            self.__profiler.recordDispatch(
+                eventType, time.time() - dispatchStarted)
+            self.__profiler.recordPerf(eventType, perf)
         return perf
 
     def getResponders(self, eventType):
@@ -283,6 +487,10 @@ class EventManager(input.InputManager):
         # Wrap the responder-function to provide is_running() function
         responderList.append(EventResponderFuncWrapper(responderFunc))
 
+        if eventType == "timer":
+            # Timer responders are called on every tick.
+            self.__onTickNeededSooner()
+
     def removeResponder(self, responderFunc, sync=False):
         """
         Removes responderFunc from the internal responder dictionary.
@@ -332,6 +540,85 @@ class EventManager(input.InputManager):
         """
         input.InputManager.run(self)  # @UndefinedVariable
 
+    def getProfiler(self):
+        """
+        Returns the DispatchProfiler timing the dispatch of the events
+        to their responders.  It is disabled unless
+        config.PROFILE_EVENT_DISPATCH is set.
+        """
+
+        return self.__profiler
+
+    def __dispatch(self, eventType, *args):
+        """
+        Calls the responders of the given event type, timing them if
+        the profiler is enabled.
+        """
+
+        profiler = self.__profiler
+        if not profiler.isEnabled():
+            for func in self.__responders[eventType]:
+                func(*args)
+            return
+
+        dispatchStarted = started = _profilerClock()
+        for func in self.__responders[eventType]:
+            try:
+                func(*args)
+            finally:
+                now = _profilerClock()
+                profiler.recordResponder(eventType, func, now - started)
+                started = now
+        profiler.recordDispatch(eventType, started - dispatchStarted)
+
+    # ----------------------------------------------------------------------
+    # Timers
+    # ----------------------------------------------------------------------
+
+    def callLater(self, delayMs, func, *args):
+        """
+        Schedules func(*args) to be called once on a tick, delayMs
+        milliseconds from now.  Returns a TimerHandle whose cancel()
+        method cancels the call.
+
+        Unlike "timer" responders, which are called on every tick,
+        scheduled calls let the input loop sleep until they are due.
+        """
+
+        return self.__timers.callLater(delayMs, func, *args)
+
+    def callEvery(self, intervalMs, func, *args):
+        """
+        Schedules func(*args) to be called on a tick every intervalMs
+        milliseconds, until the returned TimerHandle is cancelled.
+        """
+
+        return self.__timers.callEvery(intervalMs, func, *args)
+
+    def getTickDelay(self):
+        """
+        Returns the number of milliseconds the input loop can wait
+        before the next onTick() call: 0 while there are "timer"
+        responders, which want every tick, or else the time until the
+        next scheduled call is due, up to MAX_TICK_DELAY.
+        """
+
+        if self.__responders["timer"]:
+            return 0
+        delay = self.__timers.getTimeUntilNextTimer()
+        if delay is None or delay > MAX_TICK_DELAY:
+            return MAX_TICK_DELAY
+        return delay
+
+    def __onTickNeededSooner(self):
+        """
+        Lets the input loop know that the next tick may be needed
+        sooner than it planned, if it sleeps between ticks.
+        """
+        rescheduleTick = getattr(self, "rescheduleTick", None)
+        if rescheduleTick is not None:
+            rescheduleTick()
+
     # ----------------------------------------------------------------------
     # Functions for transferring the existing event handlers to the more
     # robust registerResponder method outlined above.
@@ -349,6 +636,8 @@ class EventManager(input.InputManager):
                         func.get_function().__name__, func.get_function().__module__)
             )
 
+        profiler = self.__profiler
+        dispatchStarted = started = _profilerClock()
         for func in self.__responders["idle"]:
             try:
                 func(idle_seconds)
@@ -357,14 +646,20 @@ class EventManager(input.InputManager):
                 # Call legacy onidle handler only on default interval of 5 minutes
                 if idle_seconds == IDLE_TIMEOUT:
                     func()
+            finally:
+                now = _profilerClock()
+                if profiler.isEnabled():
+                    profiler.recordResponder("idle", func, now - started)
+                started = now
+        if profiler.isEnabled():
+            profiler.recordDispatch("idle", started - dispatchStarted)
 
     def onInit(self):
         """
         Low-level event handler called as soon as the event manager
         starts running.
         """
-        for func in self.__responders["init"]:
-            func()
+        self.__dispatch("init")
 
     def onExitRequested(self):
         """
@@ -379,6 +674,11 @@ class EventManager(input.InputManager):
         number of milliseconds passed since the last onTick() call is
         passed in, although this value may not be 100% accurate.
         """
+        if self.__profiler.isEnabled():
+            tickStarted = _profilerClock()
+        else:
+            tickStarted = None
+
         super(EventManager, self).onTick(msPassed)
 
         for timeout in _IDLE_TIMEOUT_SCALE:
@@ -394,8 +694,14 @@ class EventManager(input.InputManager):
             if self.__idlingStage > 0:
                 self.__idlingStage = 0
 
-        for func in self.__responders["timer"]:
-            func(msPassed)
+        self.__dispatch("timer", msPassed)
+
+        if tickStarted is not None:
+            self.__timers.runDueTimers(self.__profiler)
+            self.__profiler.recordDispatch(
+                "tick", _profilerClock() - tickStarted)
+        else:
+            self.__timers.runDueTimers()
 
     def onTrayMenuItem(self, menuId):
         """
@@ -403,8 +709,7 @@ class EventManager(input.InputManager):
         menu item on the popup menu of the Tray Icon.
         """
         self._onDismissalEvent()
-        for func in self.__responders["traymenu"]:
-            func(menuId)
+        self.__dispatch("traymenu", menuId)
 
     def _onDismissalEvent(self):
         """
@@ -413,8 +718,7 @@ class EventManager(input.InputManager):
         """
         self.__idlingStage = 0
 
-        for func in self.__responders["dismissal"]:
-            func()
+        self.__dispatch("dismissal")
 
     def onKeypress(self, eventType, keyCode):
         """
@@ -423,8 +727,7 @@ class EventManager(input.InputManager):
         """
         super(EventManager, self).onKeypress(eventType, keyCode)
         self._onDismissalEvent()
-        for func in self.__responders["key"]:
-            func(eventType, keyCode)
+        self.__dispatch("key", eventType, keyCode)
 
         # The following message may be used by system tests.
         #logging.debug( "onKeypress: %s, %s" % (eventType, keyCode) )
@@ -437,8 +740,7 @@ class EventManager(input.InputManager):
         """
         super(EventManager, self).onMouseMove(x, y)
         self._onDismissalEvent()
-        for func in self.__responders["mousemove"]:
-            func(x, y)
+        self.__dispatch("mousemove", x, y)
 
     def onSomeMouseButton(self):
         """
@@ -454,6 +756,5 @@ class EventManager(input.InputManager):
         keypress is made.
         """
         super(EventManager, self).onSomeKey()
-        for func in self.__responders["somekey"]:
-            func()
+        self.__dispatch("somekey")
         self._onDismissalEvent()
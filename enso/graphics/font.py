@@ -46,16 +46,58 @@
 
 from __future__ import division
 
+import atexit
 import logging
+import os
 import sys
+import threading
 
 import enso
 from enso import cairo, config
+from enso.graphics import fontcache
 from enso.utils import do_once, do_once_for_given_args
 from enso.utils.memoize import memoized
 
 _graphics = enso.providers.get_interface("graphics")
 
+# File of the persistent font metrics cache, in the Enso cache directory
+FONT_METRICS_CACHE_FILE = "font_metrics.bin"
+
+_metricsCache = None
+
+# Guards the cairo context shared by all fonts for measuring, and the
+# metrics cache; fonts are also used by the message layout worker.
+_measuringLock = threading.RLock()
+
+
+# ----------------------------------------------------------------------------
+# Font Metrics Cache
+# ----------------------------------------------------------------------------
+
+def _getMetricsCache():
+    """
+    Returns the persistent font metrics cache, saved at exit.
+    """
+
+    global _metricsCache
+
+    if _metricsCache is None:
+        import enso.system
+
+        settings = (
+            getattr(config, "FONT_NAME", None),
+            getattr(config, "FONT_ANTIALIASING", None),
+            getattr(config, "FONT_HINTING", None),
+            getattr(cairo, "cairo_version", lambda: None)(),
+        )
+        _metricsCache = fontcache.FontMetricsCache(
+            os.path.join(enso.system.get_enso_cache_dir(),
+                         FONT_METRICS_CACHE_FILE),
+            fontcache.getFontsSignature(settings)
+        )
+        atexit.register(_metricsCache.save)
+    return _metricsCache
+
 
 # ----------------------------------------------------------------------------
 # Fonts
@@ -71,9 +113,11 @@ class Font(object):
         '__weakref__',
         'ascent',
         'cairoContext',
+        'cairoFontOptions',
         'descent',
         'font_name',
         'font_opts',
+        'glyphs',
         'height',
         'isItalic',
         'maxXAdvance',
@@ -95,21 +139,33 @@ class Font(object):
         self.isItalic = isItalic
         self.font_name = None
         self.font_opts = {}
+        self.cairoFontOptions = None
+
+        # Unicode character -> FontGlyph
+        self.glyphs = {}
 
         if self.isItalic:
             self.slant = cairo.FONT_SLANT_ITALIC  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
         else:
             self.slant = cairo.FONT_SLANT_NORMAL  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
 
-        if not Font._cairoContext:
-            dummySurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
-            Font._cairoContext = cairo.Context(dummySurface)  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
+        with _measuringLock:
+            if not Font._cairoContext:
+                dummySurface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
+                Font._cairoContext = cairo.Context(dummySurface)  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
 
-        self.cairoContext = Font._cairoContext
+            self.cairoContext = Font._cairoContext
 
-        self.cairoContext.save()
-
-        self.loadInto(self.cairoContext)
+            metrics = _getMetricsCache().getFontMetrics(name, size, isItalic)
+            if metrics is not None:
+                fontExtents = metrics.fontExtents
+            else:
+                self.cairoContext.save()
+                self.loadInto(self.cairoContext)
+                fontExtents = self.cairoContext.font_extents()
+                self.cairoContext.restore()
+                _getMetricsCache().addFontMetrics(
+                    name, size, isItalic, fontExtents)
 
         # Make our font metrics information visible to the client.
 
@@ -117,9 +173,7 @@ class Font(object):
          self.descent,
          self.height,
          self.maxXAdvance,
-         self.maxYAdvance) = self.cairoContext.font_extents()
-
-        self.cairoContext.restore()
+         self.maxYAdvance) = fontExtents
 
     @classmethod
     @memoized
@@ -132,13 +186,60 @@ class Font(object):
         """
         return cls(name, size, isItalic)
 
-    @memoized
     def getGlyph(self, char):
         """
         Returns a glyph of the font corresponding to the given Unicode
         character.
         """
-        return FontGlyph(char, self, self.cairoContext)
+        fontGlyph = self.glyphs.get(char)
+        if fontGlyph is None:
+            fontGlyph = self.getGlyphs(char)[0]
+        return fontGlyph
+
+    def getGlyphs(self, text):
+        """
+        Returns the list of glyphs of the font corresponding to the
+        characters of the given Unicode string.
+
+        The metrics of the characters not seen before are taken from
+        the persistent font metrics cache; those not found there are
+        measured at once, with the font loaded into the cairo context
+        just once, and added to the cache.
+        """
+        glyphs = self.glyphs
+        missing = [char for char in set(text) if char not in glyphs]
+        if missing:
+            with _measuringLock:
+                # The font options are needed by the glyphs
+                self.__resolveFont()
+                metrics = _getMetricsCache().getFontMetrics(
+                    self.name, self.size, self.isItalic)
+                if metrics is None:
+                    metrics = _getMetricsCache().addFontMetrics(
+                        self.name, self.size, self.isItalic,
+                        (self.ascent, self.descent, self.height,
+                         self.maxXAdvance, self.maxYAdvance))
+
+                unknown = []
+                for char in missing:
+                    glyphMetrics = metrics.getGlyphMetrics(char)
+                    if glyphMetrics is None:
+                        unknown.append(char)
+                    else:
+                        glyphs[char] = FontGlyph(char, self, *glyphMetrics)
+
+                if unknown:
+                    self.cairoContext.save()
+                    try:
+                        self.loadInto(self.cairoContext)
+                        for char, extents, index in _getGlyphMetrics(
+                                self.cairoContext, unknown):
+                            glyphs[char] = FontGlyph(
+                                char, self, extents, index)
+                            metrics.setGlyphMetrics(char, extents, index)
+                    finally:
+                        self.cairoContext.restore()
+        return [glyphs[char] for char in text]
 
     def getKerningDistance(self, charLeft, charRight):
         """
@@ -149,9 +250,9 @@ class Font(object):
         # the source code of Cairo.
         return 0.0
 
-    def loadInto(self, cairoContext):
+    def __resolveFont(self):
         """
-        Sets the cairo context's current font to this font.
+        Looks up the name and options of this font in enso.config.
         """
 
         def get_font_name(font_id):
@@ -232,6 +333,13 @@ class Font(object):
             self.font_name = font_name
             self.font_opts = font_opts
 
+    def loadInto(self, cairoContext):
+        """
+        Sets the cairo context's current font to this font.
+        """
+
+        self.__resolveFont()
+
         # Still not set, leave default
         if not self.font_name:
             return
@@ -248,7 +356,32 @@ class Font(object):
                 "Using font (normal): {0}".format(self.font_name)
             )
 
-        # Set custom font options from enso.config, if possible
+        # The font options are set up from enso.config just once
+        if self.cairoFontOptions is None:
+            self.cairoFontOptions = self.__makeFontOptions() or False
+
+        if self.cairoFontOptions:
+            try:
+                cairoContext.set_font_options(self.cairoFontOptions)
+            except Exception as e:
+                # This can still fail if some of the values is unsupported on the platform
+                logging.error("Error setting the font options: %s", e)
+                self.cairoFontOptions = False
+
+        cairoContext.select_font_face(
+            self.font_name,
+            self.slant,
+            cairo.FONT_WEIGHT_NORMAL  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
+        )
+
+        cairoContext.set_font_size(self.size)
+
+    def __makeFontOptions(self):
+        """
+        Returns the cairo font options with custom settings from
+        enso.config, or None if none of them could be set.
+        """
+
         fo = cairo.FontOptions()  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
         font_options_set = False
         try:
@@ -298,25 +431,50 @@ class Font(object):
                 font_options_set = True
 
         if font_options_set:
-            try:
-                cairoContext.set_font_options(fo)
-            except Exception as e:
-                # This can still fail if some of the values is unsupported on the platform
-                logging.error("Error setting the font options: %s", e)
-
-        cairoContext.select_font_face(
-            self.font_name,
-            self.slant,
-            cairo.FONT_WEIGHT_NORMAL  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
-        )
-
-        cairoContext.set_font_size(self.size)
+            return fo
+        return None
 
 
 # ----------------------------------------------------------------------------
 # Font Glyphs
 # ----------------------------------------------------------------------------
 
+def _getGlyphMetrics(cairoContext, chars):
+    """
+    Yields (char, text extents, glyph index) for each of the given
+    Unicode characters, using the font currently loaded into the given
+    cairo context.
+
+    If the cairo bindings are able to map the text to the glyphs of
+    the scaled font, all the characters are mapped with a single call
+    and the glyph index is then returned so that the glyphs can later
+    be rendered in runs by show_glyphs(); otherwise the glyph index is
+    None and the glyphs are rendered by show_text().
+    """
+
+    text = u"".join(chars)
+    cairoGlyphs = None
+    try:
+        scaledFont = cairoContext.get_scaled_font()
+        cairoGlyphs = scaledFont.text_to_glyphs(
+            0, 0, text.encode("UTF-8"), False)
+    except Exception:
+        # Older cairo/pycairo without text_to_glyphs()
+        pass
+
+    if cairoGlyphs is not None and len(cairoGlyphs) == len(chars):
+        for char, cairoGlyph in zip(chars, cairoGlyphs):
+            index = cairoGlyph[0]
+            yield (char,
+                   scaledFont.glyph_extents([(index, 0, 0)]),
+                   index)
+    else:
+        for char in chars:
+            yield (char,
+                   cairoContext.text_extents(char.encode("UTF-8")),
+                   None)
+
+
 class FontGlyph(object):
     """
     Encapsulates a glyph of a font face.
@@ -329,6 +487,7 @@ class FontGlyph(object):
         'charAsUtf8',
         'font',
         'height',
+        'index',
         'width',
         'xMax',
         'xMin',
@@ -336,11 +495,14 @@ class FontGlyph(object):
         'yMin',
     )
 
-    def __init__(self, char, font, cairoContext):
+    def __init__(self, char, font, textExtents, index=None):
         """
         Creates the font glyph corresponding to the given Unicode
-        character, using the font specified by the given Font object
-        and the given cairo context.
+        character of the font specified by the given Font object, from
+        the cairo text extents of the character.
+
+        'index' is the index of the glyph in the cairo scaled font, or
+        None if it is not known.
         """
 
         # Encode the character to UTF-8 because that's what the cairo
@@ -348,10 +510,7 @@ class FontGlyph(object):
         self.charAsUtf8 = char.encode("UTF-8")
         self.char = char
         self.font = font
-
-        cairoContext.save()
-
-        self.font.loadInto(cairoContext)
+        self.index = index
 
         # Make our font glyph metrics information visible to the client.
 
@@ -370,7 +529,7 @@ class FontGlyph(object):
          width,
          height,
          xAdvance,
-         yAdvance) = cairoContext.text_extents(self.charAsUtf8)
+         yAdvance) = textExtents
         # The xMin, xMax, yMin, yMax, and advance attributes are used
         # here to correspond to their values in this image:
         # http://freetype.sourceforge.net/freetype2/docs/glyphs/Image3.png
@@ -382,5 +541,3 @@ class FontGlyph(object):
         self.yMin = -yBearing + height
         self.yMax = -yBearing
         self.advance = xAdvance * xAdvanceModifier
-
-        cairoContext.restore()
@@ -0,0 +1,383 @@
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.graphics.fontcache
+#
+# ----------------------------------------------------------------------------
+
+"""
+    Persistent cache of font metrics.
+
+    Measuring the glyphs through cairo is slow, and it used to be done
+    again on every start of Enso for every character, font and size
+    used.  The metrics of each font are kept in a table of a binary
+    file in the Enso cache directory; the file is memory-mapped on the
+    first use and the glyph records of a table, sorted by code point,
+    are looked up by bisection, so only the metrics actually used are
+    ever read.
+
+    The file is tied to a signature of the installed fonts (the
+    modification times of the font and fontconfig cache directories)
+    and of the font settings; if the signature changes, the cached
+    metrics are dropped and measured again.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+
+# ----------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------
+
+MAGIC = "EFMC"
+VERSION = 1
+
+# File header: magic, version, signature digest, number of tables
+_HEADER = struct.Struct("<4sI20sI")
+
+# Table header, following the UTF-8 encoded font name and its length:
+# font size, italic flag, font extents, number of glyphs and offset of
+# the glyph records
+_NAME_LENGTH = struct.Struct("<H")
+_TABLE = struct.Struct("<d?5dII")
+
+# Glyph record: code point, glyph index (-1 if not known) and text
+# extents of the character
+_GLYPH = struct.Struct("<Ii6d")
+_CODE_POINT = struct.Struct("<I")
+
+if sys.platform.startswith("win"):
+    FONT_DIRECTORIES = [
+        os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+        os.path.join(os.environ.get("LOCALAPPDATA", ""),
+                     "Microsoft", "Windows", "Fonts"),
+    ]
+elif sys.platform.startswith("darwin"):
+    FONT_DIRECTORIES = [
+        "/Library/Fonts",
+        "/System/Library/Fonts",
+        os.path.expanduser("~/Library/Fonts"),
+    ]
+else:
+    FONT_DIRECTORIES = [
+        "/usr/share/fonts",
+        "/usr/local/share/fonts",
+        os.path.expanduser("~/.fonts"),
+        os.path.expanduser("~/.local/share/fonts"),
+        # Updated by fc-cache whenever fonts are (un)installed
+        "/var/cache/fontconfig",
+        os.path.expanduser("~/.cache/fontconfig"),
+        "/etc/fonts",
+    ]
+
+
+# ----------------------------------------------------------------------------
+# Signature
+# ----------------------------------------------------------------------------
+
+def getFontsSignature(settings, directories=None):
+    """
+    Returns a signature of the installed fonts and of the given font
+    settings (any object with a stable repr()).
+
+    The signature is made of the modification times of the font
+    directories and of their immediate subdirectories, which change
+    when font files are added, removed or replaced.
+    """
+
+    if directories is None:
+        directories = FONT_DIRECTORIES
+    parts = [repr(settings)]
+    for directory in directories:
+        try:
+            parts.append("%s:%r" % (directory, os.stat(directory).st_mtime))
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    parts.append("%s:%r" % (path, os.stat(path).st_mtime))
+        except OSError:
+            parts.append("%s:-" % directory)
+    return "\n".join(parts)
+
+
+# ----------------------------------------------------------------------------
+# Font Metrics
+# ----------------------------------------------------------------------------
+
+class FontMetrics(object):
+    """
+    Metrics of one font face at one size: its font extents and the
+    text extents and glyph index of its characters.
+    """
+
+    def __init__(self, fontExtents, mapped=None, offset=0, count=0):
+        """
+        Creates the metrics with the given font extents.  'mapped' is
+        the memory-mapped cache file with 'count' glyph records at
+        'offset'.
+        """
+
+        self.fontExtents = tuple(fontExtents)
+        self.__mapped = mapped
+        self.__offset = offset
+        self.__count = count
+
+        # Unicode character -> (text extents, glyph index) of the
+        # characters measured in this process
+        self.__added = {}
+
+    def __findRecord(self, codePoint):
+        """
+        Returns the offset of the mapped glyph record of the given code
+        point, or None.
+        """
+
+        lo = 0
+        hi = self.__count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = self.__offset + mid * _GLYPH.size
+            found = _CODE_POINT.unpack_from(self.__mapped, offset)[0]
+            if found < codePoint:
+                lo = mid + 1
+            elif found > codePoint:
+                hi = mid
+            else:
+                return offset
+        return None
+
+    def getGlyphMetrics(self, char):
+        """
+        Returns the (text extents, glyph index) tuple of the given
+        Unicode character, or None if it is not known.
+        """
+
+        metrics = self.__added.get(char)
+        if metrics is None and self.__count:
+            offset = self.__findRecord(ord(char))
+            if offset is not None:
+                record = _GLYPH.unpack_from(self.__mapped, offset)
+                index = record[1]
+                metrics = (record[2:], None if index < 0 else index)
+        return metrics
+
+    def setGlyphMetrics(self, char, textExtents, index):
+        """
+        Stores the text extents and the glyph index (or None) of the
+        given Unicode character.
+        """
+
+        self.__added[char] = (tuple(textExtents), index)
+
+    def isModified(self):
+        """
+        Returns whether the metrics are new or any glyph metrics were
+        added.
+        """
+
+        return self.__mapped is None or bool(self.__added)
+
+    def getGlyphRecords(self):
+        """
+        Returns the sorted list of the (code point, glyph index, text
+        extents) tuples of all the known characters.
+        """
+
+        records = {}
+        for i in range(self.__count):
+            record = _GLYPH.unpack_from(
+                self.__mapped, self.__offset + i * _GLYPH.size)
+            records[record[0]] = (record[0], record[1], record[2:])
+        for char, (textExtents, index) in self.__added.iteritems():
+            codePoint = ord(char)
+            records[codePoint] = (
+                codePoint, -1 if index is None else index, textExtents)
+        return sorted(records.itervalues())
+
+
+# ----------------------------------------------------------------------------
+# Font Metrics Cache
+# ----------------------------------------------------------------------------
+
+class FontMetricsCache(object):
+    """
+    Font metrics persisted in a memory-mapped binary file.
+    """
+
+    def __init__(self, fileName, signature):
+        """
+        Creates the cache stored in the given file; the stored metrics
+        are used only if they were saved with the same signature.
+        """
+
+        self.fileName = fileName
+        self.__digest = hashlib.sha1(signature).digest()
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__mapped = None
+        # (font name, size, italic) -> FontMetrics, loaded lazily
+        self.__tables = None
+
+    def __load(self):
+        """
+        Maps the cache file and reads its table of fonts.
+        """
+
+        self.__tables = {}
+        if not os.path.isfile(self.fileName):
+            return
+        try:
+            self.__file = open(self.fileName, "rb")
+            mapped = mmap.mmap(
+                self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__mapped = mapped
+            magic, version, digest, tableCount = _HEADER.unpack_from(mapped)
+            if (magic != MAGIC or version != VERSION or
+                    digest != self.__digest):
+                logging.info("Font metrics cache is outdated, dropping it")
+                self.__close()
+                return
+            offset = _HEADER.size
+            tables = {}
+            for _ in range(tableCount):
+                nameLength = _NAME_LENGTH.unpack_from(mapped, offset)[0]
+                offset += _NAME_LENGTH.size
+                name = mapped[offset:offset + nameLength].decode("UTF-8")
+                offset += nameLength
+                table = _TABLE.unpack_from(mapped, offset)
+                offset += _TABLE.size
+                size, isItalic = table[:2]
+                glyphCount, glyphOffset = table[-2:]
+                if glyphOffset + glyphCount * _GLYPH.size > len(mapped):
+                    raise ValueError("Truncated font metrics cache file")
+                tables[(name, size, isItalic)] = FontMetrics(
+                    table[2:-2], mapped, glyphOffset, glyphCount)
+            self.__tables = tables
+        except (EnvironmentError, ValueError, struct.error) as e:
+            logging.warning(
+                "Error reading font metrics cache %s: %s", self.fileName, e)
+            self.__close()
+
+    def __close(self):
+        if self.__mapped is not None:
+            self.__mapped.close()
+            self.__mapped = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def getFontMetrics(self, name, size, isItalic):
+        """
+        Returns the FontMetrics of the given font, or None if they are
+        not known.
+        """
+
+        with self.__lock:
+            if self.__tables is None:
+                self.__load()
+            return self.__tables.get(
+                (unicode(name), float(size), bool(isItalic)))
+
+    def addFontMetrics(self, name, size, isItalic, fontExtents):
+        """
+        Adds and returns empty FontMetrics of the given font, having
+        the given font extents.
+        """
+
+        with self.__lock:
+            if self.__tables is None:
+                self.__load()
+            metrics = FontMetrics(fontExtents)
+            self.__tables[(unicode(name), float(size), bool(isItalic))] = \
+                metrics
+            return metrics
+
+    def save(self):
+        """
+        Writes the cache file if any metrics were added since it was
+        loaded.  The FontMetrics returned before must not be used
+        anymore; they are loaded again from the new file.
+        """
+
+        with self.__lock:
+            if not self.__tables or not any(
+                    metrics.isModified()
+                    for metrics in self.__tables.itervalues()):
+                return
+
+            tables = [
+                (key, metrics.fontExtents, metrics.getGlyphRecords())
+                for key, metrics in sorted(self.__tables.iteritems())
+            ]
+
+            glyphOffset = _HEADER.size + sum(
+                _NAME_LENGTH.size + len(name.encode("UTF-8")) + _TABLE.size
+                for (name, _, _), _, _ in tables)
+            data = [_HEADER.pack(MAGIC, VERSION, self.__digest, len(tables))]
+            for (name, size, isItalic), fontExtents, glyphRecords in tables:
+                encodedName = name.encode("UTF-8")
+                data.append(_NAME_LENGTH.pack(len(encodedName)))
+                data.append(encodedName)
+                data.append(_TABLE.pack(
+                    size, isItalic,
+                    *(fontExtents + (len(glyphRecords), glyphOffset))))
+                glyphOffset += len(glyphRecords) * _GLYPH.size
+            for _, _, glyphRecords in tables:
+                for codePoint, index, textExtents in glyphRecords:
+                    data.append(_GLYPH.pack(codePoint, index, *textExtents))
+
+            # The mapping must be closed before the file is replaced
+            self.__close()
+            self.__tables = None
+
+            tmpFileName = "%s.%d.tmp" % (self.fileName, os.getpid())
+            try:
+                directory = os.path.dirname(self.fileName)
+                if directory and not os.path.isdir(directory):
+                    os.makedirs(directory)
+                with open(tmpFileName, "wb") as f:
+                    f.write("".join(data))
+                if os.name == "nt" and os.path.exists(self.fileName):
+                    os.remove(self.fileName)
+                os.rename(tmpFileName, self.fileName)
+            except (IOError, OSError) as e:
+                logging.warning(
+                    "Error saving font metrics cache %s: %s",
+                    self.fileName, e)
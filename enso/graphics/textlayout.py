@@ -55,6 +55,14 @@
 
 from __future__ import division
 
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
 # ----------------------------------------------------------------------------
 # The Document Element
 # ----------------------------------------------------------------------------
@@ -231,110 +239,48 @@ class Block(object):
         block.
         """
 
-        currLineLength = 0
-        currWordStartIndex = 0
-        currWordLength = 0
-        currLine = Line()
-
-        for i in range(len(self.__glyphs)):
-            assert(currLineLength >= currWordLength)
-
-            glyph = self.__glyphs[i]
-            advance = glyph.fontGlyph.advance
-
-            if currLineLength + advance > self.width:
-                # If we don't have *any* characters on this line yet,
-                # that means the glyph advance is greater than this
-                # block's width--we're in big trouble!
-                if currLineLength == 0:
-                    raise GlyphWiderThanBlockError(glyph)
-
-                # Time to make a new line.
-
-                if len(self.lines) == self.maxLines - 1:
-                    # We've hit the max # of lines!
-                    if not self.ellipsify:
-                        raise MaxLinesExceededError()
-                    else:
-                        # We'll put an ellipsis at the end of this
-                        # line and then break out of this loop,
-                        # ignoring the rest of the glyphs.
-                        currLine.addGlyphs(
-                            self.__glyphs[currWordStartIndex:i]
-                        )
-                        currWordLength = 0
-                        currLine.ellipsify(self.ellipsisGlyph,
-                                           self.width)
-                        break
-
-                # Determine whether our current line has a word in it.
-                currLineHasWord = (currLineLength != currWordLength)
-
-                # If our current line has no words in it, just add
-                # what we've got so far (not including the glyph we're
-                # looking at) and count it as a "word".
-
-                # Alternatively, if this character is whitespace, then
-                # we're at the end of a word; we'll effectively
-                # replace the whitespace with a newline.
-                if not currLineHasWord or glyph.isWhitespace:
-                    currLine.addGlyphs(
-                        self.__glyphs[currWordStartIndex:i]
-                    )
-
-                    # If the current character we're looking at is
-                    # whitespace, pretend it doesn't exist because
-                    # we're at the end of a line.
-                    if glyph.isWhitespace:
-                        currWordStartIndex = i + 1
-                        currWordLength = 0
-                    else:
-                        currWordStartIndex = i
-                        currWordLength = advance
-                else:
-                    # This character is part of a word.
-                    currWordLength += advance
-
-                # Now, create a new line.
-                self.__addLine(currLine)
-                currLineLength = currWordLength
-                currLine = Line()
-            elif glyph.isWhitespace:
-                # We've reached the end of our word, and the beginning
-                # of another.  Add this word, including this
-                # whitespace character, to the current line.
-                currLine.addGlyphs(
-                    self.__glyphs[currWordStartIndex:i + 1]
-                )
-                currLineLength += advance
-                currWordStartIndex = i + 1
-                currWordLength = 0
-            else:
-                # We're still building a word.
-                currLineLength += advance
-                currWordLength += advance
-
-            assert(currLineLength >= currWordLength)
-
-        assert(currLineLength >= currWordLength)
-
-        # Now that we're done looking through all the glyphs, we can
-        # safely add the last remaining word to the current line.
-        if currWordLength > 0:
-            currLine.addGlyphs(
-                self.__glyphs[currWordStartIndex:]
-            )
-
-        # If our current (i.e., last) line has anything on it, we're
-        # going to add it to the block.
-        if currLineLength > 0:
-            self.__addLine(currLine, isPartialLine=True)
+        lineBreaker = LineBreaker(self.__glyphs)
+        try:
+            for start, end, isPartialLine, isEllipsified in \
+                    lineBreaker.breakLines(self.width, self.maxLines,
+                                           self.ellipsify):
+                line = Line()
+                line.addGlyphs(self.__glyphs[start:end])
+                if isEllipsified:
+                    line.ellipsify(self.ellipsisGlyph, self.width)
+                self.__addLine(line, isPartialLine)
+        except MaxLinesExceededError as e:
+            e.block = self
+            raise
 
         self.__glyphs = None
         self.height = self.marginTop + \
             self.lineHeight * len(self.lines) + \
             self.marginBottom
 
+    def findLargestFittingSize(self, sizes, getGlyphAdvance):
+        """
+        Returns the largest of the given font sizes at which the
+        glyphs of the block would fit into the maximum number of lines
+        of the block without being ellipsified, or None if they would
+        fit at none of them.
+
+        'getGlyphAdvance(glyph, size)' must return the advance of the
+        given glyph of the block at the given font size.  This answers
+        what laying out the block at each of the sizes would do, but
+        without creating any glyphs and lines; it is meant to be used
+        after the layout of the block has raised MaxLinesExceededError.
+        """
+
+        for size in sorted(sizes, reverse=True):
+            lineBreaker = LineBreaker(
+                self.__glyphs,
+                [getGlyphAdvance(glyph, size) for glyph in self.__glyphs]
+            )
+            if lineBreaker.fitsInLines(self.width, self.maxLines):
+                return size
+        return None
+
     def draw(self, x, y, cairoContext):
         """
         Draws the block with its upper-left corner at the given
@@ -358,10 +304,187 @@ class GlyphWiderThanBlockError(Exception):
 class MaxLinesExceededError(Exception):
     """
     Exception thrown by a Block object when the maximum number of
-    lines for the block has been exceeded.
+    lines for the block has been exceeded.  The 'block' attribute is
+    the Block object that has been laid out, if known.
     """
 
-    pass
+    block = None
+
+
+# ----------------------------------------------------------------------------
+# Line Breaking
+# ----------------------------------------------------------------------------
+
+class LineBreaker(object):
+    """
+    Breaks a sequence of glyphs into lines of a given width: the line
+    is broken at the last whitespace glyph before the glyph that does
+    not fit onto it anymore, or at that glyph if the line has no
+    whitespace yet; the whitespace glyph at the break is dropped.
+
+    Instead of walking the glyphs one at a time, the break points are
+    found by bisecting the cumulative sums of the glyph advances.  As
+    those sums can differ from the line lengths summed glyph by glyph
+    in the last bits, every break point found is then checked (and
+    moved if needed) against the line length summed glyph by glyph,
+    so that the lines are always the same as those of a layout
+    walking the glyphs one at a time.
+    """
+
+    def __init__(self, glyphs, advances=None):
+        """
+        Creates a line breaker for the given glyphs.  'advances' are
+        the advances of the glyphs; the advances of their font glyphs
+        are used if not given.
+        """
+
+        if advances is None:
+            advances = [glyph.fontGlyph.advance for glyph in glyphs]
+        assert len(advances) == len(glyphs)
+
+        self.__glyphs = glyphs
+        self.__advances = advances
+
+        # The cumulative sums of the advances: the advances of
+        # glyphs[start:end] sum up to about
+        # prefixSums[end] - prefixSums[start].
+        prefixSums = [0.0]
+        append = prefixSums.append
+        total = 0.0
+        for advance in advances:
+            total += advance
+            append(total)
+        self.__prefixSums = array("d", prefixSums)
+
+        # The cumulative sums can only be bisected if they are sorted.
+        self.__canBisect = not advances or min(advances) >= 0
+
+        # Sorted indexes of the whitespace glyphs.
+        self.__whitespaces = [
+            index for index, glyph in enumerate(glyphs) if glyph.isWhitespace
+        ]
+
+    def __length(self, start, end):
+        """
+        Returns the exact length of glyphs[start:end], summed glyph by
+        glyph.
+        """
+
+        return sum(self.__advances[start:end])
+
+    def __findOverflow(self, start, first, width):
+        """
+        Returns the index of the first glyph, not before the 'first'
+        one, that does not fit onto a line of the given width starting
+        with the 'start' glyph; returns the number of glyphs if all of
+        them fit.
+        """
+
+        count = len(self.__advances)
+        if first >= count:
+            return count
+
+        if self.__canBisect:
+            prefixSums = self.__prefixSums
+            index = bisect_right(
+                prefixSums, prefixSums[start] + width, first + 1) - 1
+            # Fix the rounding differences of the cumulative sums
+            while index > first and self.__length(start, index) > width:
+                index -= 1
+        else:
+            index = first
+        while index < count and not self.__length(start, index + 1) > width:
+            index += 1
+        return index
+
+    def __findWordStart(self, start, end):
+        """
+        Returns the index of the first glyph after the last whitespace
+        glyph of glyphs[start:end], or 'start' if there is none.
+        """
+
+        whitespaces = self.__whitespaces
+        position = bisect_left(whitespaces, end) - 1
+        if position >= 0 and whitespaces[position] >= start:
+            return whitespaces[position] + 1
+        return start
+
+    def breakLines(self, width, maxLines, ellipsify):
+        """
+        Yields a (start, end, isPartialLine, isEllipsified) tuple for
+        each line of the given width the glyphs are broken into, where
+        glyphs[start:end] are the glyphs of the line.  A partial line
+        is the last one, not filled up to the width.
+
+        If 'maxLines' is exceeded, a MaxLinesExceededError is raised,
+        unless 'ellipsify' is set; then the last line is yielded as
+        the one to be ellipsified.  A GlyphWiderThanBlockError is
+        raised if a glyph alone does not fit onto a line.
+        """
+
+        glyphs = self.__glyphs
+        count = len(glyphs)
+        lineCount = 0
+        start = 0
+        first = 0
+
+        while True:
+            index = self.__findOverflow(start, first, width)
+            if index == count:
+                break
+
+            lineLength = self.__length(start, index)
+            if lineLength == 0:
+                raise GlyphWiderThanBlockError(glyphs[index])
+
+            if lineCount == maxLines - 1:
+                # We've hit the max # of lines!
+                if not ellipsify:
+                    raise MaxLinesExceededError()
+                if lineLength > 0:
+                    yield (start, index, True, True)
+                return
+
+            wordStart = self.__findWordStart(start, index)
+            lineHasWord = (lineLength != self.__length(wordStart, index))
+
+            if not lineHasWord or glyphs[index].isWhitespace:
+                # Break the line before the glyph; a whitespace glyph
+                # is replaced by the line break.
+                yield (start, index, False, False)
+                if glyphs[index].isWhitespace:
+                    start = index + 1
+                else:
+                    start = index
+            else:
+                # Move the current word onto the next line.
+                yield (start, wordStart, False, False)
+                start = wordStart
+            lineCount += 1
+            first = index + 1
+
+        # Add the last line, if it has anything on it; its last word
+        # is added only if it has any length.
+        if self.__length(start, count) > 0:
+            wordStart = self.__findWordStart(start, count)
+            if self.__length(wordStart, count) > 0:
+                end = count
+            else:
+                end = wordStart
+            yield (start, end, True, False)
+
+    def fitsInLines(self, width, maxLines):
+        """
+        Returns whether the glyphs fit into the given maximum number of
+        lines of the given width, without being ellipsified.
+        """
+
+        try:
+            for _ in self.breakLines(width, maxLines, False):
+                pass
+        except MaxLinesExceededError:
+            return False
+        return True
 
 
 # ----------------------------------------------------------------------------
@@ -383,6 +506,7 @@ class Line(object):
         '__alignOfs',
         '__cursorPos',
         '__ofsPerSpace',
+        '__runs',
         'ascent',
         'descent',
         'distanceToBaseline',
@@ -412,6 +536,9 @@ class Line(object):
         # Offset per space for justified text.
         self.__ofsPerSpace = 0.0
 
+        # Glyph runs to draw, built on the first draw; see __makeRuns().
+        self.__runs = None
+
         # Ascent of the line above the baseline, in points.
         self.ascent = None
 
@@ -449,6 +576,8 @@ class Line(object):
         # correspond to their values in this image:
         # http://freetype.sourceforge.net/freetype2/docs/glyphs/Image3.png
 
+        self.__runs = None
+
         # Cut off a trailing whitespace character, if it exists.
         if len(self.glyphs) > 1 and self.glyphs[-1].isWhitespace:
             self.glyphs = self.glyphs[:-1]
@@ -545,6 +674,7 @@ class Line(object):
             self.__cursorPos += glyph.fontGlyph.advance
             lastGlyph = glyph
         self.glyphs.extend(glyphs)
+        self.__runs = None
 
     def removeGlyph(self):
         """
@@ -553,6 +683,7 @@ class Line(object):
 
         removedGlyph = self.glyphs.pop()
         self.__cursorPos = removedGlyph.pos
+        self.__runs = None
 
     def ellipsify(self, ellipsisGlyph, maxWidth):
         """
@@ -572,32 +703,72 @@ class Line(object):
         # Add the ellipsis to the end of this line.
         self.addGlyphs([ellipsisGlyph])
 
+    def __makeRuns(self):
+        """
+        Groups the visible glyphs of the laid-out line into runs of
+        glyphs sharing the same font and color.
+
+        Each run is a (font, color, cairoGlyphs, texts) tuple, with the
+        glyph positions relative to the baseline origin of the line.
+        'cairoGlyphs' is the list of (glyph index, x, y) tuples for
+        show_glyphs(), or None if some glyph index of the run is not
+        known, in which case 'texts' is the list of (x, UTF-8 char)
+        tuples for show_text().
+        """
+
+        runs = []
+        spaceOfs = 0.0
+        runKey = None
+        runGlyphs = None
+        for glyph in self.glyphs:
+            if glyph.isWhitespace:
+                spaceOfs += self.__ofsPerSpace
+                continue
+            if (glyph.font, glyph.color) != runKey:
+                runKey = (glyph.font, glyph.color)
+                runGlyphs = []
+                runs.append((glyph.font, glyph.color, runGlyphs))
+            runGlyphs.append((glyph.fontGlyph.index,
+                              spaceOfs + self.__alignOfs + glyph.pos,
+                              glyph.charAsUtf8))
+
+        result = []
+        for font, color, runGlyphs in runs:
+            if all(index is not None for index, _, _ in runGlyphs):
+                cairoGlyphs = [(index, glyphX, 0.0)
+                               for index, glyphX, _ in runGlyphs]
+            else:
+                cairoGlyphs = None
+            texts = [(glyphX, charAsUtf8)
+                     for _, glyphX, charAsUtf8 in runGlyphs]
+            result.append((font, color, cairoGlyphs, texts))
+        return result
+
     def draw(self, x, y, cairoContext):
         """
         Draws the line to the given cairo context so that the top-left
         of the line's line box is at the given coordinates, in points.
         """
 
+        if self.__runs is None:
+            self.__runs = self.__makeRuns()
+
         y += self.distanceToBaseline
-        spaceOfs = 0.0
-        glyphX = 0.0
         currFont = None
-        for glyph in self.glyphs:
-            glyphX = spaceOfs + \
-                self.__alignOfs + \
-                x + \
-                glyph.pos
-
-            if not glyph.isWhitespace:
-                if currFont != glyph.font:
-                    currFont = glyph.font
-                    currFont.loadInto(cairoContext)
-                cairoContext.set_source_rgba(*glyph.color)
-                cairoContext.move_to(glyphX, y)
-
-                cairoContext.show_text(glyph.charAsUtf8)
+        for font, color, cairoGlyphs, texts in self.__runs:
+            if currFont != font:
+                currFont = font
+                currFont.loadInto(cairoContext)
+            cairoContext.set_source_rgba(*color)
+            if cairoGlyphs is not None:
+                cairoContext.save()
+                cairoContext.translate(x, y)
+                cairoContext.show_glyphs(cairoGlyphs)
+                cairoContext.restore()
             else:
-                spaceOfs += self.__ofsPerSpace
+                for glyphX, charAsUtf8 in texts:
+                    cairoContext.move_to(x + glyphX, y)
+                    cairoContext.show_text(charAsUtf8)
 
 
 class InvalidAlignmentError(Exception):
@@ -195,6 +195,192 @@ STYLE_PROPERTIES = (
 )
 
 
+# Style properties whose values are measurements, such as '2pt',
+# '1em' or '20px'.
+STYLE_MEASUREMENT_PROPERTIES = frozenset([
+    "width",
+    "line_height",
+    "font_size",
+    "margin_top",
+    "margin_bottom"
+])
+
+
+# ----------------------------------------------------------------------------
+# Compiled Styles
+# ----------------------------------------------------------------------------
+
+class EmSize(float):
+    """
+    A measurement relative to the font size of the element it applies
+    to, such as '1.5em'; it is resolved when the style is cascaded.
+    """
+
+    __slots__ = ()
+
+
+@memoized
+def compilePropertyValue(propertyName, value):
+    """
+    Parses the string value of the given style property: measurements
+    are converted into points (or into an EmSize, for measurements
+    relative to the font size), colors into RGBA tuples, 'max_lines'
+    into an integer and 'ellipsify' into a boolean.  Values of other
+    properties are returned as they are.
+
+    Examples:
+
+    >>> compilePropertyValue( 'width', '1in' )
+    72.0
+    >>> compilePropertyValue( 'line_height', '1.5em' )
+    1.5
+    >>> compilePropertyValue( 'max_lines', '3' )
+    3
+    >>> compilePropertyValue( 'ellipsify', 'true' )
+    True
+    >>> compilePropertyValue( 'text_align', 'left' )
+    'left'
+    """
+
+    if propertyName in STYLE_MEASUREMENT_PROPERTIES:
+        if value.endswith("em"):
+            return EmSize(value[:-2])
+        return measurement.strToPoints(value)
+    elif propertyName == "color":
+        return colorHashToRgba(value)
+    elif propertyName == "max_lines":
+        return int(value)
+    elif propertyName == "ellipsify":
+        return stringToBool(value)
+    else:
+        return value
+
+
+class CompiledStyle(object):
+    """
+    Immutable, hashable form of the properties of a style, holding
+    both the string values of the properties and their parsed values.
+    Two compiled styles with the same properties are equal.
+    """
+
+    __slots__ = ("properties", "values", "_hash")
+
+    def __init__(self, properties):
+        """
+        Compiles the given dictionary of style properties, raising
+        ValueError if a value can't be parsed.
+        """
+
+        self.properties = frozenset(properties.iteritems())
+        self.values = dict(
+            (name, compilePropertyValue(name, value))
+            for name, value in self.properties
+        )
+        self._hash = hash(self.properties)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledStyle) and \
+            self._hash == other._hash and \
+            self.properties == other.properties
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+# Maximum number of computed styles kept for reuse; the set is cleared
+# when it grows larger, which only happens if the styles keep changing.
+MAX_COMPUTED_STYLES = 512
+
+# (parent ComputedStyle, CompiledStyle) -> ComputedStyle
+_computedStyles = {}
+
+
+class ComputedStyle(object):
+    """
+    Immutable, hashable style of an element: its compiled style
+    cascaded over the computed style of its parent element, with all
+    the measurements resolved into points.
+
+    Computed styles are created by ComputedStyle.get(), which returns
+    the same object for the same element in the same context, so they
+    are shared by all the documents laid out with the same styles.
+    """
+
+    __slots__ = ("properties", "values", "_cascadedValues", "_key", "_hash")
+
+    # This is just a set version of STYLE_UNINHERITED_PROPERTIES.
+    uninheritedProps = frozenset(STYLE_UNINHERITED_PROPERTIES)
+
+    @classmethod
+    def get(cls, parent, compiled):
+        """
+        Returns the computed style of an element with the given
+        compiled style and the given parent computed style (None for
+        the root element).
+        """
+
+        key = (parent, compiled)
+        computed = _computedStyles.get(key)
+        if computed is None:
+            if len(_computedStyles) >= MAX_COMPUTED_STYLES:
+                _computedStyles.clear()
+            computed = cls(parent, compiled)
+            _computedStyles[key] = computed
+        return computed
+
+    def __init__(self, parent, compiled):
+        """
+        Cascades the given compiled style over the given parent
+        computed style; use ComputedStyle.get() instead.
+        """
+
+        properties = {}
+        cascadedValues = {}
+        if parent is not None:
+            for name, value in parent.properties:
+                if name not in self.uninheritedProps:
+                    properties[name] = value
+                    cascadedValues[name] = parent._cascadedValues[name]
+
+        properties.update(compiled.properties)
+        cascadedValues.update(compiled.values)
+
+        # Measurements in ems, including the inherited ones, are
+        # relative to the font size of the element itself, except for
+        # the font size, which is relative to that of the parent.
+        values = dict(cascadedValues)
+        fontSize = values.get("font_size")
+        if isinstance(fontSize, EmSize):
+            fontSize = fontSize * parent.values["font_size"]
+            values["font_size"] = cascadedValues["font_size"] = fontSize
+        for name, value in values.iteritems():
+            if isinstance(value, EmSize):
+                values[name] = value * fontSize
+
+        self.properties = frozenset(properties.iteritems())
+        self.values = values
+        self._cascadedValues = cascadedValues
+
+        # The same properties resolve to different values under
+        # parents with different font sizes.
+        self._key = (self.properties, frozenset(values.iteritems()))
+        self._hash = hash(self._key)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, ComputedStyle) and \
+            self._hash == other._hash and \
+            self._key == other._key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
 # ----------------------------------------------------------------------------
 # Style Registry
 # ----------------------------------------------------------------------------
@@ -213,6 +399,9 @@ class StyleRegistry(object):
 
         self._styleDict = {}
 
+        # Selector -> CompiledStyle of its properties
+        self._compiledDict = {}
+
     def __validateKeys(self, style_dict):
         """
         Makes sure that the keys of dict are the names of valid style
@@ -253,6 +442,7 @@ class StyleRegistry(object):
             raise ValueError("Style '%s' already exists." % selector)
 
         self.__validateKeys(properties)
+        self._compiledDict[selector] = CompiledStyle(properties)
         self._styleDict[selector] = properties
 
     def findMatch(self, selector):
@@ -277,6 +467,22 @@ class StyleRegistry(object):
 
         return self._styleDict.get(selector, None)
 
+    def findCompiledMatch(self, selector):
+        """
+        Given a selector, returns the CompiledStyle corresponding to it,
+        or None if no match is found.
+
+        Examples:
+
+        >>> styles = StyleRegistry()
+        >>> styles.add( 'document', width = '1000pt', color = '#ff0000' )
+        >>> style = styles.findCompiledMatch( 'document' )
+        >>> style.values['width'], tuple( style.values['color'] )
+        (1000.0, (1.0, 0.0, 0.0, 1.0))
+        """
+
+        return self._compiledDict.get(selector, None)
+
     def update(self, selector, **properties):
         """
         Updates the styles for selector to those described by
@@ -294,7 +500,34 @@ class StyleRegistry(object):
         assert selector in self._styleDict
 
         self.__validateKeys(properties)
-        self._styleDict[selector].update(properties)
+        styleDict = self._styleDict[selector]
+        if all(styleDict.get(key, self) == value
+               for key, value in properties.iteritems()):
+            # Nothing changes, keep the compiled style
+            return
+        compiled = CompiledStyle(dict(styleDict, **properties))
+        styleDict.update(properties)
+        self._compiledDict[selector] = compiled
+
+    def getSnapshot(self):
+        """
+        Returns a hashable snapshot of the current styles; snapshots of
+        registries holding the same styles are equal.
+
+        Examples:
+
+        >>> styles = StyleRegistry()
+        >>> styles.add( 'document', width = '1000pt' )
+        >>> snapshot = styles.getSnapshot()
+        >>> styles.update( 'document', width = '500pt' )
+        >>> snapshot == styles.getSnapshot()
+        False
+        >>> styles.update( 'document', width = '1000pt' )
+        >>> snapshot == styles.getSnapshot()
+        True
+        """
+
+        return frozenset(self._compiledDict.iteritems())
 
 
 class InvalidPropertyError(Exception):
@@ -316,9 +549,6 @@ class CascadingStyleStack(object):
     the XML text layout markup.
     """
 
-    # This is just a set version of STYLE_UNINHERITED_PROPERTIES.
-    uninheritedProps = set(STYLE_UNINHERITED_PROPERTIES)
-
     def __init__(self):
         """
         Creates an empty stack.
@@ -329,25 +559,22 @@ class CascadingStyleStack(object):
     def push(self, newStyle):
         """
         Push a new style onto the Cascading Style Stack, making it the
-        current style.
+        current style.  The style is either a CompiledStyle, or a
+        dictionary of style properties.
         """
 
+        if not isinstance(newStyle, CompiledStyle):
+            newStyle = CompiledStyle(newStyle)
+
         if len(self.__stack) > 0:
             # "Cascade" the new style by combining it with our current
             # style, removing any uninherited properties first.
-
-            currStyle = self.__stack[-1].copy()
-            props = self.uninheritedProps.intersection(currStyle.keys())
-
-            for key in props:
-                del currStyle[key]
-
-            currStyle.update(newStyle)
-            self.__stack.append(currStyle)
+            parent = self.__stack[-1]
         else:
             # Set this style as our current style.
+            parent = None
 
-            self.__stack.append(newStyle)
+        self.__stack.append(ComputedStyle.get(parent, newStyle))
 
     def pop(self):
         """
@@ -363,8 +590,7 @@ class CascadingStyleStack(object):
         """
 
         if unitsStr.endswith("em"):
-            currEmSizeStr = self.__stack[-1]["font_size"]
-            currEmSize = self._strToPoints(currEmSizeStr)
+            currEmSize = self.__stack[-1].values["font_size"]
             units = float(unitsStr[:-2])
             return units * currEmSize
         else:
@@ -376,8 +602,7 @@ class CascadingStyleStack(object):
         floating-point value measured in points.
         """
 
-        propertyStr = self.__stack[-1][propertyName]
-        return self._strToPoints(propertyStr)
+        return self.__stack[-1].values[propertyName]
 
     def _propertyToInt(self, propertyName):
         """
@@ -385,7 +610,7 @@ class CascadingStyleStack(object):
         value.
         """
 
-        return int(self.__stack[-1][propertyName])
+        return self.__stack[-1].values[propertyName]
 
     def _propertyToBool(self, propertyName):
         """
@@ -393,7 +618,7 @@ class CascadingStyleStack(object):
         value.
         """
 
-        return stringToBool(self.__stack[-1][propertyName])
+        return self.__stack[-1].values[propertyName]
 
     def _propertyToColor(self, propertyName):
         """
@@ -401,14 +626,14 @@ class CascadingStyleStack(object):
         a) color tuple.
         """
 
-        return colorHashToRgba(self.__stack[-1][propertyName])
+        return self.__stack[-1].values[propertyName]
 
     def _property(self, propertyName):
         """
         Returns the value of the given property name as a string.
         """
 
-        return self.__stack[-1][propertyName]
+        return self.__stack[-1].values[propertyName]
 
     def makeNewDocument(self):
         """
@@ -455,8 +680,7 @@ class CascadingStyleStack(object):
 
         color = self._propertyToColor("color")
 
-        for char in characters:
-            fontGlyph = fontObj.getGlyph(char)
+        for fontGlyph in fontObj.getGlyphs(characters):
             glyph = textlayout.Glyph(
                 fontGlyph,
                 color,
@@ -585,22 +809,22 @@ class _XmlMarkupHandler(xml.sax.handler.ContentHandler):
         use the style named by the tag.
         """
 
-        styleDict = None
+        style = None
 
         styleAttr = attrs.get("style", None)
         if styleAttr:
-            styleDict = self.styleRegistry.findMatch(styleAttr)
+            style = self.styleRegistry.findCompiledMatch(styleAttr)
 
-        if styleDict is None:
-            styleDict = self.styleRegistry.findMatch(name)
+        if style is None:
+            style = self.styleRegistry.findCompiledMatch(name)
 
-        if styleDict is None:
+        if style is None:
             raise ValueError, "No style found for: %s, %s" % (
                 name,
                 str(styleAttr)
             )
 
-        self.style.push(styleDict)
+        self.style.push(style)
 
     def startElement(self, name, attrs):
         """
@@ -691,22 +915,22 @@ class _LXmlMarkupHandler(object):
         use the style named by the tag.
         """
 
-        styleDict = None
+        style = None
 
         styleAttr = attrs.get("style", None)
         if styleAttr:
-            styleDict = self.styleRegistry.findMatch(styleAttr)
+            style = self.styleRegistry.findCompiledMatch(styleAttr)
 
-        if styleDict is None:
-            styleDict = self.styleRegistry.findMatch(name)
+        if style is None:
+            style = self.styleRegistry.findCompiledMatch(name)
 
-        if styleDict is None:
+        if style is None:
             raise ValueError, "No style found for: %s, %s" % (
                 name,
                 str(styleAttr)
             )
 
-        self.style.push(styleDict)
+        self.style.push(style)
 
     def start(self, name, attrs):
         """
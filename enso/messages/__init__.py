@@ -126,6 +126,7 @@
 import logging
 import time
 
+from enso import config
 
 # ----------------------------------------------------------------------------
 # Message Object
@@ -410,6 +411,10 @@ class MessageManager(object):
         self.__messageGraveyard = []
         self.__onDismissalFunc = None
 
+        # The worker laying out messages in the background (see
+        # config.MESSAGES_ASYNC_LAYOUT), created on demand.
+        self.__layoutWorker = None
+
     def newMessage(self, msg, onDismissal=None, position=(None, None)):
         """
         Adds a new message to the queue, which will get displayed and
@@ -487,6 +492,21 @@ class MessageManager(object):
         del self.__primaryMsgWind
         self.__primaryMsgWind = None
 
+    def getLayoutWorker(self):
+        """
+        Returns the LayoutWorker that the message windows use to lay
+        out messages in the background, or None if messages are laid
+        out synchronously.
+        """
+
+        if not config.MESSAGES_ASYNC_LAYOUT:
+            return None
+        if self.__layoutWorker is None:
+            from enso.messages.layoutworker import LayoutWorker
+
+            self.__layoutWorker = LayoutWorker(self.__evtManager)
+        return self.__layoutWorker
+
     def getRecentMessage(self):
         return self.__messageGraveyard[0] if len(self.__messageGraveyard) > 0 else None
 
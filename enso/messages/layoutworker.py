@@ -0,0 +1,208 @@
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.messages.layoutworker
+#
+# ----------------------------------------------------------------------------
+
+"""
+    Implements a worker thread that lays out the XML of primary and
+    mini messages in the background, so that long messages don't hold
+    up the handling of the keyboard on the event thread.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import logging
+import threading
+from collections import deque
+from Queue import Queue
+
+
+# ----------------------------------------------------------------------------
+# The LayoutWorker
+# ----------------------------------------------------------------------------
+
+class LayoutJob(object):
+    """
+    A layout submitted to the LayoutWorker.
+    """
+
+    __slots__ = ("func", "args", "onDone", "onError", "isCancelled")
+
+    def __init__(self, func, args, onDone, onError):
+        self.func = func
+        self.args = args
+        self.onDone = onDone
+        self.onError = onError
+        self.isCancelled = False
+
+    def cancel(self):
+        """
+        Cancels the job: it is skipped if it has not started yet, and
+        its callbacks are not called.
+        """
+
+        self.isCancelled = True
+
+
+class LayoutWorker(object):
+    """
+    Runs layout jobs on a worker thread, one at a time, in the order
+    they were submitted.
+
+    The finished jobs are handed back to the event thread: while any
+    job is pending, the worker responds to "timer" events and calls
+    the callbacks of the finished jobs from there, so that the
+    documents are rendered on the event thread.
+    """
+
+    def __init__(self, eventManager):
+        """
+        Initializes the worker; the thread is started by the first
+        submitted job.
+        """
+
+        self.__evtManager = eventManager
+        self.__queue = None
+        self.__thread = None
+        self.__isPolling = False
+
+        # Number of the submitted jobs not handed back yet.
+        self.__numPending = 0
+
+        # (job, result, exception) tuples of the finished jobs,
+        # appended by the worker thread.
+        self.__finished = deque()
+
+    def submit(self, func, args, onDone, onError=None):
+        """
+        Schedules func(*args) to be run on the worker thread.  Once it
+        has finished, onDone(result) is called on the event thread, or
+        onError(exception) if func raised an exception.
+
+        Returns the LayoutJob, which can be cancelled.
+        """
+
+        job = LayoutJob(func, args, onDone, onError)
+        self.__start()
+        self.__numPending += 1
+        self.__startPolling()
+        self.__queue.put_nowait(job)
+        return job
+
+    def isPending(self):
+        """
+        Returns whether any submitted job was not handed back yet.
+        """
+
+        return self.__numPending > 0
+
+    def onTick(self, msPassed):
+        """
+        Called on a timer event; hands the finished jobs back.
+        """
+
+        # So pychecker doesn't complain
+        dummy = msPassed
+
+        while self.__finished:
+            job, result, exception = self.__finished.popleft()
+            self.__numPending -= 1
+            if job.isCancelled:
+                continue
+            if exception is None:
+                job.onDone(result)
+            elif job.onError is not None:
+                job.onError(exception)
+
+        if self.__numPending == 0:
+            self.__stopPolling()
+
+    def stop(self):
+        """
+        Stops the worker thread once it has finished the submitted
+        jobs.  The thread is started again by the next submitted job.
+        """
+
+        if self.__thread is not None:
+            # None stops the thread.
+            self.__queue.put_nowait(None)
+            self.__queue = None
+            self.__thread = None
+
+    def __startPolling(self):
+        if not self.__isPolling:
+            self.__isPolling = True
+            self.__evtManager.registerResponder(self.onTick, "timer")
+
+    def __stopPolling(self):
+        if self.__isPolling:
+            self.__isPolling = False
+            self.__evtManager.removeResponder(self.onTick)
+
+    def __start(self):
+        """
+        Starts the worker thread if it is not running.
+        """
+
+        if self.__thread is None:
+            # Each thread gets its own queue, so that a stopping
+            # thread never picks up the jobs of its successor.
+            self.__queue = Queue()
+            self.__thread = threading.Thread(
+                target=self.__run, args=(self.__queue,),
+                name="LayoutWorker")
+            self.__thread.setDaemon(True)
+            self.__thread.start()
+
+    def __run(self, queue):
+        """
+        Worker thread function.  Runs the jobs from the queue until it
+        gets None.
+        """
+
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+
+            result = exception = None
+            if not job.isCancelled:
+                try:
+                    result = job.func(*job.args)
+                except Exception as e:
+                    logging.error("Error laying out message: %s", e)
+                    exception = e
+
+            # Cancelled jobs are handed back too, to be counted.
+            self.__finished.append((job, result, exception))
@@ -99,6 +99,11 @@ class MiniMessageQueue(object):
         self.__mousePos = None
         self.__mouseChanged = False
 
+        # Jobs laying out the new messages on the layout worker, and
+        # the documents of the laid out ones, by message.
+        self.__layoutJobs = {}
+        self.__layouts = {}
+
     def hideAll(self):
         if self.__hidingAll:
             return
@@ -111,6 +116,13 @@ class MiniMessageQueue(object):
             return
         else:
             self.__newMessages.append(msg)
+            layoutWorker = self.__msgManager.getLayoutWorker()
+            if layoutWorker is not None:
+                self.__layoutJobs[msg] = layoutWorker.submit(
+                    layoutMiniMessage, (msg,),
+                    lambda doc: self.__onMessageLaidOut(msg, doc),
+                    lambda exception: self.__onMessageLaidOut(msg, None),
+                )
             # Switch to polling to trigger the animation.
             if self.__status == self.STATUS_EMPTY:
                 self.__startPolling()
@@ -179,7 +191,8 @@ class MiniMessageQueue(object):
                     and len(self.__newMessages) == 0:
                 # There are no messages to poll for!
                 self.__stopPolling()
-            elif len(self.__newMessages) != 0:
+            elif len(self.__newMessages) != 0 \
+                    and self.__newMessages[0] not in self.__layoutJobs:
                 self.__startAppearing(self.__newMessages.pop(0))
             elif self.__hidingAll:
                 if len(self.__visibleMessages) > 0:
@@ -198,6 +211,17 @@ class MiniMessageQueue(object):
             assert False, "Unhandled status value!"
             pass
 
+    def __onMessageLaidOut(self, msg, doc):
+        """
+        Called on the event thread when the layout worker has laid out
+        a new message; doc is None if the layout failed, and the
+        message is then laid out again when it appears.
+        """
+
+        self.__layoutJobs.pop(msg, None)
+        if doc is not None:
+            self.__layouts[msg] = doc
+
     def __showHelpMessage(self, xPos, yPos, rounded):
         if self.__helpWindow is None:
             msgXml = config.MINI_MSG_HELP_XML
@@ -273,7 +297,8 @@ class MiniMessageQueue(object):
         #    # Startbar is on the right.
         #    xPos -= pixelsToPoints(taskBarSize[0])
 
-        newWindow = MiniMessageWindow(msg, xPos, yPos)
+        newWindow = MiniMessageWindow(msg, xPos, yPos,
+                                      self.__layouts.pop(msg, None))
         self.__visibleMessages.append(newWindow)
         self.__changingIndex = len(self.__visibleMessages) - 1
         self.__status = self.STATUS_APPEARING
@@ -350,9 +375,15 @@ class MiniMessageWindow(MessageWindow):
     LONGTERM TODO: More documentation for this class and its methods.
     """
 
-    def __init__(self, msg, xPos, yPos):
+    def __init__(self, msg, xPos, yPos, doc=None):
+        """
+        Creates the window of the msg; doc is the laid out message, if
+        it was laid out already (see layoutMiniMessage()).
+        """
+
         MessageWindow.__init__(self, MINI_WIND_SIZE)
         self.__isRounded = False
+        self.__doc = doc
         self.__draw(msg, xPos, yPos)
         self.isFinishedVanishing = False
         self.isFinishedAppearing = False
@@ -438,8 +469,11 @@ class MiniMessageWindow(MessageWindow):
 
         self.setPos(xPos, yPos)
 
-        docSize = width - 2 * MINI_MARGIN, height - 2 * MINI_MARGIN
-        doc = self.__layout(msg, docSize[0], docSize[1])
+        # The message is laid out once, and redrawn when the corners
+        # change.
+        if self.__doc is None:
+            self.__doc = layoutMiniMessage(msg)
+        doc = self.__doc
 
         afterWidth = computeWidth(doc)
         afterHeight = doc.height
@@ -463,25 +497,38 @@ class MiniMessageWindow(MessageWindow):
 
         doc.draw(xPos, yPos, cr)
 
-    @staticmethod
-    def __layout(msg, width, height):
-        text = msg.getMiniXml()
-        text = "<document>%s</document>" % text
-        for size in reversed(MINI_SCALE[1:]):
-            try:
-                doc = layoutMessageXml(xmlMarkup=text,
-                                       width=width,
-                                       size=size,
-                                       height=height, )
-                return doc
-            except Exception as e:
-                # TODO: Lookup actual errors and catch them.
-                logging.error(e)
-
-        doc = layoutMessageXml(xmlMarkup=text,
-                               width=width,
-                               size=size,
-                               height=height,
-                               ellipsify="true",
-                               )
-        return doc
+
+# ----------------------------------------------------------------------------
+# Mini Message Layout
+# ----------------------------------------------------------------------------
+
+def layoutMiniMessage(msg):
+    """
+    Lays out the mini XML of msg to fit in a mini message window.  This
+    is called on the layout worker thread, if there is one.
+    """
+
+    width, height = MINI_WIND_SIZE
+    width -= 2 * MINI_MARGIN
+    height -= 2 * MINI_MARGIN
+
+    text = msg.getMiniXml()
+    text = "<document>%s</document>" % text
+    for size in reversed(MINI_SCALE[1:]):
+        try:
+            doc = layoutMessageXml(xmlMarkup=text,
+                                   width=width,
+                                   size=size,
+                                   height=height, )
+            return doc
+        except Exception as e:
+            # TODO: Lookup actual errors and catch them.
+            logging.error(e)
+
+    doc = layoutMessageXml(xmlMarkup=text,
+                           width=width,
+                           size=size,
+                           height=height,
+                           ellipsify="true",
+                           )
+    return doc
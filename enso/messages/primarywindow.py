@@ -41,6 +41,7 @@
 # ----------------------------------------------------------------------------
 
 import logging
+import threading
 from collections import namedtuple
 
 from enso import graphics
@@ -135,6 +136,9 @@ class PrimaryMsgWind(MessageWindow):
         self.__wait_time = DEFAULT_WAIT_TIME
         self.__timeSinceCreated = None
 
+        # The job laying out the message on the layout worker, if any.
+        self.__layoutJob = None
+
     def setMessage(self, message):
         """
         Sets the current primary message to "message".
@@ -147,16 +151,23 @@ class PrimaryMsgWind(MessageWindow):
         # Set the current primary message, and draw it.
         self.__msg = message
 
+        layoutWorker = self.__msgManager.getLayoutWorker()
+        if layoutWorker is not None:
+            # The message is drawn once the worker has laid it out.
+            self.__layoutJob = layoutWorker.submit(
+                self.__layoutMessage,
+                (message.getPrimaryXml(), self.getMaxSize()),
+                self.__onMessageLaidOut,
+                self.__onMessageLayoutError,
+            )
+            return
+
         try:
-            self.__drawMessage()
+            self.__drawMessage(
+                self.__layoutMessage(message.getPrimaryXml(),
+                                     self.getMaxSize()))
         finally:
-            # Now, set a time-responder to wait for a bit, so that the
-            # user doesn't accidentally clear the message before it registers
-            # as existing.
-            self.__timeSinceCreated = 0
-            self.__wait_time = max(self.__msg.getWaitTime(), DEFAULT_WAIT_TIME)
-            self.__evtManager.registerResponder(self.waitTick, "timer")
-            self.__waiting = True
+            self.__startWaiting()
 
     def dismiss(self, no_fadeout=False):
         """
@@ -167,6 +178,10 @@ class PrimaryMsgWind(MessageWindow):
         if self.__msg is None:
             return
 
+        if self.__layoutJob is not None:
+            # The message is not drawn yet, there is nothing to fade out.
+            no_fadeout = True
+
         if no_fadeout:
             # No fadeout animation, interrupt all stages and hide window
             self.__interrupt()
@@ -230,6 +245,44 @@ class PrimaryMsgWind(MessageWindow):
         if self._wind.getOpacity() == 255:
             self._wind.grabPointer()
 
+    def __startWaiting(self):
+        """
+        Sets a time-responder to wait for a bit, so that the user
+        doesn't accidentally clear the message before it registers as
+        existing.
+        """
+
+        self.__timeSinceCreated = 0
+        self.__wait_time = max(self.__msg.getWaitTime(), DEFAULT_WAIT_TIME)
+        self.__evtManager.registerResponder(self.waitTick, "timer")
+        self.__waiting = True
+
+    def __onMessageLaidOut(self, layout):
+        """
+        Called on the event thread when the layout worker has laid out
+        the current message.
+        """
+
+        self.__layoutJob = None
+        try:
+            self.__drawMessage(layout)
+        finally:
+            self.__startWaiting()
+
+    def __onMessageLayoutError(self, exception):
+        """
+        Called on the event thread when the layout worker failed to
+        lay out the current message.
+        """
+
+        # So pychecker doesn't complain
+        dummy = exception
+
+        # The error is logged by the worker; as when drawing the
+        # message fails, the message can still be dismissed.
+        self.__layoutJob = None
+        self.__startWaiting()
+
     def __position(self):
         """
         Centers the message window horizontally using the current size.
@@ -251,6 +304,11 @@ class PrimaryMsgWind(MessageWindow):
         its animation, and/or
         """
 
+        if self.__layoutJob is not None:
+            # The old message is still being laid out.
+            self.__layoutJob.cancel()
+            self.__layoutJob = None
+
         if self.__msg is not None:
             # If there's an old message, then we've got an
             # event responder registered:
@@ -268,26 +326,45 @@ class PrimaryMsgWind(MessageWindow):
 
         # self.__msgManager.onPrimaryMessageFinished()
 
-    def __drawMessage(self):
+    @staticmethod
+    def __layoutMessage(text, maxSize):
         """
-        Draws the current message to the underlying Cairo context.
+        Lays out the primary XML of a message in a window of the given
+        maximum size.  This is called on the layout worker thread, if
+        there is one.
+
+        Returns named tuple
+          MessageLayout( width, height, msgDoc, capDoc, msgPos, capPos )
         """
 
-        # This function is the master drawing function; all layout and
-        # rendering methods are called from here.
+        # This function is the master layout function; all layout
+        # methods are called from here.
 
-        text = self.__msg.getPrimaryXml()
+        MessageLayout = namedtuple(
+            'MessageLayout', 'width height msgDoc capDoc msgPos capPos')
 
         msgText, capText = splitContent(text)
-        width, height = self.getMaxSize()
+        width, height = maxSize
         width -= 2 * PRIM_MSG_MARGIN
         height -= 2 * PRIM_MSG_MARGIN
-        msgDoc, capDoc = self.__layoutText(msgText,
-                                           capText,
-                                           width,
-                                           height)
+        msgDoc, capDoc = PrimaryMsgWind.__layoutText(msgText,
+                                                     capText,
+                                                     width,
+                                                     height)
         width, height, msgPos, capPos = \
-            self.__layoutBlocks(msgDoc, capDoc)
+            PrimaryMsgWind.__layoutBlocks(msgDoc, capDoc)
+        return MessageLayout(width, height, msgDoc, capDoc, msgPos, capPos)
+
+    def __drawMessage(self, layout):
+        """
+        Draws the laid out current message to the underlying Cairo
+        context.
+        """
+
+        # This function is the master drawing function; all rendering
+        # methods are called from here.
+
+        width, height, msgDoc, capDoc, msgPos, capPos = layout
 
         # Set the window size and draw the outlining rectangle
         self.__setSize(width, height, False)
@@ -516,6 +593,10 @@ _styles.add(
     color="#DD2222",
 )
 
+# Guards the style registry, which is updated for every layout; the
+# messages are also laid out by the layout worker.
+_layoutLock = threading.Lock()
+
 # The tag aliases for primary message XML.
 _tagAliases = xmltextlayout.XmlMarkupTagAliases()
 _tagAliases.add("p", baseElement="block")
@@ -540,34 +621,35 @@ def layoutMessageXml(xmlMarkup, width, size, height, ellipsify="false",
 
     maxLines = int(height / (size * LINE_SPACING))
 
-    _styles.update("document",
-                   width="%fpt" % width,
-                   line_height="%spt" % int(size * LINE_SPACING),
-                   max_lines=maxLines,
-                   font_size="%spt" % size,
-                   ellipsify=ellipsify,
-                   )
-
-    try:
-        document = xmltextlayout.xmlMarkupToDocument(
-            xmlMarkup,
-            _styles,
-            _tagAliases
-        )
-    except MaxLinesExceededError:
-        pass
-    except Exception as e:
-        if raiseLayoutExceptions:
-            raise
-        logging.warn("Could not layout message text %s; got error %s"
-                     % (xmlMarkup, e))
-        document = xmltextlayout.xmlMarkupToDocument(
-            "<document><p>%s</p>%s</document>" %
-            (escape_xml(xmlMarkup.strip()),
-             "<caption>from a broken message</caption>"),
-            _styles,
-            _tagAliases
-        )
+    with _layoutLock:
+        _styles.update("document",
+                       width="%fpt" % width,
+                       line_height="%spt" % int(size * LINE_SPACING),
+                       max_lines=maxLines,
+                       font_size="%spt" % size,
+                       ellipsify=ellipsify,
+                       )
+
+        try:
+            document = xmltextlayout.xmlMarkupToDocument(
+                xmlMarkup,
+                _styles,
+                _tagAliases
+            )
+        except MaxLinesExceededError:
+            pass
+        except Exception as e:
+            if raiseLayoutExceptions:
+                raise
+            logging.warn("Could not layout message text %s; got error %s"
+                         % (xmlMarkup, e))
+            document = xmltextlayout.xmlMarkupToDocument(
+                "<document><p>%s</p>%s</document>" %
+                (escape_xml(xmlMarkup.strip()),
+                 "<caption>from a broken message</caption>"),
+                _styles,
+                _tagAliases
+            )
 
     return document
 
@@ -37,6 +37,7 @@ __updated__ = "2018-07-04"
 import atexit
 import logging
 import os
+import time
 from threading import Thread
 
 import gobject
@@ -59,6 +60,10 @@ _TIMER_INTERVAL = 0.010
 # Timer interval in milliseconds.
 _TIMER_INTERVAL_IN_MS = int(_TIMER_INTERVAL * 1000)
 
+# Longest interval between two timer ticks, in milliseconds; the timer
+# ticks less often when the event manager has nothing to do.
+_MAX_TIMER_INTERVAL_IN_MS = 1000
+
 # Input modes
 QUASI_MODAL = 0
 MODAL = 1
@@ -406,6 +411,12 @@ class InputManager (object):
 
     __keyListener = None
 
+    # The gobject timeout calling onTick(), its delay in ms, and the
+    # time it was last (re)started at
+    __timeoutSource = None
+    __tickDelay = None
+    __tickStarted = None
+
     def __init__(self):
         '''Initialize object'''
         pass
@@ -413,13 +424,47 @@ class InputManager (object):
     def __timerCallback(self):
         '''Handle gobject timeout'''
         with gtk.gdk.lock:
+            source = self.__timeoutSource
+            now = time.time()
+            msPassed = int(round((now - self.__tickStarted) * 1000))
+            self.__tickStarted = now
             try:
-                self.onTick(_TIMER_INTERVAL_IN_MS)
+                self.onTick(msPassed)
             except KeyboardInterrupt:
                 gtk.main_quit()
                 return False
             finally:
-                return True  # Return true to keep the timeout running
+                # Return true to keep the timeout running, or start
+                # one with a different delay
+                if self.__timeoutSource != source:
+                    # Restarted by rescheduleTick() meanwhile
+                    return False
+                delay = self.__getTickDelay()
+                if delay == self.__tickDelay:
+                    return True
+                self.__startTimeout(delay)
+                return False
+
+    def __getTickDelay(self):
+        '''Delay (in ms) until the next onTick() call'''
+        return int(min(max(self.getTickDelay(), _TIMER_INTERVAL_IN_MS),
+                       _MAX_TIMER_INTERVAL_IN_MS))
+
+    def __startTimeout(self, delay):
+        '''Start the gobject timeout calling onTick()'''
+        self.__timeoutSource = gobject.timeout_add(delay,
+                                                   self.__timerCallback)
+        self.__tickDelay = delay
+        self.__tickStarted = time.time()
+
+    def rescheduleTick(self):
+        '''Called when onTick() may be needed sooner than planned'''
+        if self.__timeoutSource is None:
+            return
+        delay = self.__getTickDelay()
+        if delay < self.__tickDelay:
+            gobject.source_remove(self.__timeoutSource)
+            self.__startTimeout(delay)
 
     def __keyCallback(self, info):
         '''Handle callbacks from KeyListener'''
@@ -445,8 +490,7 @@ class InputManager (object):
         '''Main input events processing loop'''
         logging.info("Entering InputManager.run ()")
 
-        timeout_source = gobject.timeout_add(_TIMER_INTERVAL_IN_MS,
-                                             self.__timerCallback)
+        self.__startTimeout(_TIMER_INTERVAL_IN_MS)
 
         self.__keyListener = _KeyListener(self, self.__keyCallback)
         self.__keyListener.start()
@@ -463,7 +507,8 @@ class InputManager (object):
                 logging.error(e)
         finally:
             self.__keyListener.stop()
-            gobject.source_remove(timeout_source)
+            gobject.source_remove(self.__timeoutSource)
+            self.__timeoutSource = None
 
         logging.info("Exiting InputManager.run ()")
         exit(1)
@@ -519,6 +564,10 @@ class InputManager (object):
         else:
             self.__keyListener.disable_caps_lock()
 
+    def getTickDelay(self):
+        '''Return the delay (in ms) the next onTick() call can wait'''
+        return _TIMER_INTERVAL_IN_MS
+
     def onTick(self, msPassed):
         pass
 
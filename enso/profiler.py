@@ -0,0 +1,610 @@
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.profiler
+#
+# ----------------------------------------------------------------------------
+
+"""
+    Aggregates the time spent dispatching the events of the
+    EventManager into per-event and per-responder latency histograms,
+    e.g. to find out which plugin makes the quasimode sluggish.
+
+    The histograms have a fixed number of buckets and the number of
+    the responders tracked is capped, so the memory used by the
+    profiler stays bounded however long Enso runs.
+
+    Also implements the LatencyTracer, which follows each keystroke
+    typed in the quasimode until the quasimode windows are drawn,
+    keeping the most recent traces in a ring buffer.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+
+# ----------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------
+
+# Clock used to time the dispatches; time.time() ticks only every
+# 15ms or so on Windows.
+if sys.platform.startswith("win"):
+    clock = time.clock
+else:
+    clock = time.time
+
+# Upper bounds (in seconds) of the histogram buckets: each bucket is
+# 2 ** 0.25 times (~19%) wider than the previous one, from 1us to
+# about 2 minutes.  The percentiles are estimated to within the width
+# of a bucket.
+_BUCKET_BOUNDS = tuple(1e-6 * 2 ** (i / 4.0) for i in range(108))
+
+# Maximum number of the responders tracked by a profiler; the time
+# spent in the responders above the limit is aggregated under
+# OTHER_RESPONDERS.
+MAX_RESPONDERS = 512
+
+OTHER_RESPONDERS = "(other)"
+
+# Number of the most recent keystrokes kept by the LatencyTracer
+MAX_TRACES = 256
+
+
+# ----------------------------------------------------------------------------
+# Histograms
+# ----------------------------------------------------------------------------
+
+class LatencyHistogram(object):
+    """
+    A histogram of durations with logarithmically sized buckets.
+    """
+
+    __slots__ = ("count", "total", "max", "__buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.__buckets = [0] * (len(_BUCKET_BOUNDS) + 1)
+
+    def add(self, elapsed):
+        """
+        Adds a duration, in seconds.
+        """
+
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.__buckets[bisect.bisect_left(_BUCKET_BOUNDS, elapsed)] += 1
+
+    def getPercentile(self, percent):
+        """
+        Returns the estimated duration, in seconds, below which the
+        given percentage of the durations lie; 0.0 if the histogram
+        is empty.
+        """
+
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for i, bucketCount in enumerate(self.__buckets):
+            seen += bucketCount
+            if seen >= rank and bucketCount:
+                if i < len(_BUCKET_BOUNDS):
+                    return min(_BUCKET_BOUNDS[i], self.max)
+                break
+        return self.max
+
+    def getSummary(self):
+        """
+        Returns a dictionary with the count of the durations and
+        their mean, median, 95th percentile and maximum, in
+        milliseconds.
+        """
+
+        if self.count:
+            mean = self.total / self.count
+        else:
+            mean = 0.0
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": mean * 1000,
+            "p50_ms": self.getPercentile(50) * 1000,
+            "p95_ms": self.getPercentile(95) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+# ----------------------------------------------------------------------------
+# Responder names
+# ----------------------------------------------------------------------------
+
+def getResponderName(func):
+    """
+    Returns a readable name of an event responder, e.g.
+    "enso.quasimode.Quasimode.onKeyEvent".
+    """
+
+    # Unwrap the EventResponderFuncWrapper objects
+    getFunction = getattr(func, "get_function", None)
+    if getFunction is not None:
+        func = getFunction()
+
+    # functools.partial objects
+    func = getattr(func, "func", func)
+
+    name = getattr(func, "__name__", None)
+    if name is None:
+        return repr(func)
+    owner = getattr(func, "__self__", None)
+    if owner is not None:
+        if not isinstance(owner, type):
+            owner = owner.__class__
+        return "%s.%s.%s" % (owner.__module__, owner.__name__, name)
+    module = getattr(func, "__module__", None)
+    if module:
+        return "%s.%s" % (module, name)
+    return name
+
+
+# ----------------------------------------------------------------------------
+# The DispatchProfiler
+# ----------------------------------------------------------------------------
+
+class DispatchProfiler(object):
+    """
+    Collects the dispatch times of the events, as a whole and per
+    responder, while it is enabled.
+    """
+
+    def __init__(self, maxResponders=MAX_RESPONDERS):
+        self.__maxResponders = maxResponders
+        self.__enabled = False
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def isEnabled(self):
+        return self.__enabled
+
+    def enable(self):
+        self.__enabled = True
+
+    def disable(self):
+        self.__enabled = False
+
+    def reset(self):
+        """
+        Discards all the collected times.
+        """
+
+        with self.__lock:
+            # eventType -> LatencyHistogram of the whole dispatches
+            self.__events = {}
+            # eventType -> { responder name -> LatencyHistogram }
+            self.__responders = {}
+            self.__numResponders = 0
+            # Responder function -> name
+            self.__names = {}
+            self.__started = time.time()
+
+    def recordDispatch(self, eventType, elapsed):
+        """
+        Records that dispatching an event of the given type to all
+        its responders took elapsed seconds.
+        """
+
+        with self.__lock:
+            histogram = self.__events.get(eventType)
+            if histogram is None:
+                histogram = self.__events[eventType] = LatencyHistogram()
+            histogram.add(elapsed)
+
+    def recordResponder(self, eventType, func, elapsed):
+        """
+        Records that the responder func took elapsed seconds to handle
+        an event of the given type.
+        """
+
+        with self.__lock:
+            self.__getResponderHistogram(eventType, func).add(elapsed)
+
+    def recordPerf(self, eventType, perf):
+        """
+        Records the (func, args, kwargs, elapsed) tuples returned by
+        EventManager.triggerEvent().
+        """
+
+        with self.__lock:
+            for func, _, _, elapsed in perf:
+                self.__getResponderHistogram(eventType, func).add(elapsed)
+
+    def getStats(self):
+        """
+        Returns the summaries (see LatencyHistogram.getSummary()) of
+        the collected times, as a JSON-serializable dictionary:
+
+          { "events": { eventType: { ...summary...,
+                                     "responders": { name: summary } } },
+            "started": ..., "elapsed_s": ..., "enabled": ... }
+        """
+
+        with self.__lock:
+            events = {}
+            for eventType in set(self.__events) | set(self.__responders):
+                histogram = self.__events.get(eventType, LatencyHistogram())
+                stats = histogram.getSummary()
+                stats["responders"] = dict(
+                    (name, responderHistogram.getSummary())
+                    for name, responderHistogram
+                    in self.__responders.get(eventType, {}).iteritems()
+                )
+                events[eventType] = stats
+            return {
+                "events": events,
+                "started": self.__started,
+                "elapsed_s": time.time() - self.__started,
+                "enabled": self.__enabled,
+            }
+
+    def getSlowestResponders(self, count=10, key="p95_ms"):
+        """
+        Returns a list of up to count (eventType, name, summary)
+        tuples of the responders with the highest value of the given
+        summary key.
+        """
+
+        responders = [
+            (eventType, name, summary)
+            for eventType, stats in self.getStats()["events"].iteritems()
+            for name, summary in stats["responders"].iteritems()
+        ]
+        responders.sort(key=lambda item: item[2][key], reverse=True)
+        return responders[:count]
+
+    def dumpJson(self, fileName):
+        """
+        Writes the statistics returned by getStats() to the given file
+        as JSON.
+        """
+
+        stats = self.getStats()
+        tmpFileName = "%s.%d.tmp" % (fileName, os.getpid())
+        directory = os.path.dirname(fileName)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            with open(tmpFileName, "wb") as f:
+                json.dump(stats, f, indent=2, sort_keys=True)
+            if os.name == "nt" and os.path.exists(fileName):
+                os.remove(fileName)
+            os.rename(tmpFileName, fileName)
+        finally:
+            if os.path.exists(tmpFileName):
+                os.remove(tmpFileName)
+
+    def __getResponderHistogram(self, eventType, func):
+        """
+        Must be called with the lock held.
+        """
+
+        name = self.__names.get(func)
+        if name is None:
+            if len(self.__names) >= 4 * self.__maxResponders:
+                # Handlers can be re-created (e.g. on a scripts reload)
+                self.__names.clear()
+            name = self.__names[func] = getResponderName(func)
+
+        responders = self.__responders.get(eventType)
+        if responders is None:
+            responders = self.__responders[eventType] = {}
+        histogram = responders.get(name)
+        if histogram is None:
+            if self.__numResponders >= self.__maxResponders:
+                name = OTHER_RESPONDERS
+                histogram = responders.get(name)
+            if histogram is None:
+                histogram = responders[name] = LatencyHistogram()
+                self.__numResponders += 1
+        return histogram
+
+
+# ----------------------------------------------------------------------------
+# The LatencyTracer
+# ----------------------------------------------------------------------------
+
+class _NullSpan(object):
+    """
+    The span returned by LatencyTracer.span() when nothing is traced.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """
+    Times a phase of the traced keystrokes, as a context manager.
+    """
+
+    __slots__ = ("tracer", "name", "started")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer._addSpan(self.name, clock() - self.started)
+        return False
+
+
+class LatencyTrace(object):
+    """
+    The timings of one keystroke: when it arrived, when the quasimode
+    text reflecting it was drawn ("visible"), when all the affected
+    windows, including the suggestions, were drawn ("finished"), and
+    the time spent in each phase in between.
+    """
+
+    __slots__ = ("label", "started", "visible", "finished", "phases")
+
+    def __init__(self, label, started):
+        self.label = label
+        self.started = started
+        self.visible = None
+        self.finished = None
+        # Phase name -> [total time, number of spans]
+        self.phases = {}
+
+    def asDict(self):
+        """
+        Returns the trace as a JSON-serializable dictionary, with the
+        times in milliseconds.
+        """
+
+        return {
+            "key": self.label,
+            "visible_ms": (self.visible - self.started) * 1000,
+            "finished_ms": (self.finished - self.started) * 1000,
+            "phases": dict(
+                (name, {"total_ms": total * 1000, "count": count})
+                for name, (total, count) in self.phases.iteritems()
+            ),
+        }
+
+
+class LatencyTracer(object):
+    """
+    Traces the keystrokes from their arrival in the quasimode until
+    the quasimode windows are drawn.
+
+    A trace is started for each keystroke; the spans timed meanwhile,
+    e.g. the suggestion update or the layout, are added to all the
+    keystrokes not drawn yet, as keystrokes typed in a quick
+    succession are drawn together.  The phases can nest, e.g. the
+    layout includes the XML parsing.
+    """
+
+    __instance = None
+
+    @classmethod
+    def get(cls):
+        if cls.__instance is None:
+            cls.__instance = cls()
+        return cls.__instance
+
+    def __init__(self, maxTraces=MAX_TRACES):
+        self.__maxTraces = maxTraces
+        self.__enabled = False
+        self.__lock = threading.Lock()
+        # The finished traces, the oldest first
+        self.__traces = deque(maxlen=maxTraces)
+        # The traces of the keystrokes not drawn yet
+        self.__pending = []
+
+    def isEnabled(self):
+        return self.__enabled
+
+    def enable(self):
+        self.__enabled = True
+
+    def disable(self):
+        self.__enabled = False
+        self.cancelTraces()
+
+    def reset(self):
+        """
+        Discards all the traces.
+        """
+
+        with self.__lock:
+            self.__traces.clear()
+            self.__pending = []
+
+    def startTrace(self, label):
+        """
+        Starts tracing a keystroke, if the tracer is enabled.  Returns
+        the LatencyTrace, or None.
+        """
+
+        if not self.__enabled:
+            return None
+        trace = LatencyTrace(label, clock())
+        with self.__lock:
+            if len(self.__pending) >= self.__maxTraces:
+                # Nothing gets drawn; don't let the traces pile up.
+                del self.__pending[0]
+            self.__pending.append(trace)
+        return trace
+
+    def discardTrace(self, trace):
+        """
+        Discards the trace of a keystroke that turned out to change
+        nothing on the screen.
+        """
+
+        with self.__lock:
+            if trace in self.__pending:
+                self.__pending.remove(trace)
+
+    def hasPendingTraces(self):
+        """
+        Returns whether there are keystrokes not drawn yet.
+        """
+
+        return bool(self.__pending)
+
+    def span(self, name):
+        """
+        Returns a context manager timing the given phase of the
+        keystrokes being traced.  It is a no-op if no keystrokes are
+        being traced.
+        """
+
+        if not self.__pending:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def markVisible(self):
+        """
+        Called when the quasimode text is drawn.
+        """
+
+        if not self.__pending:
+            return
+        now = clock()
+        with self.__lock:
+            for trace in self.__pending:
+                if trace.visible is None:
+                    trace.visible = now
+
+    def finishTraces(self):
+        """
+        Called when all the quasimode windows affected by the traced
+        keystrokes are drawn.
+        """
+
+        if not self.__pending:
+            return
+        now = clock()
+        with self.__lock:
+            for trace in self.__pending:
+                if trace.visible is None:
+                    trace.visible = now
+                trace.finished = now
+                self.__traces.append(trace)
+            self.__pending = []
+
+    def cancelTraces(self):
+        """
+        Discards the traces of the keystrokes not drawn yet, e.g. when
+        the quasimode ends.
+        """
+
+        with self.__lock:
+            self.__pending = []
+
+    def getTraces(self):
+        """
+        Returns the finished traces, the oldest first.
+        """
+
+        with self.__lock:
+            return list(self.__traces)
+
+    def getSummary(self):
+        """
+        Returns the summaries (see LatencyHistogram.getSummary()) of
+        the latencies of the finished traces, as a JSON-serializable
+        dictionary:
+
+          { "keystrokes": ..., "visible": summary, "finished": summary,
+            "phases": { name: summary of the time per keystroke } }
+        """
+
+        visible = LatencyHistogram()
+        finished = LatencyHistogram()
+        phases = {}
+        traces = self.getTraces()
+        for trace in traces:
+            visible.add(trace.visible - trace.started)
+            finished.add(trace.finished - trace.started)
+            for name, (total, _) in trace.phases.iteritems():
+                histogram = phases.get(name)
+                if histogram is None:
+                    histogram = phases[name] = LatencyHistogram()
+                histogram.add(total)
+        return {
+            "keystrokes": len(traces),
+            "visible": visible.getSummary(),
+            "finished": finished.getSummary(),
+            "phases": dict(
+                (name, histogram.getSummary())
+                for name, histogram in phases.iteritems()
+            ),
+        }
+
+    def _addSpan(self, name, elapsed):
+        """
+        Called by the spans when they end.
+        """
+
+        with self.__lock:
+            for trace in self.__pending:
+                phase = trace.phases.get(name)
+                if phase is None:
+                    trace.phases[name] = [elapsed, 1]
+                else:
+                    phase[0] += elapsed
+                    phase[1] += 1
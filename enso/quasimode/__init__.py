@@ -56,6 +56,7 @@ import weakref
 
 from enso import config, graphics, input, messages
 from enso.messages.windows import computeWidth
+from enso.profiler import LatencyTracer
 from enso.quasimode import layout
 from enso.quasimode.charmaps import STANDARD_ALLOWED_KEYCODES as ALLOWED_KEYCODES
 from enso.quasimode.parametersuggestionlist import ParameterSuggestionList
@@ -177,6 +178,12 @@ class Quasimode(object):
         # Unique numeric ID of the Quasimode "session"
         self.__quasimodeID = 0
 
+        # Traces the keystrokes until they are drawn, if enabled (see
+        # the 'quasimode latency' command).
+        self.__latencyTracer = LatencyTracer.get()
+        if config.QUASIMODE_LATENCY_TRACING:
+            self.__latencyTracer.enable()
+
     def setQuasimodeKeyByName(self, function_name, key_name):
         # Sets the quasimode to use the given key (key_name must be a
         # string corresponding to a constant defined in the os-specific
@@ -332,8 +339,13 @@ class Quasimode(object):
         }
 
         if eventType == input.EVENT_KEY_QUASIMODE:  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
+            if (keyCode == input.KEYCODE_QUASIMODE_START  # IGNORE:E1101 @UndefinedVariable
+                    and not self._inQuasimode):
+                self.__latencyTracer.startTrace("quasimode start")
             FUNC_CALL_MAP[eventType][keyCode](eventType, keyCode)
         elif eventType == input.EVENT_KEY_DOWN and self._inQuasimode:  # IGNORE:E1101 @UndefinedVariable Keep PyLint and PyDev happy
+            trace = self.__latencyTracer.startTrace(
+                ALLOWED_KEYCODES.get(keyCode, "keycode %d" % keyCode))
             if keyCode in FUNC_CALL_MAP[eventType]:
                 FUNC_CALL_MAP[eventType][keyCode](eventType, keyCode)
                 self.__needsRedraw = True
@@ -347,7 +359,8 @@ class Quasimode(object):
                 self.__needsRedraw = True
             else:
                 # The user has pressed a key that is not valid
-                pass
+                if trace is not None:
+                    self.__latencyTracer.discardTrace(trace)
 
     def __onParameterModified(self, keyCode, oldText, newText):
         cmd = self.__suggestionList.getActiveCommand()
@@ -426,6 +439,10 @@ class Quasimode(object):
 
         self.__quasimodeID = time.time()
 
+        # Let the command manager narrow the suggestions incrementally
+        # while the user types.
+        self.__cmdManager.startQuasimodeSession()
+
         graphics.refreshDesktopInfo()
         graphics.refreshWorkareaInfo()
 
@@ -474,6 +491,11 @@ class Quasimode(object):
 
         self.__refreshParameterSuggestionsList(timePassed)
 
+        # Take over the suggestions retrieved in the background (see
+        # config.QUASIMODE_ASYNC_SUGGESTIONS).
+        if self.__suggestionList.pollSuggestions():
+            self.__needsRedraw = True
+
         if self._inQuasimode:
             if self.__needsRedraw:
                 self.__needsRedraw = False
@@ -494,6 +516,9 @@ class Quasimode(object):
         # function as an event responder.
         self.__eventMgr.removeResponder(self.__onTick, sync=True)
 
+        # Keystrokes not drawn by now never will be.
+        self.__latencyTracer.cancelTraces()
+
         self.__eventMgr.triggerEvent("endQuasimode")
 
         # Hide the Quasimode window.
@@ -515,6 +540,8 @@ class Quasimode(object):
             self.__showBadCommandMsg(userText)
 
         self.__suggestionList.clearState()
+        self.__suggestionList.stopWorker()
+        self.__cmdManager.endQuasimodeSession()
 
         self.__quasimodeID = 0
 
@@ -40,12 +40,15 @@
 # Imports
 # ----------------------------------------------------------------------------
 
+import copy
 import logging
+from collections import OrderedDict
 from time import clock
 
 from enso import config, graphics
-from enso.graphics import xmltextlayout
+from enso.graphics import font, measurement, xmltextlayout
 from enso.graphics.textlayout import MaxLinesExceededError
+from enso.profiler import LatencyTracer
 from enso.utils.html_tools import strip_html_tags
 from enso.utils.xml_tools import escape_xml
 from enso.utils.strings import smart_quote
@@ -285,6 +288,42 @@ def retrieveSuggestionStyles(active=True, size=SMALL_SCALE[-1]):
 _size_scale_map = {}
 
 
+def _getGlyphAdvanceFunc(usedSize):
+    """
+    Returns a function returning the advance of a glyph laid out at
+    the font size 'usedSize' at another font size, for
+    Block.findLargestFittingSize().
+    """
+
+    usedFontSize = measurement.strToPoints("%fpt" % usedSize)
+    sizedFonts = {}
+
+    def getGlyphAdvance(glyph, size):
+        sizedFont = sizedFonts.get((glyph.font, size))
+        if sizedFont is None:
+            # Same font size as _updateStyleSizes() sets
+            fontSize = measurement.strToPoints("%fpt" % size)
+            if glyph.font.size != usedFontSize:
+                # Font size relative to the document one
+                fontSize = glyph.font.size * size / usedSize
+            sizedFont = font.Font.get(
+                glyph.font.name, fontSize, glyph.font.isItalic)
+            sizedFonts[(glyph.font, size)] = sizedFont
+        return sizedFont.getGlyph(glyph.char).advance
+
+    return getGlyphAdvance
+
+
+# Maximum number of laid out lines kept in the cache, see layoutXmlLine()
+LINE_CACHE_SIZE = 256
+
+# Laid out documents by (xml_data, styles snapshot, scale), least
+# recently used first
+_line_cache = OrderedDict()
+
+_latencyTracer = LatencyTracer.get()
+
+
 def layoutXmlLine(xml_data, styles, scale):
     """
     Performs a layout of a line using xml_data and styles, doing
@@ -292,6 +331,36 @@ def layoutXmlLine(xml_data, styles, scale):
     size allowed by scale (a list of font sizes).  If the text will
     not fit even at the smallest size of scale, then ellipsifies
     the text at that size.
+
+    The laid out lines are cached, so laying out the same line with
+    the same styles again skips the XML parsing and the layout.  The
+    returned document is a shallow copy of the cached one; its own
+    attributes (background, corners...) can be set freely, but its
+    blocks are shared and must not be modified.
+
+    The 'contentKey' attribute of the returned document identifies the
+    laid out content; it is equal for the lines laid out equally.
+    """
+
+    # Bring the size-dependent styles to a canonical state, so that
+    # the key does not depend on the size used by the last layout.
+    _updateStyles(styles, scale, scale[-1])
+    key = (xml_data, styles.getSnapshot(), tuple(scale))
+    document = _line_cache.pop(key, None)
+    if document is None:
+        with _latencyTracer.span("xml"):
+            document = _layoutXmlLine(xml_data, styles, scale)
+        document.contentKey = key
+        if len(_line_cache) >= LINE_CACHE_SIZE:
+            _line_cache.popitem(last=False)
+    # (Re)insert as the most recently used
+    _line_cache[key] = document
+    return copy.copy(document)
+
+
+def _layoutXmlLine(xml_data, styles, scale):
+    """
+    Performs the actual layout for layoutXmlLine().
     """
 
     # OPTIMIZATION BEGIN:
@@ -318,7 +387,9 @@ def layoutXmlLine(xml_data, styles, scale):
     # OPTIMIZATION END
 
     document = None
-    for size in reversed(scale):
+    sizes = list(reversed(scale))
+    while sizes:
+        size = sizes.pop(0)
         try:
             _updateStyles(styles, scale, size)
             document = xmltextlayout.xmlMarkupToDocument(
@@ -328,8 +399,20 @@ def layoutXmlLine(xml_data, styles, scale):
             )
             usedSize = size
             break
-        except MaxLinesExceededError:
+        except MaxLinesExceededError as e:
             hasFailed = True
+            if e.block is not None and sizes:
+                # Skip the layouts at the sizes the overflowing block
+                # does not fit at; the smallest size always fits, as
+                # it ellipsifies.
+                fittingSize = e.block.findLargestFittingSize(
+                    [smaller for smaller in sizes if smaller != scale[0]],
+                    _getGlyphAdvanceFunc(size),
+                )
+                if fittingSize is None:
+                    fittingSize = scale[0]
+                if fittingSize in sizes:
+                    sizes = sizes[sizes.index(fittingSize):]
             # NOTE: If the error is fundamental (not size-related),
             # then it will be raised again below
 
@@ -52,6 +52,7 @@ from enso.graphics.measurement import (
     pointsToPixels,
 )
 from enso.graphics.transparentwindow import TransparentWindow
+from enso.profiler import LatencyTracer
 from enso.quasimode import layout
 
 
@@ -76,6 +77,12 @@ class TextWindow(object):
         Position and height should be in pixels.
         """
 
+        # Fingerprint of the currently drawn content, see draw()
+        self.__drawnFingerprint = None
+        # Number of the performed and skipped draw() calls
+        self.drawsPerformed = 0
+        self.drawsSkipped = 0
+        self.__latencyTracer = LatencyTracer.get()
         self.__setupWindow(height, position)
 
     def __setupWindow(self, height=None, position=None):
@@ -93,6 +100,7 @@ class TextWindow(object):
             logging.error(e)
         self.__context = self.__window.makeCairoContext()
         self.__is_visible = True
+        self.__drawnFingerprint = None
 
     def getHeight(self):
         """
@@ -118,11 +126,33 @@ class TextWindow(object):
 
         An updating call; at the end of this method, the displayed
         window should reflect the drawn content.
+
+        If the window already displays the same content, nothing is
+        drawn; returns whether the window was drawn.
         """
         if self.__width != graphics.getDesktopSize()[0]:
             del self.__window
             self.__setupWindow()
 
+        fingerprint = _getDocumentFingerprint(document)
+        if (self.__is_visible and fingerprint is not None
+                and fingerprint == self.__drawnFingerprint):
+            self.drawsSkipped += 1
+            return False
+
+        with self.__latencyTracer.span("draw"):
+            self.__drawDocument(document)
+        self.__is_visible = True
+        self.__drawnFingerprint = fingerprint
+        self.drawsPerformed += 1
+        return True
+
+    def __drawDocument(self, document):
+        """
+        Draws the document onto the window surface with cairo and
+        updates the window.
+        """
+
         width = document.ragWidth + layout.L_MARGIN + layout.R_MARGIN
         height = self.__window.getMaxHeight()
         cr = self.__context
@@ -168,12 +198,12 @@ class TextWindow(object):
 
         self.__window.setSize(width, height)
         self.__window.update()
-        self.__is_visible = True
 
     def hide(self):
         """
         Clears the window's surface (making it disappear).
         """
+        self.__drawnFingerprint = None
         if not self.__is_visible:
             return
 
@@ -195,3 +225,23 @@ class TextWindow(object):
         self.__window.hide()
 
         self.__is_visible = False
+
+
+def _getDocumentFingerprint(document):
+    """
+    Returns a value identifying everything the TextWindow draws for the
+    document, or None if the document content can't be identified.
+    """
+
+    contentKey = getattr(document, "contentKey", None)
+    if contentKey is None:
+        return None
+    return (
+        contentKey,
+        document.ragWidth,
+        tuple(document.background),
+        document.roundUpperRight,
+        document.roundLowerRight,
+        document.roundLowerLeft,
+        document.shrinkOffset,
+    )
@@ -43,10 +43,11 @@
 # ----------------------------------------------------------------------------
 # Imports
 # ----------------------------------------------------------------------------
-from heapq import nsmallest
 
 from enso import commands, config
 from enso.commands.suggestions import AutoCompletion, Suggestion
+from enso.profiler import LatencyTracer
+from enso.quasimode.suggestionworker import SuggestionWorker
 
 
 # ----------------------------------------------------------------------------
@@ -81,6 +82,15 @@ class SuggestionList(object):
 
         self.__cmdManager = commandManager
 
+        self.__latencyTracer = LatencyTracer.get()
+
+        # If the suggestions are retrieved asynchronously, the worker
+        # that retrieves them; otherwise None.
+        if config.QUASIMODE_ASYNC_SUGGESTIONS:
+            self.__worker = SuggestionWorker()
+        else:
+            self.__worker = None
+
         # Set all of the member variables to their empty values.
         self.clearState()
 
@@ -113,6 +123,13 @@ class SuggestionList(object):
 
         self.__activeCommand = None
 
+        # The (user text, auto-completion source, auto-completion text)
+        # tuple the current or pending asynchronous suggestions were
+        # requested for.
+        self.__suggestionsSource = None
+        if self.__worker is not None:
+            self.__worker.cancel()
+
         # A boolean telling whether the suggestion list and
         # auto-completion attributes above need to be updated.
         self.__isDirty = False
@@ -210,18 +227,34 @@ class SuggestionList(object):
         if not self.__isDirty:
             return
 
-        # NOTE: in the next line, ".lstrip()" is called because the
-        # autcompletions hould ignore heading whitespace.
-        # Leaving the trailing space intact so we can indicate it by dot
-        # in special cases (user typing command parameter).
-        self.__autoCompletion = self.__autoComplete(
-            self.getUserText().lstrip()
-        )
-        # NOTE: in the next line, ".strip()" is called because the
-        # suggestions should ignore trailing whitespace.
-        self.__suggestions = self.__findSuggestions(
-            self.getUserText().strip()
-        )
+        with self.__latencyTracer.span("suggestions"):
+            # NOTE: in the next line, ".lstrip()" is called because the
+            # autcompletions hould ignore heading whitespace.
+            # Leaving the trailing space intact so we can indicate it by dot
+            # in special cases (user typing command parameter).
+            self.__autoCompletion = self.__autoComplete(
+                self.getUserText().lstrip()
+            )
+            # NOTE: in the next line, ".strip()" is called because the
+            # suggestions should ignore trailing whitespace.
+            if self.__worker is None:
+                self.__suggestions = self.__findSuggestions(
+                    self.getUserText().strip()
+                )
+            else:
+                self.__suggestions = self.__findSuggestionsAsync(
+                    self.getUserText().strip()
+                )
+            self.__updateActiveCommand()
+
+        self.__isDirty = False
+
+    def __updateActiveCommand(self):
+        """
+        Updates the active command to reflect the current suggestions
+        and active index.
+        """
+
         # We need to verify that it is a valid index; if the
         # namespace changed, then the suggestionss in the above
         # getSuggestions() line might be different than the
@@ -237,8 +270,6 @@ class SuggestionList(object):
             self.__activeCommand = self.__cmdManager.getCommand(
                 activeCommandName)
 
-        self.__isDirty = False
-
     def __autoComplete(self, userText):
         """
         Uses the CommandManager to determine if userText auto-completes
@@ -252,7 +283,8 @@ class SuggestionList(object):
         if len(userText) < config.QUASIMODE_MIN_AUTOCOMPLETE_CHARS:
             autoCompletion = AutoCompletion(userText, "")
         else:
-            autoCompletion = self.__cmdManager.autoComplete(userText)
+            with self.__latencyTracer.span("commands"):
+                autoCompletion = self.__cmdManager.autoComplete(userText)
             if autoCompletion is None:
                 autoCompletion = AutoCompletion(userText, "")
 
@@ -268,12 +300,75 @@ class SuggestionList(object):
         suggestion different than the autocompletion for a command
         name that is similar to userText.
         """
-        # FIXME: Avoid this function to have side effects, refactor! It belongs
-        # to __update() method
 
         if len(userText) < config.QUASIMODE_MIN_AUTOCOMPLETE_CHARS:
             return [self.__autoCompletion]
 
+        auto, userText = self.__resolveAutoCompletion(userText)
+        return self.__retrieveSuggestions(userText, auto)
+
+    def __findSuggestionsAsync(self, userText):
+        """
+        Works as __findSuggestions(), but the suggestions are
+        retrieved by the worker thread; until they are ready (see
+        pollSuggestions()), the suggestion list contains only the
+        auto-completion.
+        """
+
+        if len(userText) < config.QUASIMODE_MIN_AUTOCOMPLETE_CHARS:
+            self.__worker.cancel()
+            self.__suggestionsSource = None
+            return [self.__autoCompletion]
+
+        auto, userText = self.__resolveAutoCompletion(userText)
+
+        source = (userText, auto.getSource(), auto.toText())
+        if source == self.__suggestionsSource:
+            # Only the active index has changed; keep the current (or
+            # pending) suggestions.
+            return [auto] + self.__suggestions[1:]
+
+        self.__suggestionsSource = source
+        self.__worker.submit(self.__retrieveSuggestions, userText, auto)
+        return [auto]
+
+    def pollSuggestions(self):
+        """
+        Takes over the suggestions retrieved by the worker thread, if
+        they are ready.  Called periodically while in the quasimode.
+
+        Returns True if the suggestion list has changed.
+        """
+
+        if self.__worker is None:
+            return False
+
+        suggestions = self.__worker.popResult()
+        if suggestions is None:
+            return False
+
+        self.__suggestions = suggestions
+        self.__updateActiveCommand()
+        return True
+
+    def stopWorker(self):
+        """
+        Stops the thread retrieving the suggestions, if any.  Called
+        when the quasimode ends; the thread is started again on demand.
+        """
+
+        if self.__worker is not None:
+            self.__worker.stop()
+
+    def __resolveAutoCompletion(self, userText):
+        """
+        Returns the (auto-completion, user text) tuple the suggestions
+        should be retrieved for.  If nothing matches the user text,
+        these can be the "calculate <text>" or "open <text>" variants.
+        """
+        # FIXME: Avoid this function to have side effects, refactor! It belongs
+        # to __update() method
+
         # Cache current autocompletion
         auto = self.__autoCompletion
 
@@ -299,14 +394,27 @@ class SuggestionList(object):
                     self.setUserText(userText)
                     self.setSuggestedTextPrefix("open")
 
+        return auto, userText
+
+    def __retrieveSuggestions(self, userText, auto, isCancelled=None):
+        """
+        Returns the suggestion list for userText, with auto as the 0th
+        element.  Can be called on the worker thread; returns None if
+        isCancelled() becomes True.
+        """
+
         # Get N top suggestions based on nearness
         # __cmp__() function on Suggestion object takes care of proper sort
-        suggestions = nsmallest(
-            # Get max+1 as the auto-completion can appear in the suggestions
-            # list and we will remove it later
-            config.QUASIMODE_MAX_SUGGESTIONS + 1,
-            self.__cmdManager.retrieveSuggestions(userText)
-        )
+        with self.__latencyTracer.span("commands"):
+            suggestions = self.__cmdManager.retrieveTopSuggestions(
+                userText,
+                # Get max+1 as the auto-completion can appear in the suggestions
+                # list and we will remove it later
+                config.QUASIMODE_MAX_SUGGESTIONS + 1,
+                isCancelled
+            )
+        if suggestions is None:
+            return None
 
         # Remove the auto-completion entry from the list
         try:
@@ -318,11 +426,15 @@ class SuggestionList(object):
 
         if len(suggestions) < config.QUASIMODE_MAX_SUGGESTIONS:
             if (config.QUASIMODE_APPEND_OPEN_COMMAND or len(suggestions) == 0) and not userText.startswith("open "):
-                opencmd_suggestions = nsmallest(
-                    config.QUASIMODE_MAX_SUGGESTIONS - len(suggestions),
-                    self.__cmdManager.retrieveSuggestions("open %s" % userText)
-                )
-                if opencmd_suggestions:
+                with self.__latencyTracer.span("commands"):
+                    opencmd_suggestions = self.__cmdManager.retrieveTopSuggestions(
+                        "open %s" % userText,
+                        config.QUASIMODE_MAX_SUGGESTIONS - len(suggestions),
+                        isCancelled
+                    )
+                if opencmd_suggestions is None:
+                    return None
+                elif opencmd_suggestions:
                     suggestions.extend(opencmd_suggestions)
                 else:
                     pass
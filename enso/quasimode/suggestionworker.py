@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# vim:set tabstop=4 softtabstop=4 shiftwidth=4 expandtab:
+#
+# Copyright (c) 2008, Humanized, Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#    1. Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#    2. Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#
+#    3. Neither the name of Enso nor the names of its contributors may
+#       be used to endorse or promote products derived from this
+#       software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY Humanized, Inc. ``AS IS'' AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL Humanized, Inc. BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# ----------------------------------------------------------------------------
+#
+#   enso.quasimode.suggestionworker
+#
+# ----------------------------------------------------------------------------
+
+"""
+    Implements a worker thread that retrieves the quasimode suggestions
+    in the background, so that slow command factories don't hold up
+    the drawing of the quasimode.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import logging
+import threading
+from Queue import Empty, Queue
+
+
+# ----------------------------------------------------------------------------
+# The SuggestionWorker
+# ----------------------------------------------------------------------------
+
+class SuggestionWorker(object):
+    """
+    Runs suggestion retrieval jobs on a worker thread, one at a time.
+
+    Every submitted job gets a new generation number, and submitting a
+    job cancels all the previous ones: the jobs that have not started
+    yet are skipped, and the results of the stale jobs are discarded.
+    A running job can stop early by checking the isCancelled()
+    function passed to it.
+    """
+
+    def __init__(self):
+        """
+        Initializes the worker; the thread is started by the first
+        submitted job.
+        """
+
+        self.__queue = None
+        self.__thread = None
+
+        # Generation of the most recently submitted (or cancelled) job.
+        self.__generation = 0
+
+        # The (generation, result) tuple of the last finished job.
+        self.__result = None
+
+    def submit(self, func, *args):
+        """
+        Schedules func(*args, isCancelled=<function>) to be run on the
+        worker thread, cancelling any previous job.  func must return
+        None if it was cancelled, or else its (non-None) result, which
+        is then available through popResult().
+
+        Returns the generation of the job.
+        """
+
+        self.cancel()
+        self.__start()
+        self.__queue.put_nowait((self.__generation, func, args))
+        return self.__generation
+
+    def cancel(self):
+        """
+        Cancels the pending job, if any, and discards its result.
+        """
+
+        self.__generation += 1
+        self.__result = None
+
+    def popResult(self):
+        """
+        Returns the result of the most recently submitted job, if it
+        has finished and its result was not popped yet; otherwise
+        returns None.
+        """
+
+        result = self.__result
+        if result is None or result[0] != self.__generation:
+            return None
+        self.__result = None
+        return result[1]
+
+    def stop(self):
+        """
+        Cancels the pending job and stops the worker thread.  The
+        thread is started again by the next submitted job.
+        """
+
+        self.cancel()
+        if self.__thread is not None:
+            # Wake up the thread waiting for a job; None stops it.
+            self.__queue.put_nowait(None)
+            self.__queue = None
+            self.__thread = None
+
+    def __start(self):
+        """
+        Starts the worker thread if it is not running.
+        """
+
+        if self.__thread is None:
+            # Each thread gets its own queue, so that a stopping
+            # thread never picks up the jobs of its successor.
+            self.__queue = Queue()
+            self.__thread = threading.Thread(
+                target=self.__run, args=(self.__queue,),
+                name="SuggestionWorker")
+            self.__thread.setDaemon(True)
+            self.__thread.start()
+
+    def __run(self, queue):
+        """
+        Worker thread function.  Runs the most recently submitted job
+        each time the queue is non-empty, until it gets None.
+        """
+
+        while True:
+            jobs = [queue.get()]
+            # Only the most recent job matters; skip the stale ones.
+            try:
+                while True:
+                    jobs.append(queue.get_nowait())
+            except Empty:
+                pass
+            if None in jobs:
+                return
+
+            generation, func, args = jobs[-1]
+            if generation != self.__generation:
+                continue
+
+            def isCancelled():
+                return generation != self.__generation
+
+            try:
+                result = func(*args, isCancelled=isCancelled)
+            except Exception as e:
+                logging.error("Error retrieving suggestions: %s", e)
+                continue
+
+            if result is not None and not isCancelled():
+                self.__result = (generation, result)
@@ -74,6 +74,7 @@ from enso.quasimode.layout import (
     SUGGESTION_SCALE,
     QuasimodeLayout,
 )
+from enso.profiler import LatencyTracer
 from enso.quasimode.linewindows import TextWindow
 from enso.quasimode.layout import SCALE_FACTOR
 
@@ -140,6 +141,8 @@ class QuasimodeWindow(object):
         # The time, in float seconds since the epoch, when the last
         # drawing of the quasimode display started.
         self.__drawStart = 0
+
+        self.__latencyTracer = LatencyTracer.get()
         atexit.register(self.__finalize)
 
     def setPosition(self, x, y):
@@ -171,7 +174,8 @@ class QuasimodeWindow(object):
 
         # Instantiate a layout object, effectively laying out the
         # quasimode display.
-        layout = QuasimodeLayout(quasimode)
+        with self.__latencyTracer.span("layout"):
+            layout = QuasimodeLayout(quasimode)
 
         self.__drawStart = time.time()
 
@@ -207,6 +211,9 @@ class QuasimodeWindow(object):
                 self.__didyoumeanHintWindow.hide()
         suggestionLines = newLines[suggestions_start:]
 
+        # The typed text is on the screen now
+        self.__latencyTracer.markVisible()
+
         # We now need to hide all line windows.
         for i in range(len(suggestionLines),
                        len(self.__suggestionWindows)):
@@ -221,6 +228,7 @@ class QuasimodeWindow(object):
             # Draw suggestions
             while self.continueDrawing(ignoreTimeElapsed=True):
                 pass
+            self.__latencyTracer.finishTraces()
 
     def continueDrawing(self, ignoreTimeElapsed=False):
         """
@@ -231,7 +239,9 @@ class QuasimodeWindow(object):
         QUASIMODE_SUGGESTION_DELAY constant will be ignored and any
         pending suggestion waiting to be drawn will be rendered.
 
-        Returns whether a suggestion was drawn.
+        Returns whether a suggestion was drawn.  The suggestions that
+        are already displayed are skipped, so that the first changed
+        one is drawn.
 
         This function should only be called after update() has been
         called.
@@ -245,11 +255,28 @@ class QuasimodeWindow(object):
                 (timeElapsed < config.QUASIMODE_SUGGESTION_DELAY)):
             return False
         try:
-            suggestionDrawer = self.__suggestionsLeft.next()
-            suggestionDrawer.draw()
-            return True
+            while True:
+                suggestionDrawer = self.__suggestionsLeft.next()
+                if suggestionDrawer.draw():
+                    return True
         except StopIteration:
             self.__suggestionsLeft = None
+            # All the suggestions are on the screen now
+            self.__latencyTracer.finishTraces()
+
+    def getDrawStats(self):
+        """
+        Returns the numbers of the line draws performed and skipped
+        (because the line was already displayed), as a dictionary
+        {"performed": ..., "skipped": ...}.
+        """
+
+        windows = [self.__descriptionWindow, self.__userTextWindow,
+                   self.__didyoumeanHintWindow] + self.__suggestionWindows
+        return {
+            "performed": sum(w.drawsPerformed for w in windows),
+            "skipped": sum(w.drawsSkipped for w in windows),
+        }
 
     def __finalize(self):
         del self.__descriptionWindow
@@ -274,7 +301,7 @@ class _SuggestionDrawer(object):
         self.__line = line
 
     def draw(self):
-        self.__suggestionWindow.draw(self.__line)
+        return self.__suggestionWindow.draw(self.__line)
 
 
 def _makeSuggestionIterator(lines, suggestionWindows):
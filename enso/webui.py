@@ -314,16 +314,12 @@ def install_command_from_url(command_url):
 
 
 commandq = Queue.Queue()
-_poll_ms_accumulator = 0
 
+# Interval (in ms) of polling the command queue
+POLL_INTERVAL = 500
 
-def pollqueue(ms):
-    global _poll_ms_accumulator
-    _poll_ms_accumulator += ms
-    if _poll_ms_accumulator < 500:
-        return
-    _poll_ms_accumulator = 0
 
+def pollqueue():
     try:
         command_url = commandq.get(False, 0)
     except Queue.Empty:
@@ -338,5 +334,5 @@ def start(eventManager):
     httpd_server = Httpd(commandq)
     httpd_server.setDaemon(True)
     httpd_server.start()
-    eventManager.registerResponder(pollqueue, "timer")
+    eventManager.callEvery(POLL_INTERVAL, pollqueue)
     return httpd_server
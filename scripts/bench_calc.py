@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+# vim:set tabstop=4 shiftwidth=4 expandtab:
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the 'calculate' command preview.
+
+Simulates typing a corpus of realistic expressions, one character at a
+time, evaluating each typed prefix a few times per keystroke (as the
+command manager does when building the preview), and reports the
+time per keystroke with and without the parsed expressions cache of
+fourfn.evaluate().
+
+Usage:
+    python scripts/bench_calc.py [repeat]
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+
+from enso.contrib.calc import fourfn
+
+
+# Number of evaluations of the expression per keystroke
+EVALUATIONS_PER_KEYSTROKE = 3
+
+DEFAULT_REPEAT = 3
+
+CORPUS = (
+    "1+2",
+    "9 + 3 / 11",
+    "(9+3) / 11",
+    "2^3^2",
+    "PI * PI / 10",
+    "pi times pi divide 10",
+    "sin(PI/2) + cos(0)",
+    "round(E) * trunc(-E)",
+    "sqrt(16) + cubed(3)",
+    "1232 // 2.3",
+    "10.3 % 6",
+    "one plus one",
+    "four hundred fifty thousand five times 2",
+    "1,234,567.89 * 1.21",
+    "6.02E23 * 8.048",
+    "(1+2)*(3+4)/(5-6)",
+    "((2+3)*4)^2",
+    "MMXIX - 1990",
+    "today + 3 days",
+    "now + 2 hours",
+    "1.1.2019 + 30 days",
+    "10:30:00 + 45 minutes",
+    "1500 * 12 * 0.85",
+    "abs(-12.5) * 3",
+    "(1 + 0.05) ^ 10 * 1000",
+    "144 divided by 12",
+)
+
+
+def type_expression(evaluator, expression):
+    """ Returns the times of the keystrokes typing the expression """
+    timings = []
+    for length in range(1, len(expression) + 1):
+        typed = expression[:length]
+        started = time.time()
+        for _ in range(EVALUATIONS_PER_KEYSTROKE):
+            try:
+                evaluator.evaluate(typed)
+            except Exception:
+                pass
+        timings.append(time.time() - started)
+    return timings
+
+
+def type_corpus(cache_size, repeat):
+    """ Returns the times of the keystrokes typing the corpus """
+    timings = []
+    for _ in range(repeat):
+        evaluator = fourfn.Evaluator(cache_size)
+        for expression in CORPUS:
+            timings.extend(type_expression(evaluator, expression))
+    return timings
+
+
+def percentile(timings, percent):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, len(timings) * percent // 100)]
+
+
+def main(repeat):
+    # Only the time matters, not the warnings about the partial
+    # expressions nor the debugging output of the evaluation
+    logging.disable(logging.WARNING)
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    results = []
+    try:
+        for label, cache_size in (
+                ("uncached", 0), ("cached", fourfn.EXPRESSION_CACHE_SIZE)):
+            results.append((label, type_corpus(cache_size, repeat)))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print "%d expressions, %d keystrokes, %d evaluations per keystroke" % (
+        len(CORPUS), len(results[0][1]) // repeat, EVALUATIONS_PER_KEYSTROKE)
+    print "%-10s %10s %10s %10s" % ("", "total", "p50", "p95")
+    for label, timings in results:
+        print "%-10s %8.1fms %8.3fms %8.3fms" % (
+            label,
+            sum(timings) * 1000 / repeat,
+            percentile(timings, 50) * 1000,
+            percentile(timings, 95) * 1000)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEAT)
@@ -0,0 +1,150 @@
+#! /usr/bin/env python
+# vim:set tabstop=4 shiftwidth=4 expandtab:
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the per-keystroke cost of GenericPrefixFactory matching.
+
+Simulates typing a few 'open' queries, one character at a time, against
+factories holding an increasing number of postfixes, and reports the
+median time of one keystroke (autoComplete() + retrieveSuggestions()).
+
+For the selective queries the latency should stay roughly flat as the
+number of postfixes grows; only the 1-2 character queries, which really
+do match a large part of the postfixes, scale with the postfix count.
+
+It also compares ranking the top suggestions of such short queries with
+retrieveTopSuggestions() against nsmallest() over all the suggestions.
+
+Usage:
+    python scripts/bench_prefix_factory.py [size [size ...]]
+"""
+
+import os
+import random
+import sys
+import time
+from heapq import nsmallest
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+
+from enso.commands.factories import GenericPrefixFactory
+
+
+DEFAULT_SIZES = (1000, 5000, 20000, 50000)
+
+QUERIES = (
+    "open firefox",
+    "open libreoffice calc",
+    "open zzz-no-match",
+)
+
+# Short queries matching a large part of the postfixes
+RANKING_QUERIES = ("open e", "open re")
+
+# Number of suggestions shown by the quasimode (+1 for the autocompletion)
+TOP_K = 11
+
+WORDS = (
+    "document", "report", "image", "photo", "backup", "project", "notes",
+    "invoice", "music", "video", "archive", "readme", "setup", "config",
+    "server", "client", "manager", "viewer", "editor", "player", "terminal",
+)
+
+
+class BenchFactory(GenericPrefixFactory):
+    PREFIX = "open "
+
+    def update(self):
+        pass
+
+    def _generateCommandObj(self, postfix):
+        return None
+
+
+def make_postfixes(size, seed=42):
+    rnd = random.Random(seed)
+    postfixes = set(["firefox", "firefox private window", "libreoffice calc",
+                     "libreoffice writer"])
+    while len(postfixes) < size:
+        postfixes.add("%s %s %d" % (
+            rnd.choice(WORDS), rnd.choice(WORDS), rnd.randint(0, 10 ** 6)))
+    return list(postfixes)
+
+
+def time_keystrokes(factory, query, repeat=5):
+    """ Returns median keystroke times for every prefix of the query """
+    timings = []
+    for length in range(len(factory.PREFIX) + 1, len(query) + 1):
+        userText = query[:length]
+        samples = []
+        for _ in range(repeat):
+            started = time.time()
+            factory.autoComplete(userText)
+            factory.retrieveSuggestions(userText)
+            samples.append(time.time() - started)
+        samples.sort()
+        timings.append((userText, samples[len(samples) // 2]))
+    return timings
+
+
+def time_call(func, repeat=5):
+    """ Returns the median time of the call """
+    samples = []
+    for _ in range(repeat):
+        started = time.time()
+        func()
+        samples.append(time.time() - started)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def time_ranking(factory, userText):
+    """ Returns the (all suggestions, top suggestions) ranking times """
+    assert (nsmallest(TOP_K, factory.retrieveSuggestions(userText))
+            == factory.retrieveTopSuggestions(userText, TOP_K))
+    return (
+        time_call(lambda: nsmallest(
+            TOP_K, factory.retrieveSuggestions(userText))),
+        time_call(lambda: factory.retrieveTopSuggestions(userText, TOP_K)))
+
+
+def main(sizes):
+    print "%-24s %s" % ("keystroke", " ".join("%10d" % size for size in sizes))
+    results = {}
+    rankings = {}
+    for size in sizes:
+        factory = BenchFactory()
+        started = time.time()
+        factory.setPostfixes(make_postfixes(size))
+        factory.afterUpdate()
+        print "Indexed %d postfixes in %0.3fs" % (size, time.time() - started)
+        for query in QUERIES:
+            for userText, elapsed in time_keystrokes(factory, query):
+                results.setdefault(userText, {})[size] = elapsed
+        for userText in RANKING_QUERIES:
+            rankings.setdefault(userText, {})[size] = time_ranking(
+                factory, userText)
+
+    for query in QUERIES:
+        print
+        for length in range(len(BenchFactory.PREFIX) + 1, len(query) + 1):
+            userText = query[:length]
+            print "%-24r %s" % (
+                userText,
+                " ".join("%8.3fms" % (results[userText][size] * 1000)
+                         for size in sizes))
+
+    print
+    print "Top %d ranking (all suggestions / top suggestions):" % TOP_K
+    for userText in RANKING_QUERIES:
+        print "%-24r %s" % (
+            userText,
+            " ".join("%8.1f/%0.1fms" % (
+                rankings[userText][size][0] * 1000,
+                rankings[userText][size][1] * 1000)
+                for size in sizes))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+# vim:set tabstop=4 shiftwidth=4 expandtab:
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the text rendering used by the quasimode.
+
+Lays out a few quasimode-like lines and draws them repeatedly onto an
+offscreen cairo ImageSurface, comparing the glyph-run rendering of
+textlayout.Line.draw() (one show_glyphs() per font/color run) with
+the former character-at-a-time rendering (one move_to() and
+show_text() per glyph). It also compares computing the metrics of new
+glyphs with Font.getGlyphs() against measuring the characters one at
+a time. The pixels of both renderings are compared too: they only
+differ on the antialiased edges of the glyphs that touch each other,
+as a run is composited in one go instead of glyph over glyph.
+
+Usage:
+    python scripts/bench_text_rendering.py [repeat]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+
+from enso import cairo
+from enso.graphics import font, textlayout
+
+
+DEFAULT_REPEAT = 2000
+
+FONT_NAME = "Sans"
+FONT_SIZE = 24
+
+LINES = (
+    ((u"open ", (1.0, 1.0, 1.0, 1.0)),
+     (u"firefox private window", (0.6, 0.8, 0.2, 1.0))),
+    ((u"calculate ", (1.0, 1.0, 1.0, 1.0)),
+     (u"(12.5 + 7) * sin(pi / 4) / 3", (0.6, 0.8, 0.2, 1.0))),
+    ((u"learn as open ", (1.0, 1.0, 1.0, 1.0)),
+     (u"my project", (0.6, 0.8, 0.2, 1.0)),
+     (u" (directory)", (0.5, 0.5, 0.5, 1.0))),
+)
+
+
+def make_line(fontObj, runs):
+    line = textlayout.Line()
+    for text, color in runs:
+        line.addGlyphs([textlayout.Glyph(fontGlyph, color)
+                        for fontGlyph in fontObj.getGlyphs(text)])
+    line.layout("left", 1000, FONT_SIZE * 1.5)
+    return line
+
+
+def draw_per_char(line, x, y, cairoContext):
+    """ The former Line.draw(), drawing the glyphs one at a time """
+    y += line.distanceToBaseline
+    alignOfs = line._Line__alignOfs
+    currFont = None
+    for glyph in line.glyphs:
+        if not glyph.isWhitespace:
+            if currFont != glyph.font:
+                currFont = glyph.font
+                currFont.loadInto(cairoContext)
+            cairoContext.set_source_rgba(*glyph.color)
+            cairoContext.move_to(x + alignOfs + glyph.pos, y)
+            cairoContext.show_text(glyph.charAsUtf8)
+
+
+def time_call(func, repeat):
+    started = time.time()
+    for _ in range(repeat):
+        func()
+    return (time.time() - started) / repeat
+
+
+def render(draw):
+    """ Returns the pixels drawn by draw(context) """
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1200, 200)
+    draw(cairo.Context(surface))
+    surface.flush()
+    return surface.get_data()[:]
+
+
+def main(repeat):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1200, 200)
+    context = cairo.Context(surface)
+    fontObj = font.Font.get(FONT_NAME, FONT_SIZE, False)
+    lines = [make_line(fontObj, runs) for runs in LINES]
+
+    def draw_runs(context=context):
+        for i, line in enumerate(lines):
+            line.draw(0, i * FONT_SIZE * 1.5, context)
+
+    def draw_chars(context=context):
+        for i, line in enumerate(lines):
+            draw_per_char(line, 0, i * FONT_SIZE * 1.5, context)
+
+    print "Glyph indices known: %s" % all(
+        glyph.fontGlyph.index is not None for line in lines
+        for glyph in line.glyphs)
+    run_pixels = render(draw_runs)
+    char_pixels = render(draw_chars)
+    print "Pixels differing from per char drawing: %d of %d drawn" % (
+        sum(run_pixels[i:i + 4] != char_pixels[i:i + 4]
+            for i in range(0, len(run_pixels), 4)),
+        sum(char_pixels[i:i + 4] != "\0\0\0\0"
+            for i in range(0, len(char_pixels), 4)))
+    per_char = time_call(draw_chars, repeat)
+    runs = time_call(draw_runs, repeat)
+    print "Drawing %d lines: %8.3fms per char, %8.3fms by glyph runs" % (
+        len(lines), per_char * 1000, runs * 1000)
+
+    text = u"".join(text for runs in LINES for text, _ in runs)
+
+    def metrics_per_char():
+        fontObj = font.Font(FONT_NAME, FONT_SIZE + 1, False)
+        context.save()
+        fontObj.loadInto(context)
+        for char in set(text):
+            context.text_extents(char.encode("UTF-8"))
+        context.restore()
+
+    def metrics_batched():
+        font.Font(FONT_NAME, FONT_SIZE + 1, False).getGlyphs(text)
+
+    metrics_repeat = max(1, repeat // 10)
+    print "Metrics of %d chars: %8.3fms per char, %8.3fms batched" % (
+        len(set(text)),
+        time_call(metrics_per_char, metrics_repeat) * 1000,
+        time_call(metrics_batched, metrics_repeat) * 1000)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEAT)
@@ -0,0 +1,429 @@
+#! /usr/bin/env python
+# vim:set tabstop=4 shiftwidth=4 expandtab:
+# -*- coding: utf-8 -*-
+
+"""
+Headless replay of recorded quasimode key sequences, reporting the
+keystroke-to-pixel latency traced by enso.profiler.LatencyTracer.
+
+The script installs itself as the only Enso provider: the quasimode
+windows are drawn onto offscreen cairo ImageSurfaces and the keys are
+fed to the EventManager directly. A synthetic set of commands is
+registered, then each key sequence is typed into the Quasimode, the
+event manager being ticked after each key until the quasimode windows
+are drawn. The suggestions are drawn without the usual delay, so the
+numbers only depend on the work done.
+
+A recording is a JSON list of key sequences. Each sequence is a string
+typed in the quasimode; the special keys are written in braces:
+{BACK}, {DELETE}, {TAB}, {UP}, {DOWN}, {HOME}, {END}, {RETURN}.
+
+Usage:
+    python scripts/replay_quasimode_latency.py [options] [recording.json]
+
+Options:
+    --repeat N  replay the sequences N times (default: 5)
+    --json      print the traces and their summary as JSON
+"""
+
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cairo
+
+import enso.config
+
+
+DEFAULT_REPEAT = 5
+
+DEFAULT_SEQUENCES = (
+    u"open firefox",
+    u"open libreoffice{BACK}{BACK}{BACK}{BACK}{BACK}{BACK}{BACK} writer",
+    u"calculate 12.5*(3+4)",
+    u"op{TAB}{DOWN}{DOWN}{UP}",
+    u"learn as open my project",
+    u"zzz no such command",
+)
+
+# Size of the offscreen desktop, in pixels
+DESKTOP_SIZE = (1920, 1080)
+
+# Number of the postfixes of the synthetic 'open' command
+NUM_SHORTCUTS = 5000
+
+WORDS = (
+    "document", "report", "image", "photo", "backup", "project", "notes",
+    "invoice", "music", "video", "archive", "readme", "setup", "config",
+    "server", "client", "manager", "viewer", "editor", "player", "terminal",
+)
+
+# Maximum number of ticks to wait for the quasimode to be drawn
+MAX_TICKS = 100
+
+TICK_MS = 10
+
+
+# ----------------------------------------------------------------------------
+# Offscreen graphics
+# ----------------------------------------------------------------------------
+
+class OffscreenWindow(object):
+    """ A transparent window drawn onto an ImageSurface only """
+
+    def __init__(self, x, y, maxWidth, maxHeight):
+        self.__x = x
+        self.__y = y
+        self.__maxWidth = maxWidth
+        self.__maxHeight = maxHeight
+        self.__width = maxWidth
+        self.__height = maxHeight
+        self.__opacity = 0xff
+        self.__surface = None
+
+    def makeCairoSurface(self):
+        if self.__surface is None:
+            self.__surface = cairo.ImageSurface(
+                cairo.FORMAT_ARGB32, self.__maxWidth, self.__maxHeight)
+        return self.__surface
+
+    def update(self):
+        if self.__surface is not None:
+            self.__surface.flush()
+
+    def setOpacity(self, opacity):
+        self.__opacity = opacity
+
+    def getOpacity(self):
+        return self.__opacity
+
+    def setPosition(self, x, y):
+        self.__x = x
+        self.__y = y
+
+    def getX(self):
+        return self.__x
+
+    def getY(self):
+        return self.__y
+
+    def setSize(self, width, height):
+        self.__width = width
+        self.__height = height
+
+    def getWidth(self):
+        return self.__width
+
+    def getHeight(self):
+        return self.__height
+
+    def getMaxWidth(self):
+        return self.__maxWidth
+
+    def getMaxHeight(self):
+        return self.__maxHeight
+
+    def hideWindow(self):
+        pass
+
+    def finish(self):
+        if self.__surface is not None:
+            self.__surface.finish()
+            self.__surface = None
+
+
+def make_graphics_module():
+    module = types.ModuleType("offscreen_graphics")
+    module.TransparentWindow = OffscreenWindow
+    module.getDesktopOffset = lambda: (0, 0)
+    module.getDesktopSize = lambda: DESKTOP_SIZE
+    module.getWorkareaOffset = lambda: (0, 0)
+    module.getWorkareaSize = lambda: DESKTOP_SIZE
+    module.processWindowManagerPendingEvents = lambda: None
+    return module
+
+
+# ----------------------------------------------------------------------------
+# Headless input
+# ----------------------------------------------------------------------------
+
+CHARACTERS = u"abcdefghijklmnopqrstuvwxyz0123456789 .,-+*/()=_'"
+
+SPECIAL_KEYS = ("CAPITAL", "RETURN", "ESCAPE", "TAB", "BACK", "DOWN", "UP",
+                "LEFT", "RIGHT", "HOME", "END", "DELETE", "SPACE")
+
+
+class HeadlessInputManager(object):
+    """ An InputManager without any event loop; the keys are replayed """
+
+    def __init__(self):
+        self.__qmKeycodes = [0, 0, 0, 0]
+        self.__isModal = False
+
+    def run(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def enableMouseEvents(self, isEnabled):
+        pass
+
+    def onKeypress(self, eventType, vkCode):
+        pass
+
+    def onSomeKey(self):
+        pass
+
+    def onSomeMouseButton(self):
+        pass
+
+    def onExitRequested(self):
+        pass
+
+    def onMouseMove(self, x, y):
+        pass
+
+    def getQuasimodeKeycode(self, quasimodeKeycode):
+        return self.__qmKeycodes[quasimodeKeycode]
+
+    def setQuasimodeKeycode(self, quasimodeKeycode, keycode):
+        self.__qmKeycodes[quasimodeKeycode] = keycode
+
+    def setModality(self, isModal):
+        self.__isModal = isModal
+
+    def getModality(self):
+        return self.__isModal
+
+    def getIdleTime(self):
+        return 0
+
+    def getTickDelay(self):
+        return TICK_MS
+
+    def onTick(self, msPassed):
+        pass
+
+    def onInit(self):
+        pass
+
+
+def make_input_module():
+    module = types.ModuleType("headless_input")
+    module.InputManager = HeadlessInputManager
+    module.EVENT_KEY_UP = 0
+    module.EVENT_KEY_DOWN = 1
+    module.EVENT_KEY_QUASIMODE = 2
+    module.KEYCODE_QUASIMODE_START = 0
+    module.KEYCODE_QUASIMODE_END = 1
+    module.KEYCODE_QUASIMODE_CANCEL = 2
+    module.KEYCODE_QUASIMODE_CANCEL2 = 3
+    # The special keys get codes above those of the characters
+    for i, name in enumerate(SPECIAL_KEYS):
+        setattr(module, "KEYCODE_%s" % name, 0x10000 + i)
+    module.CASE_INSENSITIVE_KEYCODE_MAP = dict(
+        (ord(char), char) for char in CHARACTERS)
+    return module
+
+
+def make_selection_module():
+    module = types.ModuleType("headless_selection")
+    module.get = lambda: {}
+    module.set = lambda seldict: False
+    module.getClipboardText = lambda: None
+    return module
+
+
+def make_system_module(cache_dir):
+    module = types.ModuleType("headless_system")
+    module.get_enso_cache_dir = lambda: cache_dir
+    return module
+
+
+# ----------------------------------------------------------------------------
+# The provider
+# ----------------------------------------------------------------------------
+
+_interfaces = {}
+
+
+def provide_interface(name):
+    """ Called by enso.providers; this script is the only provider """
+    return _interfaces.get(name)
+
+
+def install_provider(cache_dir):
+    _interfaces["cairo"] = cairo
+    _interfaces["graphics"] = make_graphics_module()
+    _interfaces["input"] = make_input_module()
+    _interfaces["selection"] = make_selection_module()
+    _interfaces["system"] = make_system_module(cache_dir)
+    enso.config.PROVIDERS = [__name__]
+    enso.config.PLUGINS = []
+    # Draw the suggestions right away, see the module docstring
+    enso.config.QUASIMODE_SUGGESTION_DELAY = 0
+    enso.config.QUASIMODE_DOUBLETAP_DELAY = 0
+    enso.config.QUASIMODE_ASYNC_SUGGESTIONS = False
+
+
+# ----------------------------------------------------------------------------
+# Commands
+# ----------------------------------------------------------------------------
+
+def register_commands():
+    from enso.commands import CommandManager, CommandObject
+    from enso.commands.factories import ArbitraryPostfixFactory, GenericPrefixFactory
+
+    class NullCommand(CommandObject):
+        def __init__(self, description):
+            super(NullCommand, self).__init__()
+            self.setDescription(description)
+
+        def run(self):
+            pass
+
+    class OpenFactory(GenericPrefixFactory):
+        PREFIX = "open "
+        HELP_TEXT = "name"
+        NAME = "%s{name}" % PREFIX
+
+        def __init__(self, postfixes):
+            super(OpenFactory, self).__init__()
+            self._postfixes = postfixes
+
+        def update(self):
+            pass
+
+        def _generateCommandObj(self, postfix):
+            return NullCommand("Opens %s." % postfix)
+
+    class ArbitraryFactory(ArbitraryPostfixFactory):
+        def __init__(self, prefix):
+            super(ArbitraryFactory, self).__init__()
+            self.PREFIX = prefix
+            self.NAME = "%s{text}" % prefix
+
+        def _generateCommandObj(self, postfix):
+            return NullCommand("Runs %s%s." % (self.PREFIX, postfix))
+
+    rnd = random.Random(42)
+    postfixes = set(["firefox", "firefox private window", "libreoffice calc",
+                     "libreoffice writer"])
+    while len(postfixes) < NUM_SHORTCUTS:
+        postfixes.add("%s %s %d" % (
+            rnd.choice(WORDS), rnd.choice(WORDS), rnd.randint(0, 10 ** 6)))
+
+    cmd_manager = CommandManager.get()
+    cmd_manager.registerCommand(OpenFactory.NAME, OpenFactory(sorted(postfixes)))
+    for prefix in ("calculate ", "learn as open ", "google ", "define "):
+        factory = ArbitraryFactory(prefix)
+        cmd_manager.registerCommand(factory.NAME, factory)
+    for name in ("help", "hide mini messages", "show recent message",
+                 "quasimode latency show", "profile events show"):
+        cmd_manager.registerCommand(name, NullCommand("Runs %s." % name))
+
+
+# ----------------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------------
+
+def parse_keys(sequence):
+    """ Returns the list of the keys of a recorded sequence """
+    return re.findall(r"\{[A-Z]+\}|.", sequence, re.DOTALL)
+
+
+def replay_sequence(event_manager, tracer, sequence):
+    from enso import input
+
+    def tick():
+        for _ in range(MAX_TICKS):
+            event_manager.onTick(TICK_MS)
+            if not tracer.hasPendingTraces():
+                break
+
+    event_manager.onKeypress(input.EVENT_KEY_QUASIMODE,
+                             input.KEYCODE_QUASIMODE_START)
+    tick()
+    for key in parse_keys(sequence):
+        if key.startswith("{"):
+            keycode = getattr(input, "KEYCODE_%s" % key[1:-1])
+        else:
+            keycode = ord(key.lower())
+        event_manager.onKeypress(input.EVENT_KEY_DOWN, keycode)
+        tick()
+    event_manager.onKeypress(input.EVENT_KEY_QUASIMODE,
+                             input.KEYCODE_QUASIMODE_CANCEL)
+
+
+def print_summary(summary):
+    print "Keystrokes: %d" % summary["keystrokes"]
+    print "%-28s %9s %9s %9s" % ("", "p50 ms", "p95 ms", "max ms")
+    rows = [("keystroke to text drawn", summary["visible"]),
+            ("keystroke to all drawn", summary["finished"])]
+    rows.extend(sorted(summary["phases"].iteritems(),
+                       key=lambda item: item[1]["p95_ms"], reverse=True))
+    for name, stats in rows:
+        print "%-28s %9.3f %9.3f %9.3f" % (
+            name, stats["p50_ms"], stats["p95_ms"], stats["max_ms"])
+
+
+def main(args):
+    repeat = DEFAULT_REPEAT
+    as_json = False
+    sequences = DEFAULT_SEQUENCES
+    while args:
+        arg = args.pop(0)
+        if arg == "--repeat":
+            repeat = int(args.pop(0))
+        elif arg == "--json":
+            as_json = True
+        else:
+            with open(arg, "rb") as f:
+                sequences = json.load(f)
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        install_provider(cache_dir)
+
+        from enso.events import EventManager
+        from enso.profiler import LatencyTracer
+        from enso.quasimode import Quasimode
+
+        register_commands()
+        event_manager = EventManager.get()
+        Quasimode.install(event_manager)
+        tracer = LatencyTracer.get()
+
+        # The first replay warms up the caches (fonts, layouts...)
+        for sequence in sequences:
+            replay_sequence(event_manager, tracer, sequence)
+
+        tracer.reset()
+        tracer.enable()
+        for _ in range(repeat):
+            for sequence in sequences:
+                replay_sequence(event_manager, tracer, sequence)
+        tracer.disable()
+
+        if as_json:
+            json.dump({"summary": tracer.getSummary(),
+                       "traces": [trace.asDict()
+                                  for trace in tracer.getTraces()]},
+                      sys.stdout, indent=2, sort_keys=True)
+            print
+        else:
+            print_summary(tracer.getSummary())
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,5 +1,8 @@
+from heapq import nsmallest
+
 import pytest
 
+from enso.commands.factories import ArbitraryPostfixFactory, GenericPrefixFactory
 from enso.commands.manager import CommandManager
 from enso.contrib.help import HelpCommand
 from enso.contrib.scriptotron.cmdretriever import getCommandsFromObjects
@@ -83,5 +86,136 @@ def test_getCommandPrefix(command_manager):
     assert prefix == "enso "
 
 
+def test_getCommand_quasimodeSession(command_manager):
+    # Remembered commands must be the same as the retrieved ones
+    names = ["enso help", "enso help ", "enso hel", "enso ab", "x", ""]
+    expected = [command_manager.getCommand(name) for name in names]
+
+    command_manager.startQuasimodeSession()
+    try:
+        for _ in range(2):
+            commands = [command_manager.getCommand(name) for name in names]
+            assert [c and c.getName() for c in commands] == \
+                [c and c.getName() for c in expected]
+    finally:
+        command_manager.endQuasimodeSession()
+
+
+class StatefulCommandFactory(ArbitraryPostfixFactory):
+    """
+    Returns itself as the command, keeping the parameter, as e.g. the
+    'calculate' command factory does.
+    """
+    PREFIX = "stateful "
+    HELP_TEXT = "expression"
+    NAME = "%s{%s}" % (PREFIX, HELP_TEXT)
+
+    def __init__(self):
+        super(StatefulCommandFactory, self).__init__()
+        self.expression = None
+
+    def _generateCommandObj(self, parameter):
+        self.expression = parameter
+        return self
+
+    def update(self):
+        pass
+
+
+def test_getCommand_quasimodeSession_statefulFactory(command_manager):
+    factory = StatefulCommandFactory()
+    command_manager.registerCommand(factory.NAME, factory)
+    command_manager.startQuasimodeSession()
+    try:
+        # Typing and then backspacing the last character
+        for expression in ["1+1", "1+12", "1+1"]:
+            cmd = command_manager.getCommand("stateful %s" % expression)
+            assert cmd is factory
+            assert cmd.expression == expression
+    finally:
+        command_manager.endQuasimodeSession()
+        command_manager.unregisterCommand(factory.NAME)
+
+
+class ShortcutsCommandFactory(GenericPrefixFactory):
+    """
+    Opens the shortcuts given by the postfixes, which can change at any
+    time, as e.g. the 'open' command factory does.
+    """
+    PREFIX = "shortcut "
+    HELP_TEXT = "name"
+    NAME = "%s{%s}" % (PREFIX, HELP_TEXT)
+
+    def __init__(self):
+        super(ShortcutsCommandFactory, self).__init__()
+        self.shortcuts = {}
+
+    def setShortcut(self, name, command):
+        if name in self.shortcuts:
+            self._removePostfix(name)
+        if command is None:
+            del self.shortcuts[name]
+        else:
+            self.shortcuts[name] = command
+            self._addPostfix(name)
+
+    def _generateCommandObj(self, postfix):
+        return self.shortcuts.get(postfix)
+
+    def update(self):
+        pass
+
+
+def test_getCommand_quasimodeSession_postfixesChanged(command_manager):
+    factory = ShortcutsCommandFactory()
+    command_manager.registerCommand(factory.NAME, factory)
+    command_manager.startQuasimodeSession()
+    try:
+        assert command_manager.getCommand("shortcut gimp") is None
+        # Shortcut added by a directory monitor during the session
+        gimp = object()
+        factory.setShortcut("gimp", gimp)
+        assert command_manager.getCommand("shortcut gimp") is gimp
+        assert command_manager.getCommand("shortcut gimp") is gimp
+        # Shortcut replaced
+        new_gimp = object()
+        factory.setShortcut("gimp", new_gimp)
+        assert command_manager.getCommand("shortcut gimp") is new_gimp
+        # Shortcut removed
+        factory.setShortcut("gimp", None)
+        assert command_manager.getCommand("shortcut gimp") is None
+    finally:
+        command_manager.endQuasimodeSession()
+        command_manager.unregisterCommand(factory.NAME)
+
+
+def test_quasimodeSession(command_manager):
+    # Narrowed suggestions must be the same as the ones of a full query
+    def suggestion_texts(userText):
+        return sorted(
+            s.toText() for s in command_manager.retrieveSuggestions(userText))
+
+    typed = ["e", "en", "ens", "enso", "enso ", "enso h", "enso he",
+             "enso h", "enso ", "enso a", "enso ab", "enso abx", "x"]
+    expected = [suggestion_texts(userText) for userText in typed]
+
+    command_manager.startQuasimodeSession()
+    try:
+        assert [suggestion_texts(userText) for userText in typed] == expected
+    finally:
+        command_manager.endQuasimodeSession()
+
+
+def test_retrieveTopSuggestions(command_manager):
+    # Top suggestions must be the nearest ones of all the suggestions
+    for userText in ["e", "enso", "enso ", "enso h", "enso about", "x"]:
+        for k in [0, 1, 2, 11]:
+            expected = nsmallest(
+                k, command_manager.retrieveSuggestions(userText))
+            top = command_manager.retrieveTopSuggestions(userText, k)
+            assert [s.toText() for s in top] == \
+                [s.toText() for s in expected]
+
+
 if __name__ == '__main__':
     pass
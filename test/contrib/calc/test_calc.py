@@ -0,0 +1,32 @@
+from enso.contrib.calc import calc
+
+
+LINES = [
+    "1",
+    "  2 + 4",
+    "foo",
+    "",
+    "1,000,000",
+    "4.5",
+]
+
+
+def test_calculate_lines():
+    values = calc.calculate_lines(LINES)
+    assert values == [1, 6, None, None, 1000000, 4.5]
+
+
+def test_calculate_lines_workers():
+    lines = LINES * 20
+    assert calc.calculate_lines(lines, workers=4) == calc.calculate_lines(lines)
+
+
+def test_format_lines():
+    expression, result = calc._format_lines(
+        LINES, calc.calculate_lines(LINES))
+    assert expression == u"1 +\n  6 +\nfoo +\n +\n1000000 +\n4.5\n"
+    assert result == 1000011
+
+
+if __name__ == '__main__':
+    pass
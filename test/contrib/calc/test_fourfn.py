@@ -1,7 +1,10 @@
 from __future__ import division
 
+import datetime
 import math
+import threading
 
+from enso.contrib.calc import fourfn
 from enso.contrib.calc.fourfn import evaluate
 
 
@@ -58,3 +61,94 @@ def test_fourfn():
     # Not passing tests:
     #assert evaluate( "9^9^2") == (float(9**9**2), "9 ^ 9 ^ 2")
     #assert evaluate("--9") == (9, "9")
+
+
+def test_fourfn_cache():
+    evaluator = fourfn.Evaluator()
+    assert evaluator.evaluate("2  *   (3 + 4)") == (14, "2 * (3 + 4)")
+    assert evaluator.evaluate("2 * (3 + 4) ") == (14, "2 * (3 + 4)")
+    assert evaluator._cache.keys() == [u"2 * (3 + 4)"]
+
+    # The parse errors are cached too
+    for _ in range(2):
+        try:
+            evaluator.evaluate("(")
+        except Exception:
+            pass
+        else:
+            assert False, "The expression is invalid"
+    assert len(evaluator._cache) == 2
+
+    evaluator = fourfn.Evaluator(cache_size=3)
+    for i in range(10):
+        evaluator.evaluate("%d + 1" % i)
+    assert evaluator._cache.keys() == [u"7 + 1", u"8 + 1", u"9 + 1"]
+
+    evaluator.clear_cache()
+    assert evaluator._cache.keys() == []
+
+
+def test_fourfn_time_dependent():
+    # The cached expressions don't contain the values of the time
+    # dependent tokens, they are evaluated each time
+    assert fourfn.get_parsed_expression("today") == ("today",)
+    assert evaluate("today") == (
+        datetime.date.today(), str(datetime.date.today()))
+    assert fourfn.get_parsed_expression("now + 1 hour")[0] == "now"
+    value, _ = evaluate("now")
+    assert abs(value - datetime.datetime.now()) < datetime.timedelta(minutes=1)
+
+    # Same for the home currency
+    assert fourfn.HOME_CURRENCY in fourfn.get_parsed_expression("1 usd")
+    get_home_currency = fourfn.get_home_currency
+    try:
+        for home_currency in ("EUR", "CZK"):
+            fourfn.get_home_currency = lambda: home_currency
+            assert fourfn.evaluateStack([fourfn.HOME_CURRENCY]) == (
+                home_currency, fourfn.HOME_CURRENCY)
+    finally:
+        fourfn.get_home_currency = get_home_currency
+
+
+def test_fourfn_threads():
+    expressions = [
+        ("%d * (%d + 1) - sqrt(16)" % (i, i), i * (i + 1) - 4.0)
+        for i in range(50)
+    ]
+    errors = []
+
+    def evaluate_all(evaluator):
+        try:
+            for _ in range(4):
+                for expression, value in expressions:
+                    assert evaluator.evaluate(expression)[0] == value, \
+                        expression
+        except Exception as e:
+            errors.append(e)
+
+    # The threads share an evaluator, or use evaluators of their own,
+    # all of them share the grammar
+    shared = fourfn.Evaluator(cache_size=0)
+    threads = [
+        threading.Thread(target=evaluate_all, args=(evaluator,))
+        for evaluator in [shared] * 4 + [
+            fourfn.Evaluator(cache_size=10) for _ in range(4)]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_fourfn_reentrant():
+    # A parsing started while another one is in progress in the same
+    # thread leaves the stack of the outer one alone
+    outer_stack = ["1"]
+    fourfn._parse_state.stack = outer_stack
+    try:
+        assert fourfn.BNF.parse("2 + 3") == ("2", "3", "+")
+        assert fourfn._parse_state.stack is outer_stack
+        assert outer_stack == ["1"]
+    finally:
+        fourfn._parse_state.stack = None
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+
+from enso.contrib.calc import ip2country
+
+APNIC_RECORDS = """\
+2|apnic|20190101|4|19830613|20181231|+1000
+apnic|*|ipv4|*|4|summary
+apnic|AU|ipv4|1.0.0.0|256|20110811|assigned
+apnic|CN|ipv4|1.0.1.0|256|20110414|allocated
+apnic|CN|ipv4|1.0.2.0|512|20110414|allocated
+apnic|JP|ipv4|1.0.16.0|4096|20110412|allocated
+apnic||ipv4|1.0.64.0|256||available
+apnic|JP|ipv6|2001:200::|35|19990813|allocated
+"""
+
+
+def ip2country_lookup(index, ipaddr):
+    return index.lookup(ip2country.ipToLong(ipaddr))
+
+
+def check_index(index):
+    assert len(index) == 3
+    assert ip2country_lookup(index, "0.255.255.255") is None
+    assert ip2country_lookup(index, "1.0.0.0") == "AU"
+    assert ip2country_lookup(index, "1.0.0.255") == "AU"
+    # Adjacent ranges of the same country are merged
+    assert ip2country_lookup(index, "1.0.1.1") == "CN"
+    assert ip2country_lookup(index, "1.0.3.255") == "CN"
+    assert ip2country_lookup(index, "1.0.4.0") is None
+    # The whole range is covered, not only its first /24
+    assert ip2country_lookup(index, "1.0.31.200") == "JP"
+    assert ip2country_lookup(index, "1.0.32.0") is None
+    assert ip2country_lookup(index, "1.0.64.1") is None
+    assert ip2country_lookup(index, "255.255.255.255") is None
+
+
+def test_ip2country_index():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        apnic_file = os.path.join(temp_dir, "apnic")
+        with open(apnic_file, "w") as f:
+            f.write(APNIC_RECORDS)
+        index = ip2country.RangeIndex.fromRecords(
+            ip2country.readApnicRecords(apnic_file))
+        check_index(index)
+
+        index_file = os.path.join(temp_dir, "apnic.idx")
+        index.save(index_file)
+        mapped_index = ip2country.RangeIndex.fromFile(index_file)
+        try:
+            check_index(mapped_index)
+        finally:
+            mapped_index.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    pass
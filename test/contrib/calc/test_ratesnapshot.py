@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+from enso.contrib.calc.exchangerates.ratesnapshot import RatesSnapshot
+
+RATES_CSV = """\
+EUR,1.000000
+USD,1.100000
+CZK,25.000000
+XXX,N/A
+"""
+
+
+def check_snapshot(snapshot):
+    assert len(snapshot) == 4
+    assert "CZK" in snapshot and "ABC" not in snapshot
+    assert snapshot.get_rate("USD") == 1.1
+    assert snapshot.get_rate("XXX") == 0
+
+    converted, rate, unknown_rates = snapshot.convert_many(
+        [1, 10], "EUR", "CZK")
+    assert (converted, rate, unknown_rates) == ([25.0, 250.0], 25.0, [])
+    converted, rate, unknown_rates = snapshot.convert_many(
+        [25, 50], "CZK", "EUR")
+    assert (converted, rate, unknown_rates) == ([1.0, 2.0], 1 / 25.0, [])
+    converted, rate, unknown_rates = snapshot.convert_many(
+        [11, 1], "USD", "CZK")
+    assert (converted, rate, unknown_rates) == ([250.0, 22.7273], None, [])
+    assert snapshot.convert_many([1], "XXX", "EUR") == (None, None, ["XXX"])
+    assert snapshot.convert_many([1], "CZK", "XXX") == (None, None, ["XXX"])
+
+
+def test_ratesnapshot():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        csv_file = os.path.join(temp_dir, "rates.csv")
+        with open(csv_file, "w") as f:
+            f.write(RATES_CSV)
+        snapshot = RatesSnapshot.from_csv(csv_file)
+        assert snapshot.updated == os.path.getmtime(csv_file)
+        check_snapshot(snapshot)
+
+        snapshot_file = os.path.join(temp_dir, "rates.bin")
+        snapshot.save(snapshot_file)
+        mapped_snapshot = RatesSnapshot.load(snapshot_file)
+        assert mapped_snapshot.codes == snapshot.codes
+        assert mapped_snapshot.get_updated() == snapshot.get_updated()
+        check_snapshot(mapped_snapshot)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_ratesnapshot_invalid():
+    temp_dir = tempfile.mkdtemp()
+    try:
+        snapshot_file = os.path.join(temp_dir, "rates.bin")
+        RatesSnapshot.from_rates([("EUR", 1.0)]).save(snapshot_file)
+        with open(snapshot_file, "ab") as f:
+            f.write("X")
+        try:
+            RatesSnapshot.load(snapshot_file)
+        except ValueError:
+            pass
+        else:
+            assert False, "Truncated snapshot loaded"
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    pass
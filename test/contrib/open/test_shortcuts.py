@@ -0,0 +1,65 @@
+from enso.contrib.open import shortcuts
+
+
+def _shortcut(name, category="learned", target_type=shortcuts.SHORTCUT_TYPE_EXECUTABLE):
+    return shortcuts.Shortcut(
+        name, target_type, "/usr/bin/%s" % name, "/tmp/%s.desktop" % name,
+        category=category)
+
+
+def test_subscribe_changes():
+    shortcuts_dict = shortcuts.ShortcutsDict()
+    shortcuts_dict.update_by_category("learned", {
+        "gimp": _shortcut("gimp"),
+        "vim": _shortcut("vim"),
+    })
+    changes = shortcuts_dict.subscribe()
+    assert changes.pop() == ({}, {})
+
+    # Re-reading unchanged shortcuts is not reported
+    shortcuts_dict.update_by_category("learned", {
+        "gimp": _shortcut("gimp"),
+        "vim": _shortcut("vim"),
+    })
+    assert changes.pop() == ({}, {})
+
+    old_vim = shortcuts_dict["vim"]
+    new_vim = _shortcut("vim", target_type=shortcuts.SHORTCUT_TYPE_DOCUMENT)
+    inkscape = _shortcut("inkscape")
+    shortcuts_dict.update_by_category("learned", {
+        "vim": new_vim,
+        "inkscape": inkscape,
+    })
+    added, removed = changes.pop()
+    assert added == {"vim": new_vim, "inkscape": inkscape}
+    assert sorted(removed.keys()) == ["gimp", "vim"]
+    assert removed["vim"] is old_vim
+
+
+def test_changes_are_merged():
+    shortcuts_dict = shortcuts.ShortcutsDict()
+    changes = shortcuts_dict.subscribe()
+    gimp = _shortcut("gimp")
+    shortcuts_dict["gimp"] = gimp
+    shortcuts_dict["vim"] = _shortcut("vim")
+    del shortcuts_dict["vim"]
+    assert changes.pop() == ({"gimp": gimp}, {})
+
+    shortcuts_dict["gimp"] = _shortcut("gimp", target_type=shortcuts.SHORTCUT_TYPE_DOCUMENT)
+    del shortcuts_dict["gimp"]
+    # Only the net change against the last pop() is reported
+    assert changes.pop() == ({}, {"gimp": gimp})
+
+
+def test_update_by_dir_changes():
+    shortcuts_dict = shortcuts.ShortcutsDict()
+    shortcuts_dict.update({"gimp": _shortcut("gimp"), "vim": _shortcut("vim")})
+    changes = shortcuts_dict.subscribe()
+    shortcuts_dict.update_by_dir("/tmp", {"vim": _shortcut("vim")})
+    added, removed = changes.pop()
+    assert added == {}
+    assert removed.keys() == ["gimp"]
+
+    shortcuts_dict.unsubscribe(changes)
+    shortcuts_dict.update_by_dir("/tmp", {})
+    assert changes.pop() == ({}, {})
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import time
+
+import pytest
+
+from enso.contrib.open import shortcuts
+from enso.contrib.open.snapshot import ShortcutsSnapshot, get_source_signature
+
+
+@pytest.fixture
+def tmpdir_path():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _touch(path, mtime=None):
+    with open(path, "w") as f:
+        f.write("x")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_source_signature(tmpdir_path):
+    source_dir = os.path.join(tmpdir_path, "apps")
+    os.mkdir(source_dir)
+    source_file = os.path.join(tmpdir_path, "bookmarks")
+    _touch(os.path.join(source_dir, "a.desktop"), time.time() - 100)
+
+    paths = (source_dir, source_file)
+    signature = get_source_signature(paths)
+    assert signature == get_source_signature(paths)
+
+    # File in the directory modified in place
+    _touch(os.path.join(source_dir, "a.desktop"))
+    assert signature != get_source_signature(paths)
+    signature = get_source_signature(paths)
+
+    # Missing file created
+    _touch(source_file)
+    assert signature != get_source_signature(paths)
+
+
+def test_save_load(tmpdir_path):
+    source_dir = os.path.join(tmpdir_path, "learned")
+    os.mkdir(source_dir)
+    sources = {"learned": (source_dir,), "desktop": ()}
+    filename = os.path.join(tmpdir_path, "shortcuts.snapshot")
+
+    shortcuts_dict = shortcuts.ShortcutsDict()
+    snapshot = ShortcutsSnapshot(filename, sources)
+    assert not snapshot.load(shortcuts_dict)
+    assert sorted(snapshot.get_stale_categories()) == ["desktop", "learned"]
+
+    @snapshot.updates("learned", shortcuts_dict)
+    def update_learned():
+        shortcuts_dict.update_by_category("learned", {
+            u"gimp": shortcuts.Shortcut(
+                u"gimp", shortcuts.SHORTCUT_TYPE_EXECUTABLE, "/usr/bin/gimp",
+                os.path.join(source_dir, "gimp.desktop"), category="learned"),
+            u"news": shortcuts.Shortcut(
+                u"news", shortcuts.SHORTCUT_TYPE_URL, "http://news.cz",
+                category="learned"),
+        })
+
+    update_learned()
+    assert snapshot.get_stale_categories() == ["desktop"]
+
+    loaded_dict = shortcuts.ShortcutsDict()
+    snapshot = ShortcutsSnapshot(filename, sources)
+    assert snapshot.load(loaded_dict)
+    assert sorted(loaded_dict.keys()) == [u"gimp", u"news"]
+    assert str(loaded_dict[u"gimp"]) == str(shortcuts_dict[u"gimp"])
+    assert str(loaded_dict[u"news"]) == str(shortcuts_dict[u"news"])
+    assert snapshot.get_stale_categories() == ["desktop"]
+
+    # Modified source makes the category stale
+    _touch(os.path.join(source_dir, "gimp.desktop"))
+    assert sorted(snapshot.get_stale_categories()) == ["desktop", "learned"]
+
+
+def test_skipped_update_is_not_recorded(tmpdir_path):
+    filename = os.path.join(tmpdir_path, "shortcuts.snapshot")
+    snapshot = ShortcutsSnapshot(filename, {"bookmarks": ()})
+
+    @snapshot.updates("bookmarks", shortcuts.ShortcutsDict())
+    def update_bookmarks():
+        return False
+
+    update_bookmarks()
+    assert snapshot.get_stale_categories() == ["bookmarks"]
+    assert not os.path.exists(filename)
+
+
+def test_recursive_source_signature(tmpdir_path):
+    source_dir = os.path.join(tmpdir_path, "apps")
+    sub_dir = os.path.join(source_dir, "kde4")
+    os.makedirs(sub_dir)
+    _touch(os.path.join(sub_dir, "a.desktop"), time.time() - 100)
+    os.utime(sub_dir, (time.time() - 100, time.time() - 100))
+
+    paths = (source_dir,)
+    signature = get_source_signature(paths)
+    recursive_signature = get_source_signature(paths, recursive=True)
+    assert recursive_signature == get_source_signature(paths, recursive=True)
+
+    # File in the subdirectory modified in place
+    _touch(os.path.join(sub_dir, "a.desktop"))
+    assert signature == get_source_signature(paths)
+    assert recursive_signature != get_source_signature(paths, recursive=True)
+    recursive_signature = get_source_signature(paths, recursive=True)
+
+    # File added to the subdirectory
+    _touch(os.path.join(sub_dir, "b.desktop"), time.time() - 100)
+    assert recursive_signature != get_source_signature(paths, recursive=True)
+
+
+def test_removed_executable(tmpdir_path):
+    source_dir = os.path.join(tmpdir_path, "apps")
+    os.mkdir(source_dir)
+    executable = os.path.join(tmpdir_path, "gimp")
+    _touch(executable)
+    sources = {"application": (source_dir,), "learned": ()}
+    filename = os.path.join(tmpdir_path, "shortcuts.snapshot")
+
+    shortcuts_dict = shortcuts.ShortcutsDict()
+    snapshot = ShortcutsSnapshot(
+        filename, sources, recursive=("application",),
+        executables=("application",))
+
+    @snapshot.updates("application", shortcuts_dict)
+    def update_applications():
+        shortcuts_dict.update_by_category("application", {
+            u"gimp": shortcuts.Shortcut(
+                u"gimp", shortcuts.SHORTCUT_TYPE_EXECUTABLE, executable,
+                os.path.join(source_dir, "gimp.desktop"),
+                category="application"),
+        })
+
+    @snapshot.updates("learned", shortcuts_dict)
+    def update_learned():
+        shortcuts_dict.update_by_category("learned", {
+            u"missing": shortcuts.Shortcut(
+                u"missing", shortcuts.SHORTCUT_TYPE_EXECUTABLE,
+                os.path.join(tmpdir_path, "missing"), category="learned"),
+        })
+
+    update_applications()
+    update_learned()
+    assert snapshot.get_stale_categories() == []
+
+    snapshot = ShortcutsSnapshot(
+        filename, sources, recursive=("application",),
+        executables=("application",))
+    assert snapshot.load(shortcuts.ShortcutsDict())
+    assert snapshot.get_stale_categories() == []
+
+    os.remove(executable)
+    assert snapshot.get_stale_categories() == ["application"]
@@ -0,0 +1,118 @@
+"""
+    Tests for the CodeCache of the scriptotron command files.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from enso.contrib.scriptotron.codecache import CodeCache
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class CodeCacheTests( unittest.TestCase ):
+    def setUp( self ):
+        self.tempDir = tempfile.mkdtemp()
+        self.cache = CodeCache( os.path.join( self.tempDir, "cache" ) )
+        self.fileName = os.path.join( self.tempDir, "commands.py" )
+        self._writeFile( "def cmd_hello(ensoapi):\n    return 'hello'\n" )
+
+    def tearDown( self ):
+        shutil.rmtree( self.tempDir, ignore_errors=True )
+
+    def _writeFile( self, text, mtime=1000000000 ):
+        with open( self.fileName, "w" ) as f:
+            f.write( text )
+        os.utime( self.fileName, ( mtime, mtime ) )
+        return os.stat( self.fileName )
+
+    def _compile( self ):
+        with open( self.fileName ) as f:
+            return compile( f.read(), self.fileName, "exec" )
+
+    def testGetPut( self ):
+        fileStat = os.stat( self.fileName )
+        self.failUnlessEqual( self.cache.get( self.fileName, fileStat ),
+                              ( False, None ) )
+        self.cache.put( self.fileName, fileStat, self._compile() )
+
+        found, code = self.cache.get( self.fileName, fileStat )
+        self.failUnless( found )
+        self.failUnlessEqual( code.co_filename, self.fileName )
+        allGlobals = {}
+        exec code in allGlobals
+        self.failUnlessEqual( allGlobals["cmd_hello"]( None ), "hello" )
+
+    def testNoneCode( self ):
+        fileStat = os.stat( self.fileName )
+        self.cache.put( self.fileName, fileStat, None )
+        self.failUnlessEqual( self.cache.get( self.fileName, fileStat ),
+                              ( True, None ) )
+
+    def testInvalidation( self ):
+        fileStat = os.stat( self.fileName )
+        self.cache.put( self.fileName, fileStat, self._compile() )
+        # Modified time
+        newStat = self._writeFile(
+            "def cmd_hello(ensoapi):\n    return 'hello'\n", mtime=1000000001 )
+        self.failUnlessEqual( self.cache.get( self.fileName, newStat ),
+                              ( False, None ) )
+        # Modified size, same time
+        newStat = self._writeFile( "def cmd_hello(ensoapi):\n    pass\n" )
+        self.failUnlessEqual( self.cache.get( self.fileName, newStat ),
+                              ( False, None ) )
+
+    def testCorruptedCacheFile( self ):
+        fileStat = os.stat( self.fileName )
+        self.cache.put( self.fileName, fileStat, self._compile() )
+        cacheDir = os.path.join( self.tempDir, "cache" )
+        for name in os.listdir( cacheDir ):
+            with open( os.path.join( cacheDir, name ), "r+b" ) as f:
+                f.truncate( 10 )
+        self.failUnlessEqual( self.cache.get( self.fileName, fileStat ),
+                              ( False, None ) )
+
+    def testPrune( self ):
+        fileStat = os.stat( self.fileName )
+        self.cache.put( self.fileName, fileStat, self._compile() )
+        # Command file renamed
+        renamedFileName = os.path.join( self.tempDir, "renamed.py" )
+        os.rename( self.fileName, renamedFileName )
+        self.cache.put( renamedFileName, fileStat, None )
+        cacheDir = os.path.join( self.tempDir, "cache" )
+        otherFileName = os.path.join( cacheDir, "other.txt" )
+        with open( otherFileName, "w" ) as f:
+            f.write( "x" )
+        self.failUnlessEqual( len( os.listdir( cacheDir ) ), 3 )
+
+        self.cache.prune( [ renamedFileName ] )
+        self.failUnlessEqual( self.cache.get( renamedFileName, fileStat ),
+                              ( True, None ) )
+        self.failUnlessEqual( self.cache.get( self.fileName, fileStat ),
+                              ( False, None ) )
+        # Only the cached code is removed
+        self.failUnlessEqual( len( os.listdir( cacheDir ) ), 2 )
+        self.failUnless( os.path.exists( otherFileName ) )
+
+        self.cache.prune( [] )
+        self.failUnlessEqual( os.listdir( cacheDir ), [ "other.txt" ] )
+
+    def testPruneMissingCacheDir( self ):
+        self.cache.prune( [ self.fileName ] )
+        self.failIf( os.path.exists( os.path.join( self.tempDir, "cache" ) ) )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+    Tests for the measuring of the glyphs of a font: the glyph indices
+    and metrics are taken from the scaled font if the cairo bindings
+    can map the text to glyphs, and from the text extents otherwise.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from enso.graphics.font import _getGlyphMetrics
+
+
+# ----------------------------------------------------------------------------
+# Fake Cairo Contexts
+# ----------------------------------------------------------------------------
+
+def textExtents( char ):
+    return ( 0.5, -8.0, 5.0, 8.0, 6.0 + ord( char ) % 5, 0.0 )
+
+
+def glyphIndex( char ):
+    return ord( char ) + 1000
+
+
+class FakeScaledFont( object ):
+    def __init__( self, ligatures=False ):
+        self.ligatures = ligatures
+        self.textToGlyphsCalls = 0
+
+    def text_to_glyphs( self, x, y, utf8, withClusters ):
+        self.textToGlyphsCalls += 1
+        text = utf8.decode( "UTF-8" )
+        if self.ligatures:
+            text = text.replace( u"fi", u"\ufb01" )
+        return [ ( glyphIndex( char ), x + i * 6.0, y )
+                 for i, char in enumerate( text ) ]
+
+    def glyph_extents( self, glyphs ):
+        ( index, _, _ ), = glyphs
+        return textExtents( unichr( index - 1000 ) )
+
+
+class FakeContext( object ):
+    def __init__( self, scaledFont=None ):
+        self.scaledFont = scaledFont
+        self.textExtentsCalls = 0
+
+    def get_scaled_font( self ):
+        if self.scaledFont is None:
+            # Bindings without the scaled fonts
+            raise AttributeError( "get_scaled_font" )
+        return self.scaledFont
+
+    def text_extents( self, utf8 ):
+        self.textExtentsCalls += 1
+        return textExtents( utf8.decode( "UTF-8" ) )
+
+
+class OldScaledFont( object ):
+    """ Scaled font of the bindings without text_to_glyphs() """
+    pass
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class GlyphMetricsTests( unittest.TestCase ):
+    CHARS = list( u"abc \u017e!" )
+
+    def _getMetrics( self, context ):
+        metrics = list( _getGlyphMetrics( context, self.CHARS ) )
+        self.failUnlessEqual( [ char for char, _, _ in metrics ],
+                              self.CHARS )
+        for char, extents, _ in metrics:
+            self.failUnlessEqual( extents, textExtents( char ) )
+        return [ index for _, _, index in metrics ]
+
+    def testGlyphIndices( self ):
+        scaledFont = FakeScaledFont()
+        context = FakeContext( scaledFont )
+        self.failUnlessEqual( self._getMetrics( context ),
+                              [ glyphIndex( char ) for char in self.CHARS ] )
+        # All the chars are mapped at once
+        self.failUnlessEqual( scaledFont.textToGlyphsCalls, 1 )
+        self.failUnlessEqual( context.textExtentsCalls, 0 )
+
+    def testWithoutTextToGlyphs( self ):
+        for context in ( FakeContext(), FakeContext( OldScaledFont() ) ):
+            self.failUnlessEqual( self._getMetrics( context ),
+                                  [ None ] * len( self.CHARS ) )
+            self.failUnlessEqual( context.textExtentsCalls,
+                                  len( self.CHARS ) )
+
+    def testGlyphsNotMatchingChars( self ):
+        # Ligatures can't be mapped back to the chars
+        self.CHARS = list( u"fix" )
+        context = FakeContext( FakeScaledFont( ligatures=True ) )
+        self.failUnlessEqual( self._getMetrics( context ), [ None ] * 3 )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
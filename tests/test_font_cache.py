@@ -0,0 +1,126 @@
+"""
+    Tests for the persistent FontMetricsCache.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from enso.graphics.fontcache import FontMetricsCache, getFontsSignature
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+FONT_EXTENTS = ( 10.0, 3.0, 13.0, 12.0, 0.0 )
+
+
+def textExtents( char ):
+    return ( 0.5, -8.0, 5.0, 8.0, 6.0 + ord( char ) % 5, 0.0 )
+
+
+class FontMetricsCacheTests( unittest.TestCase ):
+    def setUp( self ):
+        self.tempDir = tempfile.mkdtemp()
+        self.fileName = os.path.join( self.tempDir, "cache", "metrics.bin" )
+
+    def tearDown( self ):
+        shutil.rmtree( self.tempDir, ignore_errors=True )
+
+    def _addFont( self, cache, name, size, chars ):
+        metrics = cache.addFontMetrics( name, size, False, FONT_EXTENTS )
+        for char in chars:
+            metrics.setGlyphMetrics( char, textExtents( char ), ord( char ) )
+        return metrics
+
+    def testSaveLoad( self ):
+        cache = FontMetricsCache( self.fileName, "signature" )
+        self.failUnlessEqual( cache.getFontMetrics( "Sans", 12.0, False ),
+                              None )
+        self._addFont( cache, "Sans", 12.0, u"hello w\u00f6rld" )
+        metrics = cache.addFontMetrics( "Sans", 12.0, True, FONT_EXTENTS )
+        metrics.setGlyphMetrics( u"x", textExtents( u"x" ), None )
+        cache.save()
+
+        cache = FontMetricsCache( self.fileName, "signature" )
+        metrics = cache.getFontMetrics( "Sans", 12.0, False )
+        self.failUnlessEqual( metrics.fontExtents, FONT_EXTENTS )
+        for char in u"hello w\u00f6rld":
+            self.failUnlessEqual( metrics.getGlyphMetrics( char ),
+                                  ( textExtents( char ), ord( char ) ) )
+        self.failUnlessEqual( metrics.getGlyphMetrics( u"z" ), None )
+        self.failUnlessEqual(
+            cache.getFontMetrics( "Sans", 12.0, True ).getGlyphMetrics( u"x" ),
+            ( textExtents( u"x" ), None ) )
+        self.failUnlessEqual( cache.getFontMetrics( "Sans", 14.0, False ),
+                              None )
+
+    def testMerge( self ):
+        cache = FontMetricsCache( self.fileName, "signature" )
+        self._addFont( cache, "Sans", 12.0, u"abc" )
+        self._addFont( cache, "Serif", 12.0, u"abc" )
+        cache.save()
+
+        cache = FontMetricsCache( self.fileName, "signature" )
+        cache.getFontMetrics( "Sans", 12.0, False ).setGlyphMetrics(
+            u"d", textExtents( u"d" ), 100 )
+        cache.save()
+
+        cache = FontMetricsCache( self.fileName, "signature" )
+        metrics = cache.getFontMetrics( "Sans", 12.0, False )
+        for char in u"abc":
+            self.failUnlessEqual( metrics.getGlyphMetrics( char ),
+                                  ( textExtents( char ), ord( char ) ) )
+        self.failUnlessEqual( metrics.getGlyphMetrics( u"d" ),
+                              ( textExtents( u"d" ), 100 ) )
+        self.failIfEqual( cache.getFontMetrics( "Serif", 12.0, False ), None )
+
+    def testSignatureChange( self ):
+        cache = FontMetricsCache( self.fileName, "signature" )
+        self._addFont( cache, "Sans", 12.0, u"abc" )
+        cache.save()
+
+        cache = FontMetricsCache( self.fileName, "other signature" )
+        self.failUnlessEqual( cache.getFontMetrics( "Sans", 12.0, False ),
+                              None )
+
+    def testCorruptedFile( self ):
+        cache = FontMetricsCache( self.fileName, "signature" )
+        self._addFont( cache, "Sans", 12.0, u"abc" )
+        cache.save()
+        with open( self.fileName, "r+b" ) as f:
+            f.truncate( os.path.getsize( self.fileName ) - 10 )
+
+        cache = FontMetricsCache( self.fileName, "signature" )
+        self.failUnlessEqual( cache.getFontMetrics( "Sans", 12.0, False ),
+                              None )
+
+    def testFontsSignature( self ):
+        fontDir = os.path.join( self.tempDir, "fonts" )
+        os.makedirs( os.path.join( fontDir, "truetype" ) )
+        os.utime( fontDir, ( 1000000000, 1000000000 ) )
+        signature = getFontsSignature( "settings", [ fontDir ] )
+        self.failUnlessEqual( getFontsSignature( "settings", [ fontDir ] ),
+                              signature )
+        self.failIfEqual( getFontsSignature( "other settings", [ fontDir ] ),
+                          signature )
+
+        # A font installed into a subdirectory
+        subDir = os.path.join( fontDir, "truetype" )
+        os.utime( subDir, ( 1000000100, 1000000100 ) )
+        self.failIfEqual( getFontsSignature( "settings", [ fontDir ] ),
+                          signature )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
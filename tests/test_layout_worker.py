@@ -0,0 +1,123 @@
+"""
+    Tests for the LayoutWorker used by the message windows.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import threading
+import time
+import unittest
+
+from enso.messages.layoutworker import LayoutWorker
+
+
+# ----------------------------------------------------------------------------
+# Fake Event Manager
+# ----------------------------------------------------------------------------
+
+class FakeEventManager( object ):
+    def __init__( self ):
+        self.responders = []
+
+    def registerResponder( self, responderFunc, eventType ):
+        assert eventType == "timer"
+        assert responderFunc not in self.responders
+        self.responders.append( responderFunc )
+
+    def removeResponder( self, responderFunc ):
+        self.responders.remove( responderFunc )
+
+    def tick( self ):
+        for responder in self.responders[:]:
+            responder( 10 )
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class LayoutWorkerTests( unittest.TestCase ):
+    TIMEOUT = 5.0
+
+    def setUp( self ):
+        self.eventManager = FakeEventManager()
+        self.worker = LayoutWorker( self.eventManager )
+        self.results = []
+
+    def tearDown( self ):
+        self.worker.stop()
+        self.worker = None
+        self.eventManager = None
+
+    def _waitForJobs( self ):
+        started = time.time()
+        while time.time() - started < self.TIMEOUT:
+            self.eventManager.tick()
+            if not self.worker.isPending():
+                return
+            time.sleep( 0.001 )
+        self.fail( "The worker did not finish the jobs." )
+
+    def testResults( self ):
+        for text in [ "a", "b", "c" ]:
+            self.worker.submit( lambda text: text.upper(), ( text, ),
+                                self.results.append )
+        self.failUnlessEqual( len( self.eventManager.responders ), 1 )
+        self._waitForJobs()
+        # The results are handed back in order, on a timer event
+        self.failUnlessEqual( self.results, [ "A", "B", "C" ] )
+        self.failUnlessEqual( self.eventManager.responders, [] )
+
+    def testCancel( self ):
+        release = threading.Event()
+        self.worker.submit( lambda: release.wait( self.TIMEOUT ), (),
+                            self.results.append )
+        job = self.worker.submit( lambda: "cancelled", (),
+                                  self.results.append )
+        job.cancel()
+        self.worker.submit( lambda: "done", (), self.results.append )
+        release.set()
+        self._waitForJobs()
+        self.failUnlessEqual( self.results[1:], [ "done" ] )
+
+    def testError( self ):
+        errors = []
+
+        def fail():
+            raise ValueError( "broken message" )
+
+        self.worker.submit( fail, (), self.results.append, errors.append )
+        self.worker.submit( fail, (), self.results.append )
+        self._waitForJobs()
+        self.failUnlessEqual( self.results, [] )
+        self.failUnlessEqual( [ str( e ) for e in errors ],
+                              [ "broken message" ] )
+
+    def testSubmitFromCallback( self ):
+        def onDone( result ):
+            self.results.append( result )
+            if result < 3:
+                self.worker.submit( lambda: result + 1, (), onDone )
+
+        self.worker.submit( lambda: 1, (), onDone )
+        self._waitForJobs()
+        self.failUnlessEqual( self.results, [ 1, 2, 3 ] )
+        self.failUnlessEqual( self.eventManager.responders, [] )
+
+    def testRestart( self ):
+        self.worker.submit( lambda: 1, (), self.results.append )
+        self._waitForJobs()
+        self.worker.stop()
+        self.worker.submit( lambda: 2, (), self.results.append )
+        self._waitForJobs()
+        self.failUnlessEqual( self.results, [ 1, 2 ] )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
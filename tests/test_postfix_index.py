@@ -0,0 +1,144 @@
+"""
+    Tests for the PostfixIndex used by GenericPrefixFactory, and for
+    the incremental postfix updates of GenericPrefixFactory.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import random
+import unittest
+
+from enso.commands.factories import GenericPrefixFactory
+from enso.commands.postfixindex import PostfixIndex, normalize
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class PostfixIndexTests( unittest.TestCase ):
+    POSTFIXES = [
+        "firefox",
+        "Firefox Private Window",
+        "file  manager",
+        "gimp",
+        "bookmark: news (cz)",
+        "my_project",
+        "firefox",
+        ]
+
+    def setUp( self ):
+        self.index = PostfixIndex( self.POSTFIXES )
+
+    def tearDown( self ):
+        self.index = None
+
+    def _naiveCandidates( self, postfixes, text, anchored ):
+        query = normalize( text )
+        if anchored:
+            return sorted( p for p in postfixes
+                           if normalize( p ).startswith( query ) )
+        else:
+            return sorted( p for p in postfixes if query in normalize( p ) )
+
+    def testCandidates( self ):
+        for text in [ "", "f", "fi", "fire", "FIREFOX", "fox", "file manager",
+                      "my-project", "news 9cz0", "zzz" ]:
+            for anchored in ( False, True ):
+                self.failUnlessEqual(
+                    sorted( self.index.candidates( text, anchored ) ),
+                    self._naiveCandidates( self.POSTFIXES, text, anchored ) )
+
+    def testDuplicates( self ):
+        self.failUnlessEqual( self.index.candidates( "firefox", True ).count(
+            "firefox" ), 2 )
+        self.index.remove( "firefox" )
+        self.failUnlessEqual( self.index.candidates( "firefox", True ).count(
+            "firefox" ), 1 )
+        self.failUnlessEqual( len( self.index ), len( self.POSTFIXES ) - 1 )
+
+    def testRemoveMissing( self ):
+        self.failUnlessRaises( ValueError, self.index.remove, "missing" )
+
+    def testIncrementalUpdates( self ):
+        rnd = random.Random( 0 )
+        alphabet = "abc de_-12@!"
+        postfixes = list( self.POSTFIXES )
+        for _ in range( 200 ):
+            if postfixes and rnd.random() < 0.4:
+                postfix = rnd.choice( postfixes )
+                postfixes.remove( postfix )
+                self.index.remove( postfix )
+            else:
+                postfix = "".join( rnd.choice( alphabet )
+                                   for _ in range( rnd.randint( 0, 8 ) ) )
+                postfixes.append( postfix )
+                self.index.add( postfix )
+            text = "".join( rnd.choice( alphabet )
+                            for _ in range( rnd.randint( 0, 4 ) ) )
+            for anchored in ( False, True ):
+                self.failUnlessEqual(
+                    sorted( self.index.candidates( text, anchored ) ),
+                    self._naiveCandidates( postfixes, text, anchored ) )
+
+    def testSetPostfixes( self ):
+        newPostfixes = [ "gimp", "inkscape", "firefox" ] + \
+                       [ "document %d" % i for i in range( 100 ) ]
+        self.index.setPostfixes( newPostfixes )
+        self.failUnlessEqual( len( self.index ), len( newPostfixes ) )
+        self.failUnlessEqual( sorted( self.index.candidates( "" ) ),
+                              sorted( newPostfixes ) )
+        self.failUnlessEqual( sorted( self.index.candidates( "doc", True ) ),
+                              sorted( newPostfixes[3:] ) )
+
+
+class PrefixFactory( GenericPrefixFactory ):
+    PREFIX = "open "
+
+    def update( self ):
+        pass
+
+    def _generateCommandObj( self, postfix ):
+        return None
+
+
+class UpdatePostfixesTests( unittest.TestCase ):
+    def setUp( self ):
+        self.factory = PrefixFactory()
+        self.factory.setPostfixes( [ "firefox", "gimp", "vim", "gimp" ] )
+        self.factory.afterUpdate()
+
+    def tearDown( self ):
+        self.factory = None
+
+    def _suggestions( self, userText ):
+        return sorted( s.toText() for s in
+                       self.factory.retrieveSuggestions( userText ) )
+
+    def testUpdatePostfixes( self ):
+        self.factory._updatePostfixes( [ "inkscape", "vi" ], [ "gimp", "vim" ] )
+        self.failUnlessEqual( sorted( self.factory.getPostfixes() ),
+                              [ "firefox", "gimp", "inkscape", "vi" ] )
+        self.failUnlessEqual( self._suggestions( "open ink" ),
+                              [ "open inkscape" ] )
+        self.failUnlessEqual( self._suggestions( "open vi" ), [ "open vi" ] )
+        self.failUnlessEqual( self._suggestions( "open gimp" ),
+                              [ "open gimp" ] )
+
+    def testRemoveMissing( self ):
+        self.failUnlessRaises( ValueError, self.factory._updatePostfixes,
+                               [ "inkscape" ], [ "missing" ] )
+        # Nothing is changed
+        self.failUnlessEqual( self.factory.getPostfixes(),
+                              [ "firefox", "gimp", "vim", "gimp" ] )
+        self.failUnlessEqual( self._suggestions( "open inkscape" ), [] )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+"""
+    Tests for the DispatchProfiler, its latency histograms and the
+    LatencyTracer.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import functools
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from enso.profiler import (
+    OTHER_RESPONDERS,
+    DispatchProfiler,
+    LatencyHistogram,
+    LatencyTracer,
+    getResponderName,
+)
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+def onKey(eventType, keyCode):
+    pass
+
+
+class Responder( object ):
+    def onTick( self, msPassed ):
+        pass
+
+
+class LatencyHistogramTests( unittest.TestCase ):
+    def testEmpty( self ):
+        summary = LatencyHistogram().getSummary()
+        self.failUnlessEqual( summary["count"], 0 )
+        self.failUnlessEqual( summary["p95_ms"], 0.0 )
+        self.failUnlessEqual( summary["max_ms"], 0.0 )
+
+    def testPercentiles( self ):
+        histogram = LatencyHistogram()
+        for ms in range( 1, 101 ):
+            histogram.add( ms / 1000.0 )
+        summary = histogram.getSummary()
+        self.failUnlessEqual( summary["count"], 100 )
+        self.failUnlessAlmostEqual( summary["mean_ms"], 50.5 )
+        self.failUnlessAlmostEqual( summary["max_ms"], 100.0 )
+        # The estimates are within the width of a bucket
+        self.failUnless( 50.0 <= summary["p50_ms"] <= 50.0 * 1.19,
+                         summary["p50_ms"] )
+        self.failUnless( 95.0 <= summary["p95_ms"] <= 100.0,
+                         summary["p95_ms"] )
+
+    def testOutOfRange( self ):
+        histogram = LatencyHistogram()
+        histogram.add( 0.0 )
+        histogram.add( 1000.0 )
+        # The estimates are the upper bounds of the buckets
+        self.failUnless( histogram.getPercentile( 50 ) <= 1e-6 )
+        self.failUnlessEqual( histogram.getPercentile( 100 ), 1000.0 )
+
+
+class DispatchProfilerTests( unittest.TestCase ):
+    def setUp( self ):
+        self.profiler = DispatchProfiler( maxResponders=3 )
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        self.profiler = None
+        shutil.rmtree( self.tempDir, ignore_errors=True )
+
+    def testResponderNames( self ):
+        self.failUnlessEqual( getResponderName( onKey ),
+                              "%s.onKey" % __name__ )
+        self.failUnlessEqual( getResponderName( Responder().onTick ),
+                              "%s.Responder.onTick" % __name__ )
+        self.failUnlessEqual(
+            getResponderName( functools.partial( onKey, "down" ) ),
+            "%s.onKey" % __name__ )
+
+    def testStats( self ):
+        self.profiler.recordDispatch( "key", 0.003 )
+        self.profiler.recordResponder( "key", onKey, 0.001 )
+        self.profiler.recordResponder( "key", onKey, 0.002 )
+        self.profiler.recordPerf( "startQuasimode",
+                                  [ ( Responder().onTick, (), {}, 0.5 ) ] )
+
+        events = self.profiler.getStats()["events"]
+        self.failUnlessEqual( sorted( events ), [ "key", "startQuasimode" ] )
+        self.failUnlessEqual( events["key"]["count"], 1 )
+        key = events["key"]["responders"]["%s.onKey" % __name__]
+        self.failUnlessEqual( key["count"], 2 )
+        self.failUnlessAlmostEqual( key["max_ms"], 2.0 )
+        self.failUnlessEqual( events["startQuasimode"]["count"], 0 )
+
+        slowest = self.profiler.getSlowestResponders( 1 )
+        self.failUnlessEqual( [ item[:2] for item in slowest ],
+                              [ ( "startQuasimode",
+                                  "%s.Responder.onTick" % __name__ ) ] )
+
+        self.profiler.reset()
+        self.failUnlessEqual( self.profiler.getStats()["events"], {} )
+
+    def testBoundedResponders( self ):
+        for i in range( 10 ):
+            def responder():
+                pass
+            responder.__name__ = "responder%d" % i
+            self.profiler.recordResponder( "timer", responder, 0.001 )
+
+        responders = self.profiler.getStats()["events"]["timer"]["responders"]
+        self.failUnlessEqual( len( responders ), 4 )
+        self.failUnlessEqual( responders[OTHER_RESPONDERS]["count"], 7 )
+
+    def testDumpJson( self ):
+        self.profiler.recordResponder( "key", onKey, 0.001 )
+        fileName = os.path.join( self.tempDir, "profile", "events.json" )
+        self.profiler.dumpJson( fileName )
+        with open( fileName, "rb" ) as f:
+            stats = json.load( f )
+        self.failUnlessEqual(
+            stats["events"]["key"]["responders"].keys(),
+            [ "%s.onKey" % __name__ ] )
+        self.failUnlessEqual( os.listdir( os.path.dirname( fileName ) ),
+                              [ "events.json" ] )
+
+
+class LatencyTracerTests( unittest.TestCase ):
+    def setUp( self ):
+        self.tracer = LatencyTracer( maxTraces=4 )
+        self.tracer.enable()
+
+    def tearDown( self ):
+        self.tracer = None
+
+    def testDisabled( self ):
+        self.tracer.disable()
+        self.failUnlessEqual( self.tracer.startTrace( "a" ), None )
+        self.failIf( self.tracer.hasPendingTraces() )
+        with self.tracer.span( "layout" ):
+            pass
+        self.tracer.finishTraces()
+        self.failUnlessEqual( self.tracer.getTraces(), [] )
+
+    def testTrace( self ):
+        self.tracer.startTrace( "a" )
+        with self.tracer.span( "layout" ):
+            with self.tracer.span( "xml" ):
+                pass
+        self.tracer.startTrace( "b" )
+        self.tracer.markVisible()
+        with self.tracer.span( "layout" ):
+            pass
+        self.failUnless( self.tracer.hasPendingTraces() )
+        self.tracer.finishTraces()
+        self.failIf( self.tracer.hasPendingTraces() )
+
+        first, second = self.tracer.getTraces()
+        self.failUnlessEqual( ( first.label, second.label ), ( "a", "b" ) )
+        self.failUnlessEqual( first.phases["layout"][1], 2 )
+        self.failUnlessEqual( first.phases["xml"][1], 1 )
+        # Keystrokes drawn together share the spans timed after they
+        # arrived
+        self.failUnlessEqual( second.phases["layout"][1], 1 )
+        self.failIf( "xml" in second.phases )
+        self.failUnless( first.started <= first.visible <= first.finished )
+
+        summary = self.tracer.getSummary()
+        self.failUnlessEqual( summary["keystrokes"], 2 )
+        self.failUnlessEqual( summary["phases"]["layout"]["count"], 2 )
+        self.failUnlessEqual( summary["phases"]["xml"]["count"], 1 )
+        json.dumps( [ trace.asDict() for trace in first, second ] )
+
+    def testDiscardAndCancel( self ):
+        trace = self.tracer.startTrace( "invalid" )
+        self.tracer.discardTrace( trace )
+        self.failIf( self.tracer.hasPendingTraces() )
+
+        self.tracer.startTrace( "a" )
+        self.tracer.cancelTraces()
+        self.tracer.finishTraces()
+        self.failUnlessEqual( self.tracer.getTraces(), [] )
+
+    def testBoundedTraces( self ):
+        for i in range( 10 ):
+            self.tracer.startTrace( i )
+            self.tracer.finishTraces()
+        self.failUnlessEqual( [ trace.label for trace in
+                                self.tracer.getTraces() ], [ 6, 7, 8, 9 ] )
+
+        for i in range( 10 ):
+            self.tracer.startTrace( i )
+        self.tracer.finishTraces()
+        self.failUnlessEqual( [ trace.label for trace in
+                                self.tracer.getTraces() ], [ 6, 7, 8, 9 ] )
+
+        self.tracer.reset()
+        self.failUnlessEqual( self.tracer.getTraces(), [] )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
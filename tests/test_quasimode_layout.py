@@ -0,0 +1,155 @@
+"""
+    Tests for the cache of the lines laid out by
+    enso.quasimode.layout.layoutXmlLine().
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from enso.graphics import textlayout
+from enso.quasimode import layout
+
+
+# ----------------------------------------------------------------------------
+# Fakes
+# ----------------------------------------------------------------------------
+
+class FakeGraphics( object ):
+    @staticmethod
+    def getDesktopSize():
+        return ( 1000, 800 )
+
+
+XML_A = "<document><line>a</line></document>"
+XML_B = "<document><line>b</line></document>"
+XML_C = "<document><line>c</line></document>"
+XML_D = "<document><line>d</line></document>"
+
+SCALE = [ 10, 12, 14 ]
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class LineCacheTests( unittest.TestCase ):
+    def setUp( self ):
+        self.__oldLayoutXmlLine = layout._layoutXmlLine
+        self.__oldGraphics = layout.graphics
+        self.__oldCacheSize = layout.LINE_CACHE_SIZE
+        self.__oldCache = layout._line_cache.copy()
+        layout._layoutXmlLine = self._fakeLayoutXmlLine
+        layout.graphics = FakeGraphics
+        layout._line_cache.clear()
+        self.styles = layout._newLineStyleRegistry()
+        self.laidOut = []
+
+    def tearDown( self ):
+        layout._layoutXmlLine = self.__oldLayoutXmlLine
+        layout.graphics = self.__oldGraphics
+        layout.LINE_CACHE_SIZE = self.__oldCacheSize
+        layout._line_cache.clear()
+        layout._line_cache.update( self.__oldCache )
+
+    def _fakeLayoutXmlLine( self, xml_data, styles, scale ):
+        self.laidOut.append( xml_data )
+        # Like a line that only fits at the smallest size, leaves
+        # the styles updated to that size.
+        layout._updateStyles( styles, scale, scale[0] )
+        document = textlayout.Document( 100, 0, 0 )
+        document.shrinkOffset = scale[-1] - scale[0]
+        return document
+
+    def _layout( self, xml_data, scale = SCALE ):
+        return layout.layoutXmlLine( xml_data, self.styles, scale )
+
+    def testHit( self ):
+        document = self._layout( XML_A )
+        self.failUnlessEqual( self._layout( XML_A ).contentKey,
+                              document.contentKey )
+        self.failUnlessEqual( self.laidOut, [ XML_A ] )
+        self.failUnlessEqual( len( layout._line_cache ), 1 )
+
+    def testMissOnOtherXml( self ):
+        self._layout( XML_A )
+        self._layout( XML_B )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_B ] )
+
+    def testMissOnStyleChange( self ):
+        document = self._layout( XML_A )
+        self.styles.update( "line", color = layout.COLOR_DESIGNER_GREEN )
+        changed = self._layout( XML_A )
+        self.failIfEqual( changed.contentKey, document.contentKey )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_A ] )
+        # Back to the former styles, the first layout is used
+        self.styles.update( "line", color = layout.COLOR_WHITE )
+        self.failUnlessEqual( self._layout( XML_A ).contentKey,
+                              document.contentKey )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_A ] )
+
+    def testMissOnScaleChange( self ):
+        self._layout( XML_A )
+        self._layout( XML_A, [ 10, 12, 16 ] )
+        self._layout( XML_A, [ 12, 14 ] )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_A, XML_A ] )
+
+    def testKeyIndependentOfLastSize( self ):
+        document = self._layout( XML_A )
+        # The layout left the styles at the smallest size, and so can
+        # any other layout using the same style registry.
+        self.failUnlessEqual( self.styles.findMatch( "document" )["font_size"],
+                              "%fpt" % SCALE[0] )
+        self._layout( XML_A )
+        layout._updateStyles( self.styles, SCALE, SCALE[1] )
+        self._layout( XML_A )
+        self.failUnlessEqual( self.laidOut, [ XML_A ] )
+        # The key holds the styles at the largest size
+        layout._updateStyles( self.styles, SCALE, SCALE[-1] )
+        self.failUnlessEqual( document.contentKey,
+                              ( XML_A, self.styles.getSnapshot(),
+                                tuple( SCALE ) ) )
+
+    def testLeastRecentlyUsedEvicted( self ):
+        layout.LINE_CACHE_SIZE = 3
+        for xml_data in [ XML_A, XML_B, XML_C ]:
+            self._layout( xml_data )
+        # Makes XML_B the least recently used line
+        self._layout( XML_A )
+        self._layout( XML_D )
+        self.failUnlessEqual( len( layout._line_cache ), 3 )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_B, XML_C, XML_D ] )
+        for xml_data in [ XML_A, XML_C, XML_D ]:
+            self._layout( xml_data )
+        self.failUnlessEqual( self.laidOut, [ XML_A, XML_B, XML_C, XML_D ] )
+        self._layout( XML_B )
+        self.failUnlessEqual( self.laidOut,
+                              [ XML_A, XML_B, XML_C, XML_D, XML_B ] )
+        self.failUnlessEqual( len( layout._line_cache ), 3 )
+
+    def testReturnsCopy( self ):
+        document = self._layout( XML_A )
+        document.background = "background"
+        document.roundUpperRight = True
+        document.ragWidth = 5
+        cached = layout._line_cache[ document.contentKey ]
+        self.failIf( document is cached )
+        again = self._layout( XML_A )
+        self.failIf( again is cached )
+        for doc in [ cached, again ]:
+            self.failIf( hasattr( doc, "background" ) )
+            self.failIf( hasattr( doc, "roundUpperRight" ) )
+            self.failIf( hasattr( doc, "ragWidth" ) )
+            self.failUnlessEqual( doc.shrinkOffset, SCALE[-1] - SCALE[0] )
+        # The laid out blocks are shared
+        self.failUnless( again.blocks is cached.blocks )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,288 @@
+"""
+    Tests for skipping the redraws of the quasimode lines that are
+    already displayed, in enso.quasimode.linewindows.TextWindow and
+    enso.quasimode.window.QuasimodeWindow.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from enso import config
+from enso.quasimode import linewindows, window
+
+
+# ----------------------------------------------------------------------------
+# Fakes
+# ----------------------------------------------------------------------------
+
+class StubContext( object ):
+    """
+    Cairo context accepting any drawing call.
+    """
+
+    def __getattr__( self, name ):
+        return lambda *args, **kwargs: None
+
+
+class FakeTransparentWindow( object ):
+    def __init__( self, x, y, maxWidth, maxHeight ):
+        self.x = x
+        self.y = y
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+
+    def makeCairoContext( self ):
+        return StubContext()
+
+    def getMaxWidth( self ):
+        return self.maxWidth
+
+    def getMaxHeight( self ):
+        return self.maxHeight
+
+    def getHeight( self ):
+        return self.maxHeight
+
+    def getX( self ):
+        return self.x
+
+    def getY( self ):
+        return self.y
+
+    def setPosition( self, x, y ):
+        self.x = x
+        self.y = y
+
+    def setSize( self, width, height ):
+        pass
+
+    def update( self ):
+        pass
+
+    def hide( self ):
+        pass
+
+
+class FakeGraphics( object ):
+    desktopWidth = 1000
+
+    @classmethod
+    def getDesktopSize( cls ):
+        return ( cls.desktopWidth, 800 )
+
+    @staticmethod
+    def getDesktopOffset():
+        return ( 0, 0 )
+
+
+class FakeDocument( object ):
+    """
+    Laid out line, as returned by layout.layoutXmlLine().
+    """
+
+    def __init__( self, contentKey, **attrs ):
+        self.contentKey = contentKey
+        self.ragWidth = 100
+        self.background = ( 0, 0, 0, 0.5 )
+        self.roundUpperRight = False
+        self.roundLowerRight = False
+        self.roundLowerLeft = False
+        self.shrinkOffset = 0
+        self.__dict__.update( attrs )
+        self.draws = 0
+
+    def draw( self, x, y, cairoContext ):
+        self.draws += 1
+
+
+class FakeSuggestion( object ):
+    def isEmpty( self ):
+        return False
+
+    def getSource( self ):
+        return "text"
+
+
+class FakeSuggestionList( object ):
+    def getSuggestions( self ):
+        return [ FakeSuggestion() ]
+
+    def getDidyoumeanHint( self ):
+        return None
+
+
+class FakeQuasimode( object ):
+    def __init__( self, lines ):
+        self.lines = lines
+
+    def getSuggestionList( self ):
+        return FakeSuggestionList()
+
+
+class FakeQuasimodeLayout( object ):
+    def __init__( self, quasimode ):
+        self.newLines = quasimode.lines
+
+
+def makeLines( active ):
+    """
+    Returns the lines of the quasimode display with the suggestion
+    'active' being the active one.
+    """
+
+    lines = [
+        FakeDocument( "description" ),
+        FakeDocument( "text" ),
+        FakeDocument( "hint" ),
+        ]
+    for i in range( config.QUASIMODE_MAX_SUGGESTIONS ):
+        lines.append( FakeDocument( ( "suggestion %d" % i, i == active ) ) )
+    return lines
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class _FakeWindowTestCase( unittest.TestCase ):
+    def setUp( self ):
+        self.__oldTransparentWindow = linewindows.TransparentWindow
+        self.__oldGraphics = linewindows.graphics
+        linewindows.TransparentWindow = FakeTransparentWindow
+        linewindows.graphics = FakeGraphics
+        FakeGraphics.desktopWidth = 1000
+
+    def tearDown( self ):
+        linewindows.TransparentWindow = self.__oldTransparentWindow
+        linewindows.graphics = self.__oldGraphics
+
+
+class TextWindowTests( _FakeWindowTestCase ):
+    def setUp( self ):
+        _FakeWindowTestCase.setUp( self )
+        self.window = linewindows.TextWindow( 30, ( 0, 0 ) )
+
+    def _failUnlessRedrawn( self, contentKey = "line", **attrs ):
+        self.window.draw( FakeDocument( "line" ) )
+        changed = FakeDocument( contentKey, **attrs )
+        self.failUnless( self.window.draw( changed ) )
+        self.failIf( self.window.draw( changed ) )
+        self.failUnless( self.window.draw( FakeDocument( "line" ) ) )
+
+    def testUnchangedSkipped( self ):
+        document = FakeDocument( "line" )
+        self.failUnless( self.window.draw( document ) )
+        # Another document laid out equally
+        self.failIf( self.window.draw( FakeDocument( "line" ) ) )
+        self.failIf( self.window.draw( document ) )
+        self.failUnlessEqual( document.draws, 1 )
+        self.failUnlessEqual( self.window.drawsPerformed, 1 )
+        self.failUnlessEqual( self.window.drawsSkipped, 2 )
+
+    def testContentRedrawn( self ):
+        self._failUnlessRedrawn( "other line" )
+        self.failUnlessEqual( self.window.drawsPerformed, 3 )
+        self.failUnlessEqual( self.window.drawsSkipped, 1 )
+
+    def testBackgroundRedrawn( self ):
+        self._failUnlessRedrawn( background = ( 0, 0, 0, 0.6 ) )
+
+    def testRagWidthRedrawn( self ):
+        self._failUnlessRedrawn( ragWidth = 120 )
+
+    def testCornersRedrawn( self ):
+        self._failUnlessRedrawn( roundUpperRight = True )
+        self._failUnlessRedrawn( roundLowerRight = True )
+        self._failUnlessRedrawn( roundLowerLeft = True )
+
+    def testShrinkOffsetRedrawn( self ):
+        self._failUnlessRedrawn( shrinkOffset = 2 )
+
+    def testUnknownContentAlwaysDrawn( self ):
+        document = FakeDocument( None )
+        self.failUnless( self.window.draw( document ) )
+        self.failUnless( self.window.draw( document ) )
+        self.failUnlessEqual( document.draws, 2 )
+
+    def testHideResets( self ):
+        document = FakeDocument( "line" )
+        self.window.draw( document )
+        self.window.hide()
+        self.failUnless( self.window.draw( document ) )
+        # Hidden twice in a row
+        self.window.hide()
+        self.window.hide()
+        self.failUnless( self.window.draw( document ) )
+        self.failUnlessEqual( document.draws, 3 )
+
+    def testDesktopResizeResets( self ):
+        document = FakeDocument( "line" )
+        self.window.draw( document )
+        FakeGraphics.desktopWidth = 1200
+        self.failUnless( self.window.draw( document ) )
+        self.failIf( self.window.draw( document ) )
+
+
+class QuasimodeWindowTests( _FakeWindowTestCase ):
+    def setUp( self ):
+        _FakeWindowTestCase.setUp( self )
+        self.__oldQuasimodeLayout = window.QuasimodeLayout
+        window.QuasimodeLayout = FakeQuasimodeLayout
+        self.window = window.QuasimodeWindow()
+
+    def tearDown( self ):
+        window.QuasimodeLayout = self.__oldQuasimodeLayout
+        _FakeWindowTestCase.tearDown( self )
+
+    def testFullRedraw( self ):
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        # The hint line is not drawn without a did-you-mean hint
+        self.failUnlessEqual( self.window.getDrawStats(),
+                              { "performed": 2 +
+                                config.QUASIMODE_MAX_SUGGESTIONS,
+                                "skipped": 0 } )
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        self.failUnlessEqual( self.window.getDrawStats(),
+                              { "performed": 2 +
+                                config.QUASIMODE_MAX_SUGGESTIONS,
+                                "skipped": 2 +
+                                config.QUASIMODE_MAX_SUGGESTIONS } )
+
+    def testActiveSuggestionMoved( self ):
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        before = self.window.getDrawStats()
+        lines = makeLines( 1 )
+        self.window.update( FakeQuasimode( lines ), True )
+        after = self.window.getDrawStats()
+        # Only the formerly and the newly active suggestions
+        self.failUnlessEqual( after["performed"] - before["performed"], 2 )
+        self.failUnlessEqual( after["skipped"] - before["skipped"],
+                              config.QUASIMODE_MAX_SUGGESTIONS )
+        self.failUnlessEqual( [ line.draws for line in lines[3:] ],
+                              [ 1, 1 ] + [ 0 ] *
+                              ( config.QUASIMODE_MAX_SUGGESTIONS - 2 ) )
+
+    def testContinueDrawingSkipsDisplayed( self ):
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        self.window.update( FakeQuasimode( makeLines( 1 ) ), False )
+        drawn = 0
+        while self.window.continueDrawing( ignoreTimeElapsed = True ):
+            drawn += 1
+        self.failUnlessEqual( drawn, 2 )
+
+    def testHide( self ):
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        self.window.hide()
+        self.window.update( FakeQuasimode( makeLines( 0 ) ), True )
+        self.failUnlessEqual( self.window.getDrawStats()["skipped"], 0 )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
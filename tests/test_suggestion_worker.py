@@ -0,0 +1,88 @@
+"""
+    Tests for the SuggestionWorker used by the quasimode SuggestionList.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import threading
+import time
+import unittest
+
+from enso.quasimode.suggestionworker import SuggestionWorker
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class SuggestionWorkerTests( unittest.TestCase ):
+    TIMEOUT = 5.0
+
+    def setUp( self ):
+        self.worker = SuggestionWorker()
+
+    def tearDown( self ):
+        self.worker.stop()
+        self.worker = None
+
+    def _waitForResult( self ):
+        started = time.time()
+        while time.time() - started < self.TIMEOUT:
+            result = self.worker.popResult()
+            if result is not None:
+                return result
+            time.sleep( 0.001 )
+        self.fail( "The worker did not finish the job." )
+
+    def testResult( self ):
+        self.worker.submit( lambda text, isCancelled: text.upper(), "abc" )
+        self.failUnlessEqual( self._waitForResult(), "ABC" )
+        # The result is popped only once.
+        self.failUnlessEqual( self.worker.popResult(), None )
+
+    def testStaleJobIsCancelled( self ):
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        def slowJob( isCancelled ):
+            started.set()
+            while not isCancelled():
+                time.sleep( 0.001 )
+            cancelled.set()
+            return "stale"
+
+        self.worker.submit( slowJob )
+        started.wait( self.TIMEOUT )
+        self.worker.submit( lambda isCancelled: "fresh" )
+        self.failUnless( cancelled.wait( self.TIMEOUT ) )
+        self.failUnlessEqual( self._waitForResult(), "fresh" )
+
+    def testCancel( self ):
+        release = threading.Event()
+
+        def job( isCancelled ):
+            release.wait( self.TIMEOUT )
+            return "result"
+
+        self.worker.submit( job )
+        self.worker.cancel()
+        release.set()
+        time.sleep( 0.05 )
+        self.failUnlessEqual( self.worker.popResult(), None )
+
+    def testRestart( self ):
+        self.worker.submit( lambda isCancelled: 1 )
+        self.failUnlessEqual( self._waitForResult(), 1 )
+        self.worker.stop()
+        self.worker.submit( lambda isCancelled: 2 )
+        self.failUnlessEqual( self._waitForResult(), 2 )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+    Tests for the CacheStore and Cache of the suggestions cache.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from enso.commands.suggestions_cache.manager import (
+    Cache, CacheStore, CacheWriter, estimate_size, key_hash)
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class CacheStoreTests( unittest.TestCase ):
+    def setUp( self ):
+        self.cacheDir = tempfile.mkdtemp()
+        self.dbFile = os.path.join( self.cacheDir, "suggestions.sqlite" )
+
+    def tearDown( self ):
+        shutil.rmtree( self.cacheDir, ignore_errors=True )
+
+    def _writeCacheFile( self, cacheId, key, lines, age=0 ):
+        fname = key_hash( key ) + ".cache"
+        cacheSubdir = os.path.join( self.cacheDir, cacheId, fname[0] )
+        if not os.path.exists( cacheSubdir ):
+            os.makedirs( cacheSubdir )
+        fname = os.path.join( cacheSubdir, fname )
+        with open( fname, "wb" ) as f:
+            f.write( u"\n".join( lines ).encode( "UTF-8" ) )
+        mtime = time.time() - age
+        os.utime( fname, ( mtime, mtime ) )
+
+    def testGetPut( self ):
+        store = CacheStore( self.dbFile )
+        store.put_many( "google", [ ( "foo", [ u"foo bar", u"foo baz" ] ),
+                                    ( u"caf\xe9", [ u"caf\xe9 latte" ] ),
+                                    ( "empty", [] ) ] )
+        self.failUnlessEqual( store.get( "google", "foo" ),
+                              [ u"foo bar", u"foo baz" ] )
+        self.failUnlessEqual( store.get( "google", u"caf\xe9" ),
+                              [ u"caf\xe9 latte" ] )
+        self.failUnlessEqual( store.get( "google", "empty" ), [] )
+        self.failUnlessEqual( store.get( "google", "missing" ), None )
+        self.failUnlessEqual( store.get( "bing", "foo" ), None )
+
+        # The data survive re-opening the store.
+        store = CacheStore( self.dbFile )
+        self.failUnlessEqual( store.get( "google", "foo" ),
+                              [ u"foo bar", u"foo baz" ] )
+
+    def testExpiry( self ):
+        store = CacheStore( self.dbFile, max_age=-1 )
+        store.put_many( "google", [ ( "foo", [ u"foo bar" ] ) ] )
+        self.failUnlessEqual( store.get( "google", "foo" ), None )
+        store.expire()
+        store = CacheStore( self.dbFile )
+        self.failUnlessEqual( store.get( "google", "foo" ), None )
+
+    def testImportCacheFiles( self ):
+        self._writeCacheFile( "google", "foo", [ u"foo bar", u"foo baz" ] )
+        self._writeCacheFile( "google", "old", [ u"old" ], age=13 * 60 * 60 )
+        store = CacheStore( self.dbFile )
+        self.failUnlessEqual( store.get( "google", "foo" ),
+                              [ u"foo bar", u"foo baz" ] )
+        self.failUnlessEqual( store.get( "google", "old" ), None )
+        # The imported files are removed.
+        self.failUnlessEqual( os.listdir( self.cacheDir ),
+                              [ "suggestions.sqlite" ] )
+
+
+class CacheTests( unittest.TestCase ):
+    def setUp( self ):
+        self.cacheDir = tempfile.mkdtemp()
+        self.store = CacheStore(
+            os.path.join( self.cacheDir, "suggestions.sqlite" ) )
+        self.writer = CacheWriter()
+
+    def tearDown( self ):
+        self.writer.flush()
+        self.store = None
+        shutil.rmtree( self.cacheDir, ignore_errors=True )
+
+    def testMaxItems( self ):
+        cache = Cache( "google", max_items=2 )
+        cache.set_object( "a", [ u"a" ] )
+        cache.set_object( "b", [ u"b" ] )
+        # Touch "a" so that "b" is the least recently used.
+        self.failUnlessEqual( cache.get_object( "a" ), [ u"a" ] )
+        cache.set_object( "c", [ u"c" ] )
+        self.failUnlessEqual( cache.get_object( "b" ), None )
+        self.failUnlessEqual( cache.get_object( "a" ), [ u"a" ] )
+        self.failUnlessEqual( cache.get_object( "c" ), [ u"c" ] )
+
+        stats = cache.get_stats()
+        self.failUnlessEqual( stats["items"], 2 )
+        self.failUnlessEqual( stats["evictions"], 1 )
+        self.failUnlessEqual( stats["hits"], 3 )
+        self.failUnlessEqual( stats["misses"], 1 )
+
+    def testMaxBytes( self ):
+        value = [ u"x" * 100 ]
+        size = estimate_size( "k0", value )
+        cache = Cache( "google", max_bytes=size * 3 )
+        for i in range( 10 ):
+            cache.set_object( "k%d" % i, value )
+        stats = cache.get_stats()
+        self.failUnlessEqual( stats["items"], 3 )
+        self.failUnless( stats["bytes"] <= size * 3 )
+        self.failUnlessEqual( stats["evictions"], 7 )
+
+        cache.configure( max_items=1 )
+        self.failUnlessEqual( cache.get_stats()["items"], 1 )
+        self.failUnlessEqual( cache.get_object( "k9" ), value )
+
+    def testWriteBehind( self ):
+        cache = Cache( "google", self.store, self.writer )
+        cache.set_object( "foo", [ u"foo bar" ] )
+        cache.persist()
+        self.writer.flush()
+        self.failUnlessEqual( self.store.get( "google", "foo" ),
+                              [ u"foo bar" ] )
+
+        # A fresh cache reads the persisted data from the store.
+        cache = Cache( "google", self.store, self.writer )
+        self.failUnlessEqual( cache.get_object( "foo" ), [ u"foo bar" ] )
+        self.failUnlessEqual( cache.get_object( "foo" ), [ u"foo bar" ] )
+        stats = cache.get_stats()
+        self.failUnlessEqual( stats["store_hits"], 1 )
+        self.failUnlessEqual( stats["hits"], 1 )
+
+    def testEvictedItemsArePersisted( self ):
+        cache = Cache( "google", self.store, self.writer, max_items=1 )
+        cache.set_object( "foo", [ u"foo bar" ] )
+        cache.set_object( "baz", [ u"baz" ] )
+        self.writer.flush()
+        self.failUnlessEqual( self.store.get( "google", "foo" ),
+                              [ u"foo bar" ] )
+        # Not persisted yet.
+        self.failUnlessEqual( self.store.get( "google", "baz" ), None )
+        self.failUnlessEqual( cache.get_object( "foo" ), [ u"foo bar" ] )
+
+    def testOversizedItemsArePersisted( self ):
+        for cache in ( Cache( "google", self.store, self.writer,
+                              max_bytes=10 ),
+                       Cache( "wikipedia", self.store, self.writer,
+                              max_items=0 ) ):
+            # Evicted right away, the item is written through
+            cache.set_object( "foo", [ u"x" * 100 ] )
+            cache.persist()
+            self.failUnlessEqual( cache.get_stats()["items"], 0 )
+            self.writer.flush()
+            self.failUnlessEqual( self.store.get( cache.cache_id, "foo" ),
+                                  [ u"x" * 100 ] )
+
+            # Later items are still persisted
+            cache.set_object( "bar", [ u"bar" ] )
+            cache.persist()
+            self.writer.flush()
+            self.failUnlessEqual( self.store.get( cache.cache_id, "bar" ),
+                                  [ u"bar" ] )
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
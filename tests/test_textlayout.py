@@ -0,0 +1,473 @@
+"""
+    Tests for the line breaking of textlayout.Block: a differential
+    test of the layout against the former layout walking the glyphs
+    one at a time, over a corpus of random glyph sequences.  Also
+    tests the drawing of textlayout.Line in glyph runs against the
+    former drawing of the glyphs one at a time.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import random
+import unittest
+
+from enso.graphics.textlayout import (
+    Block,
+    Glyph,
+    GlyphWiderThanBlockError,
+    Line,
+    MaxLinesExceededError,
+)
+
+
+# ----------------------------------------------------------------------------
+# Fake Fonts
+# ----------------------------------------------------------------------------
+
+class FakeFont( object ):
+    ascent = 10.0
+    descent = 3.0
+
+    def getKerningDistance( self, charLeft, charRight ):
+        return 0.0
+
+    def loadInto( self, cairoContext ):
+        cairoContext.font = self
+
+
+class FakeFontGlyph( object ):
+    def __init__( self, char, advance, font, index=None ):
+        self.char = char
+        self.charAsUtf8 = char.encode( "UTF-8" )
+        self.font = font
+        # The glyph index of the fake fonts is the character code
+        self.index = index
+        self.advance = advance
+        self.xMin = 0.0
+        self.xMax = advance
+        self.yMin = -2.0
+        self.yMax = 8.0
+
+
+FONT = FakeFont()
+
+# Advances like those of hinted fonts scaled from pixels to points, so
+# that the sums of the advances are rounded
+ADVANCES = [ 0.0, 0.75, 2.25, 5.1, 6.0, 7.3, 0.1 * 3, 10.0 / 3, 13.8, 2.0 / 7 ]
+
+
+def makeGlyphs( spec ):
+    """
+    Makes glyphs from a list of (char, advance) tuples.
+    """
+
+    return [ Glyph( FakeFontGlyph( char, advance, FONT ), ( 1, 1, 1, 1 ) )
+             for char, advance in spec ]
+
+
+def makeSpec( rnd, length ):
+    spec = []
+    for _ in range( length ):
+        if rnd.random() < 0.2:
+            spec.append( ( u" ", rnd.choice( ADVANCES[:4] ) ) )
+        else:
+            spec.append( ( rnd.choice( u"abcdefgh" ), rnd.choice( ADVANCES ) ) )
+    return spec
+
+
+# ----------------------------------------------------------------------------
+# The Former Layout
+# ----------------------------------------------------------------------------
+
+class ReferenceBlock( Block ):
+    """
+    Block laid out by the former layout, walking the glyphs one at a
+    time.
+    """
+
+    def layout( self ):
+        glyphs = self._Block__glyphs
+        addLine = self._Block__addLine
+
+        currLineLength = 0
+        currWordStartIndex = 0
+        currWordLength = 0
+        currLine = Line()
+
+        for i in range( len( glyphs ) ):
+            glyph = glyphs[i]
+            advance = glyph.fontGlyph.advance
+
+            if currLineLength + advance > self.width:
+                if currLineLength == 0:
+                    raise GlyphWiderThanBlockError( glyph )
+
+                if len( self.lines ) == self.maxLines - 1:
+                    if not self.ellipsify:
+                        raise MaxLinesExceededError()
+                    else:
+                        currLine.addGlyphs( glyphs[currWordStartIndex:i] )
+                        currWordLength = 0
+                        currLine.ellipsify( self.ellipsisGlyph, self.width )
+                        break
+
+                currLineHasWord = ( currLineLength != currWordLength )
+
+                if not currLineHasWord or glyph.isWhitespace:
+                    currLine.addGlyphs( glyphs[currWordStartIndex:i] )
+                    if glyph.isWhitespace:
+                        currWordStartIndex = i + 1
+                        currWordLength = 0
+                    else:
+                        currWordStartIndex = i
+                        currWordLength = advance
+                else:
+                    currWordLength += advance
+
+                addLine( currLine )
+                currLineLength = currWordLength
+                currLine = Line()
+            elif glyph.isWhitespace:
+                currLine.addGlyphs( glyphs[currWordStartIndex:i + 1] )
+                currLineLength += advance
+                currWordStartIndex = i + 1
+                currWordLength = 0
+            else:
+                currLineLength += advance
+                currWordLength += advance
+
+        if currWordLength > 0:
+            currLine.addGlyphs( glyphs[currWordStartIndex:] )
+
+        if currLineLength > 0:
+            addLine( currLine, isPartialLine=True )
+
+        self._Block__glyphs = None
+        self.height = self.marginTop + \
+            self.lineHeight * len( self.lines ) + \
+            self.marginBottom
+
+
+def layOut( blockClass, spec, width, maxLines, ellipsify, textAlign ):
+    """
+    Lays out the glyphs of the spec and returns a comparable result:
+    either the raised error, or the lines with their glyphs.
+    """
+
+    glyphs = makeGlyphs( spec )
+    block = blockClass( width, 15.0, 1.0, 2.0, textAlign, maxLines,
+                        ellipsify )
+    block.setEllipsisGlyph( makeGlyphs( [ ( u"\u2026", 4.5 ) ] )[0] )
+    block.addGlyphs( glyphs )
+    try:
+        block.layout()
+    except GlyphWiderThanBlockError as e:
+        return ( "GlyphWiderThanBlockError", glyphs.index( e.args[0] ) )
+    except MaxLinesExceededError:
+        return ( "MaxLinesExceededError", )
+    except IndexError:
+        # Raised by ellipsify() if even the ellipsis alone doesn't fit
+        return ( "IndexError", )
+    return ( block.height, [
+        ( [ ( glyph.char, glyph.pos ) for glyph in line.glyphs ],
+          line.xMin, line.xMax, line.yMin, line.yMax )
+        for line in block.lines ] )
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class BlockLayoutTests( unittest.TestCase ):
+    def _assertSameLayout( self, spec, width, maxLines, ellipsify,
+                           textAlign="left" ):
+        args = ( spec, width, maxLines, ellipsify, textAlign )
+        self.failUnlessEqual( layOut( Block, *args ),
+                              layOut( ReferenceBlock, *args ),
+                              "Layouts differ for %r" % ( args, ) )
+
+    def testSimple( self ):
+        spec = [ ( char, 5.0 ) for char in u"hello world, how are you" ]
+        for width in [ 4.0, 5.0, 24.0, 25.0, 30.0, 55.0, 60.0, 1000.0 ]:
+            for maxLines in [ 1, 2, 3, 100 ]:
+                for ellipsify in ( False, True ):
+                    self._assertSameLayout( spec, width, maxLines, ellipsify )
+
+    def testEmpty( self ):
+        self._assertSameLayout( [], 10.0, 1, False )
+        self._assertSameLayout( [ ( u" ", 0.0 ) ], 10.0, 1, False )
+
+    def testCorpus( self ):
+        rnd = random.Random( 0 )
+        for _ in range( 1500 ):
+            spec = makeSpec( rnd, rnd.randint( 0, 60 ) )
+            total = sum( advance for _, advance in spec )
+            widths = [ rnd.uniform( 5.0, 60.0 ), total / rnd.randint( 1, 5 ) ]
+            # Widths equal to line lengths test the rounding of the
+            # cumulative sums
+            start = rnd.randint( 0, len( spec ) )
+            end = rnd.randint( start, len( spec ) )
+            widths.append( sum( advance for _, advance in spec[start:end] ) )
+            for width in widths:
+                self._assertSameLayout(
+                    spec, width,
+                    rnd.choice( [ 1, 2, 3, 1000 ] ),
+                    rnd.random() < 0.5,
+                    rnd.choice( [ "left", "right", "center", "justify" ] ) )
+
+    def testNegativeAdvances( self ):
+        rnd = random.Random( 1 )
+        for _ in range( 200 ):
+            spec = [ ( char, advance if rnd.random() < 0.9 else -advance )
+                     for char, advance in makeSpec( rnd, 30 ) ]
+            self._assertSameLayout( spec, rnd.uniform( 10.0, 40.0 ),
+                                    1000, False )
+
+    def testFindLargestFittingSize( self ):
+        rnd = random.Random( 2 )
+        sizes = [ 12.0, 18.0, 24.0, 32.0 ]
+        for _ in range( 300 ):
+            spec = makeSpec( rnd, rnd.randint( 1, 40 ) )
+            width = rnd.uniform( 20.0, 120.0 )
+            maxLines = rnd.choice( [ 1, 2 ] )
+
+            def specAtSize( size ):
+                # Not exactly proportional, like hinted advances
+                return [ ( char, round( advance * size / 24.0 * 4 ) / 4 )
+                         for char, advance in spec ]
+
+            # Trial layouts from the largest size
+            expected = None
+            for size in reversed( sizes ):
+                result = layOut( ReferenceBlock, specAtSize( size ), width,
+                                 maxLines, False, "left" )
+                if result[0] == "GlyphWiderThanBlockError":
+                    expected = result
+                    break
+                if result[0] != "MaxLinesExceededError":
+                    expected = size
+                    break
+
+            glyphs = makeGlyphs( spec )
+            advances = dict( ( size, [ advance for _, advance
+                                       in specAtSize( size ) ] )
+                             for size in sizes )
+            block = Block( width, 15.0, 1.0, 2.0, "left", maxLines, False )
+            block.addGlyphs( glyphs )
+            try:
+                result = block.findLargestFittingSize(
+                    sizes,
+                    lambda glyph, size: advances[size][glyphs.index( glyph )] )
+            except GlyphWiderThanBlockError as e:
+                result = ( "GlyphWiderThanBlockError",
+                           glyphs.index( e.args[0] ) )
+            self.failUnlessEqual( result, expected )
+
+    def testMaxLinesExceededBlock( self ):
+        block = Block( 10.0, 15.0, 1.0, 2.0, "left", 1, False )
+        block.addGlyphs( makeGlyphs( [ ( u"a", 6.0 ), ( u"b", 6.0 ) ] ) )
+        try:
+            block.layout()
+        except MaxLinesExceededError as e:
+            self.failUnless( e.block is block )
+        else:
+            self.fail( "MaxLinesExceededError not raised" )
+        self.failUnlessEqual(
+            block.findLargestFittingSize(
+                [ 1.0, 2.0 ],
+                lambda glyph, size: glyph.fontGlyph.advance / size ),
+            2.0 )
+
+
+# ----------------------------------------------------------------------------
+# Line Drawing
+# ----------------------------------------------------------------------------
+
+RED = ( 1, 0, 0, 1 )
+BLUE = ( 0, 0, 1, 1 )
+
+
+class RecordingContext( object ):
+    """
+    Fake cairo context recording the drawn characters as (UTF-8 char,
+    x, y, font, color) tuples, in the absolute coordinates.
+    """
+
+    def __init__( self ):
+        self.font = None
+        self.color = None
+        self.origin = ( 0.0, 0.0 )
+        self.saved = []
+        self.point = None
+        self.drawn = []
+        self.fontLoads = 0
+        self.showGlyphsCalls = 0
+        self.showTextCalls = 0
+
+    def __setattr__( self, name, value ):
+        if name == "font" and value is not None:
+            self.fontLoads += 1
+        object.__setattr__( self, name, value )
+
+    def save( self ):
+        self.saved.append( self.origin )
+
+    def restore( self ):
+        self.origin = self.saved.pop()
+
+    def translate( self, x, y ):
+        self.origin = ( self.origin[0] + x, self.origin[1] + y )
+
+    def set_source_rgba( self, *color ):
+        self.color = color
+
+    def move_to( self, x, y ):
+        self.point = ( self.origin[0] + x, self.origin[1] + y )
+
+    def show_text( self, text ):
+        self.showTextCalls += 1
+        self.drawn.append( ( text, self.point[0], self.point[1],
+                             self.font, self.color ) )
+
+    def show_glyphs( self, glyphs ):
+        self.showGlyphsCalls += 1
+        for index, x, y in glyphs:
+            self.drawn.append( ( chr( index ), self.origin[0] + x,
+                                 self.origin[1] + y, self.font,
+                                 self.color ) )
+
+
+def drawPerChar( line, x, y ):
+    """
+    Returns the characters drawn by the former Line.draw(), one glyph
+    at a time, as RecordingContext.drawn does.
+    """
+
+    drawn = []
+    y += line.distanceToBaseline
+    spaceOfs = 0.0
+    for glyph in line.glyphs:
+        if glyph.isWhitespace:
+            spaceOfs += line._Line__ofsPerSpace
+        else:
+            drawn.append( ( glyph.charAsUtf8,
+                            spaceOfs + line._Line__alignOfs + x + glyph.pos,
+                            y, glyph.font, glyph.color ) )
+    return drawn
+
+
+def roundPositions( drawn ):
+    return [ ( char, round( x, 6 ), round( y, 6 ), font, color )
+             for char, x, y, font, color in drawn ]
+
+
+def makeRunGlyphs( text, font, color, withIndices=True ):
+    return [ Glyph( FakeFontGlyph( char, 5.0, font,
+                                   ord( char ) if withIndices else None ),
+                    color )
+             for char in text ]
+
+
+class LineDrawTests( unittest.TestCase ):
+    def setUp( self ):
+        self.fonts = [ FakeFont(), FakeFont() ]
+
+    def tearDown( self ):
+        self.fonts = None
+
+    def _makeLine( self, runs, alignment="left", width=200.0 ):
+        line = Line()
+        for text, font, color, withIndices in runs:
+            line.addGlyphs( makeRunGlyphs( text, font, color, withIndices ) )
+        line.layout( alignment, width, 16.0 )
+        return line
+
+    def _draw( self, line, x=3.0, y=7.0 ):
+        context = RecordingContext()
+        line.draw( x, y, context )
+        # The positions are summed in another order by the glyph runs
+        self.failUnlessEqual( roundPositions( context.drawn ),
+                              roundPositions( drawPerChar( line, x, y ) ) )
+        return context
+
+    def testRuns( self ):
+        font, otherFont = self.fonts
+        line = self._makeLine( [ ( u"ab c", font, RED, True ),
+                                 ( u"de ", font, BLUE, True ),
+                                 ( u"fg", otherFont, BLUE, True ) ] )
+        context = self._draw( line )
+        # One run per font and color
+        self.failUnlessEqual( context.showGlyphsCalls, 3 )
+        self.failUnlessEqual( context.showTextCalls, 0 )
+        self.failUnlessEqual( context.fontLoads, 2 )
+        self.failUnlessEqual( len( context.drawn ), 7 )
+
+    def testUnknownGlyphIndices( self ):
+        font = self.fonts[0]
+        line = self._makeLine( [ ( u"ab", font, RED, True ),
+                                 ( u"cd", font, BLUE, False ) ] )
+        context = self._draw( line )
+        # The run with unknown glyph indices is drawn one char at a time
+        self.failUnlessEqual( context.showGlyphsCalls, 1 )
+        self.failUnlessEqual( context.showTextCalls, 2 )
+
+        line = self._makeLine( [ ( u"ab", font, RED, True ),
+                                 ( u"c", font, RED, False ) ] )
+        context = self._draw( line )
+        self.failUnlessEqual( context.showGlyphsCalls, 0 )
+        self.failUnlessEqual( context.showTextCalls, 3 )
+
+    def testAlignments( self ):
+        font, otherFont = self.fonts
+        runs = [ ( u"ab cd ", font, RED, True ),
+                 ( u"e f  g", otherFont, BLUE, True ) ]
+        for alignment in ( "left", "right", "center", "justify" ):
+            line = self._makeLine( runs, alignment )
+            self._draw( line )
+        # The justified spaces shift the glyphs after them
+        xs = [ x for _, x, _, _, _ in self._draw( line ).drawn ]
+        self.failUnlessEqual( xs[0], 3.0 )
+        self.failUnlessAlmostEqual( xs[-1], 3.0 + 200.0 - 5.0 )
+
+    def testRunsInvalidated( self ):
+        font = self.fonts[0]
+        line = self._makeLine( [ ( u"ab", font, RED, True ) ] )
+        self._draw( line )
+        line.addGlyphs( makeRunGlyphs( u"c", font, BLUE ) )
+        context = self._draw( line )
+        self.failUnlessEqual( [ char for char, _, _, _, _ in context.drawn ],
+                              [ "a", "b", "c" ] )
+        line.removeGlyph()
+        line.removeGlyph()
+        context = self._draw( line )
+        self.failUnlessEqual( [ char for char, _, _, _, _ in context.drawn ],
+                              [ "a" ] )
+
+    def testCorpus( self ):
+        rnd = random.Random( 1 )
+        for _ in range( 200 ):
+            line = Line()
+            for _ in range( rnd.randint( 1, 6 ) ):
+                spec = makeSpec( rnd, rnd.randint( 1, 8 ) )
+                font = rnd.choice( self.fonts )
+                color = rnd.choice( ( RED, BLUE ) )
+                withIndices = rnd.random() < 0.8
+                line.addGlyphs( [
+                    Glyph( FakeFontGlyph(
+                        char, advance, font,
+                        ord( char ) if withIndices else None ), color )
+                    for char, advance in spec ] )
+            line.layout( rnd.choice( ( "left", "right", "center",
+                                       "justify" ) ),
+                         rnd.uniform( 50.0, 300.0 ), 16.0 )
+            self._draw( line, rnd.uniform( 0, 10 ), rnd.uniform( 0, 10 ) )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
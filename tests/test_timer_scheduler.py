@@ -0,0 +1,144 @@
+"""
+    Tests for the TimerScheduler behind EventManager.callLater() and
+    EventManager.callEvery().
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from enso.events import TimerScheduler
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class FakeClock( object ):
+    def __init__( self ):
+        self.now = 1000.0
+
+    def __call__( self ):
+        return self.now
+
+    def advance( self, ms ):
+        self.now += ms / 1000.0
+
+
+class TimerSchedulerTests( unittest.TestCase ):
+    def setUp( self ):
+        self.clock = FakeClock()
+        self.wakeUps = 0
+        self.scheduler = TimerScheduler( self._onEarlierDeadline, self.clock )
+        self.calls = []
+
+    def tearDown( self ):
+        self.scheduler = None
+
+    def _onEarlierDeadline( self ):
+        self.wakeUps += 1
+
+    def _advance( self, ms ):
+        self.clock.advance( ms )
+        self.scheduler.runDueTimers()
+
+    def testCallLater( self ):
+        self.scheduler.callLater( 100, self.calls.append, "b" )
+        self.scheduler.callLater( 50, self.calls.append, "a" )
+        self.scheduler.callLater( 100, self.calls.append, "c" )
+        self.failUnlessEqual( len( self.scheduler ), 3 )
+        self.failUnlessAlmostEqual( self.scheduler.getTimeUntilNextTimer(),
+                                    50.0 )
+
+        self._advance( 49 )
+        self.failUnlessEqual( self.calls, [] )
+        self._advance( 1 )
+        self.failUnlessEqual( self.calls, [ "a" ] )
+        # Callbacks with the same deadline run in the scheduling order
+        self._advance( 100 )
+        self.failUnlessEqual( self.calls, [ "a", "b", "c" ] )
+        self.failUnlessEqual( len( self.scheduler ), 0 )
+        self.failUnlessEqual( self.scheduler.getTimeUntilNextTimer(), None )
+
+    def testCallEvery( self ):
+        handle = self.scheduler.callEvery( 100, self.calls.append, "tick" )
+        for _ in range( 5 ):
+            self._advance( 50 )
+        self.failUnlessEqual( self.calls, [ "tick" ] * 2 )
+
+        # Missed runs are skipped
+        self._advance( 1000 )
+        self.failUnlessEqual( len( self.calls ), 3 )
+        self.failUnlessAlmostEqual( self.scheduler.getTimeUntilNextTimer(),
+                                    100.0 )
+
+        handle.cancel()
+        handle.cancel()
+        self._advance( 1000 )
+        self.failUnlessEqual( len( self.calls ), 3 )
+        self.failUnlessEqual( len( self.scheduler ), 0 )
+
+    def testCancel( self ):
+        handles = [ self.scheduler.callLater( i, self.calls.append, i )
+                    for i in range( 100 ) ]
+        for handle in handles[::2]:
+            handle.cancel()
+        self.failUnlessEqual( len( self.scheduler ), 50 )
+        self.failUnlessAlmostEqual( self.scheduler.getTimeUntilNextTimer(),
+                                    1.0 )
+        self._advance( 100 )
+        self.failUnlessEqual( self.calls, range( 1, 100, 2 ) )
+        self.failUnlessEqual( len( self.scheduler ), 0 )
+
+    def testCancelFromCallback( self ):
+        later = []
+
+        def cancelLater():
+            self.calls.append( "first" )
+            later[0].cancel()
+
+        self.scheduler.callLater( 10, cancelLater )
+        later.append( self.scheduler.callLater( 10, self.calls.append,
+                                                "second" ) )
+        self._advance( 10 )
+        self.failUnlessEqual( self.calls, [ "first" ] )
+        self.failUnlessEqual( len( self.scheduler ), 0 )
+
+    def testScheduleFromCallback( self ):
+        def again():
+            self.calls.append( "again" )
+            self.scheduler.callLater( 0, again )
+
+        self.scheduler.callLater( 0, again )
+        # A callback scheduled by a callback runs on the next call
+        self._advance( 0 )
+        self.failUnlessEqual( self.calls, [ "again" ] )
+        self._advance( 0 )
+        self.failUnlessEqual( self.calls, [ "again" ] * 2 )
+
+    def testErrorInCallback( self ):
+        def fail():
+            raise ValueError( "broken timer" )
+
+        self.scheduler.callLater( 10, fail )
+        self.scheduler.callLater( 10, self.calls.append, "ok" )
+        self._advance( 10 )
+        self.failUnlessEqual( self.calls, [ "ok" ] )
+
+    def testEarlierDeadline( self ):
+        self.scheduler.callLater( 100, self.calls.append, 1 )
+        self.failUnlessEqual( self.wakeUps, 1 )
+        self.scheduler.callLater( 200, self.calls.append, 2 )
+        self.failUnlessEqual( self.wakeUps, 1 )
+        self.scheduler.callEvery( 50, self.calls.append, 3 )
+        self.failUnlessEqual( self.wakeUps, 2 )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
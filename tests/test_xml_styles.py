@@ -0,0 +1,136 @@
+"""
+    Tests for the compiled styles of the StyleRegistry and the computed
+    styles of the CascadingStyleStack.
+"""
+
+# ----------------------------------------------------------------------------
+# Imports
+# ----------------------------------------------------------------------------
+
+import unittest
+
+from enso.graphics.xmltextlayout import (
+    CascadingStyleStack,
+    ComputedStyle,
+    StyleRegistry,
+)
+
+
+# ----------------------------------------------------------------------------
+# Unit Tests
+# ----------------------------------------------------------------------------
+
+class StylesTests( unittest.TestCase ):
+    def setUp( self ):
+        self.styles = StyleRegistry()
+        self.styles.add(
+            "document",
+            width = "1in",
+            margin_top = "1em",
+            margin_bottom = "0pt",
+            font_size = "10pt",
+            font_family = "Sans",
+            font_style = "normal",
+            color = "#ff0000",
+            line_height = "1.5em",
+            text_align = "left",
+            max_lines = "3",
+            ellipsify = "false",
+            )
+        self.styles.add( "block", margin_bottom = "2pt", font_size = "2em" )
+        self.styles.add( "inline", color = "#00ff0080", ellipsify = "true" )
+
+    def tearDown( self ):
+        self.styles = None
+
+    def _pushStyles( self, *selectors ):
+        stack = CascadingStyleStack()
+        for selector in selectors:
+            stack.push( self.styles.findCompiledMatch( selector ) )
+        return stack
+
+    def testCompiledValues( self ):
+        values = self.styles.findCompiledMatch( "document" ).values
+        self.failUnlessEqual( values["width"], 72.0 )
+        self.failUnlessEqual( tuple( values["color"] ), ( 1.0, 0.0, 0.0, 1.0 ) )
+        self.failUnlessEqual( values["max_lines"], 3 )
+        self.failUnlessEqual( values["ellipsify"], False )
+        self.failUnlessEqual( values["font_family"], "Sans" )
+        self.failUnlessEqual( self.styles.findCompiledMatch( "missing" ), None )
+
+    def testInvalidValue( self ):
+        self.failUnlessRaises( ValueError, self.styles.add, "invalid",
+                               max_lines = "many" )
+        self.failUnlessRaises( ValueError, self.styles.update, "block",
+                               ellipsify = "maybe" )
+        # The style is left unchanged
+        self.failUnlessEqual( self.styles.findMatch( "block" ),
+                              { "margin_bottom" : "2pt", "font_size" : "2em" } )
+
+    def testUpdate( self ):
+        compiled = self.styles.findCompiledMatch( "document" )
+        self.styles.update( "document", width = "1in", max_lines = "3" )
+        self.failUnless( self.styles.findCompiledMatch( "document" )
+                         is compiled )
+
+        self.styles.update( "document", max_lines = 5 )
+        self.failUnlessEqual(
+            self.styles.findCompiledMatch( "document" ).values["max_lines"], 5 )
+        self.failUnlessEqual( self.styles.findMatch( "document" )["max_lines"],
+                              5 )
+
+    def testCascade( self ):
+        stack = self._pushStyles( "document" )
+        self.failUnlessEqual( stack._propertyToPoints( "margin_top" ), 10.0 )
+        self.failUnlessEqual( stack._propertyToPoints( "line_height" ), 15.0 )
+
+        stack = self._pushStyles( "document", "block", "inline" )
+        # The font size in ems is relative to that of the parent, the
+        # other measurements to the font size of the element
+        self.failUnlessEqual( stack._propertyToPoints( "font_size" ), 20.0 )
+        self.failUnlessEqual( stack._propertyToPoints( "line_height" ), 30.0 )
+        self.failUnlessEqual( stack._propertyToBool( "ellipsify" ), True )
+        self.failUnlessEqual( stack._propertyToInt( "max_lines" ), 3 )
+        self.failUnlessEqual( stack._propertyToColor( "color" ),
+                              ( 0.0, 1.0, 0.0, 128 / 255.0 ) )
+
+        stack.pop()
+        self.failUnlessEqual( stack._propertyToPoints( "margin_bottom" ), 2.0 )
+        self.failUnlessEqual( stack._property( "text_align" ), "left" )
+        self.failUnlessEqual( stack._strToPoints( "0.5em" ), 10.0 )
+
+    def testUninheritedProperties( self ):
+        stack = self._pushStyles( "document", "inline" )
+        self.failUnlessRaises( KeyError, stack._propertyToPoints,
+                               "margin_top" )
+
+    def testComputedStylesAreShared( self ):
+        first = self._pushStyles( "document", "block" )
+        second = self._pushStyles( "document", "block" )
+        self.failUnless( first._CascadingStyleStack__stack[-1] is
+                         second._CascadingStyleStack__stack[-1] )
+
+        # Plain dictionaries are compiled when pushed
+        third = CascadingStyleStack()
+        third.push( self.styles.findMatch( "document" ) )
+        third.push( self.styles.findMatch( "block" ) )
+        computed = third._CascadingStyleStack__stack[-1]
+        self.failUnless( isinstance( computed, ComputedStyle ) )
+        self.failUnless( computed is second._CascadingStyleStack__stack[-1] )
+        self.failUnlessEqual( hash( computed ),
+                              hash( first._CascadingStyleStack__stack[-1] ) )
+
+    def testSamePropertiesDifferentValues( self ):
+        self.styles.add( "large", font_size = "20pt" )
+        first = self._pushStyles( "document", "block", "inline" )
+        second = self._pushStyles( "document", "large", "block", "inline" )
+        self.failUnlessEqual( first._propertyToPoints( "font_size" ), 20.0 )
+        self.failUnlessEqual( second._propertyToPoints( "font_size" ), 40.0 )
+
+
+# ----------------------------------------------------------------------------
+# Script
+# ----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()